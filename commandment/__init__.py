@@ -23,10 +23,15 @@ from .profiles.api import profiles_api_app
 from .inventory.api import api_app as inventory_api
 from .mdm.api import api_app as mdm_api
 from .apps.app_jsonapi import api_app as applications_api
+from .runner.api import api_app as runner_api
 
-from .threads import startup_thread
-from .dep import threads as dep_threads
-from .apns import threads as push_threads
+from .threads import startup_thread, enrollment_thread
+from .pki import keypool
+from .dep import threads as dep_threads  # registers runner jobs
+from .apns import threads as push_threads  # registers runner jobs
+from .vpp import threads as vpp_threads, planner as vpp_planner  # registers runner jobs
+from .inventory import rollups  # registers runner jobs
+from .mdm import retention  # registers runner jobs
 
 
 def create_app(config_file: Optional[Union[str, PurePath]] = None) -> Flask:
@@ -77,10 +82,10 @@ def create_app(config_file: Optional[Union[str, PurePath]] = None) -> Flask:
     except ImportError:
         app.logger.warning("SCEP will not be available, cannot load SCEPy")
 
-    # Threads
+    # Threads, the startup thread also starts the job runner once migrations have been applied.
     startup_thread.start(app)
-    # dep_threads.start(app)
-    # push_threads.start(app)
+    enrollment_thread.start(app)
+    keypool.start(app)
 
     # SPA Entry Point (when not behind nginx or apache)
     @app.route('/')
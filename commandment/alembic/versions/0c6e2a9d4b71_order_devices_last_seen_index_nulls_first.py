@@ -0,0 +1,60 @@
+"""Order the devices last_seen index with NULLs first on PostgreSQL
+
+Revision ID: 0c6e2a9d4b71
+Revises: e3b7c9d1a486
+Create Date: 2026-10-20 09:12:40.518302
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '0c6e2a9d4b71'
+down_revision = 'e3b7c9d1a486'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    # Keyset pagination orders NULLs first. Other databases already sort NULLs before all values in an index.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_devices_last_seen_id', table_name='devices')
+        op.create_index('ix_devices_last_seen_id', 'devices', ['last_seen', 'id'], unique=False,
+                        postgresql_ops={'last_seen': 'NULLS FIRST'})
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_devices_last_seen_id', table_name='devices')
+        op.create_index('ix_devices_last_seen_id', 'devices', ['last_seen', 'id'], unique=False)
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
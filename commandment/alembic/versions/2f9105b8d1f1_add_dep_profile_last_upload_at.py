@@ -0,0 +1,62 @@
+"""Add last_upload_at to DEP profiles
+
+Revision ID: 2f9105b8d1f1
+Revises: ac54ef77d9c1
+Create Date: 2019-06-16 09:42:51.104837
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '2f9105b8d1f1'
+down_revision = 'ac54ef77d9c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    with op.batch_alter_table('dep_profiles', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_upload_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_devices_dep_profile_id'), ['dep_profile_id'], unique=False)
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_devices_dep_profile_id'))
+
+    with op.batch_alter_table('dep_profiles', schema=None) as batch_op:
+        batch_op.drop_column('last_upload_at')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
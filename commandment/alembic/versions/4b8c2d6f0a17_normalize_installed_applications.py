@@ -0,0 +1,155 @@
+"""Move the attributes of installed applications into an application_versions catalog
+
+Revision ID: 4b8c2d6f0a17
+Revises: d7e3a91f4b62
+Create Date: 2026-10-19 16:02:47.551203
+
+"""
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '4b8c2d6f0a17'
+down_revision = 'd7e3a91f4b62'
+branch_labels = None
+depends_on = None
+
+# The catalog attributes in the order hashed by commandment.inventory.catalog.version_key at this revision.
+catalog_columns = (
+    sa.column('bundle_identifier', sa.String),
+    sa.column('version', sa.String),
+    sa.column('short_version', sa.String),
+    sa.column('name', sa.String),
+    sa.column('bundle_size', sa.BigInteger),
+    sa.column('external_version_identifier', sa.BigInteger),
+    sa.column('adhoc_codesigned', sa.Boolean),
+    sa.column('appstore_vendable', sa.Boolean),
+    sa.column('beta_app', sa.Boolean),
+)
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    op.create_table('application_versions',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('key', sa.String(length=64), nullable=False),
+                    sa.Column('bundle_identifier', sa.String(), nullable=True),
+                    sa.Column('version', sa.String(), nullable=True),
+                    sa.Column('short_version', sa.String(), nullable=True),
+                    sa.Column('name', sa.String(), nullable=True),
+                    sa.Column('bundle_size', sa.BigInteger(), nullable=True),
+                    sa.Column('external_version_identifier', sa.BigInteger(), nullable=True),
+                    sa.Column('adhoc_codesigned', sa.Boolean(), nullable=True),
+                    sa.Column('appstore_vendable', sa.Boolean(), nullable=True),
+                    sa.Column('beta_app', sa.Boolean(), nullable=True),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('key')
+                    )
+    op.create_index(op.f('ix_application_versions_bundle_identifier'), 'application_versions',
+                    ['bundle_identifier'], unique=False)
+    op.create_index(op.f('ix_application_versions_version'), 'application_versions', ['version'], unique=False)
+    op.create_index(op.f('ix_application_versions_external_version_identifier'), 'application_versions',
+                    ['external_version_identifier'], unique=False)
+
+    with op.batch_alter_table('installed_applications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('application_version_id', sa.Integer(), nullable=True))
+
+    # Not optional: the columns are dropped below
+    populate_catalog()
+
+    with op.batch_alter_table('installed_applications', schema=None) as batch_op:
+        batch_op.drop_index('ix_installed_applications_bundle_identifier')
+        batch_op.drop_index('ix_installed_applications_version')
+        batch_op.drop_index('ix_installed_applications_external_version_identifier')
+        for column in catalog_columns:
+            batch_op.drop_column(column.name)
+        batch_op.alter_column('application_version_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_installed_applications_application_version_id', 'application_versions',
+                                    ['application_version_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_installed_applications_application_version_id'),
+                              ['application_version_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_installed_applications_device_id'), ['device_id'], unique=False)
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    with op.batch_alter_table('installed_applications', schema=None) as batch_op:
+        for column in catalog_columns:
+            batch_op.add_column(sa.Column(column.name, column.type, nullable=True))
+
+    installed_applications = sa.table('installed_applications', sa.column('application_version_id', sa.Integer),
+                                      *[sa.column(c.name, c.type) for c in catalog_columns])
+    application_versions = sa.table('application_versions', sa.column('id', sa.Integer),
+                                    *[sa.column(c.name, c.type) for c in catalog_columns])
+    op.execute(installed_applications.update().values({
+        c.name: sa.select([application_versions.c[c.name]]).where(
+            application_versions.c.id == installed_applications.c.application_version_id).as_scalar()
+        for c in catalog_columns
+    }))
+
+    with op.batch_alter_table('installed_applications', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_installed_applications_device_id'))
+        batch_op.drop_index(batch_op.f('ix_installed_applications_application_version_id'))
+        batch_op.drop_constraint('fk_installed_applications_application_version_id', type_='foreignkey')
+        batch_op.drop_column('application_version_id')
+        batch_op.create_index('ix_installed_applications_bundle_identifier', ['bundle_identifier'], unique=False)
+        batch_op.create_index('ix_installed_applications_version', ['version'], unique=False)
+        batch_op.create_index('ix_installed_applications_external_version_identifier',
+                              ['external_version_identifier'], unique=False)
+
+    op.drop_index(op.f('ix_application_versions_external_version_identifier'), table_name='application_versions')
+    op.drop_index(op.f('ix_application_versions_version'), table_name='application_versions')
+    op.drop_index(op.f('ix_application_versions_bundle_identifier'), table_name='application_versions')
+    op.drop_table('application_versions')
+
+
+def populate_catalog():
+    """Insert one application version per distinct set of attributes, and point the installations at it."""
+    installed_applications = sa.table('installed_applications', sa.column('application_version_id', sa.Integer),
+                                      *[sa.column(c.name, c.type) for c in catalog_columns])
+    application_versions = sa.table('application_versions', sa.column('id', sa.Integer), sa.column('key', sa.String),
+                                    *[sa.column(c.name, c.type) for c in catalog_columns])
+    connection = op.get_bind()
+
+    distinct = connection.execute(
+        sa.select([installed_applications.c[c.name] for c in catalog_columns]).distinct()).fetchall()
+    for row in distinct:
+        values = [row[c.name] for c in catalog_columns]
+        key = hashlib.sha256(json.dumps(values).encode('utf8')).hexdigest()
+        connection.execute(application_versions.insert().values(
+            dict(zip([c.name for c in catalog_columns], values), key=key)))
+        version_id = connection.execute(
+            sa.select([application_versions.c.id]).where(application_versions.c.key == key)).scalar()
+        connection.execute(installed_applications.update().where(sa.and_(*[
+            installed_applications.c[c.name].isnot_distinct_from(value)
+            for c, value in zip(catalog_columns, values)
+        ])).values(application_version_id=version_id))
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
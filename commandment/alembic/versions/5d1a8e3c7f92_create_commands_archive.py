@@ -0,0 +1,77 @@
+"""Create commands_archive table
+
+Revision ID: 5d1a8e3c7f92
+Revises: 9e2f4c7a1b35
+Create Date: 2026-10-19 18:42:05.316284
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '5d1a8e3c7f92'
+down_revision = '9e2f4c7a1b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    op.create_table('commands_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('request_type', sa.String(), nullable=False),
+    sa.Column('uuid', commandment.dbtypes.GUID(), nullable=False),
+    sa.Column('parameters', commandment.dbtypes.JSONEncodedDict(), nullable=True),
+    sa.Column('status', sa.String(length=40), nullable=False),
+    sa.Column('queued_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('acknowledged_at', sa.DateTime(), nullable=True),
+    sa.Column('after', sa.DateTime(), nullable=True),
+    sa.Column('ttl', sa.Integer(), nullable=False),
+    sa.Column('device_id', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('commands_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_commands_archive_uuid'), ['uuid'], unique=False)
+        batch_op.create_index(batch_op.f('ix_commands_archive_device_id'), ['device_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_commands_archive_archived_at'), ['archived_at'], unique=False)
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    with op.batch_alter_table('commands_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_commands_archive_archived_at'))
+        batch_op.drop_index(batch_op.f('ix_commands_archive_device_id'))
+        batch_op.drop_index(batch_op.f('ix_commands_archive_uuid'))
+
+    op.drop_table('commands_archive')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
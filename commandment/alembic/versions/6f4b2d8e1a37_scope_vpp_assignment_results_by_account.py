@@ -0,0 +1,70 @@
+"""Scope vpp_assignment_results by VPP account
+
+Revision ID: 6f4b2d8e1a37
+Revises: 0c6e2a9d4b71
+Create Date: 2026-10-20 14:02:19.330871
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '6f4b2d8e1a37'
+down_revision = '0c6e2a9d4b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    with op.batch_alter_table('vpp_assignment_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('vpp_account_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_vpp_assignment_results_vpp_account_id', 'vpp_accounts',
+                                    ['vpp_account_id'], ['id'])
+        batch_op.drop_constraint('uq_vpp_assignment_results_adam_id_pricing_param_serial_number', type_='unique')
+        batch_op.create_unique_constraint('uq_vpp_assignment_results_account_product_serial_number',
+                                          ['vpp_account_id', 'adam_id', 'pricing_param', 'serial_number'])
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    # Keep the most recent result of each product and serial number, the other accounts' results would conflict.
+    op.execute('DELETE FROM vpp_assignment_results WHERE id NOT IN ('
+               'SELECT max_id FROM (SELECT max(id) AS max_id FROM vpp_assignment_results '
+               'GROUP BY adam_id, pricing_param, serial_number) AS latest)')
+
+    with op.batch_alter_table('vpp_assignment_results', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_vpp_assignment_results_account_product_serial_number', type_='unique')
+        batch_op.create_unique_constraint('uq_vpp_assignment_results_adam_id_pricing_param_serial_number',
+                                          ['adam_id', 'pricing_param', 'serial_number'])
+        batch_op.drop_constraint('fk_vpp_assignment_results_vpp_account_id', type_='foreignkey')
+        batch_op.drop_column('vpp_account_id')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
@@ -0,0 +1,131 @@
+"""Mirror VPP assets, licenses and users
+
+Revision ID: 7c3e5a1f9b24
+Revises: 2f9105b8d1f1
+Create Date: 2019-06-18 14:05:12.617220
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '7c3e5a1f9b24'
+down_revision = '2f9105b8d1f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def existing_enum(*values, name: str):
+    """An enum type which was already created by the vpp_licenses migration, so must not be created again."""
+    return sa.Enum(*values, name=name).with_variant(postgresql.ENUM(*values, name=name, create_type=False),
+                                                    'postgresql')
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    with op.batch_alter_table('vpp_accounts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('exp_date', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('org_name', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('location_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('location_name', sa.String(), nullable=True))
+
+    with op.batch_alter_table('vpp_users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('vpp_account_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('its_id_hash', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_vpp_users_vpp_account_id', 'vpp_accounts', ['vpp_account_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_vpp_users_vpp_account_id'), ['vpp_account_id'], unique=False)
+        batch_op.create_unique_constraint('uq_vpp_users_client_user_id', ['client_user_id'])
+
+    with op.batch_alter_table('vpp_licenses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('vpp_account_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('status', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('serial_number', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_vpp_licenses_vpp_account_id', 'vpp_accounts', ['vpp_account_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_vpp_licenses_vpp_account_id'), ['vpp_account_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vpp_licenses_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vpp_licenses_serial_number'), ['serial_number'], unique=False)
+        batch_op.create_index('ix_vpp_licenses_adam_id_pricing_param', ['adam_id', 'pricing_param'], unique=False)
+
+    op.create_table('vpp_assets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('vpp_account_id', sa.Integer(), nullable=False),
+    sa.Column('adam_id', sa.String(), nullable=False),
+    sa.Column('pricing_param', existing_enum('StandardQuality', 'HighQuality', name='vpppricingparam'),
+              nullable=False),
+    sa.Column('product_type', existing_enum('Software', 'Application', 'Publication', name='vppproducttype'),
+              nullable=True),
+    sa.Column('product_type_name', sa.String(), nullable=True),
+    sa.Column('is_irrevocable', sa.Boolean(), nullable=True),
+    sa.Column('device_assignable', sa.Boolean(), nullable=True),
+    sa.Column('total_count', sa.Integer(), nullable=True),
+    sa.Column('assigned_count', sa.Integer(), nullable=True),
+    sa.Column('available_count', sa.Integer(), nullable=True),
+    sa.Column('retired_count', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['vpp_account_id'], ['vpp_accounts.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('vpp_account_id', 'adam_id', 'pricing_param',
+                        name='uq_vpp_assets_vpp_account_id_adam_id_pricing_param')
+    )
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    op.drop_table('vpp_assets')
+
+    with op.batch_alter_table('vpp_licenses', schema=None) as batch_op:
+        batch_op.drop_index('ix_vpp_licenses_adam_id_pricing_param')
+        batch_op.drop_index(batch_op.f('ix_vpp_licenses_serial_number'))
+        batch_op.drop_index(batch_op.f('ix_vpp_licenses_user_id'))
+        batch_op.drop_index(batch_op.f('ix_vpp_licenses_vpp_account_id'))
+        batch_op.drop_constraint('fk_vpp_licenses_vpp_account_id', type_='foreignkey')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('serial_number')
+        batch_op.drop_column('status')
+        batch_op.drop_column('vpp_account_id')
+
+    with op.batch_alter_table('vpp_users', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_vpp_users_client_user_id', type_='unique')
+        batch_op.drop_index(batch_op.f('ix_vpp_users_vpp_account_id'))
+        batch_op.drop_constraint('fk_vpp_users_vpp_account_id', type_='foreignkey')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('its_id_hash')
+        batch_op.drop_column('vpp_account_id')
+
+    with op.batch_alter_table('vpp_accounts', schema=None) as batch_op:
+        batch_op.drop_column('location_name')
+        batch_op.drop_column('location_id')
+        batch_op.drop_column('org_name')
+        batch_op.drop_column('exp_date')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
@@ -0,0 +1,107 @@
+"""Create the device search index
+
+Revision ID: 9e2f4c7a1b35
+Revises: 4b8c2d6f0a17
+Create Date: 2026-10-19 17:20:11.902716
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = '9e2f4c7a1b35'
+down_revision = '4b8c2d6f0a17'
+branch_labels = None
+depends_on = None
+
+# commandment.api.search.SEARCH_COLUMNS at this revision.
+search_columns = ('device_name', 'hostname', 'local_hostname', 'serial_number', 'udid', 'wifi_mac', 'bluetooth_mac')
+
+# Must match commandment.api.search.search_text()
+search_text = 'lower({})'.format(" || ' ' || ".join("coalesce({}, '')".format(c) for c in search_columns))
+
+
+def sqlite_supports_trigram_fts(connection) -> bool:
+    """The trigram tokenizer needs SQLite 3.34 with FTS5, older or smaller builds can only search by prefix."""
+    try:
+        connection.execute("CREATE VIRTUAL TABLE temp.devices_search_probe USING fts5(value, tokenize='trigram')")
+    except sa.exc.OperationalError:
+        return False
+
+    connection.execute('DROP TABLE temp.devices_search_probe')
+    return True
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_devices_search_trgm ON devices USING gin (({}) gin_trgm_ops)'.format(search_text))
+
+    elif dialect == 'sqlite' and sqlite_supports_trigram_fts(op.get_bind()):
+        # NOTE: Recreating the devices table in a batch migration drops these triggers, they must be created again.
+        columns = ', '.join(search_columns)
+        new_values = ', '.join('new.{}'.format(c) for c in search_columns)
+        old_values = ', '.join('old.{}'.format(c) for c in search_columns)
+
+        op.execute("CREATE VIRTUAL TABLE devices_search USING fts5({}, content='devices', content_rowid='id', "
+                   "tokenize='trigram')".format(columns))
+        op.execute("INSERT INTO devices_search (devices_search) VALUES ('rebuild')")
+        op.execute('CREATE TRIGGER devices_search_insert AFTER INSERT ON devices BEGIN '
+                   'INSERT INTO devices_search (rowid, {columns}) VALUES (new.id, {new}); '
+                   'END'.format(columns=columns, new=new_values))
+        op.execute('CREATE TRIGGER devices_search_delete AFTER DELETE ON devices BEGIN '
+                   "INSERT INTO devices_search (devices_search, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+                   'END'.format(columns=columns, old=old_values))
+        op.execute('CREATE TRIGGER devices_search_update AFTER UPDATE OF {columns} ON devices BEGIN '
+                   "INSERT INTO devices_search (devices_search, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+                   'INSERT INTO devices_search (rowid, {columns}) VALUES (new.id, {new}); '
+                   'END'.format(columns=columns, old=old_values, new=new_values))
+
+    # Other databases search by prefix, using the existing udid and serial_number indexes.
+    # commandment.api.search falls back to that when the devices_search table does not exist.
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_devices_search_trgm')
+
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS devices_search_update')
+        op.execute('DROP TRIGGER IF EXISTS devices_search_delete')
+        op.execute('DROP TRIGGER IF EXISTS devices_search_insert')
+        op.execute('DROP TABLE IF EXISTS devices_search')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
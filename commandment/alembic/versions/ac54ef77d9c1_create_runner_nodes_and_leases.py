@@ -0,0 +1,73 @@
+"""Create runner node and lease tables
+
+Revision ID: ac54ef77d9c1
+Revises: daf2df684e8d
+Create Date: 2019-06-09 11:05:12.730419
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = 'ac54ef77d9c1'
+down_revision = 'daf2df684e8d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    op.create_table('runner_nodes',
+    sa.Column('node_id', sa.String(length=255), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('node_id')
+    )
+    with op.batch_alter_table('runner_nodes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_runner_nodes_heartbeat_at'), ['heartbeat_at'], unique=False)
+
+    op.create_table('runner_leases',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('owner', sa.String(length=255), nullable=False),
+    sa.Column('acquired_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    op.drop_table('runner_leases')
+    with op.batch_alter_table('runner_nodes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_runner_nodes_heartbeat_at'))
+
+    op.drop_table('runner_nodes')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
@@ -0,0 +1,78 @@
+"""Create vpp_assignment_results table
+
+Revision ID: b41d6e8a2c53
+Revises: 7c3e5a1f9b24
+Create Date: 2019-06-20 10:31:47.902114
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = 'b41d6e8a2c53'
+down_revision = '7c3e5a1f9b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    pricing_param = sa.Enum('StandardQuality', 'HighQuality', name='vpppricingparam').with_variant(
+        postgresql.ENUM('StandardQuality', 'HighQuality', name='vpppricingparam', create_type=False), 'postgresql')
+
+    op.create_table('vpp_assignment_results',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('adam_id', sa.String(), nullable=False),
+    sa.Column('pricing_param', pricing_param, nullable=False),
+    sa.Column('serial_number', sa.String(), nullable=False),
+    sa.Column('operation', sa.String(), nullable=False),
+    sa.Column('succeeded', sa.Boolean(), nullable=False),
+    sa.Column('error_number', sa.Integer(), nullable=True),
+    sa.Column('error_message', sa.String(), nullable=True),
+    sa.Column('attempted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('adam_id', 'pricing_param', 'serial_number',
+                        name='uq_vpp_assignment_results_adam_id_pricing_param_serial_number')
+    )
+    with op.batch_alter_table('vpp_assignment_results', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vpp_assignment_results_serial_number'), ['serial_number'], unique=False)
+        batch_op.create_index(batch_op.f('ix_vpp_assignment_results_succeeded'), ['succeeded'], unique=False)
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    with op.batch_alter_table('vpp_assignment_results', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_vpp_assignment_results_succeeded'))
+        batch_op.drop_index(batch_op.f('ix_vpp_assignment_results_serial_number'))
+
+    op.drop_table('vpp_assignment_results')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
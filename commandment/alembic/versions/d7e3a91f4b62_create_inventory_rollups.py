@@ -0,0 +1,76 @@
+"""Create application version and device model rollup tables
+
+Revision ID: d7e3a91f4b62
+Revises: c52f7a9e1d38
+Create Date: 2026-10-19 14:41:05.318274
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3a91f4b62'
+down_revision = 'c52f7a9e1d38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    op.create_table('application_version_counts',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('bundle_identifier', sa.String(), nullable=True),
+                    sa.Column('version', sa.String(), nullable=True),
+                    sa.Column('device_count', sa.Integer(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_application_version_counts_key', 'application_version_counts',
+                    ['bundle_identifier', 'version'], unique=False)
+
+    op.create_table('device_model_counts',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('model', sa.String(), nullable=True),
+                    sa.Column('os_version', sa.String(), nullable=True),
+                    sa.Column('platform', sa.String(), nullable=True),
+                    sa.Column('device_count', sa.Integer(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_device_model_counts_key', 'device_model_counts', ['platform', 'model', 'os_version'],
+                    unique=False)
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    op.drop_index('ix_device_model_counts_key', table_name='device_model_counts')
+    op.drop_table('device_model_counts')
+    op.drop_index('ix_application_version_counts_key', table_name='application_version_counts')
+    op.drop_table('application_version_counts')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
@@ -0,0 +1,151 @@
+"""Store command payloads in the blobs table
+
+Revision ID: e3b7c9d1a486
+Revises: 5d1a8e3c7f92
+Create Date: 2026-10-19 19:55:31.604118
+
+"""
+
+# From: http://alembic.zzzcomputing.com/en/latest/cookbook.html#conditional-migration-elements
+
+import base64
+import datetime
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+import commandment.dbtypes
+
+
+from alembic import context
+
+# revision identifiers, used by Alembic.
+revision = 'e3b7c9d1a486'
+down_revision = '5d1a8e3c7f92'
+branch_labels = None
+depends_on = None
+
+# Request types and their blob_parameter at this revision. The parameters hold urlsafe base64, the blobs the bytes.
+blob_parameters = {'InstallProfile': 'Payload'}
+
+blobs = sa.table(
+    'blobs',
+    sa.column('id', sa.Integer),
+    sa.column('digest', sa.String),
+    sa.column('data', commandment.dbtypes.Compressed()),
+    sa.column('size', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+
+def commands_table(name: str):
+    return sa.table(
+        name,
+        sa.column('id', sa.Integer),
+        sa.column('request_type', sa.String),
+        sa.column('parameters', commandment.dbtypes.JSONEncodedDict()),
+        sa.column('payload_id', sa.Integer),
+    )
+
+
+commands = commands_table('commands')
+commands_archive = commands_table('commands_archive')
+
+
+def upgrade():
+    schema_upgrades()
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_upgrades()
+
+
+def downgrade():
+    if context.get_x_argument(as_dictionary=True).get('data', None):
+        data_downgrades()
+    schema_downgrades()
+
+
+def schema_upgrades():
+    """schema upgrade migrations go here."""
+    op.create_table('blobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('digest', name='uq_blobs_digest')
+    )
+
+    with op.batch_alter_table('commands', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payload_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_commands_payload_id'), ['payload_id'], unique=False)
+        batch_op.create_foreign_key('fk_commands_payload_id', 'blobs', ['payload_id'], ['id'])
+
+    with op.batch_alter_table('commands_archive', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payload_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_commands_archive_payload_id'), ['payload_id'], unique=False)
+
+    move_payloads_to_blobs()
+
+
+def move_payloads_to_blobs():
+    """Move the blob parameter of existing commands into blobs, storing each distinct value once."""
+    connection = op.get_bind()
+    blob_ids = {}
+
+    rows = connection.execute(sa.select([commands.c.id, commands.c.request_type, commands.c.parameters]).where(
+        commands.c.request_type.in_(list(blob_parameters.keys())))).fetchall()
+
+    for command_id, request_type, parameters in rows:
+        value = (parameters or {}).pop(blob_parameters[request_type], None)
+        if value is None:
+            continue
+
+        data = base64.urlsafe_b64decode(value)
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in blob_ids:
+            connection.execute(blobs.insert().values(
+                digest=digest, data=data, size=len(data), created_at=datetime.datetime.utcnow()))
+            blob_ids[digest] = connection.execute(
+                sa.select([blobs.c.id]).where(blobs.c.digest == digest)).scalar()
+
+        connection.execute(commands.update().where(commands.c.id == command_id).values(
+            parameters=parameters, payload_id=blob_ids[digest]))
+
+
+def restore_payloads(table):
+    """Copy blobs back into the parameters of the commands which reference them."""
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([table.c.id, table.c.request_type, table.c.parameters, blobs.c.data])
+                              .select_from(table.join(blobs, table.c.payload_id == blobs.c.id))).fetchall()
+    for command_id, request_type, parameters, data in rows:
+        parameters = dict(parameters or {})
+        parameters[blob_parameters[request_type]] = base64.urlsafe_b64encode(data).decode('utf-8')
+        connection.execute(table.update().where(table.c.id == command_id).values(parameters=parameters))
+
+
+def schema_downgrades():
+    """schema downgrade migrations go here."""
+    restore_payloads(commands)
+    restore_payloads(commands_archive)
+
+    with op.batch_alter_table('commands_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_commands_archive_payload_id'))
+        batch_op.drop_column('payload_id')
+
+    with op.batch_alter_table('commands', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_commands_payload_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_commands_payload_id'))
+        batch_op.drop_column('payload_id')
+
+    op.drop_table('blobs')
+
+
+def data_upgrades():
+    """Add any optional data upgrade migrations here!"""
+    pass
+
+
+def data_downgrades():
+    """Add any optional data downgrade migrations here!"""
+    pass
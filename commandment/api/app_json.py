@@ -2,7 +2,8 @@
 This module contains API endpoints which do not fit with the JSON-API specification.
 """
 import io
-from flask import Blueprint, send_file, abort, current_app, jsonify, request, make_response
+from flask import Blueprint, send_file, abort, current_app, jsonify, request, make_response, Response, \
+    stream_with_context
 from sqlalchemy.orm.exc import NoResultFound
 import plistlib
 import string
@@ -12,7 +13,12 @@ from commandment.models import db, Organization, Device, Command
 from commandment.pki.models import Certificate, RSAPrivateKey
 from commandment.profiles.models import Profile
 from commandment.mdm import commands, Platform
-from .schema import OrganizationFlatSchema
+from commandment.auth import oauth2
+from commandment.inventory.export import DATASETS, FORMATS, EXTENSIONS, export
+from commandment.inventory import rollups
+from .keyset import skip_unused_relationships
+from .schema import OrganizationFlatSchema, DeviceSchema
+from .search import search_devices
 from commandment.profiles.schema import ProfileSchema
 from commandment.profiles.plist_schema import ProfileSchema as ProfilePlistSchema
 
@@ -352,3 +358,105 @@ def download_profile(profile_id: int):
 
     return profile.data, 200, {'Content-Type': 'application/x-apple-aspen-config'}
 
+
+@flat_api.route('/v1/export/<dataset>')
+@oauth2.require_oauth()
+def export_inventory(dataset: str):
+    """Export every row of an inventory dataset as a chunked response.
+
+    The rows are streamed from a server side cursor, see :mod:`commandment.inventory.export`.
+
+    :param dataset: One of devices, installed_applications, installed_certificates or installed_profiles.
+    :query format: ndjson (default), csv or columns.
+    :resheader Content-Type: application/x-ndjson
+    :resheader Content-Type: text/csv
+    :statuscode 200: OK
+    :statuscode 400: Unknown dataset or format
+    :statuscode 401: Not authorized
+    """
+    output_format = request.args.get('format', 'ndjson')
+    if dataset not in DATASETS:
+        abort(400, 'Unknown dataset: {}'.format(dataset))
+    if output_format not in FORMATS:
+        abort(400, 'Unknown format: {}'.format(output_format))
+
+    chunks = export(dataset, output_format, current_app.config['INVENTORY_EXPORT_CHUNK_SIZE'])
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[output_format])
+    response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(
+        dataset, EXTENSIONS[output_format])
+
+    return response
+
+
+@flat_api.route('/v1/rollups/applications')
+@oauth2.require_oauth()
+def application_rollup():
+    """Count the devices with each version of each installed application, from the precomputed rollup.
+
+    :query bundle_identifier: Only count this application.
+    :query version: Only count this version.
+    :resheader Content-Type: application/json
+    :statuscode 200: OK
+    :statuscode 401: Not authorized
+    """
+    counts = rollups.application_counts(request.args.get('bundle_identifier'), request.args.get('version'))
+    return jsonify({'data': counts})
+
+
+@flat_api.route('/v1/rollups/devices')
+@oauth2.require_oauth()
+def device_rollup():
+    """Count the devices of each model, operating system version and platform, from the precomputed rollup.
+
+    :query group_by: Comma separated columns to count by, any of model, os_version and platform. Defaults to all.
+    :query model: Only count this model.
+    :query os_version: Only count this operating system version.
+    :query platform: Only count this platform.
+    :resheader Content-Type: application/json
+    :statuscode 200: OK
+    :statuscode 400: Unknown group_by column
+    :statuscode 401: Not authorized
+    """
+    group_by = request.args.get('group_by')
+    group_by = group_by.split(',') if group_by else rollups.DEVICE_GROUPS
+    filters = {name: request.args[name] for name in rollups.DEVICE_GROUPS if name in request.args}
+    try:
+        counts = rollups.device_counts(group_by, **filters)
+    except ValueError as e:
+        return abort(400, str(e))
+
+    return jsonify({'data': counts})
+
+
+@flat_api.route('/v1/devices/search')
+@oauth2.require_oauth()
+def device_search():
+    """Search devices by name, hostname, serial number, UDID or MAC address.
+
+    See :mod:`commandment.api.search` for the matching rules of each database.
+
+    :query q: Whitespace separated terms which must all match part of a searched attribute.
+    :query limit: The maximum number of devices to return, defaults to 20, up to DEVICE_SEARCH_MAX_RESULTS.
+    :resheader Content-Type: application/vnd.api+json
+    :statuscode 200: OK
+    :statuscode 400: Missing query or invalid limit
+    :statuscode 401: Not authorized
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        abort(400, 'A search query is required')
+
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return abort(400, 'limit must be a number')
+    if limit < 1:
+        abort(400, 'limit must be positive')
+
+    devices = search_devices(query, min(limit, current_app.config['DEVICE_SEARCH_MAX_RESULTS']))
+
+    schema = DeviceSchema(many=True)
+    skip_unused_relationships(schema)
+    response = jsonify(schema.dump(devices).data)
+    response.mimetype = 'application/vnd.api+json'
+    return response
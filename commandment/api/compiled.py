@@ -0,0 +1,295 @@
+"""
+Compiled JSON:API serialization for list endpoints.
+
+Dumping a page of a large collection through a marshmallow-jsonapi schema loads every row as an ORM object, then calls
+each field, builds nested dicts and finally encodes them as JSON. :class:`CompiledSchema` inspects a schema once per
+request, selects only the columns it needs as plain row tuples and writes each resource object straight to JSON text
+with a precomputed encoder per field.
+
+The output is byte for byte the same as ``json.dumps(schema.dump(objects).data, cls=JSONEncoder)``. Schemas which use
+anything that cannot be reproduced from a row (nested or method fields, resource linkage, included data, attributes
+which are not columns) are not compiled, and the caller falls back to the schema.
+"""
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import url_for, current_app
+from werkzeug.routing import BuildError
+from flask_rest_jsonapi.utils import JSONEncoder
+from marshmallow import fields as ma_fields
+from marshmallow.fields import Field
+from marshmallow_jsonapi.fields import Relationship as BaseRelationship
+from marshmallow_jsonapi.flask import Relationship
+from marshmallow_jsonapi.utils import tpl
+from sqlalchemy.orm import ColumnProperty
+
+#: Field classes whose serialized value only depends on the attribute value.
+SUPPORTED_FIELDS = (
+    ma_fields.String, ma_fields.UUID, ma_fields.Url, ma_fields.Email, ma_fields.Integer, ma_fields.Float,
+    ma_fields.Boolean, ma_fields.DateTime, ma_fields.LocalDateTime, ma_fields.Date, ma_fields.Time,
+)
+
+_json_encoder = JSONEncoder()
+
+
+def _encode_float(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == -float('inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+#: JSON encoders for the exact types that fields serialize to, matching the defaults of `json.dumps`.
+_ENCODERS: Dict[type, Callable[[Any], str]] = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
+
+def encode(value: Any) -> str:
+    """Encode a single value as JSON, the same way as ``json.dumps(value, cls=JSONEncoder)``."""
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        return _json_encoder.encode(value)
+
+    return encoder(value)
+
+
+def dumps_document(data: str, document: dict) -> str:
+    """Encode a top level document whose primary data has already been encoded.
+
+    Args:
+        data (str): The encoded value of ``data``.
+        document (dict): The other top level members, in order.
+
+    Returns:
+        str: The same text as ``json.dumps(dict(data=..., **document), cls=JSONEncoder)``.
+    """
+    if not document:
+        return '{"data": ' + data + '}'
+
+    return '{"data": ' + data + ', ' + json.dumps(document, cls=JSONEncoder)[1:]
+
+
+class UrlTemplate(object):
+    """Builds the same URLs as ``url_for(endpoint, **kwargs)`` without matching the URL rules for every row.
+
+    The URL is built once with placeholder values, each row then only converts its own values with the converters of
+    the rule, and joins them with the constant parts.
+
+    Args:
+        endpoint (str): The endpoint to build URLs for.
+        arguments (Tuple[str, ...]): The names of the rule arguments which are passed to `build`.
+
+    Raises:
+        ValueError: If the URL cannot be templated, because no rule takes exactly these arguments, or the rules which do
+            convert them differently.
+    """
+    def __init__(self, endpoint: str, arguments: Tuple[str, ...]):
+        rules = [r for r in current_app.url_map.iter_rules(endpoint) if r.arguments == set(arguments)]
+        if not rules:
+            raise ValueError('No rule for {} with arguments {}'.format(endpoint, arguments))
+        converters = rules[0]._converters
+        for rule in rules[1:]:  # url_for may choose any of them, they must convert values the same way
+            for name in arguments:
+                other = rule._converters[name]
+                if type(other) is not type(converters[name]) or vars(other) != vars(converters[name]):
+                    raise ValueError('Rules for {} convert {} differently'.format(endpoint, name))
+
+        self.endpoint = endpoint
+        self.arguments = arguments
+        placeholders = {name: 9100000000000000000 + i for i, name in enumerate(arguments)}
+        url = url_for(endpoint, **placeholders)
+
+        self.converters = []
+        self.parts = []
+        for name in sorted(arguments, key=lambda n: url.index(str(placeholders[n]))):
+            head, placeholder, url = url.partition(str(placeholders[name]))
+            if not placeholder or str(placeholders[name]) in url:
+                raise ValueError('Cannot template {} argument {}'.format(endpoint, name))
+            self.parts.append(head)
+            self.converters.append((arguments.index(name), converters[name].to_url))
+        self.parts.append(url)
+
+    def build(self, values: tuple) -> Optional[str]:
+        """Build a URL from the argument values, in the order of ``arguments``.
+
+        Returns:
+            Optional[str]: The URL, or None if an argument is None and no other rule matches, like
+                ``marshmallow_jsonapi.flask.Relationship.get_url``.
+        """
+        if None in values:  # Another rule of the endpoint may not need this argument
+            try:
+                return url_for(self.endpoint, **dict(zip(self.arguments, values)))
+            except BuildError:
+                return None
+
+        url = self.parts[0]
+        for (index, to_url), part in zip(self.converters, self.parts[1:]):
+            url += to_url(values[index]) + part
+
+        return url
+
+
+def _view_kwargs(view_kwargs: dict) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """Split view kwargs into argument names and the attributes they are taken from, None if any is not ``<attr>``."""
+    names, attributes = [], []
+    for name, value in view_kwargs.items():
+        attribute = tpl(str(value))
+        if attribute is None or '.' in attribute:
+            return None
+        names.append(name)
+        attributes.append(attribute)
+
+    return tuple(names), tuple(attributes)
+
+
+class CompiledSchema(object):
+    """A marshmallow-jsonapi schema instance compiled for dumping rows of a single model.
+
+    Use `compile` rather than the constructor, it returns None if the schema cannot be compiled.
+
+    Attributes:
+        columns (list): The model attributes to select, in row order.
+    """
+    def __init__(self, type_: str):
+        self.type_prefix = '"type": ' + encode(type_)
+        self.columns = []
+        self._column_index: Dict[str, int] = {}
+        self._plan: List[tuple] = []
+        self._links = None
+
+    def column(self, model, name: str) -> int:
+        """Get the row index of a model attribute, adding it to the selected columns if necessary.
+
+        Raises:
+            ValueError: If the attribute is not a column.
+        """
+        if name not in self._column_index:
+            attribute = getattr(model, name, None)
+            if not isinstance(getattr(attribute, 'property', None), ColumnProperty):
+                raise ValueError('{} is not a column of {}'.format(name, model.__name__))
+            self._column_index[name] = len(self.columns)
+            self.columns.append(attribute)
+
+        return self._column_index[name]
+
+    @classmethod
+    def compile(cls, schema, model, extra_columns: Tuple[str, ...] = ()) -> Optional['CompiledSchema']:
+        """Compile a schema instance, as returned by ``compute_schema``.
+
+        Args:
+            schema (marshmallow_jsonapi.Schema): The schema instance to compile.
+            model: The SQLAlchemy model which is dumped.
+            extra_columns (Tuple[str, ...]): Other model attributes which should be selected, eg. for a cursor.
+
+        Returns:
+            Optional[CompiledSchema]: The compiled schema, or None if the schema has features which are not supported.
+        """
+        if schema.include_data or schema.opts.inflect is not None or schema.prefix:
+            return None
+
+        compiled = cls(schema.opts.type_)
+        try:
+            schema._update_fields(None, many=True)  # Same field order as Schema.dump()
+            dumped = {}
+
+            for name, field in schema.fields.items():
+                if field.load_only:
+                    continue
+                key = field.dump_to or name
+                encoded_key = encode(key) + ': '
+
+                if type(field) is Relationship:
+                    if field.include_resource_linkage or field.include_data:
+                        return None
+                    links = []
+                    for link, view, view_kwargs in (('self', field.self_view, field.self_view_kwargs),
+                                                    ('related', field.related_view, field.related_view_kwargs)):
+                        if not view:
+                            continue
+                        split = _view_kwargs(view_kwargs)
+                        if split is None:
+                            return None
+                        arguments, attributes = split
+                        links.append((encode(link) + ': ', UrlTemplate(view, arguments),
+                                      tuple(compiled.column(model, a) for a in attributes)))
+                    compiled._plan.append(('relationship', encoded_key, links))
+                elif isinstance(field, BaseRelationship):
+                    return None
+                elif type(field) in SUPPORTED_FIELDS and type(field).serialize is Field.serialize \
+                        and field.attribute is None:
+                    index = compiled.column(model, name)
+                    kind = 'id' if key == 'id' else 'attribute'
+                    compiled._plan.append((kind, encoded_key, index, field._serialize, name, key))
+                    dumped[key] = index
+                else:
+                    return None
+
+            if schema.opts.self_url:
+                split = _view_kwargs(schema.opts.self_url_kwargs or {})
+                if split is None or not all(a in dumped for a in split[1]):
+                    return None
+                compiled._links = (UrlTemplate(schema.opts.self_url, split[0]), tuple(split[1]))
+
+            for name in extra_columns:
+                compiled.column(model, name)
+        except ValueError:
+            return None
+
+        return compiled
+
+    def dump_row(self, row: tuple) -> str:
+        """Encode a single row as a resource object."""
+        members = [self.type_prefix]
+        attributes, relationships = [], []
+        attributes_at = relationships_at = None
+        dumped = {}
+
+        for step in self._plan:
+            kind, key = step[0], step[1]
+            if kind == 'relationship':
+                links = []
+                for link_key, template, indexes in step[2]:
+                    url = template.build(tuple(row[i] for i in indexes))
+                    if url is not None:
+                        links.append(link_key + encode_basestring_ascii(url))
+                if links:
+                    if relationships_at is None:
+                        relationships_at = len(members)
+                        members.append(None)
+                    relationships.append(key + '{"links": {' + ', '.join(links) + '}}')
+                continue
+
+            _, _, index, serialize, name, dump_key = step
+            value = serialize(row[index], name, None)
+            dumped[dump_key] = value
+            if kind == 'id':
+                members.append('"id": ' + encode(value))
+            else:
+                if attributes_at is None:
+                    attributes_at = len(members)
+                    members.append(None)
+                attributes.append(key + encode(value))
+
+        if attributes_at is not None:
+            members[attributes_at] = '"attributes": {' + ', '.join(attributes) + '}'
+        if relationships_at is not None:
+            members[relationships_at] = '"relationships": {' + ', '.join(relationships) + '}'
+
+        if self._links is not None:
+            template, names = self._links
+            url = template.build(tuple(dumped[n] for n in names))
+            members.append('"links": {"self": ' + encode(url) + '}')
+
+        return '{' + ', '.join(members) + '}'
+
+    def dumps(self, rows: List[tuple]) -> str:
+        """Encode rows as the JSON array of resource objects."""
+        return '[' + ', '.join([self.dump_row(row) for row in rows]) + ']'
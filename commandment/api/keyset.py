@@ -0,0 +1,405 @@
+"""
+Keyset pagination and SQL sparse fieldsets for Flask-REST-JSONAPI resource lists.
+
+:class:`KeysetResourceList` accepts these query string parameters in addition to those of ``ResourceList``:
+
+- ``page[after]``: Switch to keyset pagination. Pass an empty value for the first page, then follow the ``next``
+  link, which carries an opaque cursor for the last row of the page. Each page is fetched with a ``WHERE`` on the sort
+  key instead of an ``OFFSET``, so deep pages cost the same as the first. Only ``sort`` values listed in
+  ``KeysetDataLayer.keyset_fields`` may be combined with it, the primary key is always the tie breaker.
+- ``page[count]``: Pass ``0`` to skip the ``COUNT`` query. ``meta.count`` is omitted from the response.
+
+When ``fields[<type>]`` is given, only the requested columns (and the columns needed to build relationship links) are
+selected.
+
+Relationships named by ``include``, and those which the schema dumps anyway (resource linkage, or a plain field of a
+relationship attribute), are eager loaded for the whole page. The loader strategy of each relationship path can be set
+with the ``eagerload`` data layer option, otherwise collections use ``selectinload`` and scalars use ``joinedload``.
+Other relationships are never read while serializing, so listing a page costs the same number of queries whatever its
+size.
+"""
+import base64
+import binascii
+import datetime
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from flask import current_app, request, url_for
+from flask_rest_jsonapi import ResourceList
+from flask_rest_jsonapi.data_layers.alchemy import SqlalchemyDataLayer
+from flask_rest_jsonapi.decorators import check_method_requirements
+from flask_rest_jsonapi.exceptions import BadRequest, InvalidInclude
+from flask_rest_jsonapi.pagination import add_pagination_links
+from flask_rest_jsonapi.querystring import QueryStringManager
+from flask_rest_jsonapi.schema import compute_schema, get_model_field, get_related_schema
+from marshmallow.base import SchemaABC
+from marshmallow.class_registry import get_class
+from marshmallow_jsonapi.fields import Relationship
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, load_only, selectinload, subqueryload
+from sqlalchemy.orm.properties import ColumnProperty, RelationshipProperty
+from urllib.parse import urlencode
+
+from .compiled import CompiledSchema, dumps_document
+
+#: Query string parameters handled here rather than by the QueryStringManager.
+KEYSET_PARAMETERS = ('page[after]', 'page[count]')
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+#: Relationship loader strategies which may be given in the ``eagerload`` data layer option.
+LOADER_STRATEGIES = {'joined': joinedload, 'selectin': selectinload, 'subquery': subqueryload}
+
+_view_kwarg = re.compile(r'^<(\w+)>$')
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode the sort key of a row as an opaque, URL safe cursor."""
+    encoded = [v.strftime(DATETIME_FORMAT) if isinstance(v, datetime.datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(encoded).encode('utf8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor created by `encode_cursor`.
+
+    Raises:
+        BadRequest: If the cursor is not valid.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8'))
+    except (binascii.Error, ValueError, UnicodeError):
+        raise BadRequest('Invalid cursor', source={'parameter': 'page[after]'})
+
+    if not isinstance(values, list):
+        raise BadRequest('Invalid cursor', source={'parameter': 'page[after]'})
+
+    return values
+
+
+def skip_unused_relationships(schema):
+    """Stop relationship fields from reading their attribute when it is not serialized.
+
+    marshmallow-jsonapi reads the attribute of every relationship field even if it only writes links, which lazy loads
+    the relationship of each object. Fields of included schemas are skipped the same way.
+    """
+    for field in schema.fields.values():
+        if not isinstance(field, Relationship):
+            continue
+        if field.include_data:
+            skip_unused_relationships(field.schema)
+        elif not field.include_resource_linkage:
+            field._CHECK_ATTRIBUTE = False
+
+
+def _related_schema(schema, name: str):
+    """Get the class of the related schema of a relationship field, None if it has no schema."""
+    related = get_related_schema(schema, name)
+    if isinstance(related, SchemaABC):
+        return related.__class__
+    if isinstance(related, str):
+        return get_class(related)
+    return related
+
+
+class KeysetDataLayer(SqlalchemyDataLayer):
+    """SQLAlchemy data layer supporting keyset pagination, an optional count and SQL sparse fieldsets.
+
+    Configure with the ``keyset_fields`` data layer option, the schema fields which may be used as a keyset sort key,
+    and the ``eagerload`` option, a dict of relationship paths such as ``'tags'`` or ``'commands.device'`` to the name of
+    a strategy in `LOADER_STRATEGIES`.
+    """
+    keyset_fields: Tuple[str, ...] = ()
+    eagerload: Dict[str, str] = {}
+
+    def loader(self, path: str, attribute, parent=None):
+        """Get the loader option for a relationship path.
+
+        Args:
+            path (str): The dotted path of schema relationship fields from the resource, used to look up the strategy.
+            attribute: The model relationship attribute which is loaded.
+            parent (Optional[Load]): The loader of the parent path, to chain onto.
+
+        Returns:
+            Load: The loader option.
+        """
+        strategy = self.eagerload.get(path)
+        if strategy is None:
+            strategy = 'selectin' if attribute.property.uselist else 'joined'
+
+        if parent is None:
+            return LOADER_STRATEGIES[strategy](attribute)
+        return getattr(parent, LOADER_STRATEGIES[strategy].__name__)(attribute)
+
+    def dumped_loaders(self, schema, model, path: str = '', parent=None) -> list:
+        """Get the loader options for the model relationships which a schema reads without an include.
+
+        Those are relationship fields with resource linkage, and other fields whose attribute is a model relationship.
+        """
+        options = []
+        for name, field in schema._declared_fields.items():
+            if isinstance(field, Relationship) and not field.include_resource_linkage:
+                continue
+            attribute = getattr(model, get_model_field(schema, name), None)
+            if isinstance(getattr(attribute, 'property', None), RelationshipProperty):
+                options.append(self.loader(path + name, attribute, parent))
+
+        return options
+
+    def eagerload_includes(self, query, qs: QueryStringManager):
+        """Eager load the included relationships, and the relationships which are dumped by the schema of the resource
+        or of an included resource.
+
+        Raises:
+            InvalidInclude: If an include path does not name a relationship.
+        """
+        options = self.dumped_loaders(self.resource.schema, self.model)
+
+        for include in qs.include:
+            schema, model, loader, path = self.resource.schema, self.model, None, ''
+            for name in include.split('.'):
+                if schema is None or not isinstance(schema._declared_fields.get(name), Relationship):
+                    raise InvalidInclude('{} is not a relationship which can be included'.format(include))
+                attribute = getattr(model, get_model_field(schema, name))
+                path += name
+                loader = self.loader(path, attribute, loader)
+                schema, model = _related_schema(schema, name), attribute.property.mapper.class_
+                if schema is not None:
+                    options.extend(self.dumped_loaders(schema, model, path + '.', loader))
+                path += '.'
+            options.append(loader)
+
+        if options:
+            query = query.options(*options)
+
+        return query
+
+    def sparse_columns(self, qs: QueryStringManager) -> Optional[list]:
+        """The model attributes required to serialize the requested sparse fieldset, or None for all."""
+        schema = self.resource.schema
+        requested = qs.fields.get(schema.opts.type_)
+        if not requested or qs.include:
+            return None
+
+        names = {get_model_field(schema, name) for name in requested if name in schema._declared_fields
+                 and not isinstance(schema._declared_fields[name], Relationship)}
+        for field in schema._declared_fields.values():  # Attributes referenced by relationship links
+            if isinstance(field, Relationship):
+                for value in list(field.related_view_kwargs.values()) + list(field.self_view_kwargs.values()):
+                    match = _view_kwarg.match(str(value))
+                    if match:
+                        names.add(match.group(1))
+
+        columns = []
+        for name in names:
+            attribute = getattr(self.model, name, None)
+            if attribute is not None and isinstance(getattr(attribute, 'property', None), ColumnProperty):
+                columns.append(attribute)
+
+        return columns
+
+    def keyset_sort(self, qs: QueryStringManager) -> Tuple[Optional[str], bool]:
+        """Get the keyset sort field (None for the primary key only) and whether it is descending."""
+        sorting = qs.sorting
+        if not sorting:
+            return None, False
+
+        if len(sorting) > 1 or sorting[0]['field'] not in self.keyset_fields:
+            raise BadRequest('Keyset pagination can only be sorted by one of: {}'.format(
+                ', '.join(('id',) + tuple(self.keyset_fields))), source={'parameter': 'sort'})
+
+        field = get_model_field(self.resource.schema, sorting[0]['field'])
+        return (None if field == 'id' else field), sorting[0]['order'] == 'desc'
+
+    def keyset_query(self, query, qs: QueryStringManager, after: str):
+        """Order the query by the keyset sort key, and restrict it to the rows after the cursor.
+
+        NULL values of the sort field are ordered before all other values, and the primary key breaks ties. This is
+        the order of an index on the sort field and the primary key, so the database reads each page straight from the
+        index. SQLite and MySQL order NULLs first already, PostgreSQL must be told to, and its index must be created
+        with ``NULLS FIRST``.
+        """
+        field, descending = self.keyset_sort(qs)
+        pk = self.model.id
+
+        if field is None:
+            query = query.order_by(pk.desc() if descending else pk.asc())
+            if after:
+                last_id, = decode_cursor(after)
+                query = query.filter(pk < last_id if descending else pk > last_id)
+        else:
+            column = getattr(self.model, field)
+            ordered = column.desc() if descending else column.asc()
+            if query.session.get_bind(self.model.__mapper__).dialect.name == 'postgresql':
+                ordered = ordered.nullslast() if descending else ordered.nullsfirst()
+
+            query = query.order_by(ordered, pk.desc() if descending else pk.asc())
+
+            if after:
+                value, last_id = decode_cursor(after)
+                if value is not None and column.type.python_type is datetime.datetime:
+                    value = datetime.datetime.strptime(value, DATETIME_FORMAT)
+
+                if descending:
+                    if value is None:
+                        query = query.filter(and_(column.is_(None), pk < last_id))
+                    else:
+                        query = query.filter(or_(column < value, and_(column == value, pk < last_id),
+                                                 column.is_(None)))
+                else:
+                    if value is None:
+                        query = query.filter(or_(and_(column.is_(None), pk > last_id), column.isnot(None)))
+                    else:
+                        query = query.filter(or_(column > value, and_(column == value, pk > last_id)))
+
+        page_size = int(qs.pagination.get('size', 0)) or current_app.config['PAGE_SIZE']
+        return query.limit(page_size)
+
+    def cursor(self, obj, qs: QueryStringManager) -> str:
+        """Get the cursor which continues after ``obj``."""
+        field, _ = self.keyset_sort(qs)
+        if field is None:
+            return encode_cursor([obj.id])
+
+        return encode_cursor([getattr(obj, field), obj.id])
+
+    def get_collection(self, qs: QueryStringManager, view_kwargs: dict, after: Optional[str] = None,
+                       count: bool = True, columns: Optional[list] = None):
+        """Retrieve a collection of objects.
+
+        Args:
+            qs (QueryStringManager): The parsed query string.
+            view_kwargs (dict): kwargs from the resource view.
+            after (Optional[str]): The keyset cursor, an empty string for the first page or None for offset
+                pagination.
+            count (bool): Whether to count the matching rows.
+            columns (Optional[list]): Select these model attributes as row tuples instead of loading objects.
+
+        Returns:
+            Tuple[Optional[int], list]: The number of matching rows, or None if not counted, and the page of objects.
+        """
+        self.before_get_collection(qs, view_kwargs)
+
+        query = self.query(view_kwargs)
+
+        if qs.filters:
+            query = self.filter_query(query, qs.filters, self.model)
+
+        object_count = query.count() if count else None
+
+        if columns is not None:
+            query = query.with_entities(*columns)
+        else:
+            sparse = self.sparse_columns(qs)
+            if sparse is not None and after is not None:  # The cursor is built from the sort key of the last row
+                field, _ = self.keyset_sort(qs)
+                if field is not None:
+                    sparse.append(getattr(self.model, field))
+            if sparse:
+                query = query.options(load_only(*sparse))
+
+            if getattr(self, 'eagerload_includes', True):
+                query = self.eagerload_includes(query, qs)
+
+        if after is None:
+            if qs.sorting:
+                query = self.sort_query(query, qs.sorting)
+            query = self.paginate_query(query, qs.pagination)
+        else:
+            query = self.keyset_query(query, qs, after)
+
+        collection = query.all()
+
+        collection = self.after_get_collection(collection, qs, view_kwargs)
+
+        return object_count, collection
+
+
+class KeysetResourceList(ResourceList):
+    """ResourceList which uses a `KeysetDataLayer`, see the module documentation for the query string parameters.
+
+    Pages are written with a `CompiledSchema` when the schema and query string allow it, unless the
+    ``API_COMPILED_SERIALIZATION`` setting is False.
+    """
+
+    @check_method_requirements
+    def get(self, *args, **kwargs):
+        """Retrieve a collection of objects"""
+        self.before_get(args, kwargs)
+
+        querystring = {k: v for k, v in request.args.items() if k not in KEYSET_PARAMETERS}
+        qs = QueryStringManager(querystring, self.schema)
+        after = request.args.get('page[after]')
+        count = request.args.get('page[count]', '1').lower() not in ('0', 'false')
+
+        schema_kwargs = getattr(self, 'get_schema_kwargs', dict())
+        schema_kwargs.update({'many': True})
+
+        compiled = self.compile_schema(schema_kwargs, qs, after)
+        objects_count, objects = self._data_layer.get_collection(
+            qs, kwargs, after=after, count=count, columns=compiled.columns if compiled is not None else None)
+
+        self.before_marshmallow(args, kwargs)
+
+        if compiled is None:
+            schema = compute_schema(self.schema, schema_kwargs, qs, qs.include)
+            skip_unused_relationships(schema)
+            result = schema.dump(objects).data
+        else:
+            result = {'data': None}
+
+        view_kwargs = request.view_args if getattr(self, 'view_kwargs', None) is True else dict()
+        base_url = url_for(self.view, _external=True, **view_kwargs)
+
+        if after is None:
+            add_pagination_links(result, objects_count or 0, qs, base_url)
+        else:
+            result['links'] = self.keyset_links(base_url, qs, objects)
+
+        if objects_count is not None:
+            result.update({'meta': {'count': objects_count}})
+
+        if compiled is not None:
+            del result['data']
+            result['jsonapi'] = {'version': '1.0'}
+            return dumps_document(compiled.dumps(objects), result), 200
+
+        final_result = self.after_get(result)
+
+        return final_result
+
+    def compile_schema(self, schema_kwargs: dict, qs: QueryStringManager,
+                       after: Optional[str]) -> Optional[CompiledSchema]:
+        """Compile the schema for this request, or return None to serialize through the schema.
+
+        Resources which override the ``before_marshmallow`` or ``after_get`` hooks are never compiled, since those
+        expect the objects and the document respectively.
+        """
+        if not current_app.config.get('API_COMPILED_SERIALIZATION', False) or qs.include:
+            return None
+        if type(self).before_marshmallow is not ResourceList.before_marshmallow or \
+                type(self).after_get is not ResourceList.after_get:
+            return None
+
+        extra_columns = ('id',)
+        if after is not None:
+            field, _ = self._data_layer.keyset_sort(qs)
+            if field is not None:
+                extra_columns += (field,)
+
+        schema = compute_schema(self.schema, dict(schema_kwargs), qs, qs.include)
+        return CompiledSchema.compile(schema, self._data_layer.model, extra_columns)
+
+    def keyset_links(self, base_url: str, qs: QueryStringManager, objects: list) -> dict:
+        """Build the self, first and next links of a keyset paginated response."""
+        args = dict(request.args.items())
+        links = {'self': base_url + '?' + urlencode(args)}
+
+        args['page[after]'] = ''
+        links['first'] = base_url + '?' + urlencode(args)
+
+        page_size = int(qs.pagination.get('size', 0)) or current_app.config['PAGE_SIZE']
+        if objects and len(objects) >= page_size:
+            args['page[after]'] = self._data_layer.cursor(objects[-1], qs)
+            links['next'] = base_url + '?' + urlencode(args)
+
+        return links
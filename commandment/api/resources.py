@@ -14,12 +14,18 @@ from commandment.mdm import commands as mdmcommands, CommandType
 from commandment.auth import oauth2
 
 from flask_rest_jsonapi import ResourceDetail, ResourceList, ResourceRelationship
+from .keyset import KeysetDataLayer, KeysetResourceList
 
 
-class DeviceList(ResourceList):
+class DeviceList(KeysetResourceList):
     # decorators = (oauth2.require_oauth(''),)
     schema = DeviceSchema
-    data_layer = {'session': db.session, 'model': Device}
+    data_layer = {
+        'session': db.session,
+        'model': Device,
+        'class': KeysetDataLayer,
+        'keyset_fields': ('id', 'last_seen'),
+    }
 
 
 class DeviceDetail(ResourceDetail):
@@ -157,11 +163,12 @@ class OrganizationDetail(ResourceDetail):
     }
 
 
-class TagsList(ResourceList):
+class TagsList(KeysetResourceList):
     schema = TagSchema
     data_layer = {
         'session': db.session,
-        'model': Tag
+        'model': Tag,
+        'class': KeysetDataLayer,
     }
     view_kwargs = True
 
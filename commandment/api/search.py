@@ -0,0 +1,129 @@
+"""
+Device search by name, hostname, serial number, UDID or MAC address.
+
+Each whitespace separated term of a query must match part of any of the `SEARCH_COLUMNS`, case insensitively. The
+index which answers the query depends on the database, and is created by the migration which added device search:
+
+- PostgreSQL: A ``pg_trgm`` GIN index on the lower cased concatenation of the columns (`search_text`). It answers
+  substring matches of each term, and ranks the results by trigram similarity, so that a query with a typo still
+  matches devices which are similar enough.
+- SQLite: The ``devices_search`` FTS5 table using the trigram tokenizer, which triggers on ``devices`` keep in sync
+  with every insert, update of a searched column and delete. Results are in device ID order, which lets the index
+  stop at the first matches instead of ranking all of them. Terms shorter than three characters can not be looked up
+  in the index, and are matched against the rows of the other terms.
+- Other databases, or SQLite without FTS5 or older than 3.34 (which added the trigram tokenizer), where the migration
+  does not create ``devices_search``: Each term must be a prefix of a column. Only ``udid`` and ``serial_number`` are
+  indexed.
+
+Because the indexes are maintained by the database, devices written without the ORM, eg. by the DEP sync, are
+searchable as soon as they are committed.
+"""
+from typing import List
+from sqlalchemy import and_, func, literal_column, or_, select, table, column, text
+
+from commandment.models import db, Device
+
+#: Device columns which are searched.
+SEARCH_COLUMNS = (
+    'device_name',
+    'hostname',
+    'local_hostname',
+    'serial_number',
+    'udid',
+    'wifi_mac',
+    'bluetooth_mac',
+)
+
+#: The FTS5 tokenizer can only look up terms of at least this many characters.
+TRIGRAM_LENGTH = 3
+
+devices_search = table('devices_search', column('rowid'), *[column(name) for name in SEARCH_COLUMNS])
+
+
+def search_text():
+    """The expression of the PostgreSQL trigram index, which must match the index definition exactly."""
+    expression = None
+    for name in SEARCH_COLUMNS:
+        value = func.coalesce(getattr(Device, name), literal_column("''"))
+        expression = value if expression is None else expression.op('||')(literal_column("' '")).op('||')(value)
+
+    return func.lower(expression)
+
+
+def _like_escape(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _match_expression(terms: List[str]) -> str:
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _has_fts_table(connection) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'devices_search'")).scalar() is not None
+
+
+def fts_search(terms: List[str], limit: int) -> List[Device]:
+    """Search the SQLite FTS5 table."""
+    indexed = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+    if not indexed:
+        return prefix_search(terms, limit)
+
+    matches = select([devices_search.c.rowid]).where(
+        text('devices_search MATCH :match').bindparams(match=_match_expression(indexed)))
+    for term in terms:
+        if len(term) < TRIGRAM_LENGTH:
+            pattern = '%' + _like_escape(term) + '%'
+            matches = matches.where(or_(*[devices_search.c[name].like(pattern, escape='\\')
+                                          for name in SEARCH_COLUMNS]))
+
+    # Ranking would score every match, but in rowid order the index stops after the first matches
+    matches = matches.order_by(devices_search.c.rowid).limit(limit)
+
+    return db.session.query(Device).filter(Device.id.in_(matches)).order_by(Device.id).all()
+
+
+def trigram_search(terms: List[str], limit: int) -> List[Device]:
+    """Search the PostgreSQL trigram index."""
+    searched = search_text()
+    phrase = ' '.join(terms).lower()
+    contains = and_(*[searched.like('%' + _like_escape(term.lower()) + '%', escape='\\') for term in terms])
+    # The similarity operator is a literal percent sign, which must be escaped for the format paramstyles of psycopg2
+    similar = '%%' if db.session.get_bind(Device.__mapper__).dialect.paramstyle in ('format', 'pyformat') else '%'
+
+    return db.session.query(Device).filter(or_(contains, searched.op(similar)(phrase))).order_by(
+        func.similarity(searched, phrase).desc(), Device.id).limit(limit).all()
+
+
+def prefix_search(terms: List[str], limit: int) -> List[Device]:
+    """Search without an index, matching each term against the start of the columns."""
+    query = db.session.query(Device)
+    for term in terms:
+        pattern = _like_escape(term) + '%'
+        query = query.filter(or_(*[getattr(Device, name).ilike(pattern, escape='\\') for name in SEARCH_COLUMNS]))
+
+    return query.order_by(Device.device_name, Device.id).limit(limit).all()
+
+
+def search_devices(query: str, limit: int = 20) -> List[Device]:
+    """Find the devices matching a search query.
+
+    Args:
+        query (str): Whitespace separated terms which must all match.
+        limit (int): The maximum number of devices to return.
+
+    Returns:
+        List[Device]: The matching devices, ranked by similarity on PostgreSQL, otherwise in device ID or name order.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+
+    connection = db.session.connection(mapper=Device.__mapper__)
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        return trigram_search(terms, limit)
+    if dialect == 'sqlite' and _has_fts_table(connection):
+        return fts_search(terms, limit)
+
+    return prefix_search(terms, limit)
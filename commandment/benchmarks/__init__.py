@@ -0,0 +1,70 @@
+"""
+Benchmark harnesses for the synchronisation paths in Commandment.
+
+Each harness is a module which can be run with ``python -m commandment.benchmarks.<name> --help``. They run against
+an in-process fake of the relevant Apple service so that no network access or simulator container is required,
+but can be pointed at the simulators in ``simulators/`` instead.
+"""
+import os
+import time
+import tracemalloc
+from typing import Dict, Union
+from flask import Flask
+from alembic.command import upgrade
+from alembic.config import Config
+from sqlalchemy import event
+
+from commandment.models import db
+
+
+def create_benchmark_app(database_uri: str) -> Flask:
+    """Create a minimal application with the given database, migrated to the latest revision.
+
+    The full application factory is not used, because it starts background threads which would skew the results.
+    """
+    app = Flask('commandment')
+    app.config.from_object('commandment.default_settings')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    db.init_app(app)
+
+    config = Config()
+    config.set_main_option('script_location', os.path.join(os.path.dirname(__file__), '..', 'alembic'))
+    config.set_main_option('sqlalchemy.url', database_uri)
+    upgrade(config, 'head')
+
+    return app
+
+
+class Measurement(object):
+    """Context manager which measures wall clock time, SQL statements executed and peak traced memory.
+
+    Example:
+        with Measurement(db.engine) as m:
+            do_work()
+
+        print(m.results())
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.queries = 0
+        self.elapsed = 0.0
+        self.peak_memory = 0
+        self._started = None
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        tracemalloc.start()
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.monotonic() - self._started
+        _, self.peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def results(self) -> Dict[str, Union[int, float]]:
+        return {'elapsed': self.elapsed, 'queries': self.queries, 'peak_memory': self.peak_memory}
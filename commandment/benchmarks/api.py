@@ -0,0 +1,169 @@
+"""
+Measure how many resource objects per second the JSON:API list endpoints serialize.
+
+Every page of each endpoint is fetched with keyset pagination, once serialized through the marshmallow-jsonapi schema
+and once through :class:`commandment.api.compiled.CompiledSchema`, and the responses are compared::
+
+    python -m commandment.benchmarks.api --devices 10000 --applications 20 --page-size 1000
+
+The endpoints are requested through the Flask test client without authentication.
+"""
+import argparse
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+from uuid import UUID
+from flask import Flask
+
+from commandment.api.app_jsonapi import api
+from commandment.benchmarks import create_benchmark_app, Measurement
+from commandment.dep.app import dep_app
+from commandment.inventory import catalog
+from commandment.inventory.models import installed_applications
+from commandment.mdm import CommandStatus
+from commandment.models import db, Device, Command
+
+parser = argparse.ArgumentParser(description='Benchmark JSON:API list serialization')
+parser.add_argument('--devices', type=int, default=10000, help='Number of devices')
+parser.add_argument('--applications', type=int, default=20, help='Installed applications per device')
+parser.add_argument('--commands', type=int, default=5, help='Commands per device')
+parser.add_argument('--page-size', type=int, default=1000, help='page[size] of each request')
+parser.add_argument('--database', help='SQLAlchemy database URI, defaults to a temporary SQLite file')
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ('/v1/devices', '/v1/installed_applications', '/v1/commands')
+
+
+def seed(device_count: int, applications: int, commands: int, batch_size: int = 1000):
+    """Insert devices, each with some installed applications and commands."""
+    started = datetime(2019, 6, 1)
+    version_ids = catalog.application_version_ids([{
+        'bundle_identifier': 'com.example.app{}'.format(a),
+        'name': 'Application {}'.format(a),
+        'short_version': '1.{}'.format(a),
+        'version': '1.{}.0'.format(a),
+        'bundle_size': 1024 * a,
+    } for a in range(applications)])
+    for offset in range(0, device_count, batch_size):
+        end = min(offset + batch_size, device_count)
+        db.session.bulk_insert_mappings(Device, [{
+            'id': i + 1,
+            'udid': '{:08X}-0000-0000-0000-000000000000'.format(i),
+            'serial_number': 'C02{:09d}'.format(i),
+            'device_name': 'Device {}'.format(i),
+            'model_name': 'MacBook Pro',
+            'os_version': '10.14.5',
+            'last_seen': started + timedelta(seconds=i),
+            'battery_level': (i % 100) / 100.0,
+            'device_capacity': 500.0,
+            'available_device_capacity': 120.5,
+            'is_dep': i % 2 == 0,
+            'passcode_present': True,
+        } for i in range(offset, end)])
+        db.session.execute(installed_applications.insert(), [{
+            'device_id': i + 1,
+            'device_udid': '{:08X}-0000-0000-0000-000000000000'.format(i),
+            'application_version_id': version_ids[a],
+            'is_validated': True,
+        } for i in range(offset, end) for a in range(applications)])
+        db.session.bulk_insert_mappings(Command, [{
+            'device_id': i + 1,
+            'request_type': 'DeviceInformation',
+            'uuid': UUID(int=i * commands + c),
+            'status': CommandStatus.Acknowledged,
+            'queued_at': started,
+            'sent_at': started,
+            'acknowledged_at': started,
+            'ttl': 5,
+        } for i in range(offset, end) for c in range(commands)])
+
+    db.session.commit()
+
+
+def fetch_all(app: Flask, endpoint: str, page_size: int) -> List[bytes]:
+    """Fetch every page of an endpoint by following the next links."""
+    client = app.test_client()
+    url = '{}?page[after]=&page[count]=0&page[size]={}'.format(endpoint, page_size)
+    pages = []
+    while url is not None:
+        response = client.get(url, content_type='application/vnd.api+json')
+        assert response.status_code == 200, response.data
+        pages.append(response.data)
+        url = response.get_json(force=True)['links'].get('next')
+
+    return pages
+
+
+def run(device_count: int, applications: int = 20, commands: int = 5, page_size: int = 1000,
+        database_uri: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Union[int, float]]]]:
+    """Serialize every endpoint with both methods.
+
+    Args:
+        device_count (int): The number of devices to create.
+        applications (int): The number of installed applications per device.
+        commands (int): The number of commands per device.
+        page_size (int): The number of resource objects per page.
+        database_uri (str): The database to use. It must be empty.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, Union[int, float]]]]: The measurement of each method, keyed by endpoint then
+            method name.
+    """
+    fd, path = None, None
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        database_uri = 'sqlite:///{}'.format(path)
+
+    results = {}
+    try:
+        app = create_benchmark_app(database_uri)
+        api.init_app(app)
+        app.register_blueprint(dep_app)  # DEP profile links of devices
+
+        with app.app_context():
+            seed(device_count, applications, commands)
+            rows = {'/v1/devices': device_count, '/v1/installed_applications': device_count * applications,
+                    '/v1/commands': device_count * commands}
+
+            for endpoint in ENDPOINTS:
+                results[endpoint] = {}
+                pages = {}
+                for name, compiled in (('schema', False), ('compiled', True)):
+                    app.config['API_COMPILED_SERIALIZATION'] = compiled
+                    with Measurement(db.engine) as m:
+                        pages[name] = fetch_all(app, endpoint, page_size)
+
+                    results[endpoint][name] = m.results()
+                    results[endpoint][name]['rows'] = rows[endpoint]
+                    results[endpoint][name]['per_second'] = rows[endpoint] / m.elapsed if m.elapsed else 0.0
+
+                results[endpoint]['compiled']['identical'] = pages['schema'] == pages['compiled']
+
+            db.session.remove()
+
+        return results
+    finally:
+        if path is not None:
+            os.close(fd)
+            os.unlink(path)
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print('{:>28} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+        'endpoint', 'method', 'rows', 'seconds', 'rows/sec', 'identical'))
+
+    results = run(args.devices, args.applications, args.commands, args.page_size, args.database)
+    for endpoint, methods in results.items():
+        for name, r in methods.items():
+            print('{:>28} {:>8} {:>10} {:>10.2f} {:>10.0f} {:>10}'.format(
+                endpoint, name, r['rows'], r['elapsed'], r['per_second'], str(r.get('identical', ''))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Measure how many device certificates the internal CA issues per second.
+
+Compares signing with the `CertificateAuthority` model, which parses the CA private key and increments the serial
+column for every certificate, with the cached :class:`commandment.pki.ca.CASigner`, from one or more threads::
+
+    python -m commandment.benchmarks.ca --certificates 1000 --threads 1 4
+
+Certificate signing requests are generated up front, so key generation is not part of the measurement.
+"""
+import argparse
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.x509 import NameOID
+
+from commandment.benchmarks import create_benchmark_app, Measurement
+from commandment.models import db
+from commandment.pki.ca import get_signer
+from commandment.pki.keypool import generate_private_key
+from commandment.pki.models import CertificateAuthority
+
+parser = argparse.ArgumentParser(description='Benchmark internal CA certificate issuance')
+parser.add_argument('--certificates', type=int, default=1000, help='Number of certificates to issue per run')
+parser.add_argument('--threads', type=int, nargs='+', default=[1, 4], help='Signing threads, one run per count')
+parser.add_argument('--block-size', type=int, default=100, help='PKI_SERIAL_BLOCK_SIZE for the signer')
+parser.add_argument('--database', help='SQLAlchemy database URI, defaults to a temporary SQLite file per run')
+
+logger = logging.getLogger(__name__)
+
+
+def make_requests(count: int) -> List[x509.CertificateSigningRequest]:
+    """Create ``count`` certificate signing requests, all for the same key."""
+    private_key = generate_private_key()
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'device-identity')])
+
+    return [x509.CertificateSigningRequestBuilder().subject_name(name).sign(
+        private_key, hashes.SHA256(), default_backend()) for _ in range(count)]
+
+
+def run(requests: List[x509.CertificateSigningRequest], threads: int = 1, block_size: int = 100,
+        database_uri: Optional[str] = None) -> Dict[str, Dict[str, Union[int, float]]]:
+    """Sign every request with the model, then with the signer.
+
+    Args:
+        requests (List[x509.CertificateSigningRequest]): The requests to sign.
+        threads (int): The number of signing threads.
+        block_size (int): The number of serial numbers reserved at a time by the signer.
+        database_uri (str): The database to use. It must be empty.
+
+    Returns:
+        Dict[str, Dict[str, Union[int, float]]]: The measurement of each method, keyed by name.
+    """
+    fd, path = None, None
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        database_uri = 'sqlite:///{}'.format(path)
+
+    results = {}
+    try:
+        app = create_benchmark_app(database_uri)
+        app.config['PKI_SERIAL_BLOCK_SIZE'] = block_size
+
+        with app.app_context():
+            ca_id = CertificateAuthority.create().id
+            db.session.remove()
+
+            def sign_with_model(request: x509.CertificateSigningRequest) -> x509.Certificate:
+                with app.app_context():
+                    ca = db.session.query(CertificateAuthority).get(ca_id)
+                    certificate = ca.sign(request)
+                    db.session.commit()
+                    db.session.remove()
+                    return certificate
+
+            signer = get_signer()
+
+            for name, sign in (('model', sign_with_model), ('signer', signer.sign)):
+                with Measurement(db.engine) as m:
+                    with ThreadPoolExecutor(max_workers=threads) as executor:
+                        serials = {c.serial_number for c in executor.map(sign, requests)}
+
+                results[name] = m.results()
+                results[name]['unique_serials'] = len(serials)
+                results[name]['per_second'] = len(requests) / m.elapsed if m.elapsed else 0.0
+
+            db.session.remove()
+
+        return results
+    finally:
+        if path is not None:
+            os.close(fd)
+            os.unlink(path)
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    requests = make_requests(args.certificates)
+
+    print('{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+        'threads', 'method', 'seconds', 'certs/sec', 'queries', 'unique'))
+
+    for threads in args.threads:
+        for name, r in run(requests, threads, args.block_size, args.database).items():
+            print('{:>8} {:>8} {:>10.2f} {:>10.0f} {:>10} {:>10}'.format(
+                threads, name, r['elapsed'], r['per_second'], r['queries'], r['unique_serials']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure the bind and result processing of the column types in :mod:`commandment.dbtypes`.
+
+The processors which SQLAlchemy would call for each row are called directly, without a database, so that only the
+cost of the conversion is measured. Results are reported in seconds per million values::
+
+    python -m commandment.benchmarks.dbtypes --rows 200000
+
+For comparison, ``eager`` is the previous implementation which constructed a `uuid.UUID` for every row, and ``stdlib``
+is the standard library json module.
+"""
+import argparse
+import datetime
+import json
+import time
+import uuid
+from typing import Callable, Dict, List
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from commandment import dbtypes
+
+parser = argparse.ArgumentParser(description='Benchmark column type processing')
+parser.add_argument('--rows', type=int, default=200000, help='Number of values converted by each measurement')
+
+#: A typical command parameters document.
+PARAMETERS = {
+    'Queries': ['UDID', 'DeviceName', 'OSVersion', 'BuildVersion', 'ModelName', 'Model', 'ProductName',
+                'SerialNumber', 'DeviceCapacity', 'AvailableDeviceCapacity', 'BatteryLevel', 'WiFiMAC'],
+    'ManagementFlags': 1,
+    'ManifestURL': 'https://mdm.example.com/manifests/com.example.app.plist',
+    'Options': {'NotManaged': False, 'PurchaseMethod': 1},
+    'queued_at': datetime.datetime(2019, 6, 20, 10, 31, 47, 902114),
+}
+
+
+def _eager_uuid(value: str) -> uuid.UUID:
+    return uuid.UUID(value)
+
+
+def _stdlib_dumps(value) -> str:
+    return json.dumps(value, separators=(',', ':'), default=dbtypes.json_datetime_serializer)
+
+
+def _time(fn: Callable, values: List) -> float:
+    started = time.perf_counter()
+    for value in values:
+        fn(value)
+
+    return (time.perf_counter() - started) * 1000000 / len(values)
+
+
+def run(rows: int = 200000) -> Dict[str, float]:
+    """Time each conversion.
+
+    Args:
+        rows (int): The number of values converted by each measurement.
+
+    Returns:
+        Dict[str, float]: The seconds per million values of each conversion.
+    """
+    uuids = [uuid.uuid4() for _ in range(rows)]
+    sqlite_dialect, postgresql_dialect = sqlite.dialect(), postgresql.dialect()
+
+    char, binary = dbtypes.GUID(), dbtypes.GUID(binary=True)
+    hex_values = [char.process_bind_param(u, sqlite_dialect) for u in uuids]
+    binary_values = [binary.process_bind_param(u, sqlite_dialect) for u in uuids]
+    dashed_values = [str(u) for u in uuids]
+
+    json_type = dbtypes.JSONEncodedDict()
+    documents = [dict(PARAMETERS, CommandUUID=str(u)) for u in uuids]
+    encoded = [json_type.process_bind_param(d, sqlite_dialect) for d in documents]
+
+    return {
+        'guid bind char(32)': _time(lambda v: char.process_bind_param(v, sqlite_dialect), uuids),
+        'guid bind char(32) from str': _time(lambda v: char.process_bind_param(v, sqlite_dialect), dashed_values),
+        'guid bind binary(16)': _time(lambda v: binary.process_bind_param(v, sqlite_dialect), uuids),
+        'guid result eager': _time(_eager_uuid, hex_values),
+        'guid result char(32)': _time(lambda v: char.process_result_value(v, sqlite_dialect), hex_values),
+        'guid result binary(16)': _time(lambda v: binary.process_result_value(v, sqlite_dialect), binary_values),
+        'guid result postgresql': _time(lambda v: char.process_result_value(v, postgresql_dialect), dashed_values),
+        'guid result + str()': _time(lambda v: str(char.process_result_value(v, sqlite_dialect)), hex_values),
+        'json bind stdlib': _time(_stdlib_dumps, documents),
+        'json bind': _time(lambda v: json_type.process_bind_param(v, sqlite_dialect), documents),
+        'json result stdlib': _time(json.loads, encoded),
+        'json result': _time(lambda v: json_type.process_result_value(v, sqlite_dialect), encoded),
+    }
+
+
+def main():
+    args = parser.parse_args()
+    results = run(args.rows)
+
+    print('JSON backend: {}'.format('orjson' if dbtypes.orjson is not None else 'json'))
+    print('{:>28} {:>14}'.format('conversion', 's / 1M rows'))
+    for name, seconds in results.items():
+        print('{:>28} {:>14.3f}'.format(name, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure how fast DEP fetch pages are ingested by :func:`commandment.dep.threads.dep_fetch_devices`.
+
+Runs a full fetch for each requested fleet size, against a fresh database, and reports devices per second, the number
+of SQL statements issued and the peak memory traced during the fetch::
+
+    python -m commandment.benchmarks.dep --devices 10000 100000 500000
+
+By default the DEP service is faked in-process by :class:`commandment.benchmarks.depsim.DEPSimulatorAdapter`.
+Use ``--url http://localhost:8080`` to run against a depsim container instead, in which case the fleet size is
+determined by the simulator configuration.
+"""
+import argparse
+import logging
+import os
+import tempfile
+from typing import Dict, Optional, Union
+import requests
+
+from commandment.benchmarks import create_benchmark_app, Measurement
+from commandment.benchmarks.depsim import DEPSimulatorAdapter
+from commandment.dep.dep import DEP
+from commandment.dep.models import DEPAccount
+from commandment.dep.threads import dep_fetch_devices, dep_device_mapping
+from commandment.models import db, Device
+
+parser = argparse.ArgumentParser(description='Benchmark DEP device fetch ingestion')
+parser.add_argument('--devices', type=int, nargs='+', default=[10000, 100000, 500000],
+                    help='Fleet sizes to fetch, one run per size')
+parser.add_argument('--existing', type=float, default=0.0,
+                    help='Fraction of the fleet which already exists in the database before the fetch (0.0 - 1.0)')
+parser.add_argument('--page-size', type=int, default=DEP.MaxPageSize, help='DEP_PAGE_SIZE for the fetch')
+parser.add_argument('--database', help='SQLAlchemy database URI, defaults to a temporary SQLite file per run')
+parser.add_argument('--url', help='Use a depsim simulator at this URL instead of the in-process fake')
+
+logger = logging.getLogger(__name__)
+
+
+def seed_devices(adapter: DEPSimulatorAdapter, count: int):
+    """Insert ``count`` devices which are also present in the fake DEP fleet."""
+    for offset in range(0, count, DEP.MaxPageSize):
+        end = min(offset + DEP.MaxPageSize, count)
+        db.session.bulk_insert_mappings(Device, [dep_device_mapping(adapter.device(i)) for i in range(offset, end)])
+
+    db.session.commit()
+
+
+def run(device_count: int, existing: float = 0.0, page_size: int = DEP.MaxPageSize,
+        database_uri: Optional[str] = None, url: Optional[str] = None) -> Dict[str, Union[int, float]]:
+    """Run a single fetch benchmark.
+
+    Args:
+        device_count (int): The number of devices in the fake DEP fleet.
+        existing (float): The fraction of the fleet to insert before fetching, to exercise the update path.
+        page_size (int): The DEP page size.
+        database_uri (str): The database to use. It must be empty.
+        url (str): The URL of a depsim simulator, if not using the in-process fake.
+
+    Returns:
+        Dict[str, Union[int, float]]: Sync statistics combined with the measurement.
+    """
+    fd, path = None, None
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        database_uri = 'sqlite:///{}'.format(path)
+
+    try:
+        app = create_benchmark_app(database_uri)
+        app.config['DEP_PAGE_SIZE'] = page_size
+
+        with app.app_context():
+            if url is None:
+                dep = DEP('consumer_key', 'consumer_secret', 'access_token', 'access_secret',
+                          url=DEPSimulatorAdapter.URL)
+                adapter = DEPSimulatorAdapter(device_count=device_count)
+                adapter.mount(dep)
+                seed_devices(adapter, int(device_count * existing))
+            else:
+                token = requests.get('{}/token'.format(url)).json()
+                dep = DEP(token['consumer_key'], token['consumer_secret'], token['access_token'],
+                          token['access_secret'], url=url)
+
+            account = DEPAccount(consumer_key='consumer_key', consumer_secret='consumer_secret',
+                                 access_token='access_token', access_secret='access_secret')
+            db.session.add(account)
+            db.session.commit()
+
+            with Measurement(db.engine) as m:
+                stats = dep_fetch_devices(app, dep, account.id)
+
+            db.session.remove()
+
+        results = dict(stats)
+        results.update(m.results())
+        results['devices_per_second'] = stats['devices'] / m.elapsed if m.elapsed else 0.0
+        return results
+    finally:
+        if path is not None:
+            os.close(fd)
+            os.unlink(path)
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print('{:>10} {:>8} {:>10} {:>12} {:>10} {:>14}'.format(
+        'devices', 'pages', 'seconds', 'devices/sec', 'queries', 'peak memory'))
+
+    for device_count in args.devices:
+        r = run(device_count, args.existing, args.page_size, args.database, args.url)
+        print('{:>10} {:>8} {:>10.2f} {:>12.0f} {:>10} {:>11.1f} MB'.format(
+            r['devices'], r['pages'], r['elapsed'], r['devices_per_second'], r['queries'],
+            r['peak_memory'] / (1024 * 1024)))
+
+
+if __name__ == '__main__':
+    main()
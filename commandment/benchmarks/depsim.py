@@ -0,0 +1,201 @@
+"""
+In-process fake of the DEP service, with the same API as the depsim simulator.
+
+The fake is a requests transport adapter. Mount it on the session of a :class:`commandment.dep.dep.DEP` instance and
+requests for the simulator URL never leave the process::
+
+    dep = DEP('ck', 'cs', 'at', 'as', url=DEPSimulatorAdapter.URL)
+    DEPSimulatorAdapter(device_count=10000).mount(dep)
+
+Device records are generated on demand from their index, so very large fleets do not need to be held in memory.
+"""
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from commandment.dep.dep import DEP
+
+
+class DEPSimulatorAdapter(BaseAdapter):
+    """Serve DEP service endpoints from memory.
+
+    Args:
+        device_count (int): The number of devices assigned to the fake MDM server.
+        sync_count (int): The number of 'modified' events returned by the first sync after a completed fetch.
+
+    Attributes:
+        requests (Dict[str, int]): The number of requests received, keyed by "METHOD /path".
+        profiles (Dict[str, dict]): Profiles defined through the fake, keyed by profile UUID.
+        assignments (Dict[str, str]): The profile UUID assigned to each serial number.
+        faults (List[Tuple[int, dict]]): Responses (status code, headers) returned instead of handling the next
+            requests, in order. The ``/session`` endpoint is never faulted. See :meth:`fail_next`.
+    """
+    URL = 'http://depsim.invalid'
+
+    def __init__(self, device_count: int = 500, sync_count: int = 0):
+        super(DEPSimulatorAdapter, self).__init__()
+        self.device_count = device_count
+        self.sync_count = sync_count
+        self.requests: Dict[str, int] = {}
+        self.profiles: Dict[str, dict] = {}
+        self.assignments: Dict[str, str] = {}
+        self.faults: List[Tuple[int, dict]] = []
+        self._token = uuid.uuid4().hex
+
+    def fail_next(self, status_code: int, count: int = 1, retry_after: Optional[str] = None):
+        """Respond to the next ``count`` requests with an error, optionally with a ``Retry-After`` header.
+
+        A 401 also invalidates the current session token, as if it had expired.
+        """
+        headers = {'Retry-After': retry_after} if retry_after is not None else {}
+        self.faults.extend([(status_code, headers)] * count)
+
+    def mount(self, dep: DEP):
+        """Route all requests made by a DEP client for `DEPSimulatorAdapter.URL` to this adapter."""
+        dep._session.mount(self.URL, self)
+
+    @staticmethod
+    def serial_number(index: int) -> str:
+        """The serial number of the device at ``index``."""
+        return 'C02{:09d}'.format(index)
+
+    def device(self, index: int, op_type: Optional[str] = None) -> dict:
+        serial_number = self.serial_number(index)
+        d = {
+            'serial_number': serial_number,
+            'model': 'MacBook Pro',
+            'description': 'MBP 13.3 SPACE GRAY',
+            'color': 'SPACE GRAY',
+            'asset_tag': 'ASSET{}'.format(index),
+            'os': 'OSX',
+            'device_family': 'Mac',
+            'profile_status': 'empty',
+            'device_assigned_by': 'benchmark@localhost',
+            'device_assigned_date': '2019-01-01T00:00:00Z',
+        }
+        if serial_number in self.assignments:
+            d['profile_status'] = 'assigned'
+            d['profile_uuid'] = self.assignments[serial_number]
+            d['profile_assign_time'] = '2019-01-02T00:00:00Z'
+
+        if op_type is not None:
+            d['op_type'] = op_type
+            d['op_date'] = '2019-01-03T00:00:00Z'
+
+        return d
+
+    def fetch_devices(self, body: dict) -> dict:
+        offset = int(body.get('cursor') or 0)
+        limit = min(int(body.get('limit') or 100), DEP.MaxPageSize)
+        end = min(offset + limit, self.device_count)
+
+        return {
+            'devices': [self.device(i) for i in range(offset, end)],
+            'cursor': str(end),
+            'more_to_follow': end < self.device_count,
+            'fetched_until': '2019-01-03T00:00:00Z',
+        }
+
+    def sync_devices(self, body: dict) -> dict:
+        cursor = body.get('cursor') or '0'
+        offset = int(cursor.split(':')[1]) if ':' in cursor else 0
+        limit = min(int(body.get('limit') or 100), DEP.MaxPageSize)
+        end = min(offset + limit, self.sync_count)
+
+        return {
+            'devices': [self.device(i, op_type='modified') for i in range(offset, end)],
+            'cursor': 'sync:{}'.format(end),
+            'more_to_follow': end < self.sync_count,
+            'fetched_until': '2019-01-04T00:00:00Z',
+        }
+
+    def define_profile(self, body: dict) -> dict:
+        profile_uuid = uuid.uuid4().hex.upper()
+        self.profiles[profile_uuid] = body
+        devices = body.get('devices', [])
+        for serial_number in devices:
+            self.assignments[serial_number] = profile_uuid
+
+        return {'profile_uuid': profile_uuid, 'devices': {s: 'SUCCESS' for s in devices}}
+
+    def assign_profile(self, body: dict) -> dict:
+        profile_uuid = body['profile_uuid']
+        if profile_uuid not in self.profiles:
+            return None
+
+        devices = {}
+        for serial_number in body.get('devices', []):
+            self.assignments[serial_number] = profile_uuid
+            devices[serial_number] = 'SUCCESS'
+
+        return {'profile_uuid': profile_uuid, 'devices': devices}
+
+    def remove_profile(self, body: dict) -> dict:
+        devices = {}
+        for serial_number in body.get('devices', []):
+            devices[serial_number] = 'SUCCESS' if self.assignments.pop(serial_number, None) else 'NOT_ACCESSIBLE'
+
+        return {'devices': devices}
+
+    def route(self, method: str, path: str, query: dict, body: dict):
+        """Dispatch a request to the handler for its endpoint.
+
+        Returns:
+            Tuple[int, Optional[dict]]: The status code and JSON body.
+        """
+        if path == '/session':
+            return 200, {'auth_session_token': self._token}
+        elif path == '/account':
+            return 200, {'server_name': 'Benchmark MDM', 'server_uuid': '0' * 32, 'org_name': 'Commandment'}
+        elif path == '/server/devices':
+            return 200, self.fetch_devices(body)
+        elif path == '/devices/sync':
+            return 200, self.sync_devices(body)
+        elif path == '/profile' and method == 'POST':
+            return 200, self.define_profile(body)
+        elif path == '/profile' and method == 'GET':
+            profile_uuid = query.get('profile_uuid', [None])[0]
+            if profile_uuid in self.profiles:
+                return 200, self.profiles[profile_uuid]
+            return 400, None
+        elif path == '/profile/devices' and method == 'POST':
+            result = self.assign_profile(body)
+            return (200, result) if result is not None else (400, None)
+        elif path == '/profile/devices' and method == 'DELETE':
+            return 200, self.remove_profile(body)
+
+        return 404, None
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        url = urlparse(request.url)
+        key = '{} {}'.format(request.method, url.path)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        if self.faults and url.path != '/session':
+            status_code, headers = self.faults.pop(0)
+            content = None
+            if status_code == 401:
+                self._token = uuid.uuid4().hex
+        else:
+            body = json.loads(request.body) if request.body else {}
+            status_code, content = self.route(request.method, url.path, parse_qs(url.query), body)
+            headers = {'X-ADM-Auth-Session': self._token}
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = requests.status_codes._codes[status_code][0].upper()
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json;charset=UTF8'})
+        response.headers.update(headers)
+        response._content = json.dumps(content).encode('utf-8') if content is not None else b''
+
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,120 @@
+"""
+Measure the latency of device search queries.
+
+Devices are inserted in bulk, so the search index is maintained by the database as it would be for the DEP sync, and
+each query is run repeatedly through :func:`commandment.api.search.search_devices`::
+
+    python -m commandment.benchmarks.search --devices 500000 --repeat 20
+
+Pass ``--database`` to measure a PostgreSQL database, which must be empty.
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from commandment.api.search import search_devices
+from commandment.benchmarks import create_benchmark_app
+from commandment.models import db, Device
+
+parser = argparse.ArgumentParser(description='Benchmark device search')
+parser.add_argument('--devices', type=int, default=500000, help='Number of devices')
+parser.add_argument('--repeat', type=int, default=20, help='Times each query is run')
+parser.add_argument('--limit', type=int, default=20, help='Maximum number of results per query')
+parser.add_argument('--database', help='SQLAlchemy database URI, defaults to a temporary SQLite file')
+
+logger = logging.getLogger(__name__)
+
+#: Query name to a function of the number of devices which returns the query.
+QUERIES = {
+    'name': lambda n: 'macbook {}'.format(n // 2),
+    'serial': lambda n: 'C02{:09d}'.format(n // 3)[-7:],
+    'udid prefix': lambda n: '{:08X}'.format(n // 4),
+    'mac': lambda n: _mac(n // 5)[6:],
+    'hostname': lambda n: 'host-{}.corp'.format(n // 6),
+    'no match': lambda n: 'nonexistent',
+}
+
+
+def _mac(i: int) -> str:
+    return ':'.join('{:02x}'.format(b) for b in (0xa4, 0x83, 0xe7, (i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff))
+
+
+def seed(device_count: int, batch_size: int = 10000):
+    """Insert devices with distinct names, serial numbers, UDIDs, MAC addresses and hostnames."""
+    for offset in range(0, device_count, batch_size):
+        db.session.bulk_insert_mappings(Device, [{
+            'udid': '{:08X}-0000-0000-0000-000000000000'.format(i),
+            'serial_number': 'C02{:09d}'.format(i),
+            'device_name': 'MacBook {}'.format(i),
+            'hostname': 'host-{}.corp.example.com'.format(i),
+            'wifi_mac': _mac(i),
+            'failed_push_count': 0,
+        } for i in range(offset, min(offset + batch_size, device_count))])
+        db.session.commit()
+
+
+def run(device_count: int, repeat: int = 20, limit: int = 20,
+        database_uri: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Time each query of `QUERIES`.
+
+    Args:
+        device_count (int): The number of devices to create.
+        repeat (int): The number of times each query is run.
+        limit (int): The maximum number of results per query.
+        database_uri (str): The database to use. It must be empty.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The number of results, and the median and maximum milliseconds of each query.
+    """
+    fd, path = None, None
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        database_uri = 'sqlite:///{}'.format(path)
+
+    results = {}
+    try:
+        app = create_benchmark_app(database_uri)
+
+        with app.app_context():
+            started = time.monotonic()
+            seed(device_count)
+            logger.info('Inserted %d devices in %.1f seconds', device_count, time.monotonic() - started)
+
+            for name, make_query in QUERIES.items():
+                query = make_query(device_count)
+                timings: List[float] = []
+                for _ in range(repeat):
+                    started = time.monotonic()
+                    devices = search_devices(query, limit)
+                    timings.append((time.monotonic() - started) * 1000)
+                    db.session.expunge_all()
+
+                results[name] = {'results': len(devices), 'median_ms': statistics.median(timings),
+                                 'max_ms': max(timings)}
+
+            db.session.remove()
+
+        return results
+    finally:
+        if path is not None:
+            os.close(fd)
+            os.unlink(path)
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    results = run(args.devices, args.repeat, args.limit, args.database)
+
+    print('{:>12} {:>8} {:>10} {:>10}'.format('query', 'results', 'median ms', 'max ms'))
+    for name, r in results.items():
+        print('{:>12} {:>8} {:>10.2f} {:>10.2f}'.format(name, r['results'], r['median_ms'], r['max_ms']))
+
+
+if __name__ == '__main__':
+    main()
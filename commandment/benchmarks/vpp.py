@@ -0,0 +1,153 @@
+"""
+Measure VPP cursor walking, license mirroring, bulk license association and user registration throughput.
+
+Each run seeds the fake VPP service with the requested number of licenses and users, then measures, in order:
+
+- ``walk``: iterating every license with :meth:`commandment.vpp.vpp.VPP.stream_licenses`.
+- ``sync``: mirroring every user and license into the database with :mod:`commandment.vpp.threads`.
+- ``associate``: associating licenses with device serial numbers using :func:`commandment.vpp.planner.execute`.
+- ``register``: registering new users concurrently with :meth:`commandment.vpp.vpp.VPP.register_user`.
+
+For example::
+
+    python -m commandment.benchmarks.vpp --licenses 10000 100000 --users 5000 --latency 0.05
+
+The ``--latency`` option adds a delay to every fake response, which is what makes page prefetching and concurrent
+requests pay off. Use ``--url http://localhost:8080`` to run against a vppsim container instead, in which case the
+amount of data is determined by the simulator.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from commandment.benchmarks import create_benchmark_app, Measurement
+from commandment.benchmarks.vppsim import VPPSimulatorAdapter
+from commandment.models import db
+from commandment.vpp.enum import VPPPricingParam
+from commandment.vpp.models import VPPAccount
+from commandment.vpp.planner import execute, plan
+from commandment.vpp.threads import vpp_sync_licenses, vpp_sync_users
+from commandment.vpp.vpp import VPP
+
+parser = argparse.ArgumentParser(description='Benchmark VPP synchronisation and license management')
+parser.add_argument('--licenses', type=int, nargs='+', default=[10000, 100000],
+                    help='Total number of licenses, one run per count')
+parser.add_argument('--assets', type=int, default=2, help='Number of products the licenses are split between')
+parser.add_argument('--users', type=int, default=1000, help='Number of users registered before the run')
+parser.add_argument('--devices', type=int, default=1000, help='Number of device serial numbers to associate')
+parser.add_argument('--register', type=int, default=200, help='Number of users to register during the run')
+parser.add_argument('--workers', type=int, default=4, help='Concurrent requests for associations and registrations')
+parser.add_argument('--latency', type=float, default=0.0, help='Seconds of simulated latency per fake request')
+parser.add_argument('--database', help='SQLAlchemy database URI, defaults to a temporary SQLite file per run')
+parser.add_argument('--url', help='Use a vppsim simulator at this URL instead of the in-process fake')
+
+logger = logging.getLogger(__name__)
+
+STOKEN = base64.b64encode(json.dumps({
+    'token': 'benchmark', 'expDate': '2030-01-01T00:00:00-0800', 'orgName': 'Benchmark'}).encode()).decode()
+
+
+def _rate(count: int, m: Measurement) -> Dict[str, float]:
+    results = m.results()
+    results['count'] = count
+    results['per_second'] = count / m.elapsed if m.elapsed else 0.0
+    return results
+
+
+def run(license_count: int, asset_count: int = 2, user_count: int = 1000, device_count: int = 1000,
+        register_count: int = 200, max_workers: int = 4, latency: float = 0.0,
+        database_uri: Optional[str] = None, url: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Run every VPP benchmark once.
+
+    Args:
+        license_count (int): The total number of licenses held by the fake service.
+        asset_count (int): The number of products the licenses are split between.
+        user_count (int): The number of users registered with the fake service before the run.
+        device_count (int): The number of serial numbers to associate licenses with.
+        register_count (int): The number of users to register during the run.
+        max_workers (int): The maximum number of concurrent association and registration requests.
+        latency (float): Seconds of simulated latency per fake request.
+        database_uri (str): The database to use. It must be empty.
+        url (str): The URL of a vppsim simulator, if not using the in-process fake.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The measurement for each benchmark, keyed by name.
+    """
+    fd, path = None, None
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        database_uri = 'sqlite:///{}'.format(path)
+
+    results = {}
+    try:
+        app = create_benchmark_app(database_uri)
+
+        with app.app_context():
+            if url is None:
+                adapter = VPPSimulatorAdapter(asset_count=asset_count, licenses_per_asset=license_count // asset_count,
+                                              user_count=user_count, latency=latency)
+                vpp = VPP(STOKEN, service_config=adapter.service_config)
+                adapter.mount(vpp)
+                adam_id = adapter.adam_ids[0]
+            else:
+                vpp = VPP(STOKEN, vpp_service_config_url='{}/VPPServiceConfigSrv'.format(url))
+                adam_id = vpp.assets()['assets'][0]['adamIdStr']
+
+            account = VPPAccount(stoken=STOKEN)
+            db.session.add(account)
+            db.session.commit()
+
+            with Measurement(db.engine) as m:
+                walked = sum(1 for _ in vpp.stream_licenses())
+            results['walk'] = _rate(walked, m)
+
+            with Measurement(db.engine) as m:
+                synced = [vpp_sync_users(vpp, account), vpp_sync_licenses(vpp, account)]
+            results['sync'] = _rate(sum(s['inserted'] + s['updated'] for s in synced), m)
+
+            serial_numbers = {'C02{:09d}'.format(i) for i in range(device_count)}
+            limit = vpp._service_config.get('maxBatchAssociateLicenseCount', 1)
+            batches, _ = plan({adam_id: serial_numbers}, {}, limit, limit, VPPPricingParam.StandardQuality)
+            with Measurement(db.engine) as m:
+                associated = execute(vpp, batches, max_workers)
+            results['associate'] = _rate(sum(1 for r in associated if r['succeeded']), m)
+
+            client_user_ids: List[str] = [str(uuid.uuid4()).upper() for _ in range(register_count)]
+            with Measurement(db.engine) as m:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    replies = list(executor.map(vpp.register_user, client_user_ids))
+            results['register'] = _rate(sum(1 for r in replies if r.get('status') == 0), m)
+
+            db.session.remove()
+
+        return results
+    finally:
+        if path is not None:
+            os.close(fd)
+            os.unlink(path)
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print('{:>10} {:>10} {:>10} {:>10} {:>12} {:>10} {:>14}'.format(
+        'licenses', 'benchmark', 'count', 'seconds', 'per second', 'queries', 'peak memory'))
+
+    for license_count in args.licenses:
+        results = run(license_count, args.assets, args.users, args.devices, args.register, args.workers,
+                      args.latency, args.database, args.url)
+        for name, r in results.items():
+            print('{:>10} {:>10} {:>10} {:>10.2f} {:>12.0f} {:>10} {:>11.1f} MB'.format(
+                license_count, name, r['count'], r['elapsed'], r['per_second'], r['queries'],
+                r['peak_memory'] / (1024 * 1024)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+"""
+In-process fake of the VPP service, covering the endpoints used by :class:`commandment.vpp.vpp.VPP`.
+
+The fake is a requests transport adapter, like :class:`commandment.benchmarks.depsim.DEPSimulatorAdapter`. Build the
+client with the fake's service configuration and mount the fake on it::
+
+    adapter = VPPSimulatorAdapter(asset_count=2, licenses_per_asset=10000, user_count=5000)
+    vpp = VPP('stoken', service_config=adapter.service_config)
+    adapter.mount(vpp)
+
+Licenses are numbered from their asset and position, and are only materialised when their state changes, so large
+license pools do not need to be held in memory. Every change is stamped with a version number, which is what the
+``sinceModifiedToken`` refers to.
+"""
+import json
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from commandment.vpp.vpp import VPP
+
+
+class VPPSimulatorAdapter(BaseAdapter):
+    """Serve VPP service endpoints from memory.
+
+    Args:
+        asset_count (int): The number of products the organisation holds licenses for.
+        licenses_per_asset (int): The number of licenses held for each product.
+        user_count (int): The number of registered users.
+        page_size (int): The number of records returned per page by the licenses and users endpoints.
+        max_batch (int): The maximum number of associations or disassociations accepted per request.
+        latency (float): Seconds to sleep before answering each request, to simulate the network.
+
+    Attributes:
+        requests (Dict[str, int]): The number of requests received, keyed by endpoint.
+    """
+    URL = 'http://vppsim.invalid'
+
+    #: Adam IDs of the products, the first ones are real products so the numbers look familiar.
+    ADAM_IDS = ['408709785', '361309726', '361285480', '409183694', '409201541']
+
+    def __init__(self, asset_count: int = 1, licenses_per_asset: int = 1000, user_count: int = 0,
+                 page_size: int = 600, max_batch: int = 500, latency: float = 0.0):
+        super(VPPSimulatorAdapter, self).__init__()
+        self.asset_count = asset_count
+        self.licenses_per_asset = licenses_per_asset
+        self.page_size = page_size
+        self.max_batch = max_batch
+        self.latency = latency
+        self.requests: Dict[str, int] = {}
+
+        self.version = 0
+        self._lock = threading.Lock()
+        self._licenses: Dict[int, dict] = {}  # Only licenses which have been associated at some point
+        self._license_versions: Dict[int, int] = {}
+        self._next_free: Dict[str, int] = {adam_id: 0 for adam_id in self.adam_ids}
+        self._released: Dict[str, List[int]] = {adam_id: [] for adam_id in self.adam_ids}
+        self._by_serial: Dict[Tuple[str, str], int] = {}
+        self._users: Dict[int, dict] = {}
+        self._user_versions: Dict[int, int] = {}
+
+        for i in range(user_count):
+            self.register_user({'clientUserIdStr': str(uuid.UUID(int=i + 1)).upper(),
+                                'email': 'user{}@localhost'.format(i)})
+
+    @property
+    def adam_ids(self) -> List[str]:
+        return [self.ADAM_IDS[i] if i < len(self.ADAM_IDS) else str(500000000 + i) for i in range(self.asset_count)]
+
+    @property
+    def service_config(self) -> dict:
+        """The service configuration, as returned by VPPServiceConfigSrv."""
+        return {
+            'associateLicenseSrvUrl': self.URL + '/associateVPPLicenseSrv',
+            'disassociateLicenseSrvUrl': self.URL + '/disassociateVPPLicenseSrv',
+            'editUserSrvUrl': self.URL + '/editVPPUserSrv',
+            'getLicensesSrvUrl': self.URL + '/getVPPLicensesSrv',
+            'getUserSrvUrl': self.URL + '/getVPPUserSrv',
+            'getUsersSrvUrl': self.URL + '/getVPPUsersSrv',
+            'getVPPAssetsSrvUrl': self.URL + '/getVPPAssetsSrv',
+            'manageVPPLicensesByAdamIdSrvUrl': self.URL + '/manageVPPLicensesByAdamIdSrv',
+            'maxBatchAssociateLicenseCount': self.max_batch,
+            'maxBatchDisassociateLicenseCount': self.max_batch,
+            'registerUserSrvUrl': self.URL + '/registerVPPUserSrv',
+            'retireUserSrvUrl': self.URL + '/retireVPPUserSrv',
+            'status': 0,
+        }
+
+    def mount(self, vpp: VPP):
+        """Route all requests made by a VPP client for `VPPSimulatorAdapter.URL` to this adapter."""
+        vpp._session.mount(self.URL, self)
+
+    @staticmethod
+    def error(number: int, message: str) -> dict:
+        return {'status': -1, 'errorNumber': number, 'errorMessage': message}
+
+    def _bump(self) -> int:
+        self.version += 1
+        return self.version
+
+    def license_id(self, adam_index: int, position: int) -> int:
+        return adam_index * self.licenses_per_asset + position + 1
+
+    def license(self, license_id: int) -> dict:
+        """The current state of a license, whether or not it was ever materialised."""
+        if license_id in self._licenses:
+            return self._licenses[license_id]
+
+        adam_index = (license_id - 1) // self.licenses_per_asset
+        return {
+            'licenseId': license_id,
+            'licenseIdStr': str(license_id),
+            'adamIdStr': self.adam_ids[adam_index],
+            'productTypeId': 8,
+            'productTypeName': 'Application',
+            'pricingParam': 'STDQ',
+            'isIrrevocable': False,
+            'status': 'Available',
+        }
+
+    def _page(self, kind: str, ids: List[int], offset: int, make, extra_token: str) -> dict:
+        end = min(offset + self.page_size, len(ids))
+        reply = {
+            'status': 0,
+            kind: [make(i) for i in ids[offset:end]],
+            'totalCount': len(ids),
+            'batchCount': end - offset,
+        }
+        if end < len(ids):
+            reply['batchToken'] = '{}:{}'.format(extra_token, end)
+        else:
+            reply['sinceModifiedToken'] = 'v{}'.format(self.version)
+
+        return reply
+
+    @staticmethod
+    def _parse_tokens(body: dict) -> Tuple[str, int]:
+        """Return the query (encoded in the batch token, or new) and the offset to continue from."""
+        if body.get('batchToken'):
+            query, _, offset = body['batchToken'].rpartition(':')
+            return query, int(offset)
+
+        return '', 0
+
+    def get_licenses(self, body: dict) -> dict:
+        query, offset = self._parse_tokens(body)
+        if not query:
+            since = body.get('sinceModifiedToken')
+            adam_id = str(body['adamId']) if body.get('adamId') is not None else ''
+            assigned = '1' if body.get('assignedOnly') else ''
+            query = '{}|{}|{}'.format(since[1:] if since else '', adam_id, assigned)
+
+        since, adam_id, assigned = query.split('|')
+        if since:
+            ids = sorted(i for i, v in self._license_versions.items() if v > int(since))
+        elif assigned:
+            ids = sorted(i for i, l in self._licenses.items() if l['status'] == 'Associated')
+        else:
+            indexes = range(self.asset_count)
+            ids = [self.license_id(a, p) for a in indexes for p in range(self.licenses_per_asset)]
+
+        if adam_id:
+            ids = [i for i in ids if self.license(i)['adamIdStr'] == adam_id]
+
+        return self._page('licenses', ids, offset, self.license, query)
+
+    def get_users(self, body: dict) -> dict:
+        query, offset = self._parse_tokens(body)
+        if not query:
+            since = body.get('sinceModifiedToken')
+            query = '{}|{}'.format(since[1:] if since else '', '1' if body.get('includeRetired') else '')
+
+        since, include_retired = query.split('|')
+        ids = sorted(i for i, v in self._user_versions.items() if not since or v > int(since))
+        if not include_retired:
+            ids = [i for i in ids if self._users[i]['status'] != 'Retired']
+
+        return self._page('users', ids, offset, lambda i: self._users[i], query)
+
+    def get_assets(self, body: dict) -> dict:
+        assets = []
+        for adam_id in self.adam_ids:
+            assigned = sum(1 for (a, _) in self._by_serial if a == adam_id)
+            assets.append({
+                'adamIdStr': adam_id,
+                'pricingParam': 'STDQ',
+                'productTypeId': 8,
+                'productTypeName': 'Application',
+                'isIrrevocable': False,
+                'deviceAssignable': True,
+                'totalCount': self.licenses_per_asset,
+                'assignedCount': assigned,
+                'availableCount': self.licenses_per_asset - assigned,
+                'retiredCount': 0,
+            })
+
+        return {'status': 0, 'assets': assets}
+
+    def manage_licenses(self, body: dict) -> dict:
+        adam_id = str(body.get('adamIdStr'))
+        if adam_id not in self._next_free:
+            return self.error(9610, 'License not found')
+
+        associate = body.get('associateSerialNumbers') or []
+        disassociate = body.get('disassociateSerialNumbers') or []
+        if len(associate) > self.max_batch or len(disassociate) > self.max_batch:
+            return self.error(9632, 'Too many serial numbers in a single request')
+
+        adam_index = self.adam_ids.index(adam_id)
+        reply = {'status': 0, 'adamIdStr': adam_id, 'pricingParam': 'STDQ'}
+
+        disassociations = []
+        for serial_number in disassociate:
+            license_id = self._by_serial.pop((adam_id, serial_number), None)
+            if license_id is None:
+                disassociations.append({'serialNumber': serial_number, 'errorNumber': 9618,
+                                        'errorMessage': 'License not associated'})
+                continue
+
+            self._licenses[license_id] = self.license(license_id)
+            self._licenses[license_id] = dict(self._licenses[license_id], status='Available')
+            self._licenses[license_id].pop('serialNumber', None)
+            self._license_versions[license_id] = self._bump()
+            self._released[adam_id].append(license_id)
+            disassociations.append({'serialNumber': serial_number, 'licenseIdStr': str(license_id)})
+
+        associations = []
+        for serial_number in associate:
+            license_id = self._by_serial.get((adam_id, serial_number))
+            if license_id is None:
+                if self._released[adam_id]:
+                    license_id = self._released[adam_id].pop(0)
+                elif self._next_free[adam_id] < self.licenses_per_asset:
+                    license_id = self.license_id(adam_index, self._next_free[adam_id])
+                    self._next_free[adam_id] += 1
+                else:
+                    associations.append({'serialNumber': serial_number, 'errorNumber': 9616,
+                                         'errorMessage': 'No licenses available'})
+                    continue
+
+                self._by_serial[(adam_id, serial_number)] = license_id
+                self._licenses[license_id] = dict(self.license(license_id), status='Associated',
+                                                  serialNumber=serial_number)
+                self._license_versions[license_id] = self._bump()
+
+            associations.append({'serialNumber': serial_number, 'licenseIdStr': str(license_id)})
+
+        if associate:
+            reply['associations'] = associations
+        if disassociate:
+            reply['disassociations'] = disassociations
+
+        return reply
+
+    def register_user(self, body: dict) -> dict:
+        client_user_id = body.get('clientUserIdStr')
+        if not client_user_id:
+            return self.error(9600, 'Missing clientUserIdStr')
+
+        for user in self._users.values():
+            if user['clientUserIdStr'] == client_user_id:
+                return {'status': 0, 'user': user}
+
+        user_id = len(self._users) + 1
+        user = {
+            'userId': user_id,
+            'clientUserIdStr': client_user_id,
+            'email': body.get('email'),
+            'status': 'Registered',
+            'inviteCode': uuid.uuid4().hex[:18].upper(),
+        }
+        user['inviteUrl'] = '{}/invite/{}'.format(self.URL, user['inviteCode'])
+        self._users[user_id] = user
+        self._user_versions[user_id] = self._bump()
+
+        return {'status': 0, 'user': user}
+
+    def _find_user(self, body: dict) -> Optional[dict]:
+        if body.get('userId') is not None:
+            return self._users.get(int(body['userId']))
+
+        for user in self._users.values():
+            if user['clientUserIdStr'] == body.get('clientUserIdStr'):
+                return user
+
+        return None
+
+    def get_user(self, body: dict) -> dict:
+        user = self._find_user(body)
+        return {'status': 0, 'user': user} if user is not None else self.error(9609, 'User not found')
+
+    def edit_user(self, body: dict) -> dict:
+        user = self._find_user(body)
+        if user is None:
+            return self.error(9609, 'User not found')
+
+        if 'email' in body:
+            user['email'] = body['email']
+        self._user_versions[user['userId']] = self._bump()
+
+        return {'status': 0, 'user': user}
+
+    def retire_user(self, body: dict) -> dict:
+        user = self._find_user(body)
+        if user is None:
+            return self.error(9609, 'User not found')
+
+        user['status'] = 'Retired'
+        self._user_versions[user['userId']] = self._bump()
+
+        return {'status': 0}
+
+    def route(self, path: str, body: dict) -> Tuple[int, Optional[dict]]:
+        """Dispatch a request to the handler for its endpoint.
+
+        Returns:
+            Tuple[int, Optional[dict]]: The status code and JSON body.
+        """
+        handlers = {
+            '/getVPPLicensesSrv': self.get_licenses,
+            '/getVPPUsersSrv': self.get_users,
+            '/getVPPAssetsSrv': self.get_assets,
+            '/manageVPPLicensesByAdamIdSrv': self.manage_licenses,
+            '/registerVPPUserSrv': self.register_user,
+            '/getVPPUserSrv': self.get_user,
+            '/editVPPUserSrv': self.edit_user,
+            '/retireVPPUserSrv': self.retire_user,
+        }
+        if path == '/VPPServiceConfigSrv':
+            return 200, self.service_config
+        if path not in handlers:
+            return 404, None
+        if not body.get('sToken'):
+            return 200, self.error(9600, 'Missing sToken')
+
+        with self._lock:
+            return 200, handlers[path](body)
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        url = urlparse(request.url)
+        with self._lock:
+            self.requests[url.path] = self.requests.get(url.path, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        body = json.loads(request.body) if request.body else {}
+        status_code, content = self.route(url.path, body)
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = requests.status_codes._codes[status_code][0].upper()
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json;charset=UTF8'})
+        response._content = json.dumps(content).encode('utf-8') if content is not None else b''
+
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,79 @@
+"""
+Long lived HTTP clients for Apple services.
+
+Clients for DEP and VPP used to be built, with a new :class:`requests.Session`, for every sync or request. This module
+keeps one client per account for the lifetime of the process, so that their connection pools, session tokens and
+rate limiting state are reused.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def pooled_session(pool_connections: int = 4, pool_maxsize: int = 10) -> requests.Session:
+    """Create a session with keep-alive connection pools sized for concurrent use.
+
+    Args:
+        pool_connections (int): The number of hosts to keep a connection pool for.
+        pool_maxsize (int): The number of connections kept alive per host. Should be at least the number of threads
+            which share the session, otherwise connections are closed and opened again under load.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+class ClientRegistry(object):
+    """Thread safe cache of service clients.
+
+    The key must change whenever the client would need to be built differently, for example when the credentials
+    of an account are replaced. Clients stored under an outdated key are discarded.
+
+    Example:
+        registry = ClientRegistry()
+        client = registry.get(account.id, (account.id, account.token), lambda: Client(account.token))
+    """
+    def __init__(self):
+        self._clients: Dict[Hashable, Any] = {}
+        self._keys: Dict[Hashable, Hashable] = {}
+        self._lock = threading.Lock()
+
+    def get(self, identity: Hashable, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Get the client for an account, creating it if there is none or its key changed.
+
+        Args:
+            identity (Hashable): Identifies the account, only one client is kept per identity.
+            key (Hashable): Everything the client was built from.
+            factory (Callable[[], Any]): Builds a new client.
+
+        Returns:
+            Any: The client.
+        """
+        with self._lock:
+            if self._keys.get(identity) != key:
+                self._clients[identity] = factory()
+                self._keys[identity] = key
+
+            return self._clients[identity]
+
+    def discard(self, identity: Hashable):
+        """Discard the client for an account, so that the next call to :meth:`get` creates a new one."""
+        with self._lock:
+            self._clients.pop(identity, None)
+            self._keys.pop(identity, None)
+
+    def clear(self):
+        """Discard every client."""
+        with self._lock:
+            self._clients.clear()
+            self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
@@ -1,10 +1,81 @@
-from sqlalchemy.types import TypeDecorator, CHAR
+from sqlalchemy.types import TypeDecorator, CHAR, BINARY
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 import json
+import zlib
 from datetime import datetime
+from typing import Any
 from sqlalchemy.types import TypeDecorator
-from sqlalchemy import Text
+from sqlalchemy import LargeBinary, Text
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class LazyUUID(uuid.UUID):
+    """A UUID loaded from the database, which only parses its value when it is used as a number.
+
+    Most UUIDs which are loaded are only compared, hashed or formatted as a string, if at all. Those operations are
+    answered from the stored hex digits, which is much cheaper than constructing a `uuid.UUID` for every row.
+    It is a subclass of `uuid.UUID`, so it compares equal to, and hashes the same as, the equivalent `uuid.UUID`.
+
+    Args:
+        hex (str): 32 lower case hex digits, without dashes.
+    """
+    __slots__ = ('_hex', '_int')
+
+    #: Like `uuid.UUID` values which are not generated locally.
+    is_safe = getattr(uuid, 'SafeUUID', None) and uuid.SafeUUID.unknown
+
+    def __init__(self, hex: str):
+        object.__setattr__(self, '_hex', hex)
+
+    @classmethod
+    def from_hex(cls, hex: str) -> 'LazyUUID':
+        """Create a LazyUUID without calling ``__init__``, which is the cheapest way to create one per row."""
+        u = _new_object(cls)
+        _set_hex(u, hex)
+        return u
+
+    @property
+    def int(self) -> int:
+        try:
+            return self._int
+        except AttributeError:
+            value = int(self._hex, 16)
+            object.__setattr__(self, '_int', value)
+            return value
+
+    @property
+    def hex(self) -> str:
+        return self._hex
+
+    def __str__(self):
+        h = self._hex
+        return '%s-%s-%s-%s-%s' % (h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+    def __eq__(self, other):
+        if isinstance(other, LazyUUID):
+            return self._hex == other._hex
+
+        return super(LazyUUID, self).__eq__(other)
+
+    def __hash__(self):
+        return hash(self.int)
+
+    def __reduce__(self):
+        return uuid.UUID, (self._hex,)
+
+
+_new_object = object.__new__
+_set_hex = LazyUUID._hex.__set__
 
 
 class GUID(TypeDecorator):
@@ -13,32 +84,50 @@ class GUID(TypeDecorator):
     Uses Postgresql's UUID type, otherwise uses
     CHAR(32), storing as stringified hex values.
 
+    Values are loaded as `LazyUUID`.
+
+    Args:
+        binary (bool): On databases other than Postgresql, store the 16 bytes of the UUID in a BINARY(16) column
+            instead, which halves the size of the column and its indexes. Existing CHAR(32) columns must be converted
+            before their type is changed.
     """
     impl = CHAR
 
+    def __init__(self, binary: bool = False, *args, **kwargs):
+        TypeDecorator.__init__(self, *args, **kwargs)
+        self.binary = binary
+
     def load_dialect_impl(self, dialect):
         if dialect.name == 'postgresql':
             return dialect.type_descriptor(UUID())
+        elif self.binary:
+            return dialect.type_descriptor(BINARY(16))
         else:
             return dialect.type_descriptor(CHAR(32))
 
     def process_bind_param(self, value, dialect):
         if value is None:
             return value
-        elif dialect.name == 'postgresql':
+
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(value)
+
+        if dialect.name == 'postgresql':
             return str(value)
+        elif self.binary:
+            return value.bytes
         else:
-            if not isinstance(value, uuid.UUID):
-                return "%.32x" % uuid.UUID(value).int
-            else:
-                # hexstring
-                return "%.32x" % value.int
+            # hexstring
+            return value.hex
 
     def process_result_value(self, value, dialect):
         if value is None:
             return value
+        elif isinstance(value, str):
+            # Postgresql returns the dashed form
+            return LazyUUID.from_hex(value if len(value) == 32 else value.replace('-', ''))
         else:
-            return uuid.UUID(value)
+            return LazyUUID.from_hex(bytes(value).hex())
 
 
 def json_datetime_serializer(o):
@@ -54,6 +143,34 @@ def json_datetime_serializer(o):
     raise TypeError(repr(o) + " is not JSON serializable")
 
 
+def json_dumps(value: Any) -> str:
+    """Serialize a value for a JSON text column, using orjson if it is installed.
+
+    The output of both encoders decodes to the same value. orjson writes non-ASCII characters as UTF-8 rather than
+    escaping them, and values which it does not support, such as integers wider than 64 bits, are encoded with the
+    standard library instead.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=json_datetime_serializer,
+                                option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(value, separators=(',', ':'), default=json_datetime_serializer)
+
+
+def json_loads(value: str) -> Any:
+    """Deserialize the value of a JSON text column, using orjson if it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(value)
+
+
 class JSONEncodedDict(TypeDecorator):
     """Represents an immutable structure as a json-encoded string"""
     impl = Text
@@ -62,13 +179,108 @@ class JSONEncodedDict(TypeDecorator):
         if value is None:
             return None
 
-        return json.dumps(value, separators=(',', ':'), default=json_datetime_serializer)
+        return json_dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if not value:
+            return None
+
+        return json_loads(value)
+
+
+#: The first byte of a `Compressed` value identifies the codec which compressed the rest.
+CODEC_HEADERS = {
+    'none': b'n',
+    'zlib': b'z',
+    'zstd': b's',
+}
+
+
+def compress(data: bytes, codec: str, level: int = 6) -> bytes:
+    """Compress bytes, prefixed with the header of the codec.
+
+    Args:
+        data (bytes): The data to compress.
+        codec (str): One of `CODEC_HEADERS`.
+        level (int): The compression level.
+
+    Raises:
+        ValueError: If the codec is unknown, or is ``zstd`` and the zstandard package is not installed.
+    """
+    if codec == 'none':
+        return CODEC_HEADERS['none'] + data
+    elif codec == 'zlib':
+        return CODEC_HEADERS['zlib'] + zlib.compress(data, level)
+    elif codec == 'zstd' and zstandard is not None:
+        return CODEC_HEADERS['zstd'] + zstandard.ZstdCompressor(level=level).compress(data)
+
+    raise ValueError('Compression codec not available: {}'.format(codec))
+
+
+def decompress(value: bytes) -> bytes:
+    """Decompress a value produced by :func:`compress`, whichever codec was used."""
+    header, data = value[:1], value[1:]
+    if header == CODEC_HEADERS['none']:
+        return data
+    elif header == CODEC_HEADERS['zlib']:
+        return zlib.decompress(data)
+    elif header == CODEC_HEADERS['zstd'] and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError('Compression codec not available for header: {!r}'.format(header))
+
+
+class Compressed(TypeDecorator):
+    """Represents bytes which are compressed on their way to the database.
+
+    Every value starts with a header byte naming its codec, so that the codec of a column can be changed without
+    rewriting the stored values, and values shorter than `min_size` are stored as they are.
+
+    Args:
+        codec (str): ``zlib`` or ``zstd``. Defaults to ``zstd`` if the zstandard package is installed.
+        level (int): The compression level.
+        min_size (int): Values shorter than this many bytes are not compressed.
+    """
+    impl = LargeBinary
+
+    def __init__(self, codec: str = None, level: int = 6, min_size: int = 128, *args, **kwargs):
+        TypeDecorator.__init__(self, *args, **kwargs)
+        self.codec = codec or ('zstd' if zstandard is not None else 'zlib')
+        self.level = level
+        self.min_size = min_size
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+
+        return compress(value, self.codec if len(value) >= self.min_size else 'none', self.level)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
+        return decompress(bytes(value))
+
+
+class CompressedJSONEncodedDict(Compressed):
+    """Represents an immutable structure as a compressed json-encoded string, see `Compressed`.
+
+    This is a drop in replacement for `JSONEncodedDict` on columns holding large documents, but the column type is
+    binary so existing values must be converted.
+    """
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+
+        return super(CompressedJSONEncodedDict, self).process_bind_param(
+            json_dumps(value).encode('utf-8'), dialect)
 
     def process_result_value(self, value, dialect):
         if not value:
             return None
 
-        return json.loads(value)
+        return json_loads(super(CompressedJSONEncodedDict, self).process_result_value(value, dialect).decode('utf-8'))
 
 
 class SetOfEnumValues(TypeDecorator):
@@ -83,12 +295,12 @@ class SetOfEnumValues(TypeDecorator):
         if value is None:
             return None
 
-        return json.dumps([v.value for v in value], separators=(',', ':'), default=json_datetime_serializer)
+        return json_dumps([v.value for v in value])
 
     def process_result_value(self, value, dialect):
         if not value:
             return None
 
-        values = json.loads(value)
+        values = json_loads(value)
         evalues = [self.values(v) for v in values]
         return evalues
@@ -10,6 +10,9 @@ ALEMBIC_CONTEXT = {
     'render_as_batch': True,  # Necessary to support SQLite ALTER on constraints
 }
 
+# Shortly after startup, apply the migrations, create the internal CA and start the job runner in a background thread.
+STARTUP_THREAD_ENABLED = True
+
 # Describes a static OAuth 2 Client which is the Commandment UI
 OAUTH2_CLIENT_UI = {
     'client_id': 'F8955645-A21D-44AE-9387-42B0800ADF15',
@@ -37,6 +40,99 @@ MDMCERT_API_KEY = 'b742461ff981756ca3f924f02db5a12e1f6639a9109db047ead1814aafc05
 
 PLISTIFY_MIMETYPE = 'application/xml'
 
+# Enrollment storm mode: TokenUpdate returns as soon as the device token is stored and the remaining post-enrollment
+# work (identity certificate, inventory commands, initial push, device_enrolled signal) is handled by a pool of
+# ENROLLMENT_WORKERS threads. When more than ENROLLMENT_QUEUE_SIZE enrollments are pending, work is done inline.
+ENROLLMENT_STORM_MODE = False
+ENROLLMENT_WORKERS = 4
+ENROLLMENT_QUEUE_SIZE = 1000
+
+# Number of device records requested per DEP fetch/sync page, up to the DEP service maximum of 1000.
+# Each page is written and checkpointed in a single transaction.
+DEP_PAGE_SIZE = 1000
+
+# Number of concurrent requests used to define DEP profiles and assign them to devices.
+# Assignments are sent in batches of up to 1000 serial numbers each.
+DEP_ASSIGNMENT_WORKERS = 4
+
+# Client side pacing of DEP requests. Requests wait for a slot instead of being refused by the service.
+DEP_REQUESTS_PER_SECOND = 5.0
+DEP_REQUEST_BURST = 10
+
+# Throttled (HTTP 429/503) DEP requests are retried this many times, honouring Retry-After, before the sync fails.
+DEP_MAX_RETRIES = 5
+
+# Fail a DEP request rather than wait longer than this many seconds for the rate limit.
+DEP_MAX_WAIT = 300
+
+# Number of keep-alive connections kept per host by the long lived DEP and VPP clients.
+# Should be at least the number of threads sharing a client, eg. DEP_ASSIGNMENT_WORKERS.
+HTTP_POOL_MAXSIZE = 10
+
+# VPP service configuration (the list of VPP endpoint URLs) is cached for this many seconds.
+VPP_SERVICE_CONFIG_TTL = 3600
+
+# Device license assignment by application tag (the vpp.assign runner job, add it to RUNNER_SCHEDULE to enable).
+# Number of concurrent manageVPPLicensesByAdamIdSrv requests.
+VPP_ASSIGNMENT_WORKERS = 4
+# Also release licenses from devices which are no longer tagged with the application.
+VPP_REMOVE_UNTAGGED_LICENSES = False
+
+# Job runner, see commandment.runner
+RUNNER_ENABLED = True
+# Number of jobs which may run concurrently on this node
+RUNNER_WORKERS = 2
+# Seconds between polls for due jobs
+RUNNER_POLL_INTERVAL = 5
+# Seconds before a job held by an unresponsive node may be claimed by another node
+RUNNER_LEASE_SECONDS = 120
+# Seconds before the first retry of a failed job, doubled for every further attempt
+RUNNER_RETRY_DELAY = 30
+# Periodic jobs, job name: interval in seconds. These are enqueued once per interval no matter how many nodes share
+# the database. Nothing is scheduled by default, enable the jobs you need in your own settings, eg.
+#
+# RUNNER_SCHEDULE = {
+#     'apns.push': 90,  # Push to devices with queued commands, split across nodes by device id range
+#     'dep.sync': 90,  # DEP device sync and profile assignment, leader only
+#     'vpp.sync': 300,  # Incremental VPP asset, user and license mirror, leader only
+#     'vpp.assign': 300,  # VPP device license assignment by application tag, leader only
+#     'inventory.rollup': 3600,  # Rebuild the inventory counts, leader only
+#     'commands.archive': 3600,  # Move old finished commands to commands_archive, leader only
+# }
+RUNNER_SCHEDULE = {}
+# Number of shards for sharded jobs such as apns.push. 0 means one shard per live node.
+RUNNER_SHARDS = 0
+
+
+# Command history retention (the commands.archive runner job). Finished commands are moved from commands to
+# commands_archive once they are older than this many days.
+COMMAND_RETENTION_DAYS = 30
+# Number of commands moved per transaction
+COMMAND_ARCHIVE_BATCH_SIZE = 1000
+# Stop each run after this many batches, None to archive everything that is due
+COMMAND_ARCHIVE_MAX_BATCHES = None
+# Delete archived commands after this many days, None to keep them forever
+COMMAND_ARCHIVE_PURGE_DAYS = None
+
+
+# Number of device identity private keys generated ahead of time for /enroll/profile. 0 disables the pool, in which
+# case keys are generated during the request.
+PKI_KEY_POOL_SIZE = 10
+
+# Serial numbers of certificates issued by the internal CA are reserved from the database this many at a time by each
+# process. Set PKI_SERIAL_ALLOCATION = 'random' to use random 63 bit serials without touching the database.
+PKI_SERIAL_ALLOCATION = 'block'
+PKI_SERIAL_BLOCK_SIZE = 100
+
+# JSON:API list endpoints write pages straight from row tuples to JSON when the schema allows, see
+# commandment.api.compiled. The output is identical, set to False to always serialize through the schema.
+API_COMPILED_SERIALIZATION = True
+
+# Rows fetched from the server side cursor at a time when exporting inventory, see commandment.inventory.export.
+INVENTORY_EXPORT_CHUNK_SIZE = 10000
+
+# Maximum number of devices returned by the device search endpoint, see commandment.api.search.
+DEVICE_SEARCH_MAX_RESULTS = 100
 
 # Internal CA - Certificate X.509 Attributes
 INTERNAL_CA_CN = 'COMMANDMENT-CA'
@@ -20,7 +20,7 @@ from commandment.cms.decorators import verify_cms_signers
 from commandment.plistutil.nonewriter import dumps as dumps_none
 from commandment.profiles.plist_schema import ProfileSchema
 from commandment.profiles import PROFILE_CONTENT_TYPE
-from commandment.pki.ca import get_ca
+from commandment.pki.ca import get_signer
 from commandment.dep import smime
 
 from .resources import DEPProfileList, DEPProfileDetail, DEPProfileRelationship, DEPAccountList, DEPAccountDetail
@@ -51,7 +51,6 @@ def certificate_download():
     try:
         certificate_model = db.session.query(DEPServerTokenCertificate).filter_by(x509_cn='COMMANDMENT-DEP').one()
     except sqlalchemy.orm.exc.NoResultFound:
-        ca = get_ca()
         private_key = rsa.generate_private_key(
             public_exponent=65537,
             key_size=2048,
@@ -78,7 +77,7 @@ def certificate_download():
         request_model.rsa_private_key = private_key_model
         db.session.add(request_model)
 
-        certificate = ca.sign(request)
+        certificate = get_signer().sign(request)
         certificate_model = DEPServerTokenCertificate.from_crypto(certificate)
         certificate_model.rsa_private_key = private_key_model
         db.session.add(certificate_model)
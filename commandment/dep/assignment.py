@@ -0,0 +1,208 @@
+"""
+DEP profile definition and assignment pipeline.
+
+Serial numbers are grouped by the profile they should receive, split into batches of at most
+`DEP.MaxAssignmentBatchSize` and the batches are sent to the DEP service concurrently by a small thread pool.
+The results for every serial number are written back to the devices table with a single bulk update.
+
+Only the HTTP requests run in the pool. Reading and writing the database always happens on the calling thread, so
+the pool never touches the SQLAlchemy session.
+"""
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple, Optional
+from uuid import UUID
+
+from commandment.dep.apple_schema import AppleDEPProfileSchema
+from commandment.dep.dep import DEP
+from commandment.dep.errors import DEPServiceError, DEPClientError
+from commandment.dep.models import DEPAccount, DEPProfile
+from commandment.models import db, Device
+
+logger = logging.getLogger(__name__)
+
+#: The per-serial status returned by the DEP service when an assignment succeeded.
+ASSIGNMENT_SUCCESS = 'SUCCESS'
+
+
+def apple_profile_uuid(value: UUID) -> str:
+    """Format a profile UUID the way the DEP service does: upper case hex without separators."""
+    return value.hex.upper()
+
+
+def batches(serial_numbers: List[str], size: int) -> List[List[str]]:
+    """Split a list of serial numbers into batches of at most ``size``."""
+    return [serial_numbers[i:i + size] for i in range(0, len(serial_numbers), size)]
+
+
+def pending_assignments(dep_account: DEPAccount) -> Dict[str, List[Tuple[int, str]]]:
+    """Find DEP devices which are not assigned the profile they should have.
+
+    A device should have the profile referenced by ``Device.dep_profile``. DEP devices without a profile, which
+    have either never been assigned a profile or had it removed, should have the account's default profile if one
+    is nominated.
+
+    Args:
+        dep_account (DEPAccount): Only profiles defined under this account are considered.
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]]: Device (id, serial number) tuples, keyed by the Apple profile UUID.
+    """
+    pending: Dict[str, List[Tuple[int, str]]] = {}
+
+    rows = db.session.query(Device.id, Device.serial_number, Device.profile_uuid, DEPProfile.uuid).\
+        join(DEPProfile, Device.dep_profile_id == DEPProfile.id).\
+        filter(Device.is_dep == True).\
+        filter(DEPProfile.dep_account_id == dep_account.id).\
+        filter(DEPProfile.uuid != None)
+
+    for device_id, serial_number, current_uuid, profile_uuid in rows:
+        wanted = apple_profile_uuid(profile_uuid)
+        if current_uuid is None or current_uuid.upper() != wanted:
+            pending.setdefault(wanted, []).append((device_id, serial_number))
+
+    default_profile: Optional[DEPProfile] = dep_account.default_dep_profile
+    if default_profile is not None and default_profile.uuid is not None:
+        wanted = apple_profile_uuid(default_profile.uuid)
+        rows = db.session.query(Device.id, Device.serial_number).\
+            filter(Device.is_dep == True).\
+            filter(Device.dep_profile_id == None).\
+            filter((Device.profile_status == None) | Device.profile_status.in_(['empty', 'removed']))
+
+        for device_id, serial_number in rows:
+            pending.setdefault(wanted, []).append((device_id, serial_number))
+
+    return pending
+
+
+def assign_profiles(dep: DEP, assignments: Dict[str, List[str]], max_workers: int = 4,
+                    batch_size: int = DEP.MaxAssignmentBatchSize) -> Dict[str, Tuple[str, str]]:
+    """Assign profiles to serial numbers using concurrent batched requests.
+
+    A batch which fails entirely, because of a service error or because the rate limit would keep it waiting for too
+    long, is logged and has no results. Its serial numbers stay pending and are retried on the next run.
+
+    Args:
+        dep (DEP): The DEP client.
+        assignments (Dict[str, List[str]]): Serial numbers keyed by the profile UUID to assign.
+        max_workers (int): The maximum number of concurrent requests.
+        batch_size (int): The maximum number of serial numbers per request.
+
+    Returns:
+        Dict[str, Tuple[str, str]]: (profile UUID, status) keyed by serial number.
+    """
+    if dep.session_token is None:
+        dep.fetch_token()  # Once, up front, instead of racing to fetch it in every worker
+
+    results: Dict[str, Tuple[str, str]] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for profile_uuid, serial_numbers in assignments.items():
+            for batch in batches(serial_numbers, min(batch_size, DEP.MaxAssignmentBatchSize)):
+                futures[executor.submit(dep.assign_profile, profile_uuid, *batch)] = (profile_uuid, batch)
+
+        for future in as_completed(futures):
+            profile_uuid, batch = futures[future]
+            try:
+                response = future.result()
+            except (DEPServiceError, DEPClientError) as e:
+                logger.error('Failed to assign profile %s to %d device(s): %s', profile_uuid, len(batch), e)
+                continue
+
+            for serial_number, status in response.get('devices', {}).items():
+                results[serial_number] = (profile_uuid, status)
+
+    return results
+
+
+def define_profiles(dep: DEP, profiles: List[DEPProfile], max_workers: int = 4) -> int:
+    """Define DEP profiles which have not been uploaded yet, concurrently.
+
+    Successfully defined profiles get the UUID returned by the service and their ``last_upload_at`` set.
+    The caller is responsible for committing the session.
+
+    Args:
+        dep (DEP): The DEP client.
+        profiles (List[DEPProfile]): The profiles to define.
+        max_workers (int): The maximum number of concurrent requests.
+
+    Returns:
+        int: The number of profiles defined.
+    """
+    if not profiles:
+        return 0
+
+    if dep.session_token is None:
+        dep.fetch_token()
+
+    schema = AppleDEPProfileSchema()
+    payloads = [(p, schema.dump(p).data) for p in profiles]
+    defined = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(dep.define_profile, payload): profile for profile, payload in payloads}
+
+        for future in as_completed(futures):
+            profile = futures[future]
+            try:
+                response = future.result()
+            except (DEPServiceError, DEPClientError) as e:
+                logger.error('Failed to define DEP profile %s: %s', profile.profile_name, e)
+                continue
+
+            if 'profile_uuid' not in response:
+                logger.error('DEP profile %s was not defined, no profile_uuid was returned', profile.profile_name)
+                continue
+
+            profile.uuid = response['profile_uuid']
+            profile.last_upload_at = datetime.datetime.utcnow()
+            defined += 1
+
+    return defined
+
+
+def run_assignments(dep: DEP, dep_account: DEPAccount, max_workers: int = 4,
+                    batch_size: int = DEP.MaxAssignmentBatchSize) -> Dict[str, int]:
+    """Assign every pending profile for an account and write the results back in bulk.
+
+    Args:
+        dep (DEP): The DEP client.
+        dep_account (DEPAccount): The account whose devices should be assigned.
+        max_workers (int): The maximum number of concurrent requests.
+        batch_size (int): The maximum number of serial numbers per request.
+
+    Returns:
+        Dict[str, int]: The number of serial numbers for each status returned by the service, and ``pending`` for
+            the total number of serial numbers which were attempted.
+    """
+    pending = pending_assignments(dep_account)
+    device_ids = {serial_number: device_id for devices in pending.values() for device_id, serial_number in devices}
+    assignments = {profile_uuid: [s for _, s in devices] for profile_uuid, devices in pending.items()}
+
+    stats = {'pending': len(device_ids)}
+    if not device_ids:
+        return stats
+
+    results = assign_profiles(dep, assignments, max_workers, batch_size)
+
+    now = datetime.datetime.utcnow()
+    updates = []
+    for serial_number, (profile_uuid, status) in results.items():
+        stats[status] = stats.get(status, 0) + 1
+        if status == ASSIGNMENT_SUCCESS and serial_number in device_ids:
+            updates.append({
+                'id': device_ids[serial_number],
+                'profile_uuid': profile_uuid,
+                'profile_status': 'assigned',
+                'profile_assign_time': now,
+            })
+
+    if updates:
+        db.session.bulk_update_mappings(Device, updates)
+
+    db.session.commit()
+    logger.info('DEP profile assignment: %s', ', '.join('{}={}'.format(k, v) for k, v in sorted(stats.items())))
+
+    return stats
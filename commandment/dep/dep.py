@@ -3,38 +3,22 @@ from typing import Union, List, Optional
 import requests
 from requests.auth import AuthBase
 from requests_oauthlib import OAuth1
-import re
-from datetime import timedelta, datetime
+import threading
+import time
+from datetime import datetime
 from dateutil import parser as dateparser
-from locale import atof
 import json
 import logging
-from flask import g, current_app
+from flask import current_app
 
+from commandment.clients import ClientRegistry, pooled_session
 from commandment.dep import DEPProfileRemovals
-from .errors import DEPServiceError, DEPClientError
-from email.utils import parsedate  # Necessary for HTTP-Date
+from .errors import DEPServiceError, DEPClientError, DEPRateLimitError
+from .ratelimit import TokenBucket, RequestMetrics, parse_retry_after, backoff_delay
 
 logger = logging.getLogger(__name__)
 
 
-# def get_dep():  # type: () -> DEP
-#     dep = getattr(g, '_dep', None)
-#
-#     if dep is None:
-#         dep_account: DEPAccount = db.session.query(DEPAccount).one()
-#         dep = DEP(
-#             consumer_key=dep_account.consumer_key,
-#             consumer_secret=dep_account.consumer_secret,
-#             access_token=dep_account.access_token,
-#             access_secret=dep_account.access_secret,
-#         )
-#
-#         g._dep = dep
-#
-#     return dep
-
-
 class DEPAuth(AuthBase):
     """Attach X-ADM-Auth-Session token to the request.
 
@@ -50,16 +34,58 @@ class DEPAuth(AuthBase):
 
 
 class DEP:
+    """Client for the DEP (Device Enrollment Program) service.
+
+    Requests are paced by a token bucket, which is shared by every thread using the same instance. Responses with
+    HTTP 429 or 503 pause the bucket for the duration given by ``Retry-After`` (or an exponential backoff with jitter,
+    if the service gave none) and are retried. A 401 response causes the session token to be refreshed, once, before
+    the request is retried.
+
+    Args:
+        consumer_key (str): OAuth consumer key from the DEP service token.
+        consumer_secret (str): OAuth consumer secret from the DEP service token.
+        access_token (str): OAuth access token from the DEP service token.
+        access_secret (str): OAuth access secret from the DEP service token.
+        access_token_expiry (str): The expiry date of the access token.
+        url (str): The DEP service URL.
+        requests_per_second (float): The sustained request rate. None or zero disables client side pacing.
+        burst (int): The number of requests which may be sent at once before pacing applies.
+        max_retries (int): The number of times a throttled request is retried before giving up.
+        backoff (float): The upper bound of the first retry delay, in seconds, when there is no ``Retry-After``.
+        max_backoff (float): The upper bound of any retry delay, in seconds, when there is no ``Retry-After``.
+        max_wait (float): Raise :class:`DEPRateLimitError` rather than wait longer than this for a request slot.
+        pool_maxsize (int): The number of keep-alive connections to the service, should be at least the number of
+            threads which share this instance.
+
+    Attributes:
+        metrics (RequestMetrics): How many requests were sent, retried or throttled and how long they waited.
+    """
 
     UserAgent = 'commandment'
 
+    #: The maximum number of device records the DEP service will return in a single fetch or sync page.
+    MaxPageSize = 1000
+
+    #: The maximum number of serial numbers accepted by a single profile assignment or removal request.
+    MaxAssignmentBatchSize = 1000
+
+    #: HTTP status codes which the DEP service uses to throttle clients, requests are retried after a delay.
+    RetryStatusCodes = (429, 503)
+
     def __init__(self,
                  consumer_key: str = None,
                  consumer_secret: str = None,
                  access_token: str = None,
                  access_secret: str = None,
                  access_token_expiry: Optional[str] = None,
-                 url: str = "https://mdmenrollment.apple.com") -> None:
+                 url: str = "https://mdmenrollment.apple.com",
+                 requests_per_second: Optional[float] = 5.0,
+                 burst: int = 10,
+                 max_retries: int = 5,
+                 backoff: float = 1.0,
+                 max_backoff: float = 60.0,
+                 max_wait: float = 300.0,
+                 pool_maxsize: int = 10) -> None:
 
         self._session_token: Optional[str] = None
         self._oauth = OAuth1(
@@ -76,13 +102,19 @@ class DEP:
             self._access_token_expiry = None
 
         self._url = url
-        self._session = requests.session()
+        self._session = pooled_session(pool_maxsize=pool_maxsize)
         self._session.headers.update({
             "X-Server-Protocol-Version": "3",
             "Content-Type": "application/json;charset=UTF8",
             "User-Agent": DEP.UserAgent,
         })
-        self._retry_after: Optional[datetime] = None
+        self._limiter = TokenBucket(requests_per_second, burst)
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._max_wait = max_wait
+        self._token_lock = threading.Lock()
+        self.metrics = RequestMetrics()
 
     @property
     def session_token(self) -> Optional[str]:
@@ -98,53 +130,90 @@ class DEP:
         """This method always exists as a response hook in order to keep some of the state returned by the
         DEP service internally such as:
             - The last value of the `X-ADM-Auth-Session` header, which is used on subsequent requests.
-            - The last value of the `Retry-After` header, which is used to set an instance variable to indicate
-                when we may make another request.
+            - The last value of the `Retry-After` header, which pauses every request made through this instance
+                until we may make another request.
 
         See Also:
             - `Footnote about **X-ADM-Auth-Session** under Response Payload <https://developer.apple.com/library/content/documentation/Miscellaneous/Reference/MobileDeviceManagementProtocolRef/4-Profile_Management/ProfileManagement.html#//apple_ref/doc/uid/TP40017387-CH7-SW2>`_.
         """
-        if r.status_code == 401:  # Token may be expired, or token is invalid
-            pass  # TODO: Need token refresh as decorator
-
         # If the service gives us another session token, that replaces our current token.
         if 'X-ADM-Auth-Session' in r.headers:
             self._session_token = r.headers['X-ADM-Auth-Session']
 
-        # If the service wants to rate limit us, store that information locally.
+        # If the service wants to rate limit us, hold back every request until it allows us to send another.
         if 'Retry-After' in r.headers:
-            after = r.headers['Retry-After']
-            if re.compile(r"/[0-9]+/").match(after):
-                d = timedelta(seconds=atof(after))
-                self._retry_after = datetime.utcnow() + d
-            else:  # HTTP Date
-                self._retry_after = datetime(*parsedate(after)[:6])
-
-    def send(self, req: requests.Request, **kwargs) -> Optional[requests.Response]:
+            after = parse_retry_after(r.headers['Retry-After'])
+            if after is not None:
+                self._limiter.pause(after)
+            else:
+                logger.warning('Ignoring unparseable Retry-After header: %s', r.headers['Retry-After'])
+
+    def _refresh_token(self, rejected: Optional[str]):
+        """Fetch a new session token, unless another thread already replaced the rejected one."""
+        with self._token_lock:
+            if self._session_token is None or self._session_token == rejected:
+                self.metrics.increment('token_refreshes')
+                self.fetch_token()
+
+    def send(self, req: requests.Request, **kwargs) -> requests.Response:
         """Send a request to the DEP service.
 
-        If the service responds that the token has expired, fetch a new session token and re-issue the request.
+        The request waits for a slot from the rate limiter before it is sent. Throttled requests are retried with
+        backoff, and if the service responds that the session token has expired, a new session token is fetched and
+        the request is re-issued.
 
         Args:
               req (requests.Request): The request, which will have DEP auth headers added to it.
         Returns:
               requests.Response: The response
+        Raises:
+              DEPRateLimitError: If a request slot is not available within ``max_wait`` seconds.
+              DEPServiceError: If the service responded with an error, or is still throttling after all retries.
         """
         if self._access_token_expiry is not None and datetime.now() > self._access_token_expiry:
             raise DEPClientError("DEP Service Token has expired, please generate a new one.")
 
-        if self._retry_after is not None:  # refuse to send request
-            return None
-
         if self.session_token is None:
-            self.fetch_token()
+            self._refresh_token(None)
 
         req.hooks = dict(response=self._response_hook)
-        req.auth = DEPAuth(self._session_token)
-
-        prepared = self._session.prepare_request(req)
-
-        res = self._session.send(prepared, **kwargs)
+        refreshed = False
+        attempt = 0
+
+        while True:
+            wait = self._limiter.reserve()
+            if wait > self._max_wait:
+                raise DEPRateLimitError('DEP request would wait {:.0f}s for the rate limit, '
+                                        'longer than the maximum of {:.0f}s'.format(wait, self._max_wait))
+            if wait > 0:
+                self.metrics.waited(wait)
+                time.sleep(wait)
+
+            token = self._session_token
+            req.auth = DEPAuth(token)
+            prepared = self._session.prepare_request(req)
+
+            self.metrics.increment('requests')
+            res = self._session.send(prepared, **kwargs)
+
+            if res.status_code == 401 and not refreshed:
+                refreshed = True
+                self.metrics.increment('retries')
+                self._refresh_token(token)
+                continue
+
+            if res.status_code in DEP.RetryStatusCodes and attempt < self._max_retries:
+                attempt += 1
+                self.metrics.increment('throttled')
+                self.metrics.increment('retries')
+                if 'Retry-After' not in res.headers:
+                    self._limiter.pause(backoff_delay(attempt, self._backoff, self._max_backoff))
+
+                logger.debug('DEP request %s %s throttled with HTTP %d, retry %d of %d', req.method, req.url,
+                             res.status_code, attempt, self._max_retries)
+                continue
+
+            break
 
         try:
             res.raise_for_status()
@@ -159,6 +228,8 @@ class DEP:
         Returns:
               Union[str, None]: The token that was returned (already set on this instance), or None if it failed.
         """
+        self.metrics.waited(self._limiter.acquire())
+        self.metrics.increment('requests')
         res = self._session.get(self._url + "/session", auth=self._oauth)
         try:
             res.raise_for_status()
@@ -217,20 +288,22 @@ class DEP:
         res = self.send(req)
         return res.json()
 
-    def devices(self, cursor: Union[str, None] = None) -> Iterator:
+    def devices(self, cursor: Union[str, None] = None, limit: int = 100) -> Iterator:
         """Get an iterable object which calls fetch or sync to retrieve all device records.
 
         Args:
               cursor (str): If supplied, the cursor returned will perform the sync operation. Otherwise you will
                 receive a cursor that performs a fetch for each iteration, until the fetch cursor is exhausted.
+              limit (int): The number of records to request per page, capped at `DEP.MaxPageSize`. Default is 100
 
         Returns:
               Union[DEPSyncCursor, DEPFetchCursor]: A cursor that is iterable
         """
+        limit = min(limit, DEP.MaxPageSize)
         if cursor is not None:  # Could actually be an expired cursor here
-            return DEPSyncCursor(self, cursor=cursor)
+            return DEPSyncCursor(self, cursor=cursor, limit=limit)
         else:
-            return DEPFetchCursor(self)
+            return DEPFetchCursor(self, limit=limit)
 
     def device_detail(self, *serial_numbers: Union[str, List[str]]):
         """Fetch detail about a list of devices
@@ -331,11 +404,13 @@ class DEPBaseCursor(object):
     Attributes:
           owner (DEP): The DEP instance that created this iterator.
           results (dict): The current response results.
+          limit (int): The number of records requested per page.
     """
 
-    def __init__(self, owner: DEP, results: Optional[dict] = None) -> None:
+    def __init__(self, owner: DEP, results: Optional[dict] = None, limit: int = 100) -> None:
         self.owner = owner
         self.results = results
+        self.limit = limit
 
     @property
     def cursor(self) -> Optional[str]:
@@ -360,23 +435,61 @@ class DEPFetchCursor(DEPBaseCursor, Iterator):
             raise StopIteration()
 
         if self.cursor is None:
-            self.results = self.owner.fetch_devices()
+            self.results = self.owner.fetch_devices(limit=self.limit)
         else:
-            self.results = self.owner.fetch_devices(cursor=self.cursor)
+            self.results = self.owner.fetch_devices(cursor=self.cursor, limit=self.limit)
 
         return self.results
 
 
 class DEPSyncCursor(DEPBaseCursor, Iterator):
     """DEPSyncCursor wraps the DEP device sync cursor as an iterable object."""
-    def __init__(self, owner: DEP, cursor: str, results: Optional[dict] = None) -> None:
-        super(DEPSyncCursor, self).__init__(owner, results)
+    def __init__(self, owner: DEP, cursor: str, results: Optional[dict] = None, limit: int = 100) -> None:
+        super(DEPSyncCursor, self).__init__(owner, results, limit)
         self.results = {'cursor': cursor, 'more_to_follow': True}
 
     def __next__(self):
         if not self.more_to_follow:
             raise StopIteration()
 
-        self.results = self.owner.sync_devices(cursor=self.cursor)
+        self.results = self.owner.sync_devices(cursor=self.cursor, limit=self.limit)
 
         return self.results
+
+
+clients = ClientRegistry()
+"""ClientRegistry: DEP clients shared by every thread in this process, one per DEP account."""
+
+
+def get_dep(dep_account) -> DEP:
+    """Get the long lived DEP client for an account.
+
+    The client is created on first use with the settings of the current application, and replaced if the OAuth
+    credentials of the account change.
+
+    Args:
+        dep_account (DEPAccount): The DEP account.
+
+    Returns:
+        DEP: The client.
+    """
+    credentials = (dep_account.consumer_key, dep_account.consumer_secret, dep_account.access_token,
+                   dep_account.access_secret, dep_account.url)
+    config = current_app.config
+
+    def factory() -> DEP:
+        options = {} if dep_account.url is None else {'url': dep_account.url}
+        return DEP(
+            consumer_key=dep_account.consumer_key,
+            consumer_secret=dep_account.consumer_secret,
+            access_token=dep_account.access_token,
+            access_secret=dep_account.access_secret,
+            requests_per_second=config.get('DEP_REQUESTS_PER_SECOND', 5.0),
+            burst=config.get('DEP_REQUEST_BURST', 10),
+            max_retries=config.get('DEP_MAX_RETRIES', 5),
+            max_wait=config.get('DEP_MAX_WAIT', 300),
+            pool_maxsize=config.get('HTTP_POOL_MAXSIZE', 10),
+            **options
+        )
+
+    return clients.get(dep_account.id, credentials, factory)
@@ -25,3 +25,8 @@ class DEPServiceError(HTTPError):
 class DEPClientError(Exception):
     """DEPClientError describes errors that happen on the client side, often as a result of failed validations."""
     pass
+
+
+class DEPRateLimitError(DEPClientError):
+    """DEPRateLimitError is raised when a request would have to wait too long before the rate limit allows it."""
+    pass
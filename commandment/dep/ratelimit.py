@@ -0,0 +1,168 @@
+"""
+Client side request scheduling for the DEP service.
+
+The DEP service throttles clients with HTTP 429 or 503 responses and a ``Retry-After`` header. Requests which are
+refused count against the client, so :class:`commandment.dep.dep.DEP` paces its own requests with a
+:class:`TokenBucket`. It also pauses the whole bucket when the service asks for it, which holds back every thread that
+shares the client instead of letting them all run into the same limit.
+"""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Union
+
+
+def parse_retry_after(value: str, now: Optional[datetime] = None) -> Optional[float]:
+    """Parse the value of a ``Retry-After`` header.
+
+    Args:
+        value (str): Either a number of seconds or an HTTP-date.
+        now (datetime): The current time (timezone aware), used to convert an HTTP-date into seconds.
+            Defaults to the current UTC time.
+
+    Returns:
+        Optional[float]: The number of seconds to wait, never negative, or None if the value could not be parsed.
+    """
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        after = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+    if after is None:
+        return None
+
+    if after.tzinfo is None:
+        after = after.replace(tzinfo=timezone.utc)
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    return max(0.0, (after - now).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): The number of the retry, starting from 1.
+        base (float): The upper bound of the delay for the first retry, in seconds.
+        maximum (float): The upper bound of any delay, in seconds.
+
+    Returns:
+        float: A random delay between zero and ``min(maximum, base * 2 ** (attempt - 1))``.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket(object):
+    """Thread safe token bucket which hands out request slots at a steady rate.
+
+    Every call to :meth:`acquire` reserves the next slot, even if it has to wait for it, so waiting threads are
+    served in the order in which they arrived.
+
+    Args:
+        rate (float): Tokens added per second. Zero or None disables the bucket, but pauses are still honoured.
+        capacity (int): The number of tokens which may be used in a burst.
+        clock (Callable[[], float]): Monotonic clock, replaceable for testing.
+        sleep (Callable[[float], None]): Sleep function, replaceable for testing.
+    """
+    def __init__(self, rate: Optional[float], capacity: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        """Hold back every request for at least ``seconds`` from now."""
+        with self._lock:
+            self._not_before = max(self._not_before, self._clock() + seconds)
+
+    def reserve(self) -> float:
+        """Reserve the next slot without waiting for it.
+
+        Returns:
+            float: The number of seconds until the reserved slot may be used.
+        """
+        with self._lock:
+            now = self._clock()
+            wait = max(0.0, self._not_before - now)
+
+            if self.rate:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+
+            return wait
+
+    def acquire(self) -> float:
+        """Wait for the next slot.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self._sleep(wait)
+
+        return wait
+
+
+class RequestMetrics(object):
+    """Thread safe counters describing how requests to a rate limited service were scheduled.
+
+    Attributes:
+        requests (int): The number of requests sent, including retries.
+        retries (int): The number of requests which were sent again after a 429, 503 or 401 response.
+        throttled (int): The number of 429 or 503 responses received.
+        token_refreshes (int): The number of times the session token was refreshed after a 401 response.
+        waits (int): The number of requests which had to wait before they were sent.
+        wait_seconds (float): The total time requests spent waiting.
+        max_wait_seconds (float): The longest time a single request waited.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.token_refreshes = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def waited(self, seconds: float):
+        if seconds <= 0:
+            return
+
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'token_refreshes': self.token_refreshes,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+            }
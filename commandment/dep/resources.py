@@ -1,14 +1,16 @@
 from flask import url_for
 from flask_rest_jsonapi import ResourceDetail, ResourceList, ResourceRelationship
+from commandment.api.keyset import KeysetDataLayer, KeysetResourceList
 from .schema import DEPProfileSchema, DEPAccountSchema
 from .models import db, DEPProfile, DEPAccount
 
 
-class DEPProfileList(ResourceList):
+class DEPProfileList(KeysetResourceList):
     schema = DEPProfileSchema
     data_layer = {
         'session': db.session,
         'model': DEPProfile,
+        'class': KeysetDataLayer,
     }
 
     def before_post(self, args, kwargs, data=None):
@@ -3,10 +3,8 @@
 Copyright (c) 2015 Jesse Peterson, 2018 Mosen
 Licensed under the MIT license. See the included LICENSE.txt file for details.
 
-Attributes:
-    dep_thread (threading.Timer):
-    dep_start (int): In seconds, time of first run
-    dep_time (int): In seconds, time of subsequent runs
+The DEP synchronisation is registered with the runner as the ``dep.sync`` job. It owns the single DEP sync cursor, so it
+only runs on the leader node.
 
 Todo:
     * Currently we start this thread after the database context and
@@ -14,47 +12,24 @@ Todo:
       standalone and thus we'll need to sort out separate configuration routines etc.
 """
 import logging
-import threading
-import datetime
+import time
+from typing import Dict, List, Union
 import dateutil.parser
-from flask import Flask
+from flask import Flask, current_app
 
-# Necessary because SQLAlchemy isn't threadsafe by default
-from sqlalchemy.orm import scoped_session
-from sqlalchemy.orm import sessionmaker
-
-from commandment.dep.apple_schema import AppleDEPProfileSchema
+from commandment.dep.assignment import define_profiles, run_assignments
 from commandment.dep.errors import DEPServiceError
 from commandment.models import db, Device
 from commandment.dep.models import DEPAccount, DEPProfile
-from commandment.dep.dep import DEP
+from commandment.dep.dep import DEP, get_dep
 from commandment.dep import DEPOrgType, DEPOrgVersion, DEPOperationType
+from commandment.runner.registry import job
 import sqlalchemy.orm.exc
 import sqlalchemy.exc
 
-dep_thread = None
-dep_start = 5
-dep_time = 90
-
 logger = logging.getLogger('dep thread')
 
 
-def start(app: Flask):
-    """Start the StartUp thread"""
-    logger.info('DEP thread will run in 5 seconds')
-    dep_thread = threading.Timer(dep_start, dep_thread_callback, [app])
-    dep_thread.daemon = True
-    dep_thread.start()
-
-
-def stop():
-    """Stop the runner thread"""
-    logger.info('DEP thread will stop')
-    global dep_thread
-    if dep_thread is threading.Timer:
-        dep_thread.cancel()
-
-
 def dep_sync_organization(app: Flask, dep: DEP):
     """Synchronise information from the DEP service to the local database.
     """
@@ -96,108 +71,167 @@ def dep_sync_organization(app: Flask, dep: DEP):
             app.logger.info('Not attempting to fetch DEP account information. No DEP account is configured.')
 
 
-def dep_fetch_devices(app: Flask, dep: DEP, dep_account_id: int):
+#: DEP device record keys which are stored on the device model as-is.
+DEP_DEVICE_ATTRIBUTES = ('serial_number', 'model', 'description', 'color', 'asset_tag', 'os', 'device_family',
+                         'profile_status', 'profile_uuid', 'device_assigned_by')
+
+#: DEP device record keys which contain a date and time.
+DEP_DEVICE_DATE_ATTRIBUTES = ('profile_assign_time', 'profile_push_time', 'device_assigned_date')
+
+#: The maximum number of serial numbers in one IN clause, SQLite limits the number of bound parameters to 999.
+SERIAL_LOOKUP_CHUNK = 500
+
+
+def dep_device_mapping(device: dict) -> dict:
+    """Convert a single DEP fetch or sync device record into a mapping of `Device` attributes.
+
+    Args:
+        device (dict): A device record from the devices array of a fetch or sync page.
+
+    Returns:
+        dict: Device column values, suitable for ``bulk_insert_mappings`` or ``bulk_update_mappings``.
+    """
+    mapping = {k: device[k] for k in DEP_DEVICE_ATTRIBUTES if k in device}
+    for k in DEP_DEVICE_DATE_ATTRIBUTES:
+        if device.get(k):
+            mapping[k] = dateutil.parser.parse(device[k])
+
+    if device.get('profile_status') == 'empty':  # profile fields are meaningless until a profile is assigned
+        mapping.pop('profile_uuid', None)
+        mapping.pop('profile_assign_time', None)
+
+    mapping['is_dep'] = True
+    return mapping
+
+
+def dep_upsert_page(session, devices: List[dict]) -> Dict[str, int]:
+    """Insert or update every device of a single DEP page in bulk.
+
+    Existing devices are resolved with one ``IN`` query per chunk of serial numbers instead of one query per device.
+    The caller is responsible for committing the session.
+
+    Args:
+        session: The SQLAlchemy session.
+        devices (List[dict]): The devices array of a fetch or sync page.
+
+    Returns:
+        Dict[str, int]: Counts of inserted, updated, deleted and skipped records.
+    """
+    stats = {'inserted': 0, 'updated': 0, 'deleted': 0, 'skipped': 0}
+    records: Dict[str, dict] = {}  # The last record for a serial wins, a sync page may contain the same serial twice
+
+    for device in devices:
+        if 'op_type' in device:  # its a sync, not a fetch
+            try:
+                DEPOperationType(device['op_type'])
+            except ValueError:
+                logger.error('DEP op_type not recognised (%s), skipping', device['op_type'])
+                stats['skipped'] += 1
+                continue
+
+        records[device['serial_number']] = device
+
+    serials = list(records.keys())
+    existing: Dict[str, int] = {}
+    for offset in range(0, len(serials), SERIAL_LOOKUP_CHUNK):
+        chunk = serials[offset:offset + SERIAL_LOOKUP_CHUNK]
+        existing.update(session.query(Device.serial_number, Device.id).filter(Device.serial_number.in_(chunk)))
+
+    inserts = []
+    updates = []
+    for serial_number, device in records.items():
+        deleted = device.get('op_type') == DEPOperationType.Deleted.value
+
+        if deleted:
+            if serial_number in existing:
+                updates.append({'id': existing[serial_number], 'is_dep': False})
+            stats['deleted'] += 1
+        elif serial_number in existing:
+            mapping = dep_device_mapping(device)
+            mapping['id'] = existing[serial_number]
+            updates.append(mapping)
+            stats['updated'] += 1
+        else:
+            inserts.append(dep_device_mapping(device))
+
+    if updates:
+        session.bulk_update_mappings(Device, updates)
+    if inserts:
+        session.bulk_insert_mappings(Device, inserts)
+
+    stats['inserted'] = len(inserts)
+    return stats
+
+
+def dep_fetch_devices(app: Flask, dep: DEP, dep_account_id: int) -> Dict[str, Union[int, float]]:
     """Perform fetch or sync of devices.
 
+    Every page is written with bulk inserts and updates, and the cursor returned with the page is stored in the same
+    transaction. If the sync is interrupted, the next run resumes from the last page that was committed.
+
+    The page size is taken from the ``DEP_PAGE_SIZE`` setting, up to the service maximum of 1000 records.
+
     TODO: If default DEP Profile is nominated, it is queued for assignment here. But may want to check `profile_status`
         to see whether only devices with the `removed` status are considered unassigned.
 
-    See:
-        https://docs.sqlalchemy.org/en/latest/orm/contextual.html
+    Returns:
+        Dict[str, Union[int, float]]: Counts of pages and device records processed, and the elapsed time in seconds.
     """
-    thread_session = db.create_scoped_session()
-
-    dep_account: DEPAccount = thread_session.query(DEPAccount).one()
+    started = time.monotonic()
+    dep_account: DEPAccount = db.session.query(DEPAccount).filter(DEPAccount.id == dep_account_id).one()
+    page_size = min(app.config.get('DEP_PAGE_SIZE', 100), DEP.MaxPageSize)
 
     if dep_account.cursor is not None:
         app.logger.info('Syncing using previous cursor: %s', dep_account.cursor)
     else:
         app.logger.info('No DEP cursor found, performing a full fetch')
 
-    # TODO: if fetched_until is quite recent, there's no reason to fetch again
-    for device_page in dep.devices(dep_account.cursor):
-        print(device_page)
-        for device in device_page['devices']:
-            if 'op_type' in device:  # its a sync, not a fetch
-                optype = DEPOperationType(device['op_type'])
-
-                if optype == DEPOperationType.Added:
-                    app.logger.debug('DEP Added: %s', device['serial_number'])
-                elif optype == DEPOperationType.Modified:
-                    app.logger.debug('DEP Modified: %s', device['serial_number'])
-                elif optype == DEPOperationType.Deleted:
-                    app.logger.debug('DEP Deleted: %s', device['serial_number'])
-                else:
-                    app.logger.error('DEP op_type not recognised (%s), skipping', device['op_type'])
-                    continue
-            else:
-                pass
+    stats = {'pages': 0, 'devices': 0, 'inserted': 0, 'updated': 0, 'deleted': 0, 'skipped': 0}
 
-            try:
-                d: Device = thread_session.query(Device).filter(Device.serial_number == device['serial_number']).one()
-                d.description = device['description']
-                d.model = device['model']
-                d.os = device['os']
-                d.device_family = device['device_family']
-                d.color = device['color']
-                d.profile_status = device['profile_status']
-                if device['profile_status'] != 'empty':
-                    d.profile_uuid = device.get('profile_uuid', None)  # Only exists in DEP Sync not Fetch?
-                    d.profile_assign_time = dateutil.parser.parse(device['profile_assign_time'])
-
-                d.device_assigned_by = device['device_assigned_by']
-                d.device_assigned_date = dateutil.parser.parse(device['device_assigned_date'])
-                d.is_dep = True
-
-            except sqlalchemy.orm.exc.NoResultFound:
-                app.logger.debug('No existing device record for serial: %s', device['serial_number'])
-
-                if device['profile_status'] != 'empty':
-                    device['profile_assign_time'] = dateutil.parser.parse(device['profile_assign_time'])
-
-                device['device_assigned_date'] = dateutil.parser.parse(device['device_assigned_date'])
-
-                if 'op_type' in device:
-                    del device['op_type']
-                    del device['op_date']
-                    del device['profile_assign_time']
-                    del device['device_assigned_date']
-
-                d = Device(**device)
-                d.is_dep = True
-                thread_session.add(d)
-
-            except sqlalchemy.exc.StatementError as e:
-                app.logger.error('Got a statement error trying to insert a DEP device: {}'.format(e))
+    # TODO: if fetched_until is quite recent, there's no reason to fetch again
+    for device_page in dep.devices(dep_account.cursor, limit=page_size):
+        devices = device_page.get('devices', [])
+        page_stats = dep_upsert_page(db.session, devices)
 
         app.logger.debug('Last DEP Cursor was: %s', device_page['cursor'])
         dep_account.cursor = device_page.get('cursor', None)
         dep_account.more_to_follow = device_page.get('more_to_follow', None)
         dep_account.fetched_until = dateutil.parser.parse(device_page['fetched_until'])
-        thread_session.commit()
+        db.session.commit()
+
+        stats['pages'] += 1
+        stats['devices'] += len(devices)
+        for k, v in page_stats.items():
+            stats[k] += v
+
+    stats['elapsed'] = time.monotonic() - started
+    app.logger.info('DEP sync processed %d device(s) in %d page(s) in %.1fs: %d inserted, %d updated, %d deleted, '
+                    '%d skipped', stats['devices'], stats['pages'], stats['elapsed'], stats['inserted'],
+                    stats['updated'], stats['deleted'], stats['skipped'])
+
+    return stats
 
 
 def dep_define_profiles(app: Flask, dep: DEP):
     """Create DEP profiles which have not yet been synced with Apple."""
-    thread_session = db.create_scoped_session()
-
-    dep_profiles_pending = thread_session.query(DEPProfile).filter(
+    dep_profiles_pending = db.session.query(DEPProfile).filter(
         DEPProfile.uuid.is_(None), DEPProfile.last_upload_at.is_(None)).all()
     app.logger.debug('There are %d pending DEP profile(s) to upload', len(dep_profiles_pending))
 
-    for dep_profile in dep_profiles_pending:
-        try:
-            schema = AppleDEPProfileSchema()
-            dep_profile_apple = schema.dump(dep_profile)
-            print(dep_profile_apple.data)
-            response = dep.define_profile(dep_profile_apple.data)
-            assert 'profile_uuid' in response
-            dep_profile.uuid = response['profile_uuid']
-            dep_profile.last_uploaded_at = datetime.datetime.now()
-        except Exception as e:
-            app.logger.error('Got an exception trying to define a profile: {}'.format(e))
+    defined = define_profiles(dep, dep_profiles_pending, app.config.get('DEP_ASSIGNMENT_WORKERS', 4))
+    db.session.commit()
+
+    if dep_profiles_pending:
+        app.logger.info('Defined %d of %d pending DEP profile(s)', defined, len(dep_profiles_pending))
+
 
-    thread_session.commit()
+def dep_assign_profiles(app: Flask, dep: DEP, dep_account: DEPAccount) -> Dict[str, int]:
+    """Assign DEP profiles to every device which does not have the profile it should have.
+
+    Returns:
+        Dict[str, int]: Assignment statistics, see :func:`commandment.dep.assignment.run_assignments`.
+    """
+    return run_assignments(dep, dep_account, max_workers=app.config.get('DEP_ASSIGNMENT_WORKERS', 4))
 
 
 def dep_thread_callback(app: Flask):
@@ -207,34 +241,38 @@ def dep_thread_callback(app: Flask):
         * Catch everything so we don't interrupt the thread (and it never reschedules)
         * Certificate expiration warnings/emails
     """
-    threadlocals = threading.local()
-
     with app.app_context():
         try:
             dep_account: DEPAccount = db.session.query(DEPAccount).one()
             app.logger.info('Checking DEP state')
 
-            dep = DEP(
-                consumer_key=dep_account.consumer_key,
-                consumer_secret=dep_account.consumer_secret,
-                access_token=dep_account.access_token,
-                access_secret=dep_account.access_secret,
-            )
+            dep = get_dep(dep_account)
 
             dep_sync_organization(app, dep)
 
             try:
                 dep_fetch_devices(app, dep, dep_account.id)
             except DEPServiceError as dse:
-                print(dse)
+                app.logger.error('DEP sync failed: %s', dse)
+                db.session.rollback()
                 if dse.text == 'EXPIRED_CURSOR':
                     app.logger.info("Sync cursor had expired, clearing for next run...")
                     dep_account.cursor = None
                     db.session.add(dep_account)
                     db.session.commit()
+                raise  # Fail the runner job so that it is retried, rather than recorded as succeeded.
 
             dep_define_profiles(app, dep)
+            dep_assign_profiles(app, dep, dep_account)
+
+            app.logger.info('DEP requests since the client was created: %s', ', '.join(
+                '{}={}'.format(k, v) for k, v in sorted(dep.metrics.as_dict().items())))
 
         except sqlalchemy.orm.exc.NoResultFound:
             app.logger.info('Not attempting a DEP sync, no account configured.')
 
+
+@job('dep.sync', leader_only=True)
+def dep_sync():
+    """Runner job which performs a single DEP synchronisation pass."""
+    dep_thread_callback(current_app._get_current_object())
@@ -22,7 +22,10 @@ from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from commandment.plistutil.nonewriter import dumps as dumps_none
 from commandment.enroll.util import generate_enroll_profile
 from commandment.cms.decorators import verify_cms_signers
-from commandment.pki.ca import get_ca
+from commandment.pki.ca import get_ca, get_signer
+from commandment.pki import keypool
+from commandment.enroll.cache import profile_cache, configuration_version, dump_profile, render_profile, \
+    with_identity
 
 enroll_app = Blueprint('enroll_app', __name__)
 
@@ -43,46 +46,47 @@ def trust_mobileconfig():
     :statuscode 200:
     :statuscode 500: The system has not been configured, so we can't produce anything.
     """
-    try:
-        org = db.session.query(Organization).one()
-    except NoResultFound:
-        abort(500, 'No organization is configured, cannot generate enrollment profile.')
-    except MultipleResultsFound:
-        abort(500, 'Multiple organizations, backup your database and start again')
-
-    profile = Profile(
-        identifier=org.payload_prefix + '.trust',
-        uuid=uuid4(),
-        display_name='Commandment Trust Profile',
-        description='Allows your device to trust the MDM server',
-        organization=org.name,
-        version=1,
-        scope=PayloadScope.System,
-    )
-
-    if 'CA_CERTIFICATE' in current_app.config:
-        # If you specified a CA certificate, we assume it isn't a CA trusted by Apple devices.
-        ca_payload = ca_trust_payload_from_configuration()
-        profile.payloads.append(ca_payload)
-
-    if 'SSL_CERTIFICATE' in current_app.config:
-        basepath = os.path.dirname(__file__)
-        certpath = os.path.join(basepath, current_app.config['SSL_CERTIFICATE'])
-        with open(certpath, 'rb') as fd:
-            pem_payload = PEMCertificatePayload(
-                uuid=uuid4(),
-                identifier=org.payload_prefix + '.ssl',
-                payload_content=fd.read(),
-                display_name='Web Server Certificate',
-                description='Required for your device to trust the server',
-                type='com.apple.security.pkcs1',
-                version=1
-            )
-            profile.payloads.append(pem_payload)
-
-    schema = profile_schema.ProfileSchema()
-    result = schema.dump(profile)
-    plist_data = dumps_none(result.data, skipkeys=True)
+    def render() -> bytes:
+        try:
+            org = db.session.query(Organization).one()
+        except NoResultFound:
+            abort(500, 'No organization is configured, cannot generate enrollment profile.')
+        except MultipleResultsFound:
+            abort(500, 'Multiple organizations, backup your database and start again')
+
+        profile = Profile(
+            identifier=org.payload_prefix + '.trust',
+            uuid=uuid4(),
+            display_name='Commandment Trust Profile',
+            description='Allows your device to trust the MDM server',
+            organization=org.name,
+            version=1,
+            scope=PayloadScope.System,
+        )
+
+        if 'CA_CERTIFICATE' in current_app.config:
+            # If you specified a CA certificate, we assume it isn't a CA trusted by Apple devices.
+            ca_payload = ca_trust_payload_from_configuration()
+            profile.payloads.append(ca_payload)
+
+        if 'SSL_CERTIFICATE' in current_app.config:
+            basepath = os.path.dirname(__file__)
+            certpath = os.path.join(basepath, current_app.config['SSL_CERTIFICATE'])
+            with open(certpath, 'rb') as fd:
+                pem_payload = PEMCertificatePayload(
+                    uuid=uuid4(),
+                    identifier=org.payload_prefix + '.ssl',
+                    payload_content=fd.read(),
+                    display_name='Web Server Certificate',
+                    description='Required for your device to trust the server',
+                    type='com.apple.security.pkcs1',
+                    version=1
+                )
+                profile.payloads.append(pem_payload)
+
+        return render_profile(profile)
+
+    plist_data = profile_cache.get('trust', configuration_version(), render)
 
     return plist_data, 200, {'Content-Type': PROFILE_CONTENT_TYPE,
                              'Content-Disposition': 'attachment; filename="trust.mobileconfig"'}
@@ -93,15 +97,16 @@ def enroll():
     """Generate an enrollment profile."""
 
     ca = get_ca()
-    key, csr = ca.create_device_csr('device-identity')
-    device_certificate = ca.sign(csr)
+    key, csr = ca.create_device_csr('device-identity', keypool.take())
+    device_certificate = get_signer().sign(csr)
 
     pkcs12_payload = identity_payload(key, device_certificate, 'sekret')
-    profile = generate_enroll_profile(pkcs12_payload)
 
-    schema = profile_schema.ProfileSchema()
-    result = schema.dump(profile)
-    plist_data = dumps_none(result.data, skipkeys=True)
+    # Everything but the identity is the same for every device. The identity rendered into the cached template is
+    # replaced for every request, including this one.
+    template = profile_cache.get('enroll.identity', configuration_version(),
+                                 lambda: dump_profile(generate_enroll_profile(pkcs12_payload)))
+    plist_data = dumps_none(with_identity(template, pkcs12_payload), skipkeys=True)
 
     return plist_data, 200, {'Content-Type': PROFILE_CONTENT_TYPE}
 
@@ -113,30 +118,33 @@ def ota_enroll():
     This endpoint represents the delivery of the `Profile Service` profile that should be delivered AFTER the user has
     successfully authenticated.
     """
-    try:
-        org = db.session.query(Organization).one()
-    except NoResultFound:
-        abort(500, 'No organization is configured, cannot generate enrollment profile.')
-    except MultipleResultsFound:
-        abort(500, 'Multiple organizations, backup your database and start again')
-
-    profile = {
-        'PayloadType': 'Profile Service',
-        'PayloadIdentifier': org.payload_prefix + '.ota.enroll',
-        'PayloadUUID': 'FACC45E7-CB0E-4F8B-AA3E-E22DC161E25E', #str(uuid4()),
-        'PayloadVersion': 1,
-        'PayloadDisplayName': 'Commandment Profile Service',
-        'PayloadDescription': 'Enrolls your device with Commandment',
-        'PayloadOrganization': org.name,
-        'PayloadContent': {
-            'URL': 'https://{}:{}/enroll/ota_authenticate'.format(
-                current_app.config['PUBLIC_HOSTNAME'], current_app.config['PORT']
-            ),
-            'DeviceAttributes': list(AllDeviceAttributes),
-            'Challenge': 'TODO',
-        },
-    }
-    plist_data = dumps_none(profile)
+    def render() -> bytes:
+        try:
+            org = db.session.query(Organization).one()
+        except NoResultFound:
+            abort(500, 'No organization is configured, cannot generate enrollment profile.')
+        except MultipleResultsFound:
+            abort(500, 'Multiple organizations, backup your database and start again')
+
+        profile = {
+            'PayloadType': 'Profile Service',
+            'PayloadIdentifier': org.payload_prefix + '.ota.enroll',
+            'PayloadUUID': 'FACC45E7-CB0E-4F8B-AA3E-E22DC161E25E', #str(uuid4()),
+            'PayloadVersion': 1,
+            'PayloadDisplayName': 'Commandment Profile Service',
+            'PayloadDescription': 'Enrolls your device with Commandment',
+            'PayloadOrganization': org.name,
+            'PayloadContent': {
+                'URL': 'https://{}:{}/enroll/ota_authenticate'.format(
+                    current_app.config['PUBLIC_HOSTNAME'], current_app.config['PORT']
+                ),
+                'DeviceAttributes': list(AllDeviceAttributes),
+                'Challenge': 'TODO',
+            },
+        }
+        return dumps_none(profile)
+
+    plist_data = profile_cache.get('ota.enroll', configuration_version(), render)
 
     return plist_data, 200, {'Content-Type': PROFILE_CONTENT_TYPE}
 
@@ -184,17 +192,14 @@ def ota_authenticate():
 
     current_app.logger.debug(device_attributes)
 
-    try:
-        org = db.session.query(Organization).one()
-    except NoResultFound:
-        abort(500, 'No organization is configured, cannot generate enrollment profile.')
-    except MultipleResultsFound:
-        abort(500, 'Multiple organizations, backup your database and start again')
+    def render_phase3() -> bytes:
+        try:
+            org = db.session.query(Organization).one()
+        except NoResultFound:
+            abort(500, 'No organization is configured, cannot generate enrollment profile.')
+        except MultipleResultsFound:
+            abort(500, 'Multiple organizations, backup your database and start again')
 
-    # TODO: Behold, the stupidest thing ever just to get this working, theres no way this should be prod:
-    # Phase 4 does not send a challenge but phase 3 does
-    if 'CHALLENGE' in device_attributes:
-        # Reply SCEP
         profile = Profile(
             identifier=org.payload_prefix + '.ota.phase3',
             uuid=uuid4(),
@@ -207,12 +212,17 @@ def ota_authenticate():
 
         scep_payload = scep_payload_from_configuration()
         profile.payloads.append(scep_payload)
-    else:
-        profile = generate_enroll_profile()
 
-    schema = profile_schema.ProfileSchema()
-    result = schema.dump(profile)
-    plist_data = dumps_none(result.data, skipkeys=True)
+        return render_profile(profile)
+
+    # TODO: Behold, the stupidest thing ever just to get this working, theres no way this should be prod:
+    # Phase 4 does not send a challenge but phase 3 does
+    if 'CHALLENGE' in device_attributes:
+        # Reply SCEP
+        plist_data = profile_cache.get('ota.phase3', configuration_version(), render_phase3)
+    else:
+        plist_data = profile_cache.get('enroll.scep', configuration_version(),
+                                       lambda: render_profile(generate_enroll_profile()))
 
     return plist_data, 200, {'Content-Type': PROFILE_CONTENT_TYPE}
 
@@ -0,0 +1,148 @@
+"""
+Cache of rendered enrollment and trust profiles.
+
+Building these profiles reads certificates from disk, parses the push certificate, queries the `Organization` and
+`SCEPConfig` and marshals everything through the profile schema. None of that changes between requests, so the
+rendered result is kept and reused until the configuration version changes. The version is made up of the
+organization and SCEP configuration rows, the modification time of every configured certificate file and the settings
+used in the profiles, so changes made by any process are picked up on the next request.
+
+The device identity in ``/enroll/profile`` is unique to every request, it is swapped into the cached profile by
+:func:`with_identity`.
+"""
+import copy
+import os.path
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import uuid4
+from flask import current_app, has_request_context, request
+
+from commandment.models import db, Organization, SCEPConfig
+from commandment.profiles import plist_schema as profile_schema
+from commandment.profiles.models import Profile, PKCS12CertificatePayload
+from commandment.plistutil.nonewriter import dumps as dumps_none
+
+#: Settings which are rendered into the cached profiles.
+PROFILE_SETTINGS = ('PUBLIC_HOSTNAME', 'PORT', 'SCEPY_CHALLENGE', 'CA_CERTIFICATE', 'SSL_CERTIFICATE',
+                    'PUSH_CERTIFICATE')
+
+
+def push_certificate_path() -> str:
+    """The path of the push certificate in PEM format, resolved the same way as the push service does."""
+    path = os.path.join(os.path.dirname(current_app.root_path), current_app.config['PUSH_CERTIFICATE'])
+    basename, ext = os.path.splitext(path)
+    if ext.lower() == '.p12':  # push service will have re-exported the PKCS#12 container
+        return basename + '.crt'
+
+    return path
+
+
+def ssl_certificate_path() -> str:
+    return os.path.join(os.path.dirname(__file__), current_app.config['SSL_CERTIFICATE'])
+
+
+def file_version(path: Optional[str]) -> Optional[Tuple[str, int, int]]:
+    """Identify the current version of a file by its modification time and size."""
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, 0, 0
+
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def configuration_version() -> tuple:
+    """Get a value which changes whenever anything rendered into an enrollment or trust profile changes.
+
+    This costs two small queries, which is much less than rendering a profile.
+    """
+    config = current_app.config
+    files = [file_version(config.get('CA_CERTIFICATE'))]
+    if 'SSL_CERTIFICATE' in config:
+        files.append(file_version(ssl_certificate_path()))
+    if 'PUSH_CERTIFICATE' in config:
+        files.append(file_version(push_certificate_path()))
+
+    return (
+        tuple(db.session.query(*Organization.__table__.columns).order_by(Organization.id)),
+        tuple(db.session.query(*SCEPConfig.__table__.columns).order_by(SCEPConfig.id)),
+        tuple(files),
+        tuple(config.get(key) for key in PROFILE_SETTINGS),
+        request.host_url if has_request_context() else None,  # url_for(_external=True) depends on the host
+    )
+
+
+class ProfileCache(object):
+    """Keeps the last rendered value of each profile, along with the configuration version it was rendered from."""
+    def __init__(self):
+        self._entries: Dict[str, Tuple[tuple, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, version: tuple, render: Callable[[], Any]) -> Any:
+        """Get a rendered profile, rendering it if the cached value is missing or from another version.
+
+        Args:
+            name (str): Identifies the profile.
+            version (tuple): The current configuration version, see `configuration_version`.
+            render (Callable[[], Any]): Renders the profile. Nothing is cached if it raises (eg. by calling abort).
+
+        Returns:
+            Any: The value returned by ``render``.
+        """
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        value = render()
+        with self._lock:
+            self._entries[name] = (version, value)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+profile_cache = ProfileCache()
+
+
+def dump_profile(profile: Profile) -> dict:
+    """Marshal a profile into the dict which is written as a plist."""
+    return profile_schema.ProfileSchema().dump(profile).data
+
+
+def render_profile(profile: Profile) -> bytes:
+    """Marshal a profile and write it as a plist."""
+    return dumps_none(dump_profile(profile), skipkeys=True)
+
+
+def with_identity(template: dict, identity: PKCS12CertificatePayload) -> dict:
+    """Replace the device identity in a marshalled enrollment profile.
+
+    The identity payload is swapped, the MDM payload is pointed at the new identity and the profile gets a new UUID.
+    The template itself is not modified.
+
+    Args:
+        template (dict): A marshalled enrollment profile, which contains a PKCS#12 identity payload.
+        identity (PKCS12CertificatePayload): The identity for this device.
+
+    Returns:
+        dict: The enrollment profile for this device.
+    """
+    identity_content = profile_schema.schema_for(identity.type)().dump(identity).data
+    profile = copy.copy(template)
+    profile['PayloadUUID'] = str(uuid4())
+
+    payloads = []
+    for payload in template['PayloadContent']:
+        if payload['PayloadType'] == identity.type:
+            payload = identity_content
+        elif payload['PayloadType'] == 'com.apple.mdm':
+            payload = dict(payload, IdentityCertificateUUID=identity_content['PayloadUUID'])
+        payloads.append(payload)
+
+    profile['PayloadContent'] = payloads
+    return profile
@@ -5,6 +5,7 @@ from flask import abort, current_app
 from commandment.enroll.profiles import scep_payload_from_configuration, ca_trust_payload_from_configuration, \
     ssl_trust_payload_from_configuration
 from commandment.models import db, Organization
+from commandment.enroll.cache import push_certificate_path
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.x509.name import NameOID
@@ -39,17 +40,13 @@ def generate_enroll_profile(pkcs12_payload: Optional[PKCS12CertificatePayload] =
     except MultipleResultsFound:
         abort(500, 'Multiple organizations, backup your database and start again')
 
-    push_certificate_path = os.path.join(os.path.dirname(current_app.root_path), current_app.config['PUSH_CERTIFICATE'])
+    certificate_path = push_certificate_path()
 
-    if os.path.exists(push_certificate_path):
-        push_certificate_basename, ext = os.path.splitext(push_certificate_path)
-        if ext.lower() == '.p12':  # push service will have re-exported the PKCS#12 container
-            push_certificate_path = push_certificate_basename + '.crt'
-
-        with open(push_certificate_path, 'rb') as fd:
+    if os.path.exists(certificate_path):
+        with open(certificate_path, 'rb') as fd:
             push_certificate = x509.load_pem_x509_certificate(fd.read(), backend=default_backend())
     else:
-        abort(500, 'No push certificate available at: {}'.format(push_certificate_path))
+        abort(500, 'No push certificate available at: {}'.format(certificate_path))
 
     if not org.payload_prefix:
         abort(500, 'MDM configuration has no profile prefix')
@@ -0,0 +1,153 @@
+"""
+Normalized catalog of installed applications.
+
+Each distinct application reported by any device is stored once as an `ApplicationVersion`, identified by a digest of
+all of its attributes, and the ``installed_applications`` table only references it with the few attributes that
+belong to the installation on a device. Finding the devices which have an application installed is an index lookup of
+its versions followed by an index lookup of their installations.
+
+The digest is also computed by the migration which created the catalog, see `version_key`.
+"""
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from commandment.models import db, Device
+from .models import ApplicationVersion, InstalledApplication, installed_applications
+
+#: Attributes of an `ApplicationVersion`, in the order hashed by `version_key`.
+CATALOG_FIELDS = (
+    'bundle_identifier',
+    'version',
+    'short_version',
+    'name',
+    'bundle_size',
+    'external_version_identifier',
+    'adhoc_codesigned',
+    'appstore_vendable',
+    'beta_app',
+)
+
+#: Attributes of an installed application which are stored for each device.
+INSTALLATION_FIELDS = (
+    'dynamic_size',
+    'is_validated',
+    'device_based_vpp',
+    'has_update_available',
+    'installing',
+)
+
+#: Number of keys looked up per query, below the SQLite limit of bound parameters.
+LOOKUP_BATCH_SIZE = 500
+
+
+def version_key(application: dict) -> str:
+    """Get the `ApplicationVersion.key` of an application.
+
+    Args:
+        application (dict): The attributes of an installed application, missing attributes are empty.
+
+    Returns:
+        str: The hex SHA-256 digest of the JSON array of the `CATALOG_FIELDS` values.
+    """
+    values = [application.get(field) for field in CATALOG_FIELDS]
+    return hashlib.sha256(json.dumps(values).encode('utf8')).hexdigest()
+
+
+def _lookup(keys: Iterable[str]) -> Dict[str, int]:
+    keys = list(keys)
+    found = {}
+    for offset in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        found.update(db.session.query(ApplicationVersion.key, ApplicationVersion.id).filter(
+            ApplicationVersion.key.in_(keys[offset:offset + LOOKUP_BATCH_SIZE])))
+
+    return found
+
+
+def _insert_ignoring_conflicts(rows: List[dict]):
+    """Insert catalog rows, skipping those whose key was inserted by another device reporting at the same time."""
+    table = ApplicationVersion.__table__
+    dialect = db.session.get_bind(ApplicationVersion.__mapper__).dialect.name
+
+    if dialect == 'postgresql':
+        db.session.execute(postgresql.insert(table).on_conflict_do_nothing(index_elements=['key']), rows)
+    elif dialect == 'sqlite':
+        db.session.execute(table.insert().prefix_with('OR IGNORE'), rows)
+    else:
+        # A conflict rolls back the savepoint, so each row needs its own.
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert(), row)
+            except IntegrityError:
+                pass
+
+
+def application_version_ids(applications: Sequence[dict]) -> List[int]:
+    """Find or create the catalog rows of applications.
+
+    Args:
+        applications (Sequence[dict]): The attributes of each installed application.
+
+    Returns:
+        List[int]: The `ApplicationVersion` ID of each application.
+    """
+    keys = [version_key(application) for application in applications]
+    ids = _lookup(set(keys))
+
+    missing = {}
+    for key, application in zip(keys, applications):
+        if key not in ids:
+            missing[key] = application
+
+    if missing:
+        _insert_ignoring_conflicts([dict({field: application.get(field) for field in CATALOG_FIELDS}, key=key)
+                                    for key, application in missing.items()])
+        ids.update(_lookup(missing))
+
+    return [ids[key] for key in keys]
+
+
+def replace_installed_applications(device: Device, applications: Sequence[dict]):
+    """Replace the installed applications of a device.
+
+    The caller is responsible for committing the session.
+
+    Args:
+        device (Device): The device, which must have been flushed.
+        applications (Sequence[dict]): The attributes of each installed application, as loaded by
+            `commandment.mdm.response_schema.InstalledApplicationItem`.
+    """
+    db.session.execute(installed_applications.delete().where(installed_applications.c.device_id == device.id))
+
+    if applications:
+        version_ids = application_version_ids(applications)
+        db.session.execute(installed_applications.insert(), [
+            dict({field: application.get(field) for field in INSTALLATION_FIELDS},
+                 device_id=device.id, device_udid=device.udid, application_version_id=version_id)
+            for application, version_id in zip(applications, version_ids)
+        ])
+
+    db.session.expire(device, ['installed_applications'])
+
+
+def devices_with_application(bundle_identifier: str, version: Optional[str] = None) -> List[int]:
+    """Get the IDs of the devices which have an application installed.
+
+    Args:
+        bundle_identifier (str): The bundle identifier of the application.
+        version (Optional[str]): Only devices with this version installed.
+
+    Returns:
+        List[int]: The device IDs, in ascending order.
+    """
+    query = db.session.query(InstalledApplication.device_id).filter(
+        InstalledApplication.bundle_identifier == bundle_identifier,
+        InstalledApplication.device_id.isnot(None),
+    )
+    if version is not None:
+        query = query.filter(InstalledApplication.version == version)
+
+    return [device_id for device_id, in query.distinct().order_by(InstalledApplication.device_id)]
@@ -0,0 +1,218 @@
+"""
+Streaming export of the inventory of the whole fleet.
+
+Each dataset is read in primary key order through a server side cursor, ``chunk_size`` row tuples at a time, and
+written as text chunks without loading any ORM objects, so the memory used does not depend on the number of rows.
+The exported columns are the attributes of the JSON:API schema of the resource, formatted the same way, plus the
+device of inventory rows.
+
+Formats:
+
+- ``ndjson``: One JSON object per row.
+- ``csv``: A header row, then one row per record. Missing values are empty.
+- ``columns``: One JSON object per chunk, ``{"rows": <count>, "columns": {"<name>": [<values>], ...}}``.
+
+The export is served by ``GET /api/v1/export/<dataset>?format=<format>``, or written by the command line::
+
+    commandment-export installed_applications --format csv --output applications.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from flask import Flask
+from marshmallow_jsonapi.fields import Relationship
+from sqlalchemy.orm import ColumnProperty
+
+from commandment.api.compiled import encode
+from commandment.api.schema import DeviceSchema
+from commandment.models import db, Device
+from .models import InstalledApplication, InstalledCertificate, InstalledProfile
+from .schema import InstalledApplicationSchema, InstalledCertificateSchema, InstalledProfileSchema
+
+#: Dataset name to the model, its JSON:API schema and other model attributes to export.
+DATASETS = {
+    'devices': (Device, DeviceSchema, ()),
+    'installed_applications': (InstalledApplication, InstalledApplicationSchema, ('device_id', 'device_udid')),
+    'installed_certificates': (InstalledCertificate, InstalledCertificateSchema, ('device_id', 'device_udid')),
+    'installed_profiles': (InstalledProfile, InstalledProfileSchema, ('device_id', 'device_udid')),
+}
+
+#: Export format to the MIME type of the response.
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'columns': 'application/x-ndjson',
+}
+
+#: Export format to the file name extension.
+EXTENSIONS = {
+    'ndjson': 'ndjson',
+    'csv': 'csv',
+    'columns': 'columns.ndjson',
+}
+
+Column = Tuple[str, Any, Callable[[Any], Any]]
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def export_columns(dataset: str) -> List[Column]:
+    """Get the exported columns of a dataset.
+
+    Returns:
+        List[Tuple[str, Any, Callable[[Any], Any]]]: The name, the model attribute and the function which formats a
+            value of each column.
+    """
+    model, schema_class, extra = DATASETS[dataset]
+    schema = schema_class()
+
+    columns = []
+    for name, field in schema.fields.items():
+        if field.load_only or isinstance(field, Relationship):
+            continue
+        attribute = getattr(model, field.attribute or name, None)
+        if not isinstance(getattr(attribute, 'property', None), ColumnProperty):
+            continue
+        columns.append((field.dump_to or name, attribute,
+                        lambda value, field=field, name=name: field._serialize(value, name, None)))
+
+    for name in extra:
+        columns.append((name, getattr(model, name), _identity))
+
+    return columns
+
+
+def iter_chunks(dataset: str, columns: List[Column], chunk_size: int) -> Iterator[List[list]]:
+    """Read the formatted values of a dataset from a server side cursor.
+
+    Args:
+        dataset (str): The dataset name.
+        columns (List[Column]): The columns to read, as returned by `export_columns`.
+        chunk_size (int): The number of rows fetched from the cursor at once, and yielded per chunk.
+
+    Yields:
+        List[list]: Up to ``chunk_size`` rows of values.
+    """
+    model = DATASETS[dataset][0]
+    rows = iter(db.session.query(*[attribute for _, attribute, _ in columns])
+                .order_by(model.id)
+                .yield_per(chunk_size))
+    formats = [(i, f) for i, (_, _, f) in enumerate(columns) if f is not _identity]
+
+    while True:
+        chunk = [list(row) for row in islice(rows, chunk_size)]
+        if not chunk:
+            return
+
+        for row in chunk:
+            for i, format_value in formats:
+                if row[i] is not None:
+                    row[i] = format_value(row[i])
+
+        yield chunk
+
+
+def ndjson_writer(names: List[str], chunks: Iterator[List[list]]) -> Iterator[str]:
+    """Write one JSON object per row."""
+    keys = [encode(name) + ': ' for name in names]
+    for chunk in chunks:
+        yield ''.join(['{' + ', '.join([k + encode(v) for k, v in zip(keys, row)]) + '}\n' for row in chunk])
+
+
+def csv_writer(names: List[str], chunks: Iterator[List[list]]) -> Iterator[str]:
+    """Write a header and one CSV row per row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():  # Header of an empty dataset
+        yield buffer.getvalue()
+
+
+def columns_writer(names: List[str], chunks: Iterator[List[list]]) -> Iterator[str]:
+    """Write one JSON object per chunk holding an array of values per column."""
+    for chunk in chunks:
+        yield json.dumps({'rows': len(chunk), 'columns': dict(zip(names, map(list, zip(*chunk))))}) + '\n'
+
+
+WRITERS: Dict[str, Callable[[List[str], Iterator[List[list]]], Iterator[str]]] = {
+    'ndjson': ndjson_writer,
+    'csv': csv_writer,
+    'columns': columns_writer,
+}
+
+
+def export(dataset: str, output_format: str = 'ndjson', chunk_size: int = 10000) -> Iterator[str]:
+    """Export a dataset as text chunks.
+
+    Args:
+        dataset (str): One of `DATASETS`.
+        output_format (str): One of `FORMATS`.
+        chunk_size (int): The number of rows per chunk.
+
+    Returns:
+        Iterator[str]: The exported text, one chunk per ``chunk_size`` rows.
+
+    Raises:
+        ValueError: If the dataset or format is not known.
+    """
+    if dataset not in DATASETS:
+        raise ValueError('Unknown dataset: {}'.format(dataset))
+    if output_format not in WRITERS:
+        raise ValueError('Unknown format: {}'.format(output_format))
+
+    columns = export_columns(dataset)
+    return WRITERS[output_format]([name for name, _, _ in columns], iter_chunks(dataset, columns, chunk_size))
+
+
+def create_export_app(config_file: Optional[str] = None) -> Flask:
+    """Create an application with only the database, so that exporting does not start the background threads."""
+    app = Flask('commandment')
+    app.config.from_object('commandment.default_settings')
+    if config_file is not None:
+        app.config.from_pyfile(config_file)
+    else:
+        app.config.from_envvar('COMMANDMENT_SETTINGS')
+    db.init_app(app)
+
+    return app
+
+
+parser = argparse.ArgumentParser(description='Export the inventory of all devices')
+parser.add_argument('dataset', choices=sorted(DATASETS), help='The dataset to export')
+parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson', help='The output format')
+parser.add_argument('--output', help='The file to write, defaults to standard output')
+parser.add_argument('--chunk-size', type=int, help='Rows fetched per chunk, defaults to INVENTORY_EXPORT_CHUNK_SIZE')
+parser.add_argument('--config', help='Settings file, defaults to the COMMANDMENT_SETTINGS environment variable')
+
+
+def main():
+    args = parser.parse_args()
+    app = create_export_app(args.config)
+
+    with app.app_context():
+        chunk_size = args.chunk_size or app.config['INVENTORY_EXPORT_CHUNK_SIZE']
+        output = open(args.output, 'w', newline='', encoding='utf8') if args.output else sys.stdout
+        try:
+            for text in export(args.dataset, args.format, chunk_size):
+                output.write(text)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
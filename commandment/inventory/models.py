@@ -1,34 +1,29 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.mutable import MutableList
+from sqlalchemy.orm import Session
 
 from commandment.models import db
 from commandment.dbtypes import GUID, JSONEncodedDict
 
 
-class InstalledApplication(db.Model):
-    """This model represents a single application that was returned as part of an ``InstalledApplicationList`` query.
-
-    It is impossible to create a composite key to uniquely identify each row, therefore every time the device reports
-    back we need to wipe all rows associated with a single device. The reason why a composite key won't work here is
-    that macOS will often report the binary name and no identifier, version, or size (and sometimes iOS can do the
-    inverse of that).
+class ApplicationVersion(db.Model):
+    """This model represents one distinct application, as described by the devices which have it installed.
 
-    :table: installed_applications
+    Devices report the same few thousand applications, so the attributes which describe the application itself are
+    stored once per distinct combination of values here, and `InstalledApplication` only holds the attributes which
+    belong to the copy installed on a device. Rows are found or created by
+    :func:`commandment.inventory.catalog.application_version_ids` and never updated.
 
-    See Also:
-          - `InstalledApplicationList Command <https://developer.apple.com/library/content/documentation/Miscellaneous/Reference/MobileDeviceManagementProtocolRef/3-MDM_Protocol/MDM_Protocol.html#//apple_ref/doc/uid/TP40017387-CH3-SW14>`_.
+    :table: application_versions
     """
-    __tablename__ = 'installed_applications'
+    __tablename__ = 'application_versions'
 
     id = db.Column(db.Integer, primary_key=True)
     """id (int): Identifier"""
-    device_udid = db.Column(db.String(40), index=True, nullable=False)
-    """device_udid (GUID): Unique device identifier"""
-    device_id = db.Column(db.ForeignKey('devices.id'), nullable=True)
-    """device_id (int): Parent relationship ID of the device"""
-    device = db.relationship('Device', backref='installed_applications')
-    """device (db.relationship): SQLAlchemy relationship to the device."""
+    key = db.Column(db.String(64), nullable=False, unique=True)
+    """key (str): SHA-256 digest of all other attributes, which identifies the row because any of them may be empty."""
 
-    # Many of these can be empty, so there is no valid composite key
     bundle_identifier = db.Column(db.String, index=True)
     """bundle_identifier (str): The com.xxx.yyy bundle identifier for the application. May be empty."""
     version = db.Column(db.String, index=True)
@@ -39,19 +34,86 @@ class InstalledApplication(db.Model):
     """name (str): The application name"""
     bundle_size = db.Column(db.BigInteger)
     """bundle_size (int): The application size"""
-    dynamic_size = db.Column(db.BigInteger)
-    """dynamic_size (int): The dynamic data size (for iOS containers)."""
-    is_validated = db.Column(db.Boolean)
-    """is_validated (bool):"""
     external_version_identifier = db.Column(db.BigInteger, index=True)
     """external_version_identifier (int): The application’s external version ID. 
        It can be used for comparison in the iTunes Search API to decide if the application needs to be updated."""
     adhoc_codesigned = db.Column(db.Boolean)
     appstore_vendable = db.Column(db.Boolean)
     beta_app = db.Column(db.Boolean)
-    device_based_vpp = db.Column(db.Boolean)
-    has_update_available = db.Column(db.Boolean)
-    installing = db.Column(db.Boolean)
+
+
+installed_applications = db.Table(
+    'installed_applications',
+    db.metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('device_udid', db.String(40), index=True, nullable=False),
+    db.Column('device_id', db.ForeignKey('devices.id'), nullable=True, index=True),
+    db.Column('application_version_id', db.ForeignKey('application_versions.id'), nullable=False, index=True),
+    db.Column('dynamic_size', db.BigInteger),
+    db.Column('is_validated', db.Boolean),
+    db.Column('device_based_vpp', db.Boolean),
+    db.Column('has_update_available', db.Boolean),
+    db.Column('installing', db.Boolean),
+)
+"""The installed applications of each device, referencing the `ApplicationVersion` which was installed."""
+
+
+class InstalledApplication(db.Model):
+    """This model represents a single application that was returned as part of an ``InstalledApplicationList`` query.
+
+    It is impossible to create a composite key to uniquely identify each row, therefore every time the device reports
+    back we need to wipe all rows associated with a single device. The reason why a composite key won't work here is
+    that macOS will often report the binary name and no identifier, version, or size (and sometimes iOS can do the
+    inverse of that).
+
+    The model is mapped over the ``installed_applications`` table joined to its `ApplicationVersion`, so it has the
+    attributes of both. It is read only: the installed applications of a device are written by
+    :func:`commandment.inventory.catalog.replace_installed_applications`, and a flush which would insert, delete or
+    change the catalog attributes of an instance raises `InvalidRequestError`, because the catalog row is shared by
+    every device with that application. Only ``device_id`` may change, so that a device can still be deleted.
+
+    :table: installed_applications
+
+    See Also:
+          - `InstalledApplicationList Command <https://developer.apple.com/library/content/documentation/Miscellaneous/Reference/MobileDeviceManagementProtocolRef/3-MDM_Protocol/MDM_Protocol.html#//apple_ref/doc/uid/TP40017387-CH3-SW14>`_.
+    """
+    __table__ = db.join(installed_applications, ApplicationVersion.__table__)
+    __mapper_args__ = {'primary_key': [installed_applications.c.id]}
+
+    id = installed_applications.c.id
+    """id (int): Identifier"""
+    application_version_id = db.column_property(installed_applications.c.application_version_id,
+                                                ApplicationVersion.__table__.c.id)
+    """application_version_id (int): The ID of the application version"""
+    device = db.relationship('Device', backref='installed_applications')
+    """device (db.relationship): SQLAlchemy relationship to the device."""
+
+
+#: `InstalledApplication` attributes which a flush may change, all of them columns of ``installed_applications``.
+INSTALLED_APPLICATION_WRITABLE = frozenset(('device', 'device_id'))
+
+
+@event.listens_for(Session, 'before_flush')
+def _installed_applications_read_only(session: Session, flush_context, instances):
+    """Refuse to flush changes made through the `InstalledApplication` join."""
+    for instance in session.new:
+        if isinstance(instance, InstalledApplication):
+            raise InvalidRequestError('InstalledApplication is read only, '
+                                      'use commandment.inventory.catalog.replace_installed_applications()')
+
+    for instance in session.deleted:
+        if isinstance(instance, InstalledApplication):
+            raise InvalidRequestError('InstalledApplication is read only, deleting it would delete the shared '
+                                      'application_versions row')
+
+    for instance in session.dirty:
+        if isinstance(instance, InstalledApplication):
+            state = inspect(instance)
+            changed = [attr.key for attr in state.attrs
+                       if attr.key not in INSTALLED_APPLICATION_WRITABLE and attr.history.has_changes()]
+            if changed:
+                raise InvalidRequestError('InstalledApplication is read only, cannot change: {}'.format(
+                    ', '.join(changed)))
 
 
 class InstalledCertificate(db.Model):
@@ -182,3 +244,44 @@ class AvailableOSUpdate(db.Model):
     build = db.Column(db.String)
     download_size = db.Column(db.BigInteger)
     install_size = db.Column(db.BigInteger)
+
+
+class ApplicationVersionCount(db.Model):
+    """The number of devices with a version of an application installed, see :mod:`commandment.inventory.rollups`.
+
+    A row is either the count written by the last refresh, or a +1 or -1 recorded since then when a device reported its
+    installed applications. The number of devices is the sum of the rows of a key.
+
+    :table: application_version_counts
+    """
+    __tablename__ = 'application_version_counts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    bundle_identifier = db.Column(db.String)
+    version = db.Column(db.String)
+    device_count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_application_version_counts_key', 'bundle_identifier', 'version'),
+    )
+
+
+class DeviceModelCount(db.Model):
+    """The number of devices of a model, operating system version and platform, see
+    :mod:`commandment.inventory.rollups`.
+
+    Rows are counts and deltas like `ApplicationVersionCount`.
+
+    :table: device_model_counts
+    """
+    __tablename__ = 'device_model_counts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String)
+    os_version = db.Column(db.String)
+    platform = db.Column(db.String)
+    device_count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_device_model_counts_key', 'platform', 'model', 'os_version'),
+    )
@@ -7,9 +7,12 @@ from commandment.inventory.schema import InstalledApplicationSchema, InstalledCe
 from commandment.inventory.models import db, InstalledApplication, InstalledCertificate, InstalledProfile, \
     AvailableOSUpdate
 from commandment.models import Device
+from commandment.api.keyset import KeysetDataLayer, KeysetResourceList
 
 
-class InstalledApplicationsList(ResourceList):
+class InstalledApplicationsList(KeysetResourceList):
+    methods = ['GET']
+
     def query(self, view_kwargs):
         query_ = self.session.query(InstalledApplication)
         if view_kwargs.get('device_id') is not None:
@@ -25,11 +28,13 @@ class InstalledApplicationsList(ResourceList):
     data_layer = {
         'session': db.session,
         'model': InstalledApplication,
+        'class': KeysetDataLayer,
         'methods': {'query': query}
     }
 
 
 class InstalledApplicationDetail(ResourceDetail):
+    methods = ['GET']
     schema = InstalledApplicationSchema
     data_layer = {
         'session': db.session,
@@ -37,7 +42,7 @@ class InstalledApplicationDetail(ResourceDetail):
     }
 
 
-class InstalledCertificatesList(ResourceList):
+class InstalledCertificatesList(KeysetResourceList):
     def query(self, view_kwargs):
         query_ = self.session.query(InstalledCertificate)
         if view_kwargs.get('device_id') is not None:
@@ -54,6 +59,7 @@ class InstalledCertificatesList(ResourceList):
     data_layer = {
         'session': db.session,
         'model': InstalledCertificate,
+        'class': KeysetDataLayer,
         'methods': {'query': query}
     }
 
@@ -82,7 +88,7 @@ class InstalledCertificateDetail(ResourceDetail):
 #         'model': Payload
 #     }
 
-class InstalledProfilesList(ResourceList):
+class InstalledProfilesList(KeysetResourceList):
     def query(self, view_kwargs):
         query_ = self.session.query(InstalledProfile)
         if view_kwargs.get('device_id') is not None:
@@ -99,6 +105,7 @@ class InstalledProfilesList(ResourceList):
     data_layer = {
         'session': db.session,
         'model': InstalledProfile,
+        'class': KeysetDataLayer,
         'methods': {'query': query}
     }
 
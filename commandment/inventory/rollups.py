@@ -0,0 +1,171 @@
+"""
+Precomputed device counts for inventory analytics.
+
+Two rollups are kept:
+
+- `ApplicationVersionCount`: The number of devices per (bundle_identifier, version) of an installed application.
+- `DeviceModelCount`: The number of devices per (model, os_version, platform).
+
+The ``inventory.rollup`` job rebuilds both tables from ``installed_applications`` and ``devices`` with one
+``GROUP BY`` each, leaving one count row per key. Between refreshes the inventory handlers record a +1 or -1 row for
+every key which a device enters or leaves, so the rollups stay current without updating a shared counter row that
+every device would contend for. Reading a count sums the rows of its key, which is a small table.
+
+Changes made without the handlers, such as devices inserted by the DEP sync, are only reflected after the next
+refresh.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import distinct, func
+
+from commandment.models import db, Device
+from commandment.runner.registry import job
+from .models import ApplicationVersionCount, DeviceModelCount, InstalledApplication
+
+ApplicationKey = Tuple[Optional[str], Optional[str]]
+DeviceKey = Tuple[Optional[str], Optional[str], str]
+
+#: Columns of `DeviceModelCount` which the device counts may be grouped by.
+DEVICE_GROUPS = ('model', 'os_version', 'platform')
+
+
+def device_key(device: Device) -> DeviceKey:
+    """Get the `DeviceModelCount` key of a device."""
+    return device.model, device.os_version, device.platform.value
+
+
+def record_application_versions(before: Iterable[ApplicationKey], after: Iterable[ApplicationKey]):
+    """Record that a device replaced its installed applications.
+
+    The caller is responsible for committing the session.
+
+    Args:
+        before (Iterable[ApplicationKey]): The (bundle_identifier, version) of each application previously installed.
+        after (Iterable[ApplicationKey]): The (bundle_identifier, version) of each application now installed.
+    """
+    before, after = set(before), set(after)
+    deltas = [(key, -1) for key in before - after] + [(key, 1) for key in after - before]
+    if deltas:
+        db.session.bulk_insert_mappings(ApplicationVersionCount, [
+            {'bundle_identifier': bundle_identifier, 'version': version, 'device_count': delta}
+            for (bundle_identifier, version), delta in deltas
+        ])
+
+
+def record_device_model(before: Optional[DeviceKey], after: DeviceKey):
+    """Record that a device changed its model, operating system version or platform.
+
+    The caller is responsible for committing the session.
+
+    Args:
+        before (Optional[DeviceKey]): The key of the device before the change, None for a new device.
+        after (DeviceKey): The key of the device after the change.
+    """
+    if before == after:
+        return
+
+    deltas: List[Tuple[DeviceKey, int]] = [(after, 1)]
+    if before is not None:
+        deltas.append((before, -1))
+
+    db.session.bulk_insert_mappings(DeviceModelCount, [
+        {'model': model, 'os_version': os_version, 'platform': platform, 'device_count': delta}
+        for (model, os_version, platform), delta in deltas
+    ])
+
+
+def refresh_rollups() -> Dict[str, int]:
+    """Rebuild both rollups from the inventory, replacing the counts and deltas with one count per key.
+
+    Must be called before the session begins a transaction. On PostgreSQL the rebuild runs in one REPEATABLE READ
+    snapshot: under READ COMMITTED the deltas which a handler commits between the ``DELETE`` and the ``INSERT ...
+    SELECT`` would survive the delete and also be counted by the select. SQLite does not let the handlers write
+    until the rebuild is committed.
+
+    Returns:
+        Dict[str, int]: The number of keys of each rollup.
+    """
+    if db.session.get_bind(ApplicationVersionCount.__mapper__).dialect.name == 'postgresql':
+        db.session.connection(mapper=ApplicationVersionCount.__mapper__,
+                              execution_options={'isolation_level': 'REPEATABLE READ'})
+
+    db.session.query(ApplicationVersionCount).delete(synchronize_session=False)
+    applications = db.session.query(
+        InstalledApplication.bundle_identifier,
+        InstalledApplication.version,
+        func.count(distinct(InstalledApplication.device_id)),
+    ).filter(InstalledApplication.device_id.isnot(None)).group_by(
+        InstalledApplication.bundle_identifier, InstalledApplication.version)
+    db.session.execute(ApplicationVersionCount.__table__.insert().from_select(
+        ['bundle_identifier', 'version', 'device_count'], applications.subquery().select()))
+
+    db.session.query(DeviceModelCount).delete(synchronize_session=False)
+    devices = db.session.query(Device.model, Device.os_version, Device.platform, func.count(Device.id)).group_by(
+        Device.model, Device.os_version, Device.platform)
+    db.session.execute(DeviceModelCount.__table__.insert().from_select(
+        ['model', 'os_version', 'platform', 'device_count'], devices.subquery().select()))
+
+    db.session.commit()
+
+    return {
+        'applications': db.session.query(func.count(ApplicationVersionCount.id)).scalar(),
+        'devices': db.session.query(func.count(DeviceModelCount.id)).scalar(),
+    }
+
+
+@job('inventory.rollup', leader_only=True)
+def rollup_refresh():
+    """Runner job which rebuilds the inventory rollups."""
+    db.session.commit()  # End the transaction in which the runner loaded the job, the rebuild needs its own.
+    refresh_rollups()
+
+
+def application_counts(bundle_identifier: Optional[str] = None, version: Optional[str] = None) -> List[dict]:
+    """Get the number of devices per application version, most installed first.
+
+    Args:
+        bundle_identifier (Optional[str]): Only count this application.
+        version (Optional[str]): Only count this version.
+
+    Returns:
+        List[dict]: The bundle_identifier, version and number of devices of each key with at least one device.
+    """
+    total = func.sum(ApplicationVersionCount.device_count)
+    query = db.session.query(ApplicationVersionCount.bundle_identifier, ApplicationVersionCount.version, total)
+    if bundle_identifier is not None:
+        query = query.filter(ApplicationVersionCount.bundle_identifier == bundle_identifier)
+    if version is not None:
+        query = query.filter(ApplicationVersionCount.version == version)
+
+    query = query.group_by(ApplicationVersionCount.bundle_identifier, ApplicationVersionCount.version).having(
+        total > 0).order_by(total.desc(), ApplicationVersionCount.bundle_identifier, ApplicationVersionCount.version)
+
+    return [{'bundle_identifier': b, 'version': v, 'devices': int(n)} for b, v, n in query]
+
+
+def device_counts(group_by: Sequence[str] = DEVICE_GROUPS, **filters: str) -> List[dict]:
+    """Get the number of devices per key, most devices first.
+
+    Args:
+        group_by (Sequence[str]): The `DEVICE_GROUPS` to count by, eg. only ``('os_version',)`` for the distribution of
+            operating system versions.
+        **filters (str): Only count devices with these values of `DEVICE_GROUPS`.
+
+    Returns:
+        List[dict]: The values of the group_by columns and number of devices of each key with at least one device.
+
+    Raises:
+        ValueError: If a group or filter is not one of `DEVICE_GROUPS`.
+    """
+    unknown: Set[str] = (set(group_by) | set(filters)) - set(DEVICE_GROUPS)
+    if unknown or not group_by:
+        raise ValueError('Devices can only be counted by: {}'.format(', '.join(DEVICE_GROUPS)))
+
+    columns = [getattr(DeviceModelCount, name) for name in group_by]
+    total = func.sum(DeviceModelCount.device_count)
+    query = db.session.query(*columns, total)
+    for name, value in filters.items():
+        query = query.filter(getattr(DeviceModelCount, name) == value)
+
+    query = query.group_by(*columns).having(total > 0).order_by(total.desc(), *columns)
+
+    return [dict(zip(group_by, row[:-1]), devices=int(row[-1])) for row in query]
@@ -8,14 +8,16 @@ from commandment.mdm import CommandStatus
 from commandment.mdm.commands import Command
 from commandment.decorators import parse_plist_input_data
 from commandment.cms.decorators import verify_mdm_signature
-from commandment.mdm.util import queue_full_inventory
+from commandment.mdm.util import queue_full_inventory, push_and_record, complete_enrollment, \
+    push_after_token_update
 from commandment.models import DeviceUser
+from commandment.inventory import rollups
 from commandment.pki.models import DeviceIdentityCertificate
 from commandment.mdm.routers import CommandRouter, PlistRouter
 from commandment.utils import plistify
 import plistlib
 import ssl
-from commandment.apns.push import push_to_device
+from commandment.threads import enrollment_thread
 from datetime import datetime
 from commandment.signals import device_enrolled
 
@@ -58,6 +60,7 @@ def authenticate(plist_data):
         device.meid = plist_data.get('MEID', None)
 
         device.last_seen = datetime.now()
+        rollups.record_device_model(None, rollups.device_key(device))
 
     # Authenticate message is not enough to be enrolled
     device.is_enrolled = False
@@ -92,18 +95,12 @@ def token_update(plist_data):
         )
         return 'OK'
 
-    if not device.token:  # First contact
-        device.is_enrolled = True
-
-        if hasattr(g, 'signers'):
-            device_certificate = DeviceIdentityCertificate.from_crypto(g.signers[0])
-            db.session.add(device_certificate)
-            device.certificate = device_certificate
-        else:
-            pass  # TODO: if in debug mode this should not throw an exception to deal with cert troubleshooting
+    first_contact = not device.token
+    certificate = g.signers[0] if hasattr(g, 'signers') else None
+    # TODO: if in debug mode a missing signer should not throw an exception to deal with cert troubleshooting
 
-        device_enrolled.send(device)
-        queue_full_inventory(device)
+    if first_contact:
+        device.is_enrolled = True
 
     device.tokenupdate_at = datetime.utcnow()
     device.push_magic = plist_data['PushMagic']
@@ -113,17 +110,30 @@ def token_update(plist_data):
     device.last_seen = datetime.now()
     db.session.commit()
 
+    if current_app.config.get('ENROLLMENT_STORM_MODE', False):
+        # Return as soon as the token is stored, the enrollment workers perform the rest.
+        if first_contact:
+            queued = enrollment_thread.submit(complete_enrollment, device.id, certificate)
+        else:
+            queued = enrollment_thread.submit(push_after_token_update, device.id)
+
+        if queued:
+            return 'OK'
+
+    if first_contact:
+        if certificate is not None:
+            device_certificate = DeviceIdentityCertificate.from_crypto(certificate)
+            db.session.add(device_certificate)
+            device.certificate = device_certificate
+
+        device_enrolled.send(device)
+        queue_full_inventory(device)
+
     try:
-        response = push_to_device(device)
+        push_and_record(device)
     except ssl.SSLError:
         return abort(jsonify(error=True, message="The push certificate has expired"))
 
-    current_app.logger.info("[APNS2 Response] Status: %d, Reason: %s, APNS ID: %s, Timestamp",
-                            response.status_code, response.reason, response.apns_id.decode('utf-8'))
-    device.last_push_at = datetime.utcnow()
-    if response.status_code == 200:
-        device.last_apns_id = response.apns_id
-
     db.session.commit()
 
     # TODO: macOS can chain commands from TokenUpdate but iOS will not process any response data from TokenUpdate.
@@ -257,7 +267,7 @@ def mdm():
 
     # Re-hydrate the command class based on the persisted model containing the request type and the parameters
     # that were given to generate the command
-    cmd = Command.new_request_type(command.request_type, command.parameters, command.uuid)
+    cmd = Command.new_request_type(command.request_type, command.request_parameters, command.uuid)
 
 
     # get command dictionary representation (e.g. the full command to send)
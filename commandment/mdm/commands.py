@@ -36,6 +36,11 @@ class Command(metaclass=CommandRegistry):
     # require_supervised: ClassVar[bool] = False
     """require_supervised (bool): This command requires supervision on iOS/tvOS"""
 
+    blob_parameter: Optional[str] = None
+    """blob_parameter (str): The name of a large parameter, such as a profile, which is stored once in the blobs table
+    and referenced by every command which sends it, rather than copied into the parameters of each command. The
+    parameter holds urlsafe base64 text, the blob holds the decoded bytes."""
+
     def __init__(self, uuid=None) -> None:
         """The Command class wraps an MDM Request Command dict to provide validation and convenience methods for
         accessing command attributes.
@@ -383,6 +388,7 @@ class ProfileList(Command):
 class InstallProfile(Command):
     request_type = 'InstallProfile'
     require_access = {AccessRights.ProfileInstallRemove}
+    blob_parameter = 'Payload'
 
     def __init__(self, uuid: Optional[UUID]=None, **kwargs) -> None:
         super(InstallProfile, self).__init__(uuid)
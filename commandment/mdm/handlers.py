@@ -16,6 +16,7 @@ from .response_schema import InstalledApplicationListResponse, DeviceInformation
     ProfileListResponse, SecurityInfoResponse
 from ..models import db, Device, Command as DBCommand
 from commandment.inventory.models import InstalledCertificate, InstalledProfile, InstalledApplication
+from commandment.inventory import catalog, rollups
 
 Queries = DeviceInformation.Queries
 
@@ -36,9 +37,11 @@ def ack_device_information(request: DBCommand, device: Device, response: dict):
     """
     schema = DeviceInformationResponse()
     result = schema.load(response)
+    before = rollups.device_key(device)
     for k, v in result.data['QueryResponses'].items():
         setattr(device, k, v)
 
+    rollups.record_device_model(before, rollups.device_key(device))
     db.session.commit()
 
 
@@ -186,8 +189,8 @@ def ack_installed_app_list(request: DBCommand, device: Device, response: dict):
           void: Nothing is returned but this behaviour is subject to change.
     """
 
-    for a in device.installed_applications:
-        db.session.delete(a)
+    before = db.session.query(InstalledApplication.bundle_identifier, InstalledApplication.version).filter(
+        InstalledApplication.device_id == device.id).all()
 
     applications = response['InstalledApplicationList']
     current_app.logger.debug(
@@ -200,19 +203,19 @@ def ack_installed_app_list(request: DBCommand, device: Device, response: dict):
     # current_app.logger.info(result)
 
     ignored_app_bundle_ids = current_app.config['IGNORED_APPLICATION_BUNDLE_IDS']
+    installed = []
 
     for ia in result['InstalledApplicationList']:
-        if isinstance(ia, db.Model):
-            if ia.bundle_identifier in ignored_app_bundle_ids:
-                current_app.logger.debug('Ignoring app with bundle id: %s', ia.bundle_identifier)
-                continue
-
-            ia.device = device
-            ia.device_udid = device.udid
-            db.session.add(ia)
-        else:
-            current_app.logger.debug('Not a model: %s', ia)
+        if ia.get('bundle_identifier') in ignored_app_bundle_ids:
+            current_app.logger.debug('Ignoring app with bundle id: %s', ia['bundle_identifier'])
+            continue
+
+        installed.append(ia)
+
+    catalog.replace_installed_applications(device, installed)
+    after = [(ia.get('bundle_identifier'), ia.get('version')) for ia in installed]
 
+    rollups.record_application_versions(before, after)
     db.session.commit()
 
 
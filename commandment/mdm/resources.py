@@ -4,9 +4,10 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from commandment.mdm.schema import CommandSchema
 from commandment.models import db, Command, Device
+from commandment.api.keyset import KeysetDataLayer, KeysetResourceList
 
 
-class CommandsList(ResourceList):
+class CommandsList(KeysetResourceList):
     def query(self, view_kwargs):
         query_ = self.session.query(Command)
         if view_kwargs.get('device_id') is not None:
@@ -23,6 +24,7 @@ class CommandsList(ResourceList):
     data_layer = {
         'session': db.session,
         'model': Command,
+        'class': KeysetDataLayer,
         'methods': {'query': query}
     }
 
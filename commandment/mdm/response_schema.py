@@ -193,10 +193,6 @@ class InstalledApplicationItem(Schema):
     IsValidated = fields.Boolean(attribute='is_validated')
     ExternalVersionIdentifier = fields.Integer(attribute='external_version_identifier')  # iOS 11
 
-    @post_load(pass_many=False)
-    def make_installed_application(self, data: Optional[dict]) -> Optional[inventory_models.InstalledApplication]:
-        return inventory_models.InstalledApplication(**data)
-
 
 class InstalledApplicationListResponse(CommandResponse):
     InstalledApplicationList = fields.Nested(InstalledApplicationItem, many=True)
@@ -0,0 +1,155 @@
+"""
+Command history retention.
+
+Every command sent to a device stays in ``commands`` until the ``commands.archive`` job moves it to
+``commands_archive`` (`ArchivedCommand`). A command is archived once it is finished, that is Acknowledged, Error,
+CommandFormatError or Expired, and it was answered (or queued, if it never was) more than ``COMMAND_RETENTION_DAYS``
+ago. Commands which are still referenced as the last install command of a managed application are kept.
+
+Commands are moved in batches of ``COMMAND_ARCHIVE_BATCH_SIZE`` rows, each with one ``INSERT ... SELECT`` and one
+``DELETE`` by id, and committed separately so that the job never holds long locks on ``commands``. The archive itself
+may be purged after ``COMMAND_ARCHIVE_PURGE_DAYS``, which also deletes the `Blob` payloads no longer referenced by
+any command.
+"""
+import datetime
+import logging
+from typing import Dict, Optional
+from flask import current_app
+from sqlalchemy import exists, func, literal
+
+from commandment.apps.models import ManagedApplication
+from commandment.models import db, ArchivedCommand, Blob, Command
+from commandment.runner.registry import job
+from . import CommandStatus
+
+logger = logging.getLogger(__name__)
+
+#: Commands in these states will never change again.
+FINISHED_STATUSES = (
+    CommandStatus.Acknowledged,
+    CommandStatus.Error,
+    CommandStatus.CommandFormatError,
+    CommandStatus.Expired,
+)
+
+#: Columns copied from ``commands`` to ``commands_archive``.
+ARCHIVED_COLUMNS = ('id', 'request_type', 'uuid', 'parameters', 'payload_id', 'status', 'queued_at', 'sent_at',
+                    'acknowledged_at', 'after', 'ttl', 'device_id')
+
+
+def archivable(cutoff: datetime.datetime):
+    """Get the criterion matching commands which may be archived.
+
+    Args:
+        cutoff (datetime.datetime): Only commands finished before this datetime (utc) match.
+    """
+    return db.and_(
+        Command.status.in_(FINISHED_STATUSES),
+        func.coalesce(Command.acknowledged_at, Command.queued_at) < cutoff,
+        ~exists().where(ManagedApplication.ia_command_id == Command.id),
+    )
+
+
+def archive_commands(older_than_days: int, batch_size: int = 1000,
+                     max_batches: Optional[int] = None) -> Dict[str, int]:
+    """Move finished commands older than `older_than_days` to the archive.
+
+    Each batch is committed.
+
+    Args:
+        older_than_days (int): Keep commands finished within this many days.
+        batch_size (int): The number of commands moved per transaction.
+        max_batches (Optional[int]): Stop after this many batches, the rest are moved by the next run.
+
+    Returns:
+        Dict[str, int]: The number of commands ``archived`` and the number of ``batches``.
+    """
+    now = datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=older_than_days)
+    commands = Command.__table__
+    archive = ArchivedCommand.__table__
+    stats = {'archived': 0, 'batches': 0}
+
+    while max_batches is None or stats['batches'] < max_batches:
+        ids = [command_id for command_id, in db.session.query(Command.id).filter(
+            archivable(cutoff)).order_by(Command.id).limit(batch_size)]
+        if not ids:
+            break
+
+        columns = [commands.c[name] for name in ARCHIVED_COLUMNS]
+        db.session.execute(archive.insert().from_select(
+            list(ARCHIVED_COLUMNS) + ['archived_at'],
+            db.select(columns + [literal(now, db.DateTime)]).where(commands.c.id.in_(ids))))
+        db.session.execute(commands.delete().where(commands.c.id.in_(ids)))
+        db.session.commit()
+
+        stats['archived'] += len(ids)
+        stats['batches'] += 1
+        logger.debug('Archived %d command(s) up to ID %d', len(ids), ids[-1])
+
+        if len(ids) < batch_size:
+            break
+
+    return stats
+
+
+def purge_archive(older_than_days: int, batch_size: int = 1000) -> int:
+    """Delete archived commands which were archived more than `older_than_days` ago.
+
+    Args:
+        older_than_days (int): Keep commands archived within this many days.
+        batch_size (int): The number of archived commands deleted per transaction.
+
+    Returns:
+        int: The number of archived commands deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+    archive = ArchivedCommand.__table__
+    purged = 0
+
+    while True:
+        ids = [command_id for command_id, in db.session.query(ArchivedCommand.id).filter(
+            ArchivedCommand.archived_at < cutoff).order_by(ArchivedCommand.id).limit(batch_size)]
+        if not ids:
+            break
+
+        db.session.execute(archive.delete().where(archive.c.id.in_(ids)))
+        db.session.commit()
+        purged += len(ids)
+
+        if len(ids) < batch_size:
+            break
+
+    return purged
+
+
+def purge_blobs() -> int:
+    """Delete the blobs which are referenced by neither a command nor an archived command.
+
+    Returns:
+        int: The number of blobs deleted.
+    """
+    result = db.session.execute(Blob.__table__.delete().where(db.and_(
+        ~exists().where(Command.payload_id == Blob.id),
+        ~exists().where(ArchivedCommand.payload_id == Blob.id),
+    )))
+    db.session.commit()
+
+    return result.rowcount
+
+
+@job('commands.archive', leader_only=True)
+def command_retention():
+    """Runner job which archives finished commands, and purges the archive and unused blobs if configured."""
+    config = current_app.config
+    batch_size = config.get('COMMAND_ARCHIVE_BATCH_SIZE', 1000)
+
+    stats = archive_commands(config.get('COMMAND_RETENTION_DAYS', 30), batch_size,
+                             config.get('COMMAND_ARCHIVE_MAX_BATCHES'))
+    purge_days = config.get('COMMAND_ARCHIVE_PURGE_DAYS')
+    if purge_days is not None:
+        stats['purged'] = purge_archive(purge_days, batch_size)
+        stats['blobs_purged'] = purge_blobs()
+
+    current_app.logger.info('Command retention: %s', ', '.join(
+        '{}={}'.format(k, v) for k, v in sorted(stats.items())))
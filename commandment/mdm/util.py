@@ -1,5 +1,12 @@
+from datetime import datetime
+from typing import Optional
+from cryptography import x509
+from flask import current_app
 from commandment.mdm import commands
 from commandment.models import db, Device, Command
+from commandment.pki.models import DeviceIdentityCertificate
+from commandment.apns.push import push_to_device
+from commandment.signals import device_enrolled
 
 
 def queryresponses_to_query_set(responses: dict):
@@ -51,3 +58,72 @@ def queue_full_inventory(device: Device):
     db.session.add(au_pl)
 
     db.session.commit()
+
+
+def push_and_record(device: Device):
+    """Issue a push to a device and record the result of the push on the device model.
+
+    The caller is responsible for committing the session.
+
+    Args:
+        device (Device): The device to push to.
+
+    Raises:
+        ssl.SSLError: If the push certificate has expired.
+
+    Returns:
+        APNS2Client Response object
+    """
+    response = push_to_device(device)
+    current_app.logger.info("[APNS2 Response] Status: %d, Reason: %s, APNS ID: %s, Timestamp",
+                            response.status_code, response.reason, response.apns_id.decode('utf-8'))
+    device.last_push_at = datetime.utcnow()
+    if response.status_code == 200:
+        device.last_apns_id = response.apns_id
+
+    return response
+
+
+def complete_enrollment(device_id: int, certificate: Optional[x509.Certificate] = None):
+    """Perform the work that follows the first TokenUpdate of a device.
+
+    This persists the device identity certificate, sends the `device_enrolled` signal, queues the full inventory
+    and issues the initial push. It only needs the device id so that it may be executed outside of the request
+    by the enrollment worker pool.
+
+    Args:
+          device_id (int): The primary key of the enrolled device.
+          certificate (x509.Certificate): The identity certificate that signed the TokenUpdate, if any.
+    """
+    device = db.session.query(Device).get(device_id)
+    if device is None:
+        current_app.logger.warning('Device (id: %d) was removed before enrollment could be completed', device_id)
+        return
+
+    if certificate is not None:
+        device_certificate = DeviceIdentityCertificate.from_crypto(certificate)
+        db.session.add(device_certificate)
+        device.certificate = device_certificate
+
+    device_enrolled.send(device)
+    queue_full_inventory(device)
+
+    if device.token is None or device.push_magic is None:
+        return
+
+    push_and_record(device)
+    db.session.commit()
+
+
+def push_after_token_update(device_id: int):
+    """Issue the push that follows a periodic TokenUpdate.
+
+    Args:
+          device_id (int): The primary key of the device.
+    """
+    device = db.session.query(Device).get(device_id)
+    if device is None or device.token is None or device.push_magic is None:
+        return
+
+    push_and_record(device)
+    db.session.commit()
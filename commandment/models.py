@@ -10,11 +10,14 @@ from typing import Optional, Type
 from flask_sqlalchemy import SQLAlchemy
 
 import datetime
+import hashlib
 from enum import Enum, IntEnum
 from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy import case
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.exc import IntegrityError
 
-from .dbtypes import GUID, JSONEncodedDict
+from .dbtypes import GUID, JSONEncodedDict, Compressed
 from .mdm import CommandStatus, Platform, commands
 import base64
 from binascii import hexlify
@@ -23,6 +26,10 @@ from .profiles.certificates import KeyUsage
 
 db = SQLAlchemy()
 
+#: Device model names which are reported as the macOS and iOS platforms.
+MACOS_MODEL_NAMES = ('iMac', 'MacBook Pro', 'MacBook Air', 'Mac Pro')
+IOS_MODEL_NAMES = ('iPhone', 'iPad')
+
 
 class CellularTechnology(IntEnum):
     Nothing = 0
@@ -45,6 +52,10 @@ class Device(db.Model):
     :table: devices
     """
     __tablename__ = 'devices'
+    __table_args__ = (
+        # Keyset pagination of the device list, in the order of commandment.api.keyset.KeysetDataLayer.keyset_query
+        db.Index('ix_devices_last_seen_id', 'last_seen', 'id', postgresql_ops={'last_seen': 'NULLS FIRST'}),
+    )
 
     # Common attributes
     id = db.Column(db.Integer, primary_key=True)
@@ -271,7 +282,7 @@ class Device(db.Model):
     certificate_id = db.Column(db.Integer, db.ForeignKey('certificates.id'))
     certificate = db.relationship('Certificate', backref='devices')
 
-    dep_profile_id = db.Column(db.Integer, db.ForeignKey('dep_profiles.id'))
+    dep_profile_id = db.Column(db.Integer, db.ForeignKey('dep_profiles.id'), index=True)
     dep_profile = db.relationship('DEPProfile', backref='devices')
 
     tags = db.relationship(
@@ -293,15 +304,23 @@ class Device(db.Model):
         else:
             self._unlock_token = value
 
-    @property
+    @hybrid_property
     def platform(self) -> Platform:
-        if self.model_name in ['iMac', 'MacBook Pro', 'MacBook Air', 'Mac Pro']:  # TODO: obviously not sufficient
+        if self.model_name in MACOS_MODEL_NAMES:  # TODO: obviously not sufficient
             return Platform.macOS
-        elif self.model_name in ['iPhone', 'iPad']:
+        elif self.model_name in IOS_MODEL_NAMES:
             return Platform.iOS
         else:
             return Platform.Unknown
 
+    @platform.expression
+    def platform(cls):
+        """The value of the platform as an SQL expression, for grouping and filtering."""
+        return case([
+            (cls.model_name.in_(MACOS_MODEL_NAMES), Platform.macOS.value),
+            (cls.model_name.in_(IOS_MODEL_NAMES), Platform.iOS.value),
+        ], else_=Platform.Unknown.value)
+
     def __repr__(self):
         return '<Device ID=%r UDID=%r SerialNo=%r>' % (self.id, self.udid, self.serial_number)
 
@@ -317,6 +336,56 @@ class CommandSequence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
 
+class Blob(db.Model):
+    """A large value, such as a profile, which is stored once no matter how many commands send it.
+
+    Blobs are content addressed: the same data always has the same digest and is only stored in one row.
+
+    :table: blobs
+    """
+    __tablename__ = 'blobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    """id (int): ID"""
+    digest = db.Column(db.String(64), unique=True, nullable=False)
+    """digest (str): The hex SHA-256 digest of the data"""
+    data = db.Column(Compressed, nullable=False)
+    """data (bytes): The data, compressed in the database"""
+    size = db.Column(db.Integer, nullable=False)
+    """size (int): The uncompressed size of the data in bytes"""
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    """created_at (datetime.datetime): The datetime (utc) of when the blob was first stored"""
+
+    @classmethod
+    def find_or_create(cls, data: bytes) -> 'Blob':
+        """Find the blob holding this data, or store a new one.
+
+        The caller is responsible for committing the session.
+
+        Args:
+            data (bytes): The data to store.
+
+        Returns:
+            Blob: The blob, which has been flushed.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        blob = cls.query.filter(cls.digest == digest).one_or_none()
+        if blob is not None:
+            return blob
+
+        try:
+            with db.session.begin_nested():
+                blob = cls(digest=digest, data=data, size=len(data))
+                db.session.add(blob)
+        except IntegrityError:  # Another request stored the same data at the same time
+            blob = cls.query.filter(cls.digest == digest).one()
+
+        return blob
+
+    def __repr__(self):
+        return '<Blob ID=%r Digest=%r Size=%r>' % (self.id, self.digest, self.size)
+
+
 class Command(db.Model):
     """The command model represents a single MDM command that should be, has been, or has failed to be delivered to
     a single enrolled device.
@@ -334,7 +403,11 @@ class Command(db.Model):
     parameters = db.Column(MutableDict.as_mutable(JSONEncodedDict),
                            nullable=True)  # JSON add'l data as input to command builder
     """parameters (str): The parameters that were used when generating the command, serialized into JSON. Omitting the
-            RequestType and CommandUUID attributes."""
+            RequestType and CommandUUID attributes, and the `blob_parameter` of the command class if any."""
+    payload_id = db.Column(db.ForeignKey('blobs.id'), nullable=True, index=True)
+    """payload_id (int): The blob holding the `blob_parameter` of the command class, if any."""
+    payload = db.relationship('Blob')
+    """payload (Blob): The blob holding the `blob_parameter` of the command class, if any."""
     status = db.Column(db.Enum(CommandStatus), index=True, nullable=False, default=CommandStatus.Queued)
     """status (CommandStatus): The status of the command."""
     queued_at = db.Column(db.DateTime, default=datetime.datetime.utcnow(), server_default=db.text('CURRENT_TIMESTAMP'))
@@ -363,7 +436,8 @@ class Command(db.Model):
     @classmethod
     def from_model(cls, cmd: commands.Command):
         """This method turns a subclass of commands.Command into an SQLAlchemy model.
-        The parameters of the command are encoded as a JSON dictionary inside the parameters column.
+        The parameters of the command are encoded as a JSON dictionary inside the parameters column, except for the
+        `blob_parameter` of the command class which is decoded from urlsafe base64 and stored in a `Blob`.
 
         Args:
               cmd (commands.Command): The command to be turned into a database model.
@@ -374,10 +448,25 @@ class Command(db.Model):
         assert cmd.request_type is not None
         c.request_type = cmd.request_type
         c.uuid = cmd.uuid
-        c.parameters = cmd.parameters
+        parameters = dict(cmd.parameters)
+
+        if cmd.blob_parameter is not None and parameters.get(cmd.blob_parameter) is not None:
+            c.payload = Blob.find_or_create(base64.urlsafe_b64decode(parameters.pop(cmd.blob_parameter)))
+
+        c.parameters = parameters
 
         return c
 
+    @property
+    def request_parameters(self) -> dict:
+        """The parameters to re-hydrate the command class with, including the `blob_parameter`."""
+        parameters = dict(self.parameters or {})
+        if self.payload is not None:
+            blob_parameter = commands.CommandRegistry.command_classes[self.request_type].blob_parameter
+            parameters[blob_parameter] = base64.urlsafe_b64encode(self.payload.data).decode('utf-8')
+
+        return parameters
+
     @classmethod
     def find_by_uuid(cls, uuid: str):
         """Find and return an instance of the Command model matching the given UUID string.
@@ -422,6 +511,47 @@ class Command(db.Model):
         return '<Command ID=%r UUID=%r qstatus=%r>' % (self.id, self.uuid, self.status)
 
 
+class ArchivedCommand(db.Model):
+    """A command which finished long enough ago to be moved out of the ``commands`` table by the retention job.
+
+    The columns are copied from `Command` unchanged, including the id. There are no foreign keys, so that devices can
+    be removed without touching the archive.
+
+    :table: commands_archive
+    """
+    __tablename__ = 'commands_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    """id (int): The ID the command had in the commands table"""
+    request_type = db.Column(db.String, nullable=False)
+    """request_type (str): The command RequestType attribute"""
+    uuid = db.Column(GUID, index=True, nullable=False)
+    """uuid (GUID): Globally unique command UUID"""
+    parameters = db.Column(MutableDict.as_mutable(JSONEncodedDict), nullable=True)
+    """parameters (str): The parameters that were used when generating the command, serialized into JSON."""
+    payload_id = db.Column(db.Integer, index=True, nullable=True)
+    """payload_id (int): The blob holding the `blob_parameter` of the command class, if any."""
+    status = db.Column(db.Enum(CommandStatus), nullable=False)
+    """status (CommandStatus): The final status of the command."""
+    queued_at = db.Column(db.DateTime)
+    """queued_at (datetime.datetime): The datetime (utc) of when the command was created."""
+    sent_at = db.Column(db.DateTime, nullable=True)
+    """sent_at (datetime.datetime): The datetime (utc) of when the command was delivered to the client."""
+    acknowledged_at = db.Column(db.DateTime, nullable=True)
+    """acknowledged_at (datetime.datetime): The datetime (utc) of when the response was returned."""
+    after = db.Column(db.DateTime, nullable=True)
+    """after (datetime.datetime): The datetime the command was not sent before, if any."""
+    ttl = db.Column(db.Integer, nullable=False)
+    """ttl (int): The number of retries which were remaining."""
+    device_id = db.Column(db.Integer, index=True, nullable=True)
+    """device_id (int): The ID of the device, which may since have been removed."""
+    archived_at = db.Column(db.DateTime, index=True, nullable=False, default=datetime.datetime.utcnow)
+    """archived_at (datetime.datetime): The datetime (utc) of when the command was moved to the archive."""
+
+    def __repr__(self):
+        return '<ArchivedCommand ID=%r UUID=%r status=%r>' % (self.id, self.uuid, self.status)
+
+
 class DeviceUser(db.Model):
     """
     This model represents a managed user from the standpoint of the MDM.
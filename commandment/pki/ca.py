@@ -1,5 +1,23 @@
+"""
+Internal certificate authority.
+
+:func:`get_ca` returns the database model of the CA. Certificates should be issued with :func:`get_signer`, which
+returns a :class:`CASigner` kept for the lifetime of the application. It holds the deserialized CA private key, so that
+the PEM is not parsed for every signature. Serial numbers are either reserved from the ``certificate_authority.serial`` column in blocks of
+``PKI_SERIAL_BLOCK_SIZE``, so that concurrent signers in several threads or processes only touch the database once per
+block, or are random if ``PKI_SERIAL_ALLOCATION`` is ``'random'``.
+"""
+import datetime
+import secrets
+import threading
+from typing import Callable, Optional
 from flask import g, current_app
 import sqlalchemy.orm.exc
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509 import NameOID
 
 from .models import CertificateAuthority
 from commandment.models import db, Device
@@ -22,3 +40,149 @@ def get_ca() -> CertificateAuthority:
 # def teardown_ca():
 #     ca = g.pop('ca', None)
 
+
+def reserve_serials(ca_id: int, count: int, engine=None) -> int:
+    """Atomically reserve ``count`` serial numbers from a certificate authority.
+
+    The reservation is made in its own transaction, independent of the current session.
+
+    Args:
+        ca_id (int): The id of the certificate authority.
+        count (int): The number of serials to reserve.
+        engine (sqlalchemy.engine.Engine): The engine to use, defaults to the engine of the current application.
+
+    Returns:
+        int: The last serial number of the reserved block.
+    """
+    table = CertificateAuthority.__table__
+    with (engine or db.engine).begin() as connection:
+        connection.execute(table.update().where(table.c.id == ca_id).values(
+            serial=sqlalchemy.func.coalesce(table.c.serial, 0) + count))
+        return connection.execute(sqlalchemy.select([table.c.serial]).where(table.c.id == ca_id)).scalar()
+
+
+class SerialAllocator(object):
+    """Hands out serial numbers from blocks reserved in the database.
+
+    Serial numbers left in a block when the process exits are never issued.
+
+    Args:
+        reserve (Callable[[int], int]): Reserves a block of the given size, returning the last serial in the block.
+        block_size (int): The number of serials to reserve at a time.
+    """
+    def __init__(self, reserve: Callable[[int], int], block_size: int = 100):
+        self._reserve = reserve
+        self.block_size = block_size
+        self._next = 1
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next > self._end:
+                self._end = self._reserve(self.block_size)
+                self._next = self._end - self.block_size + 1
+
+            serial = self._next
+            self._next += 1
+            return serial
+
+
+class RandomSerialAllocator(object):
+    """Hands out random serial numbers, without any coordination between signers.
+
+    Serials are limited to 63 bits so that they fit the ``certificates.serial`` BIGINT column.
+    """
+    def next(self) -> int:
+        return secrets.randbits(63) or 1
+
+
+class CASigner(object):
+    """Issues certificates from a certificate authority, with its private key held in memory.
+
+    Signing is safe from multiple threads.
+
+    Args:
+        common_name (str): The Common Name of the CA, used as the issuer name.
+        private_key (rsa.RSAPrivateKey): The CA private key.
+        validity_period (int): The number of days issued certificates are valid for.
+        serials (SerialAllocator): Source of serial numbers.
+    """
+    def __init__(self, common_name: str, private_key: rsa.RSAPrivateKey, validity_period: int, serials):
+        self.common_name = common_name
+        self.private_key = private_key
+        self.validity_period = validity_period
+        self.serials = serials
+        self.issuer = x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'commandment')
+        ])
+
+    @classmethod
+    def from_model(cls, ca: CertificateAuthority, serials=None, block_size: int = 100):
+        """Create a signer for a `CertificateAuthority`, allocating serials in blocks unless ``serials`` is given.
+
+        The signer captures the database engine of the current application, so it can be used outside of an
+        application context.
+        """
+        if serials is None:
+            ca_id, engine = ca.id, db.engine
+            serials = SerialAllocator(lambda count: reserve_serials(ca_id, count, engine), block_size)
+
+        return cls(ca.common_name, ca.rsa_private_key.to_crypto(), ca.validity_period or 365, serials)
+
+    def sign(self, request: x509.CertificateSigningRequest) -> x509.Certificate:
+        """
+        Sign a Certificate Signing Request.
+
+        Args:
+            request (x509.CertificateSigningRequest): The CSR object (cryptography) not the SQLAlchemy model.
+
+        Returns:
+            x509.Certificate: A signed certificate
+        """
+        now = datetime.datetime.utcnow()
+
+        return x509.CertificateBuilder().not_valid_before(
+            now
+        ).not_valid_after(
+            now + datetime.timedelta(days=self.validity_period)
+        ).serial_number(
+            self.serials.next()
+        ).issuer_name(
+            self.issuer
+        ).subject_name(
+            request.subject
+        ).public_key(
+            request.public_key()
+        ).sign(self.private_key, hashes.SHA256(), default_backend())
+
+
+_signer_lock = threading.Lock()
+
+
+def get_signer() -> CASigner:
+    """Get the signer for the internal CA, creating the CA if it does not exist yet.
+
+    The signer is kept for the lifetime of the application, in ``app.extensions``.
+    """
+    signer = current_app.extensions.get('ca_signer')
+    if signer is not None:
+        return signer
+
+    with _signer_lock:
+        if 'ca_signer' not in current_app.extensions:
+            serials: Optional[RandomSerialAllocator] = None
+            if current_app.config.get('PKI_SERIAL_ALLOCATION', 'block') == 'random':
+                serials = RandomSerialAllocator()
+
+            current_app.extensions['ca_signer'] = CASigner.from_model(
+                get_ca(), serials, block_size=current_app.config.get('PKI_SERIAL_BLOCK_SIZE', 100))
+
+        return current_app.extensions['ca_signer']
+
+
+def clear_signer():
+    """Forget the signer of the current application, eg. after the CA has been replaced."""
+    with _signer_lock:
+        current_app.extensions.pop('ca_signer', None)
@@ -0,0 +1,151 @@
+"""
+Pool of pre-generated RSA private keys for device identities.
+
+Generating a 2048 bit RSA key is the slowest step of producing an enrollment profile. With the pool running, a
+background thread keeps up to ``PKI_KEY_POOL_SIZE`` keys ready so that ``/enroll/profile`` only has to take one. Key
+generation happens inside OpenSSL, which releases the GIL, so the refill thread does not hold up request threads.
+
+If the pool is empty (eg. during a burst of enrollments) or was never started, :func:`take` generates a key inline
+exactly as before.
+"""
+import logging
+import queue
+import threading
+from typing import Callable, Optional
+from flask import Flask
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+logger = logging.getLogger(__name__)
+
+#: Seconds the refill thread sleeps while the pool is full, before re-checking the stop flag.
+poll_interval = 1.0
+
+
+def generate_private_key(key_size: int = 2048) -> rsa.RSAPrivateKeyWithSerialization:
+    """Generate an RSA private key, with the parameters used for device identities."""
+    return rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=key_size,
+        backend=default_backend(),
+    )
+
+
+class KeyPool(object):
+    """A bounded pool of private keys, refilled by a background thread.
+
+    Args:
+        size (int): The number of keys to keep ready.
+        key_size (int): The RSA key size in bits.
+        generate (Callable[[int], rsa.RSAPrivateKeyWithSerialization]): The key generator, given the key size.
+
+    Attributes:
+        hits (int): The number of keys taken from the pool.
+        misses (int): The number of keys generated inline because the pool was empty.
+    """
+    def __init__(self, size: int, key_size: int = 2048,
+                 generate: Callable[[int], rsa.RSAPrivateKeyWithSerialization] = generate_private_key):
+        self.key_size = key_size
+        self.hits = 0
+        self.misses = 0
+        self._generate = generate
+        self._keys = queue.Queue(maxsize=size)
+        self._wanted = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return self._keys.qsize()
+
+    def start(self):
+        """Start refilling the pool in a daemon thread."""
+        if self._thread is not None:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._refill, name='key-pool')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the refill thread. Keys already in the pool can still be taken."""
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._wanted.set()
+        self._thread.join()
+        self._thread = None
+
+    def _refill(self):
+        while not self._stopped.is_set():
+            self._wanted.clear()
+            if self._keys.full():
+                self._wanted.wait(poll_interval)
+                continue
+
+            try:
+                self._keys.put_nowait(self._generate(self.key_size))
+            except queue.Full:
+                pass
+            except Exception:
+                logger.exception('Failed to generate a private key for the key pool')
+                self._stopped.wait(poll_interval)
+
+    def take(self) -> rsa.RSAPrivateKeyWithSerialization:
+        """Take a key from the pool, or generate one inline if the pool is empty.
+
+        Returns:
+            rsa.RSAPrivateKeyWithSerialization: A private key which has not been handed out before.
+        """
+        try:
+            key = self._keys.get_nowait()
+            with self._lock:
+                self.hits += 1
+        except queue.Empty:
+            with self._lock:
+                self.misses += 1
+            key = self._generate(self.key_size)
+
+        self._wanted.set()
+        return key
+
+
+key_pool: Optional[KeyPool] = None
+
+
+def start(app: Flask):
+    """Start the device identity key pool.
+
+    Does nothing if ``PKI_KEY_POOL_SIZE`` is 0 in the application configuration.
+
+    Args:
+        app (Flask): The flask application.
+    """
+    global key_pool
+
+    size = app.config.get('PKI_KEY_POOL_SIZE', 0)
+    if not size or key_pool is not None:
+        return
+
+    logger.info('Starting device identity key pool with %d key(s)', size)
+    key_pool = KeyPool(size)
+    key_pool.start()
+
+
+def stop():
+    """Stop the device identity key pool."""
+    global key_pool
+
+    if key_pool is not None:
+        key_pool.stop()
+        key_pool = None
+
+
+def take() -> rsa.RSAPrivateKeyWithSerialization:
+    """Take a device identity key from the pool, or generate one if the pool is not running."""
+    if key_pool is None:
+        return generate_private_key()
+
+    return key_pool.take()
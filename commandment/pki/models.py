@@ -72,7 +72,8 @@ class CertificateAuthority(db.Model):
 
         return ca
 
-    def create_device_csr(self, common_name: str) -> (rsa.RSAPrivateKeyWithSerialization, x509.CertificateSigningRequest):
+    def create_device_csr(self, common_name: str, private_key: rsa.RSAPrivateKeyWithSerialization = None) -> (
+            rsa.RSAPrivateKeyWithSerialization, x509.CertificateSigningRequest):
         """
         Create a Certificate Signing Request with the specified Common Name.
 
@@ -81,16 +82,19 @@ class CertificateAuthority(db.Model):
 
         Args:
             common_name (str): The certificate Common Name attribute
+            private_key (rsa.RSAPrivateKeyWithSerialization): A key to use, eg. from the key pool. A new key is
+                generated if this is not supplied.
 
         Returns:
             Tuple[rsa.RSAPrivateKeyWithSerialization, x509.CertificateSigningRequest] - A tuple containing the RSA
             Private key that was generated, along with the CSR.
         """
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend(),
-        )
+        if private_key is None:
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+                backend=default_backend(),
+            )
 
         private_key_model = RSAPrivateKey.from_crypto(private_key)
         db.session.add(private_key_model)
@@ -0,0 +1,27 @@
+"""
+The runner is a small job scheduler which uses the configured SQL database as its only backing store.
+
+Jobs are plain functions registered by name with the :func:`commandment.runner.registry.job` decorator.
+They are either enqueued once with :func:`commandment.runner.registry.enqueue`, or enqueued periodically according to
+the ``RUNNER_SCHEDULE`` setting.
+
+Every node running the application starts a :class:`commandment.runner.worker.Runner`. It claims due jobs with a
+conditional UPDATE and holds a time-limited lease on each job while it runs. The lease is extended by a heartbeat, so
+a job whose node dies is picked up again by another node once the lease expires.
+"""
+from enum import Enum
+
+
+class JobStatus(Enum):
+    """JobStatus describes the lifecycle of a single job row.
+
+    - Queued: Waiting for ``run_at`` to pass and a worker to claim it. Failed attempts with retries remaining return
+      to this state.
+    - Running: Claimed by a worker which holds the lease.
+    - Succeeded: The job function returned without raising.
+    - Failed: The job function raised on its final attempt, or its lease expired too many times.
+    """
+    Queued = 'Queued'
+    Running = 'Running'
+    Succeeded = 'Succeeded'
+    Failed = 'Failed'
@@ -0,0 +1,13 @@
+from flask import Blueprint
+from commandment.runner.resources import JobsList, JobDetail, JobSchedulesList, JobScheduleDetail
+from commandment.api.app_jsonapi import api
+
+api_app = Blueprint('runner_api_app', __name__)
+
+# Jobs
+api.route(JobsList, 'jobs_list', '/v1/jobs', '/v1/job_schedules/<int:job_schedule_id>/jobs')
+api.route(JobDetail, 'job_detail', '/v1/jobs/<int:job_id>')
+
+# Job Schedules
+api.route(JobSchedulesList, 'job_schedules_list', '/v1/job_schedules')
+api.route(JobScheduleDetail, 'job_schedule_detail', '/v1/job_schedules/<int:job_schedule_id>')
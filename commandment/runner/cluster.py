@@ -0,0 +1,116 @@
+"""
+Coordination between several nodes sharing one database.
+
+Leader election uses the ``runner_leases`` table rather than database specific advisory locks, so that it works the
+same way on every database supported by SQLAlchemy, including SQLite. A lease is renewed by its owner on every
+runner poll, and may be taken over by any node once it has expired.
+
+Live nodes are tracked in ``runner_nodes``, and the number of live nodes is used as the default shard count for
+sharded jobs.
+"""
+import datetime
+import math
+from typing import List, Tuple
+from sqlalchemy import func
+import sqlalchemy.exc
+
+from commandment.models import db
+from commandment.runner.models import RunnerLease, RunnerNode
+
+LEADER_LEASE = 'leader'
+
+
+def acquire_lease(name: str, owner: str, seconds: int) -> bool:
+    """Acquire or renew a named lease.
+
+    Args:
+        name (str): The lease name.
+        owner (str): The node id requesting the lease.
+        seconds (int): How long the lease is valid for, from now.
+
+    Returns:
+        bool: True if ``owner`` holds the lease.
+    """
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(seconds=seconds)
+
+    renewed = db.session.query(RunnerLease).filter(
+        RunnerLease.name == name, RunnerLease.owner == owner,
+    ).update({RunnerLease.expires_at: expires_at}, synchronize_session=False)
+
+    if renewed == 0:
+        renewed = db.session.query(RunnerLease).filter(
+            RunnerLease.name == name, RunnerLease.expires_at < now,
+        ).update({
+            RunnerLease.owner: owner,
+            RunnerLease.acquired_at: now,
+            RunnerLease.expires_at: expires_at,
+        }, synchronize_session=False)
+
+    if renewed == 1:
+        db.session.commit()
+        return True
+
+    try:
+        db.session.add(RunnerLease(name=name, owner=owner, acquired_at=now, expires_at=expires_at))
+        db.session.commit()
+        return True
+    except sqlalchemy.exc.IntegrityError:
+        # The lease exists and is held by another node.
+        db.session.rollback()
+        return False
+
+
+def release_lease(name: str, owner: str):
+    """Release a named lease, if it is held by ``owner``."""
+    db.session.query(RunnerLease).filter(
+        RunnerLease.name == name, RunnerLease.owner == owner).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def node_heartbeat(node_id: str):
+    """Record that a node is alive."""
+    now = datetime.datetime.utcnow()
+    updated = db.session.query(RunnerNode).filter(RunnerNode.node_id == node_id).update(
+        {RunnerNode.heartbeat_at: now}, synchronize_session=False)
+
+    if updated == 0:
+        db.session.add(RunnerNode(node_id=node_id, started_at=now, heartbeat_at=now))
+
+    db.session.commit()
+
+
+def remove_node(node_id: str):
+    """Remove a node which is shutting down."""
+    db.session.query(RunnerNode).filter(RunnerNode.node_id == node_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def live_node_count(seconds: int) -> int:
+    """Count the nodes which have sent a heartbeat within the given number of seconds."""
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+    return db.session.query(func.count(RunnerNode.node_id)).filter(RunnerNode.heartbeat_at >= since).scalar()
+
+
+def id_ranges(column, shards: int) -> List[Tuple[int, int]]:
+    """Calculate the half-open ranges of integer ids which belong to each shard.
+
+    The span between the lowest and highest id of ``column`` is split into ``shards`` contiguous ranges of equal
+    size. The ranges are calculated once, when the shards are enqueued, so that rows created or deleted while the
+    shards run do not move the boundaries. Rows created after the ranges were calculated fall outside every range and
+    are picked up by the next run.
+
+    Args:
+        column: An integer primary key column, eg. ``Device.id``.
+        shards (int): The total number of shards.
+
+    Returns:
+        List[Tuple[int, int]]: The inclusive lower bound and exclusive upper bound of each shard.
+    """
+    min_id, max_id = db.session.query(func.min(column), func.max(column)).one()
+    if min_id is None:
+        return [(0, 0)] * shards
+
+    size = int(math.ceil((max_id - min_id + 1) / shards))
+
+    return [(min_id + shard * size, min_id + (shard + 1) * size) for shard in range(shards)]
@@ -0,0 +1,108 @@
+import datetime
+from sqlalchemy.ext.mutable import MutableDict
+from commandment.models import db
+from commandment.dbtypes import JSONEncodedDict
+from commandment.runner import JobStatus
+
+
+class JobSchedule(db.Model):
+    """A periodic job definition.
+
+    Each node reconciles this table with its ``RUNNER_SCHEDULE`` setting at startup. The node which manages to advance
+    ``next_run_at`` for a due schedule is the one that enqueues the job, so a periodic job is only enqueued once per
+    interval no matter how many nodes are running.
+
+    :table: job_schedules
+    """
+    __tablename__ = 'job_schedules'
+
+    id = db.Column(db.Integer, primary_key=True)
+    """id (int): ID"""
+    name = db.Column(db.String(255), nullable=False, unique=True)
+    """name (str): The registered job name"""
+    interval = db.Column(db.Integer, nullable=False)
+    """interval (int): Seconds between runs"""
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    """enabled (bool): Disabled schedules are kept for history but never enqueued"""
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    """next_run_at (datetime.datetime): The datetime (utc) when the job will next be enqueued"""
+    last_enqueued_at = db.Column(db.DateTime, nullable=True)
+    """last_enqueued_at (datetime.datetime): The datetime (utc) when the job was last enqueued"""
+
+
+class Job(db.Model):
+    """A single execution of a registered job.
+
+    :table: jobs
+    """
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    """id (int): ID"""
+    name = db.Column(db.String(255), nullable=False, index=True)
+    """name (str): The registered job name"""
+    parameters = db.Column(MutableDict.as_mutable(JSONEncodedDict), nullable=True)
+    """parameters (dict): Keyword arguments passed to the job function"""
+    status = db.Column(db.Enum(JobStatus), index=True, nullable=False, default=JobStatus.Queued)
+    """status (JobStatus): The status of the job"""
+
+    queued_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    """queued_at (datetime.datetime): The datetime (utc) when the job was created"""
+    run_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.datetime.utcnow)
+    """run_at (datetime.datetime): The job will not be claimed before this datetime (utc)"""
+    started_at = db.Column(db.DateTime, nullable=True)
+    """started_at (datetime.datetime): The datetime (utc) when the latest attempt started"""
+    finished_at = db.Column(db.DateTime, nullable=True)
+    """finished_at (datetime.datetime): The datetime (utc) when the job succeeded or finally failed"""
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    """attempts (int): The number of times this job has been claimed"""
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    """max_attempts (int): The job fails permanently once this many attempts have been made"""
+    error = db.Column(db.Text, nullable=True)
+    """error (str): The exception raised by the most recent failed attempt"""
+
+    lease_owner = db.Column(db.String(255), nullable=True)
+    """lease_owner (str): The node id of the runner currently holding the job"""
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    """lease_expires_at (datetime.datetime): Another node may reclaim a Running job after this datetime (utc)"""
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    """heartbeat_at (datetime.datetime): The datetime (utc) when the lease was last extended"""
+
+    schedule_id = db.Column(db.ForeignKey('job_schedules.id'), nullable=True)
+    """schedule_id (int): The schedule which enqueued this job, if it is periodic"""
+    schedule = db.relationship('JobSchedule', backref='jobs')
+
+
+class RunnerNode(db.Model):
+    """A node which is running the job runner, kept alive by its heartbeat.
+
+    :table: runner_nodes
+    """
+    __tablename__ = 'runner_nodes'
+
+    node_id = db.Column(db.String(255), primary_key=True)
+    """node_id (str): The runner node id, see :func:`commandment.runner.worker.node_identifier`"""
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    """started_at (datetime.datetime): The datetime (utc) when the node started its runner"""
+    heartbeat_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.datetime.utcnow)
+    """heartbeat_at (datetime.datetime): The datetime (utc) of the last heartbeat from this node"""
+
+
+class RunnerLease(db.Model):
+    """A named, time-limited lease which may be held by one node at a time.
+
+    The ``leader`` lease decides which node is allowed to run leader-only jobs.
+
+    :table: runner_leases
+    """
+    __tablename__ = 'runner_leases'
+
+    name = db.Column(db.String(255), primary_key=True)
+    """name (str): The lease name"""
+    owner = db.Column(db.String(255), nullable=False)
+    """owner (str): The node id of the node holding the lease"""
+    acquired_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    """acquired_at (datetime.datetime): The datetime (utc) when the current owner acquired the lease"""
+    expires_at = db.Column(db.DateTime, nullable=False)
+    """expires_at (datetime.datetime): Another node may take the lease after this datetime (utc)"""
@@ -0,0 +1,75 @@
+"""
+Registry of job functions.
+
+Attributes:
+    registered_jobs (Dict[str, RegisteredJob]): Job definitions keyed by job name.
+"""
+import datetime
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from commandment.models import db
+from commandment.runner.models import Job
+
+
+class RegisteredJob(NamedTuple):
+    name: str
+    fn: Callable
+    max_attempts: int
+    leader_only: bool
+    sharded: bool
+    shard_by: Optional[Any]
+
+
+registered_jobs: Dict[str, RegisteredJob] = {}
+
+
+def job(name: str, max_attempts: int = 3, leader_only: bool = False, sharded: bool = False,
+        shard_by: Optional[Any] = None):
+    """Register a function as a job which may be executed by the runner.
+
+    The function is called with the job parameters as keyword arguments, inside an application context.
+
+    Args:
+        name (str): Unique job name, used to enqueue the job and to refer to it in ``RUNNER_SCHEDULE``.
+        max_attempts (int): The number of attempts before the job is marked as failed.
+        leader_only (bool): Only the elected leader node may claim this job. Use this for work which must never run
+            on two nodes at once, such as a sync which owns a single cursor.
+        sharded (bool): When enqueued by a schedule, the job is split into one job per shard. The function receives
+            ``shard`` and ``shards`` keyword arguments.
+        shard_by: An integer id column of a sharded job, eg. ``Device.id``. The id ranges of all shards are calculated
+            when the shards are enqueued, and the function also receives the ``lower`` and ``upper`` bound of its
+            shard, see :func:`commandment.runner.cluster.id_ranges`.
+    """
+    def decorator(fn: Callable) -> Callable:
+        registered_jobs[name] = RegisteredJob(name, fn, max_attempts, leader_only, sharded, shard_by)
+        return fn
+
+    return decorator
+
+
+def enqueue(name: str, run_at: Optional[datetime.datetime] = None, **parameters) -> Job:
+    """Enqueue a one-off execution of a registered job.
+
+    The caller is responsible for committing the session.
+
+    Args:
+        name (str): The registered job name.
+        run_at (datetime.datetime): Do not run the job before this datetime (utc). Defaults to now.
+        **parameters: Keyword arguments for the job function, these must be JSON serializable.
+
+    Raises:
+        KeyError: If no job is registered with that name.
+
+    Returns:
+        Job: The new job model, already added to the session.
+    """
+    registered = registered_jobs[name]
+
+    j = Job(
+        name=name,
+        parameters=parameters,
+        run_at=run_at or datetime.datetime.utcnow(),
+        max_attempts=registered.max_attempts,
+    )
+    db.session.add(j)
+
+    return j
@@ -0,0 +1,58 @@
+from flask_rest_jsonapi import ResourceDetail, ResourceList
+from flask_rest_jsonapi.exceptions import ObjectNotFound
+from sqlalchemy.orm.exc import NoResultFound
+
+from commandment.runner.schema import JobSchema, JobScheduleSchema
+from commandment.runner.models import db, Job, JobSchedule
+
+
+class JobsList(ResourceList):
+    def query(self, view_kwargs):
+        query_ = self.session.query(Job)
+        if view_kwargs.get('job_schedule_id') is not None:
+            try:
+                self.session.query(JobSchedule).filter_by(id=view_kwargs['job_schedule_id']).one()
+            except NoResultFound:
+                raise ObjectNotFound({'parameter': 'job_schedule_id'},
+                                     "Job Schedule: {} not found".format(view_kwargs['job_schedule_id']))
+            else:
+                query_ = query_.filter(Job.schedule_id == view_kwargs['job_schedule_id'])
+        return query_
+
+    methods = ['GET']
+    schema = JobSchema
+    view_kwargs = True
+    data_layer = {
+        'session': db.session,
+        'model': Job,
+        'methods': {'query': query}
+    }
+
+
+class JobDetail(ResourceDetail):
+    methods = ['GET']
+    schema = JobSchema
+    data_layer = {
+        'session': db.session,
+        'model': Job,
+        'url_field': 'job_id'
+    }
+
+
+class JobSchedulesList(ResourceList):
+    methods = ['GET']
+    schema = JobScheduleSchema
+    data_layer = {
+        'session': db.session,
+        'model': JobSchedule
+    }
+
+
+class JobScheduleDetail(ResourceDetail):
+    methods = ['GET']
+    schema = JobScheduleSchema
+    data_layer = {
+        'session': db.session,
+        'model': JobSchedule,
+        'url_field': 'job_schedule_id'
+    }
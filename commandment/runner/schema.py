@@ -0,0 +1,50 @@
+from marshmallow_enum import EnumField
+from marshmallow_jsonapi import fields
+from marshmallow_jsonapi.flask import Relationship, Schema
+from commandment.runner import JobStatus
+
+
+class JobScheduleSchema(Schema):
+    class Meta:
+        type_ = 'job_schedules'
+        self_view = 'api_app.job_schedule_detail'
+        self_view_kwargs = {'job_schedule_id': '<id>'}
+        self_view_many = 'api_app.job_schedules_list'
+        strict = True
+
+    id = fields.Int(dump_only=True)
+    name = fields.Str(dump_only=True)
+    interval = fields.Int(dump_only=True)
+    enabled = fields.Bool(dump_only=True)
+    next_run_at = fields.DateTime(dump_only=True)
+    last_enqueued_at = fields.DateTime(dump_only=True)
+
+
+class JobSchema(Schema):
+    class Meta:
+        type_ = 'jobs'
+        self_view = 'api_app.job_detail'
+        self_view_kwargs = {'job_id': '<id>'}
+        self_view_many = 'api_app.jobs_list'
+        strict = True
+
+    id = fields.Int(dump_only=True)
+    name = fields.Str(dump_only=True)
+    parameters = fields.Dict(dump_only=True)
+    status = EnumField(JobStatus, dump_only=True)
+    queued_at = fields.DateTime(dump_only=True)
+    run_at = fields.DateTime(dump_only=True)
+    started_at = fields.DateTime(dump_only=True)
+    finished_at = fields.DateTime(dump_only=True)
+    attempts = fields.Int(dump_only=True)
+    max_attempts = fields.Int(dump_only=True)
+    error = fields.Str(dump_only=True)
+    lease_owner = fields.Str(dump_only=True)
+    lease_expires_at = fields.DateTime(dump_only=True)
+    heartbeat_at = fields.DateTime(dump_only=True)
+
+    schedule = Relationship(
+        related_view='api_app.job_schedule_detail',
+        related_view_kwargs={'job_schedule_id': '<schedule_id>'},
+        type_='job_schedules',
+    )
@@ -0,0 +1,379 @@
+"""
+Runner worker pool.
+
+Attributes:
+    runner (Runner): The runner started for this process, if any.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from typing import List, Optional, Set
+from flask import Flask
+from sqlalchemy import and_, or_
+import sqlalchemy.exc
+
+from commandment.models import db
+from commandment.runner import JobStatus
+from commandment.runner.models import Job, JobSchedule
+from commandment.runner.registry import registered_jobs
+from commandment.runner import cluster
+
+logger = logging.getLogger('runner')
+
+runner = None
+
+
+def node_identifier() -> str:
+    """Generate an identifier for this process which is unique across all nodes sharing the database."""
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+class Runner(object):
+    """Claims and executes jobs from the ``jobs`` table using a pool of worker threads.
+
+    One additional thread takes part in leader election, enqueues periodic jobs, extends the lease of jobs running on
+    this node and fails jobs whose lease has expired too many times.
+
+    Jobs registered with ``leader_only`` are only claimed while this node holds the leader lease. Jobs registered with
+    ``sharded`` are split into ``shards`` jobs when enqueued by a schedule, so that they can be spread across nodes.
+
+    Args:
+        app (Flask): The application, an app context is pushed for each thread.
+        workers (int): The number of jobs that may run concurrently on this node.
+        poll_interval (float): Seconds between polls for due jobs and schedules.
+        lease_seconds (int): The length of a job lease. Must be longer than the poll interval, because the lease is
+            only extended once per poll.
+        retry_delay (int): Seconds before the first retry of a failed job, doubled on every subsequent attempt.
+        shards (int): The number of shards for sharded jobs. Zero means one shard per live node.
+    """
+    def __init__(self, app: Flask, workers: int = 2, poll_interval: float = 5.0, lease_seconds: int = 120,
+                 retry_delay: int = 30, shards: int = 0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.shards = shards
+        self.node_id = node_identifier()
+        self.is_leader = False
+        self.stopped = threading.Event()
+
+        self._threads: List[threading.Thread] = []
+        self._running: Set[int] = set()
+        self._running_lock = threading.Lock()
+
+    def start(self):
+        """Reconcile the schedule and start the worker and scheduler threads."""
+        logger.info('Runner %s starting with %d worker(s)', self.node_id, self.workers)
+        with self.app.app_context():
+            self.sync_schedules(self.app.config.get('RUNNER_SCHEDULE', {}))
+            self.elect()
+
+        self.stopped.clear()
+        scheduler = threading.Thread(target=self._scheduler_loop, name='runner-scheduler')
+        scheduler.daemon = True
+        self._threads.append(scheduler)
+
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name='runner-worker-{}'.format(i))
+            t.daemon = True
+            self._threads.append(t)
+
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        """Stop claiming jobs and wait for jobs that are running on this node to finish."""
+        logger.info('Runner %s will stop', self.node_id)
+        self.stopped.set()
+        for t in self._threads:
+            t.join()
+
+        del self._threads[:]
+
+        with self.app.app_context():
+            cluster.release_lease(cluster.LEADER_LEASE, self.node_id)
+            cluster.remove_node(self.node_id)
+            db.session.remove()
+
+        self.is_leader = False
+
+    def elect(self) -> bool:
+        """Send this node's heartbeat and acquire or renew the leader lease.
+
+        Returns:
+            bool: True if this node is the leader.
+        """
+        cluster.node_heartbeat(self.node_id)
+        is_leader = cluster.acquire_lease(cluster.LEADER_LEASE, self.node_id, self.lease_seconds)
+
+        if is_leader != self.is_leader:
+            logger.info('Runner %s %s the leader lease', self.node_id, 'acquired' if is_leader else 'lost')
+
+        self.is_leader = is_leader
+        return is_leader
+
+    def shard_count(self) -> int:
+        """The number of shards to split sharded jobs into."""
+        if self.shards > 0:
+            return self.shards
+
+        return max(1, cluster.live_node_count(self.lease_seconds))
+
+    def sync_schedules(self, schedule: dict):
+        """Create or update the ``job_schedules`` rows from the configured schedule.
+
+        Schedules which are not configured on this node are disabled.
+
+        Args:
+            schedule (dict): Job name to interval in seconds.
+        """
+        for name in schedule:
+            if name not in registered_jobs:
+                logger.warning('RUNNER_SCHEDULE refers to job %s, which is not registered', name)
+
+        try:
+            for s in db.session.query(JobSchedule).all():
+                s.enabled = s.name in schedule
+                if s.enabled:
+                    s.interval = schedule[s.name]
+
+            existing = {name for name, in db.session.query(JobSchedule.name)}
+            for name, interval in schedule.items():
+                if name not in existing:
+                    db.session.add(JobSchedule(name=name, interval=interval, next_run_at=datetime.datetime.utcnow()))
+
+            db.session.commit()
+        except sqlalchemy.exc.IntegrityError:
+            # Another node inserted the same schedule at the same time, its row is as good as ours.
+            db.session.rollback()
+
+    def enqueue_due(self) -> int:
+        """Enqueue a job for every schedule which is due.
+
+        Nodes race to advance ``next_run_at`` with a conditional UPDATE, only the winner enqueues the job. A schedule is
+        skipped if the job it enqueued previously has not finished yet. A sharded job is enqueued once per shard, with
+        the id range of its shard if it is sharded by a column.
+
+        Returns:
+            int: The number of jobs enqueued by this node.
+        """
+        now = datetime.datetime.utcnow()
+        due: List[JobSchedule] = db.session.query(JobSchedule).filter(
+            JobSchedule.enabled == True, JobSchedule.next_run_at <= now).all()
+        enqueued = 0
+
+        for s in due:
+            advanced = db.session.query(JobSchedule).filter(
+                JobSchedule.id == s.id, JobSchedule.next_run_at == s.next_run_at,
+            ).update({
+                JobSchedule.next_run_at: now + datetime.timedelta(seconds=s.interval),
+                JobSchedule.last_enqueued_at: now,
+            }, synchronize_session=False)
+
+            if advanced != 1:
+                continue
+
+            pending = db.session.query(Job.id).filter(
+                Job.schedule_id == s.id, Job.status.in_([JobStatus.Queued, JobStatus.Running])).first()
+            registered = registered_jobs.get(s.name)
+
+            if pending is None and registered is not None:
+                if registered.sharded:
+                    shards = self.shard_count()
+                    parameters = [{'shard': shard, 'shards': shards} for shard in range(shards)]
+                    if registered.shard_by is not None:
+                        ranges = cluster.id_ranges(registered.shard_by, shards)
+                        for parameter, (lower, upper) in zip(parameters, ranges):
+                            parameter.update(lower=lower, upper=upper)
+                else:
+                    parameters = [{}]
+
+                for p in parameters:
+                    db.session.add(Job(name=s.name, schedule_id=s.id, parameters=p, run_at=now,
+                                       max_attempts=registered.max_attempts))
+                    enqueued += 1
+
+        db.session.commit()
+        return enqueued
+
+    def heartbeat(self):
+        """Extend the lease of every job running on this node."""
+        with self._running_lock:
+            running = list(self._running)
+
+        if not running:
+            return
+
+        now = datetime.datetime.utcnow()
+        db.session.query(Job).filter(Job.id.in_(running), Job.lease_owner == self.node_id).update({
+            Job.heartbeat_at: now,
+            Job.lease_expires_at: now + datetime.timedelta(seconds=self.lease_seconds),
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def reap(self) -> int:
+        """Fail jobs whose lease expired on their final attempt.
+
+        Returns:
+            int: The number of jobs marked as failed.
+        """
+        now = datetime.datetime.utcnow()
+        reaped = db.session.query(Job).filter(
+            Job.status == JobStatus.Running, Job.lease_expires_at < now, Job.attempts >= Job.max_attempts,
+        ).update({
+            Job.status: JobStatus.Failed,
+            Job.finished_at: now,
+            Job.error: 'Lease expired',
+            Job.lease_owner: None,
+        }, synchronize_session=False)
+        db.session.commit()
+
+        return reaped
+
+    def claim(self) -> Optional[int]:
+        """Claim a single due job for this node.
+
+        A job is due if it is queued and its ``run_at`` has passed, or if it is running but its lease has expired.
+        Leader-only jobs are skipped unless this node is the leader.
+
+        Returns:
+            Optional[int]: The id of the claimed job, or None if nothing was claimed.
+        """
+        now = datetime.datetime.utcnow()
+        claimable = or_(
+            and_(Job.status == JobStatus.Queued, Job.run_at <= now),
+            and_(Job.status == JobStatus.Running, Job.lease_expires_at < now, Job.attempts < Job.max_attempts),
+        )
+
+        if not self.is_leader:
+            leader_only = [r.name for r in registered_jobs.values() if r.leader_only]
+            if leader_only:
+                claimable = and_(claimable, Job.name.notin_(leader_only))
+
+        candidates = db.session.query(Job.id).filter(claimable).order_by(Job.run_at).limit(self.workers * 2).all()
+        for job_id, in candidates:
+            claimed = db.session.query(Job).filter(Job.id == job_id, claimable).update({
+                Job.status: JobStatus.Running,
+                Job.lease_owner: self.node_id,
+                Job.lease_expires_at: now + datetime.timedelta(seconds=self.lease_seconds),
+                Job.heartbeat_at: now,
+                Job.started_at: now,
+                Job.attempts: Job.attempts + 1,
+            }, synchronize_session=False)
+            db.session.commit()
+
+            if claimed == 1:
+                return job_id
+
+        return None
+
+    def run_job(self, job_id: int):
+        """Execute a claimed job and record the outcome.
+
+        Args:
+            job_id (int): The id of a job claimed by this node.
+        """
+        j: Job = db.session.query(Job).get(job_id)
+        name, attempts, max_attempts = j.name, j.attempts, j.max_attempts
+        parameters = dict(j.parameters or {})
+        registered = registered_jobs.get(name)
+
+        with self._running_lock:
+            self._running.add(job_id)
+
+        try:
+            if registered is None:
+                raise LookupError('No job is registered with the name: {}'.format(name))
+
+            logger.info('Running job %s (id: %d, attempt %d of %d)', name, job_id, attempts, max_attempts)
+            registered.fn(**parameters)
+        except Exception:
+            logger.exception('Job %s (id: %d) failed', name, job_id)
+            db.session.rollback()
+            now = datetime.datetime.utcnow()
+            if registered is None or attempts >= max_attempts:
+                values = {Job.status: JobStatus.Failed, Job.finished_at: now}
+            else:
+                retry_at = now + datetime.timedelta(seconds=self.retry_delay * 2 ** (attempts - 1))
+                values = {Job.status: JobStatus.Queued, Job.run_at: retry_at}
+
+            values.update({Job.error: traceback.format_exc(), Job.lease_owner: None, Job.lease_expires_at: None})
+        else:
+            values = {
+                Job.status: JobStatus.Succeeded,
+                Job.finished_at: datetime.datetime.utcnow(),
+                Job.error: None,
+                Job.lease_owner: None,
+                Job.lease_expires_at: None,
+            }
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+
+        # Only record the outcome if the lease was not lost to another node in the meantime.
+        db.session.query(Job).filter(Job.id == job_id, Job.lease_owner == self.node_id).update(
+            values, synchronize_session=False)
+        db.session.commit()
+
+    def _worker_loop(self):
+        with self.app.app_context():
+            while not self.stopped.is_set():
+                try:
+                    job_id = self.claim()
+                    if job_id is not None:
+                        self.run_job(job_id)
+                except Exception:
+                    logger.exception('Runner worker could not claim or record a job')
+                    db.session.rollback()
+                    job_id = None
+                finally:
+                    db.session.remove()
+
+                if job_id is None:
+                    self.stopped.wait(self.poll_interval)
+
+    def _scheduler_loop(self):
+        with self.app.app_context():
+            while not self.stopped.wait(self.poll_interval):
+                try:
+                    self.elect()
+                    self.heartbeat()
+                    self.reap()
+                    self.enqueue_due()
+                except Exception:
+                    logger.exception('Runner scheduler pass failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+
+def start(app: Flask):
+    """Start the runner for this process, unless it is disabled by ``RUNNER_ENABLED``."""
+    global runner
+
+    if not app.config.get('RUNNER_ENABLED', True) or runner is not None:
+        return
+
+    runner = Runner(
+        app,
+        workers=app.config.get('RUNNER_WORKERS', 2),
+        poll_interval=app.config.get('RUNNER_POLL_INTERVAL', 5),
+        lease_seconds=app.config.get('RUNNER_LEASE_SECONDS', 120),
+        retry_delay=app.config.get('RUNNER_RETRY_DELAY', 30),
+        shards=app.config.get('RUNNER_SHARDS', 0),
+    )
+    runner.start()
+
+
+def stop():
+    """Stop the runner for this process."""
+    global runner
+
+    if runner is not None:
+        runner.stop()
+        runner = None
@@ -0,0 +1,117 @@
+"""
+Enrollment worker pool.
+
+When ``ENROLLMENT_STORM_MODE`` is enabled, the post-enrollment work of a ``TokenUpdate`` (certificate persistence,
+inventory queueing, the initial push and the ``device_enrolled`` signal) is handed to a small pool of worker threads
+via a bounded queue instead of being executed inside the request. This keeps check-in latency flat during large
+DEP rollouts where hundreds of devices enroll at the same time.
+
+The queue is bounded by ``ENROLLMENT_QUEUE_SIZE``. If it is full, or the pool was never started, :func:`submit`
+returns False and the caller is expected to do the work inline.
+"""
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional
+from flask import Flask
+
+from commandment.models import db
+
+logger = logging.getLogger('enrollment thread')
+
+work_queue: Optional[queue.Queue] = None
+workers: List[threading.Thread] = []
+workers_stopped = threading.Event()
+
+#: Seconds a worker will block waiting for work before re-checking the stop flag.
+poll_interval = 1.0
+
+
+def start(app: Flask):
+    """Start the enrollment worker pool.
+
+    Does nothing unless ``ENROLLMENT_STORM_MODE`` is set in the application configuration.
+
+    Args:
+        app (Flask): The flask application, used to push an app context in each worker.
+    """
+    global work_queue
+
+    if not app.config.get('ENROLLMENT_STORM_MODE', False):
+        return
+
+    if work_queue is not None:
+        return
+
+    worker_count = app.config.get('ENROLLMENT_WORKERS', 4)
+    work_queue = queue.Queue(maxsize=app.config.get('ENROLLMENT_QUEUE_SIZE', 1000))
+    workers_stopped.clear()
+
+    logger.info('Starting %d enrollment worker(s)', worker_count)
+    for i in range(worker_count):
+        t = threading.Thread(target=worker_callback, args=(app,), name='enrollment-worker-{}'.format(i))
+        t.daemon = True
+        t.start()
+        workers.append(t)
+
+
+def stop():
+    """Stop the enrollment worker pool.
+
+    Work remaining in the queue is drained before the workers exit.
+    """
+    global work_queue
+
+    logger.info('Enrollment workers will stop')
+    workers_stopped.set()
+
+    for t in workers:
+        t.join()
+
+    del workers[:]
+    work_queue = None
+
+
+def submit(fn: Callable, *args, **kwargs) -> bool:
+    """Submit post-enrollment work to the pool without blocking.
+
+    Args:
+        fn (Callable): The function to execute inside a worker's application context.
+        *args: Positional arguments to ``fn``.
+        **kwargs: Keyword arguments to ``fn``.
+
+    Returns:
+        bool: True if the work was queued, False if the pool is not running or the queue is full.
+    """
+    if work_queue is None:
+        return False
+
+    try:
+        work_queue.put_nowait((fn, args, kwargs))
+        return True
+    except queue.Full:
+        logger.warning('Enrollment queue is full (%d items), caller will run the work inline', work_queue.maxsize)
+        return False
+
+
+def worker_callback(app: Flask):
+    """Worker loop, executes queued work one item at a time until stopped and drained."""
+    q = work_queue
+
+    with app.app_context():
+        while True:
+            try:
+                fn, args, kwargs = q.get(timeout=poll_interval)
+            except queue.Empty:
+                if workers_stopped.is_set():
+                    return
+                continue
+
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception('Enrollment work item %r failed', fn)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+                q.task_done()
@@ -1,6 +1,9 @@
 """
 This thread should run delayed, once at startup to initialise the internal CA and self-signed certificates to provide
 a baseline configuration for messing around with.
+
+It remains a thread rather than a runner job because the runner depends on the tables created by the migrations,
+so the runner is started here once they have been applied.
 """
 
 import threading
@@ -18,6 +21,7 @@ from cryptography import x509
 from cryptography.x509.oid import NameOID
 import sqlalchemy
 from commandment.pki.ca import get_ca
+from commandment.runner import worker as runner
 from flask import Flask
 
 startup_thread = None
@@ -87,15 +91,25 @@ def run_migrations(app: Flask):
 
 
 def startup_callback(app: Flask):
-    """Run the StartUp Thread jobs"""
+    """Run the StartUp Thread jobs
+
+    A missing push certificate is still raised, but only after the runner has started, because most runner jobs do
+    not need APNS.
+    """
     logger.debug("Started Thread: Startup")
-    split_pkcs12(app)
-    run_migrations(app)
-    generate_ca(app)
+    try:
+        split_pkcs12(app)
+    finally:
+        run_migrations(app)
+        generate_ca(app)
+        runner.start(app)
 
 
 def start(app: Flask):
-    """Start the StartUp thread"""
+    """Start the StartUp thread, unless it is disabled by ``STARTUP_THREAD_ENABLED``."""
+    if not app.config.get('STARTUP_THREAD_ENABLED', True):
+        return
+
     logger.info('Startup thread will run in 5 seconds')
     startup_thread = threading.Timer(startup_delay, startup_callback, [app])
     startup_thread.daemon = True
@@ -1,16 +1,37 @@
-from flask import g, current_app
+from flask import current_app
 
+from commandment.clients import ClientRegistry
 from commandment.vpp.errors import VPPError
-from commandment.vpp.vpp import VPP
+from commandment.vpp.vpp import VPP, SERVICE_CONFIG_URL
 
+clients = ClientRegistry()
+"""ClientRegistry: VPP clients shared by every thread in this process, one per VPP account."""
 
-def get_vpp() -> VPP:
-    vpp = getattr(g, '_vpp', None)
 
-    if vpp is None:
-        if 'VPP_STOKEN' not in current_app.config:
-            raise VPPError('VPP stoken not configured')
+def get_vpp(vpp_account=None) -> VPP:
+    """Get the long lived VPP client for a VPP account, or for the configured ``VPP_STOKEN`` if no account is given.
 
-        g._vpp = VPP(current_app.config['VPP_STOKEN'])
+    Args:
+        vpp_account (VPPAccount): The account whose service token should be used.
 
-    return vpp
+    Raises:
+        VPPError: If there is no account given and no VPP service token configured.
+    """
+    config = current_app.config
+
+    if vpp_account is not None:
+        identity, stoken = vpp_account.id, vpp_account.stoken
+    elif 'VPP_STOKEN' in config:
+        identity, stoken = 'VPP_STOKEN', config['VPP_STOKEN']
+    else:
+        raise VPPError('VPP stoken not configured')
+
+    def factory() -> VPP:
+        return VPP(
+            stoken,
+            vpp_service_config_url=config.get('VPP_SERVICE_CONFIG_URL', SERVICE_CONFIG_URL),
+            service_config_ttl=config.get('VPP_SERVICE_CONFIG_TTL', 3600),
+            pool_maxsize=config.get('HTTP_POOL_MAXSIZE', 10),
+        )
+
+    return clients.get(identity, stoken, factory)
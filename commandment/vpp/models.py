@@ -25,7 +25,7 @@ class VPPAccount(db.Model):
         self.exp_date = dateutil.parser.parse(data['expDate'])
         self.org_name = data['orgName']
 
-    _stoken = db.Column(db.String, nullable=False)
+    _stoken = db.Column('stoken', db.String, nullable=False)
     exp_date = db.Column(db.DateTime)
     """datetime: Populated for convenience when checking the VPP token expiry date."""
     org_name = db.Column(db.String)
@@ -44,27 +44,114 @@ class VPPAccount(db.Model):
 
 
 class VPPUser(db.Model):
+    """A VPP user, mirrored from the getVPPUsersSrv endpoint.
+
+    Retired users are not mirrored, so that their client user id may be registered again.
+    """
     __tablename__ = 'vpp_users'
 
     user_id = db.Column(db.Integer, primary_key=True)
-    client_user_id = db.Column(GUID, nullable=False)
+    vpp_account_id = db.Column(db.ForeignKey('vpp_accounts.id'), index=True)
+    client_user_id = db.Column(GUID, nullable=False, unique=True)
     email = db.Column(db.String)
     status = db.Column(db.Enum(VPPUserStatus))
     invite_url = db.Column(db.String)
     invite_code = db.Column(db.String)
+    its_id_hash = db.Column(db.String)
+    updated_at = db.Column(db.DateTime)
 
 
 class VPPLicense(db.Model):
+    """A VPP license, mirrored from the getVPPLicensesSrv endpoint.
+
+    A license is assigned to a user if it has a ``user_id``, to a device if it has a ``serial_number``, or is
+    available otherwise.
+    """
     __tablename__ = 'vpp_licenses'
 
     license_id = db.Column(db.Integer, primary_key=True)
+    vpp_account_id = db.Column(db.ForeignKey('vpp_accounts.id'), index=True)
     adam_id = db.Column(db.String)
     product_type = db.Column(db.Enum(VPPProductType))
     product_type_name = db.Column(db.String)
     pricing_param = db.Column(db.Enum(VPPPricingParam))
     is_irrevocable = db.Column(db.Boolean)
-    user_id = db.Column(db.ForeignKey('vpp_users.user_id'))
+    status = db.Column(db.String)
+    user_id = db.Column(db.ForeignKey('vpp_users.user_id'), index=True)
     client_user_id = db.Column(db.ForeignKey('vpp_users.client_user_id'))
     its_id_hash = db.Column(db.String)
-    
+    serial_number = db.Column(db.String, index=True)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_vpp_licenses_adam_id_pricing_param', 'adam_id', 'pricing_param'),
+    )
+
+
+class VPPAsset(db.Model):
+    """A product for which the VPP account holds licenses, mirrored from the getVPPAssetsSrv endpoint.
+
+    The license counts are as reported by Apple at the last sync.
+    """
+    __tablename__ = 'vpp_assets'
 
+    id = db.Column(db.Integer, primary_key=True)
+    vpp_account_id = db.Column(db.ForeignKey('vpp_accounts.id'), nullable=False)
+    adam_id = db.Column(db.String, nullable=False)
+    pricing_param = db.Column(db.Enum(VPPPricingParam), nullable=False)
+    product_type = db.Column(db.Enum(VPPProductType))
+    product_type_name = db.Column(db.String)
+    is_irrevocable = db.Column(db.Boolean)
+    device_assignable = db.Column(db.Boolean)
+    total_count = db.Column(db.Integer)
+    assigned_count = db.Column(db.Integer)
+    available_count = db.Column(db.Integer)
+    retired_count = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('vpp_account_id', 'adam_id', 'pricing_param',
+                            name='uq_vpp_assets_vpp_account_id_adam_id_pricing_param'),
+    )
+
+    @classmethod
+    def available_seats(cls, adam_id: str,
+                        pricing_param: VPPPricingParam = VPPPricingParam.StandardQuality) -> int:
+        """Get the number of unassigned licenses for a product, across all VPP accounts, from the local mirror.
+
+        Args:
+            adam_id (str): The Adam ID of the product.
+            pricing_param (VPPPricingParam): The pricing parameter (quality) of the product.
+
+        Returns:
+            int: The number of licenses available to assign.
+        """
+        available = db.session.query(db.func.sum(cls.available_count)).filter(
+            cls.adam_id == adam_id, cls.pricing_param == pricing_param).scalar()
+        return available or 0
+
+
+class VPPAssignmentResult(db.Model):
+    """The outcome of the most recent license operation for a product and device serial number.
+
+    Written by :mod:`commandment.vpp.planner`, so that devices which could not be given a license can be found
+    without asking the VPP service.
+    """
+    __tablename__ = 'vpp_assignment_results'
+
+    id = db.Column(db.Integer, primary_key=True)
+    vpp_account_id = db.Column(db.ForeignKey('vpp_accounts.id'))
+    adam_id = db.Column(db.String, nullable=False)
+    pricing_param = db.Column(db.Enum(VPPPricingParam), nullable=False)
+    serial_number = db.Column(db.String, nullable=False, index=True)
+    operation = db.Column(db.String, nullable=False)
+    """str: Either 'associate' or 'disassociate'."""
+    succeeded = db.Column(db.Boolean, nullable=False, index=True)
+    error_number = db.Column(db.Integer)
+    error_message = db.Column(db.String)
+    attempted_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('vpp_account_id', 'adam_id', 'pricing_param', 'serial_number',
+                            name='uq_vpp_assignment_results_account_product_serial_number'),
+    )
@@ -0,0 +1,387 @@
+"""
+Plan and execute VPP device license assignment in bulk.
+
+The desired state is every VPP application tagged with a tag that a device is also tagged with. It is compared
+against the local license mirror (see :mod:`commandment.vpp.threads`) to find the serial numbers which need a license
+associated or disassociated, per Adam ID. The differences are split into ``manageVPPLicensesByAdamIdSrv`` requests no
+larger than the limits given in the VPP service configuration, which are sent concurrently by a small thread pool.
+
+Each VPP account only assigns the products it holds licenses for. The outcome for every account and serial number
+is stored in ``vpp_assignment_results``, and successful operations are applied to the local license mirror so that
+the next plan does not repeat them.
+"""
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
+from flask import Flask, current_app
+import requests
+
+from commandment.apps.models import Application, PurchaseMethod, application_tags
+from commandment.models import db, Device, device_tags
+from commandment.runner.registry import job
+from commandment.vpp import get_vpp
+from commandment.vpp.enum import LicenseAssociationType, LicenseDisassociationType, VPPPricingParam
+from commandment.vpp.models import VPPAccount, VPPAsset, VPPLicense, VPPAssignmentResult
+from commandment.vpp.vpp import VPP
+
+logger = logging.getLogger(__name__)
+
+#: Used if the service configuration does not specify a batch limit.
+DEFAULT_BATCH_LIMIT = 100
+
+#: Number of values per ``IN`` clause when looking up existing rows.
+LOOKUP_CHUNK = 500
+
+Assignments = Dict[str, Set[str]]
+"""Assignments: Serial numbers keyed by Adam ID."""
+
+
+class LicenseBatch(object):
+    """A single ``manageVPPLicensesByAdamIdSrv`` request for one product.
+
+    Args:
+        adam_id (str): The Adam ID of the product.
+        pricing_param (VPPPricingParam): The pricing parameter of the product.
+        associate (List[str]): Serial numbers to associate a license with.
+        disassociate (List[str]): Serial numbers to disassociate a license from.
+    """
+    def __init__(self, adam_id: str, pricing_param: VPPPricingParam, associate: List[str] = None,
+                 disassociate: List[str] = None):
+        self.adam_id = adam_id
+        self.pricing_param = pricing_param
+        self.associate = associate or []
+        self.disassociate = disassociate or []
+
+    def __repr__(self):
+        return '<LicenseBatch adam_id={} associate={} disassociate={}>'.format(
+            self.adam_id, len(self.associate), len(self.disassociate))
+
+
+def owned_adam_ids(vpp_account_id: int, pricing_param: VPPPricingParam) -> Set[str]:
+    """Get the products which a VPP account holds licenses for, from the local mirror."""
+    return {adam_id for adam_id, in db.session.query(VPPAsset.adam_id).filter(
+        VPPAsset.vpp_account_id == vpp_account_id, VPPAsset.pricing_param == pricing_param)}
+
+
+def desired_device_assignments(vpp_account_id: Optional[int] = None,
+                               pricing_param: VPPPricingParam = VPPPricingParam.StandardQuality) -> Assignments:
+    """Find the serial numbers which should hold a license for each VPP application, by tag.
+
+    Args:
+        vpp_account_id (Optional[int]): Only include the products which this account holds licenses for, so that
+            each account only assigns its own products.
+        pricing_param (VPPPricingParam): The pricing parameter of the licenses held by the account.
+
+    Returns:
+        Assignments: Serial numbers keyed by Adam ID.
+    """
+    rows = db.session.query(Application.itunes_store_id, Device.serial_number).\
+        select_from(Application).\
+        join(application_tags, application_tags.c.application_id == Application.id).\
+        join(device_tags, device_tags.c.tag_id == application_tags.c.tag_id).\
+        join(Device, Device.id == device_tags.c.device_id).\
+        filter(Application.purchase_method == PurchaseMethod.VPP_APP_ASSIGNMENT).\
+        filter(Application.itunes_store_id != None).\
+        filter(Device.serial_number != None).\
+        distinct()
+
+    owned = owned_adam_ids(vpp_account_id, pricing_param) if vpp_account_id is not None else None
+
+    desired: Assignments = {}
+    for adam_id, serial_number in rows:
+        if owned is None or str(adam_id) in owned:
+            desired.setdefault(str(adam_id), set()).add(serial_number)
+
+    return desired
+
+
+def current_device_assignments(adam_ids: List[str], pricing_param: VPPPricingParam,
+                               vpp_account_id: Optional[int] = None) -> Assignments:
+    """Find the serial numbers holding a license for each of the given products, in the local mirror.
+
+    Args:
+        adam_ids (List[str]): The products.
+        pricing_param (VPPPricingParam): The pricing parameter of the licenses.
+        vpp_account_id (Optional[int]): Only count licenses of this account, which are the only ones its token can
+            disassociate.
+
+    Returns:
+        Assignments: Serial numbers keyed by Adam ID.
+    """
+    current: Assignments = {adam_id: set() for adam_id in adam_ids}
+    if not adam_ids:
+        return current
+
+    rows = db.session.query(VPPLicense.adam_id, VPPLicense.serial_number).filter(
+        VPPLicense.adam_id.in_(adam_ids), VPPLicense.pricing_param == pricing_param,
+        VPPLicense.serial_number != None)
+    if vpp_account_id is not None:
+        rows = rows.filter(VPPLicense.vpp_account_id == vpp_account_id)
+
+    for adam_id, serial_number in rows:
+        current[adam_id].add(serial_number)
+
+    return current
+
+
+def _batches(values: List[str], size: int) -> List[List[str]]:
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def plan(desired: Assignments, current: Assignments, associate_limit: int, disassociate_limit: int,
+         pricing_param: VPPPricingParam = VPPPricingParam.StandardQuality, remove: bool = False,
+         available: Optional[Dict[str, int]] = None) -> Tuple[List[LicenseBatch], Assignments]:
+    """Compute the requests needed to move from the current to the desired assignments.
+
+    Args:
+        desired (Assignments): Serial numbers which should hold a license, by Adam ID.
+        current (Assignments): Serial numbers which hold a license, by Adam ID.
+        associate_limit (int): The maximum number of associations per request.
+        disassociate_limit (int): The maximum number of disassociations per request.
+        pricing_param (VPPPricingParam): The pricing parameter of every product.
+        remove (bool): Also disassociate licenses from serial numbers which should not hold one.
+        available (Dict[str, int]): Available licenses by Adam ID. Licenses disassociated by the plan are added.
+            Associations beyond the number of available licenses are left out of the plan.
+
+    Returns:
+        Tuple[List[LicenseBatch], Assignments]: The requests, and serial numbers which were left out of the plan
+            because there are not enough licenses, by Adam ID.
+    """
+    batches: List[LicenseBatch] = []
+    unavailable: Assignments = {}
+
+    for adam_id in sorted(set(desired) | (set(current) if remove else set())):
+        wanted = desired.get(adam_id, set())
+        holding = current.get(adam_id, set())
+        associate = sorted(wanted - holding)
+        disassociate = sorted(holding - wanted) if remove else []
+
+        if available is not None and adam_id in available:
+            seats = max(0, available[adam_id] + len(disassociate))
+            if len(associate) > seats:
+                unavailable[adam_id] = set(associate[seats:])
+                associate = associate[:seats]
+
+        associations = _batches(associate, associate_limit)
+        disassociations = _batches(disassociate, disassociate_limit)
+        for i in range(max(len(associations), len(disassociations))):
+            batches.append(LicenseBatch(
+                adam_id, pricing_param,
+                associations[i] if i < len(associations) else [],
+                disassociations[i] if i < len(disassociations) else [],
+            ))
+
+    return batches, unavailable
+
+
+def _outcomes(batch: LicenseBatch, reply: dict, operation: str, key: str, serials: List[str]) -> List[dict]:
+    """Build one result per serial number from the associations or disassociations array of a reply."""
+    by_serial = {r.get('serialNumber'): r for r in reply.get(key, [])}
+    results = []
+    for serial_number in serials:
+        r = by_serial.get(serial_number, {})
+        error_number = r.get('errorNumber', reply.get('errorNumber') if reply.get('status') == -1 else None)
+        results.append({
+            'adam_id': batch.adam_id,
+            'pricing_param': batch.pricing_param,
+            'serial_number': serial_number,
+            'operation': operation,
+            'succeeded': error_number is None,
+            'error_number': error_number,
+            'error_message': r.get('errorMessage', reply.get('errorMessage')) if error_number is not None else None,
+            'license_id': int(r['licenseIdStr']) if r.get('licenseIdStr') else r.get('licenseId'),
+        })
+
+    return results
+
+
+def execute(vpp: VPP, batches: List[LicenseBatch], max_workers: int = 4) -> List[dict]:
+    """Send license batches concurrently.
+
+    Args:
+        vpp (VPP): The VPP client.
+        batches (List[LicenseBatch]): The requests to send.
+        max_workers (int): The maximum number of concurrent requests.
+
+    Returns:
+        List[dict]: One result per serial number and operation, with the keys of `VPPAssignmentResult` and
+            ``license_id`` if the service returned one.
+    """
+    results: List[dict] = []
+
+    def send(batch: LicenseBatch) -> dict:
+        return vpp.bulk_update_licenses(
+            batch.adam_id,
+            association_type=LicenseAssociationType.SerialNumber if batch.associate else None,
+            associate=batch.associate,
+            disassociation_type=LicenseDisassociationType.SerialNumber if batch.disassociate else None,
+            disassociate=batch.disassociate,
+            pricing_param=batch.pricing_param.value,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(send, batch): batch for batch in batches}
+
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                reply = future.result()
+            except (requests.RequestException, ValueError) as e:
+                logger.error('VPP license request for %s failed: %s', batch.adam_id, e)
+                reply = {'status': -1, 'errorNumber': -1, 'errorMessage': str(e)}
+
+            results.extend(_outcomes(batch, reply, 'associate', 'associations', batch.associate))
+            results.extend(_outcomes(batch, reply, 'disassociate', 'disassociations', batch.disassociate))
+
+    return results
+
+
+def record_results(results: List[dict], vpp_account_id: Optional[int] = None):
+    """Store the outcome for every serial number and apply successful operations to the license mirror.
+
+    The caller is responsible for committing the session.
+    """
+    now = datetime.datetime.utcnow()
+    existing = {}
+    for chunk in _batches(sorted({r['serial_number'] for r in results}), LOOKUP_CHUNK):
+        for result_id, adam_id, pricing_param, serial_number in db.session.query(
+                VPPAssignmentResult.id, VPPAssignmentResult.adam_id, VPPAssignmentResult.pricing_param,
+                VPPAssignmentResult.serial_number).filter(
+                    VPPAssignmentResult.vpp_account_id == vpp_account_id,
+                    VPPAssignmentResult.serial_number.in_(chunk)):
+            existing[(adam_id, pricing_param, serial_number)] = result_id
+
+    inserts, updates = [], []
+    for r in results:
+        mapping = {k: r[k] for k in ('adam_id', 'pricing_param', 'serial_number', 'operation', 'succeeded',
+                                     'error_number', 'error_message')}
+        mapping['vpp_account_id'] = vpp_account_id
+        mapping['attempted_at'] = now
+        key = (r['adam_id'], r['pricing_param'], r['serial_number'])
+        if key in existing:
+            mapping['id'] = existing[key]
+            updates.append(mapping)
+        else:
+            inserts.append(mapping)
+
+    if updates:
+        db.session.bulk_update_mappings(VPPAssignmentResult, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(VPPAssignmentResult, inserts)
+
+    # Keep the mirror in step, until the next sync replaces it with the service's view.
+    associated = [r for r in results if r['succeeded'] and r['operation'] == 'associate' and r['license_id']]
+    known = set()
+    for chunk in _batches([r['license_id'] for r in associated], LOOKUP_CHUNK):
+        known.update(license_id for license_id, in db.session.query(VPPLicense.license_id).filter(
+            VPPLicense.license_id.in_(chunk)))
+
+    mirror = [{
+        'license_id': r['license_id'],
+        'vpp_account_id': vpp_account_id,
+        'adam_id': r['adam_id'],
+        'pricing_param': r['pricing_param'],
+        'serial_number': r['serial_number'],
+        'status': 'Associated',
+        'updated_at': now,
+    } for r in associated]
+
+    if mirror:
+        db.session.bulk_update_mappings(VPPLicense, [m for m in mirror if m['license_id'] in known])
+        db.session.bulk_insert_mappings(VPPLicense, [m for m in mirror if m['license_id'] not in known])
+
+    released: Dict[Tuple[str, VPPPricingParam], List[str]] = {}
+    for r in results:
+        if r['succeeded'] and r['operation'] == 'disassociate':
+            released.setdefault((r['adam_id'], r['pricing_param']), []).append(r['serial_number'])
+
+    for (adam_id, pricing_param), serials in released.items():
+        for chunk in _batches(serials, LOOKUP_CHUNK):
+            licenses = db.session.query(VPPLicense).filter(
+                VPPLicense.adam_id == adam_id, VPPLicense.pricing_param == pricing_param,
+                VPPLicense.serial_number.in_(chunk),
+            )
+            if vpp_account_id is not None:
+                licenses = licenses.filter(VPPLicense.vpp_account_id == vpp_account_id)
+            licenses.update({VPPLicense.serial_number: None, VPPLicense.status: 'Available',
+                             VPPLicense.updated_at: now}, synchronize_session=False)
+
+
+def assign_device_licenses(vpp: VPP, vpp_account: Optional[VPPAccount] = None, max_workers: int = 4,
+                           remove: bool = False,
+                           pricing_param: VPPPricingParam = VPPPricingParam.StandardQuality) -> Dict[str, int]:
+    """Associate (and optionally disassociate) device licenses so that they match application tags.
+
+    Args:
+        vpp (VPP): The VPP client.
+        vpp_account (VPPAccount): The account the client belongs to. Only its products are assigned, and it is
+            recorded on mirrored licenses and results.
+        max_workers (int): The maximum number of concurrent requests.
+        remove (bool): Disassociate licenses from devices which are no longer tagged with the application.
+        pricing_param (VPPPricingParam): The pricing parameter of the licenses to manage.
+
+    Returns:
+        Dict[str, int]: Counts of batches, succeeded, failed and unavailable serial numbers.
+    """
+    vpp_account_id = vpp_account.id if vpp_account is not None else None
+    desired = desired_device_assignments(vpp_account_id, pricing_param)
+    managed = set(desired.keys())
+    if remove:  # Products which are no longer tagged at all still need their licenses released
+        managed.update(str(adam_id) for adam_id, in db.session.query(Application.itunes_store_id).filter(
+            Application.purchase_method == PurchaseMethod.VPP_APP_ASSIGNMENT, Application.itunes_store_id != None))
+        if vpp_account_id is not None:
+            managed &= owned_adam_ids(vpp_account_id, pricing_param)
+
+    current = current_device_assignments(sorted(managed), pricing_param, vpp_account_id)
+
+    # Only the products which are mirrored are limited by their available licenses, the service has the final say.
+    assets = db.session.query(VPPAsset.adam_id, db.func.sum(VPPAsset.available_count)).filter(
+        VPPAsset.pricing_param == pricing_param).group_by(VPPAsset.adam_id)
+    if vpp_account_id is not None:
+        assets = assets.filter(VPPAsset.vpp_account_id == vpp_account_id)
+    available = {adam_id: seats or 0 for adam_id, seats in assets if adam_id in desired}
+
+    config = vpp._service_config
+    batches, unavailable = plan(
+        desired, current,
+        associate_limit=config.get('maxBatchAssociateLicenseCount', DEFAULT_BATCH_LIMIT),
+        disassociate_limit=config.get('maxBatchDisassociateLicenseCount', DEFAULT_BATCH_LIMIT),
+        pricing_param=pricing_param, remove=remove, available=available,
+    )
+
+    results = execute(vpp, batches, max_workers)
+    results.extend({
+        'adam_id': adam_id, 'pricing_param': pricing_param, 'serial_number': serial_number,
+        'operation': 'associate', 'succeeded': False, 'error_number': None,
+        'error_message': 'No licenses available', 'license_id': None,
+    } for adam_id, serials in unavailable.items() for serial_number in serials)
+
+    record_results(results, vpp_account_id)
+    db.session.commit()
+
+    stats = {
+        'batches': len(batches),
+        'succeeded': sum(1 for r in results if r['succeeded']),
+        'failed': sum(1 for r in results if not r['succeeded']),
+        'unavailable': sum(len(s) for s in unavailable.values()),
+    }
+    logger.info('VPP device license assignment: %s', stats)
+    return stats
+
+
+def vpp_assign_callback(app: Flask):
+    """Assign device licenses for every VPP account."""
+    with app.app_context():
+        for vpp_account in db.session.query(VPPAccount).all():
+            assign_device_licenses(
+                get_vpp(vpp_account), vpp_account,
+                max_workers=app.config.get('VPP_ASSIGNMENT_WORKERS', 4),
+                remove=app.config.get('VPP_REMOVE_UNTAGGED_LICENSES', False),
+            )
+
+
+@job('vpp.assign', leader_only=True)
+def vpp_assign():
+    """Runner job which brings device license assignment in line with application tags."""
+    vpp_assign_callback(current_app._get_current_object())
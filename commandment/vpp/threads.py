@@ -0,0 +1,289 @@
+"""
+Mirror VPP assets, licenses and users into the local database.
+
+Licenses and users are fetched incrementally using the ``sinceModifiedToken`` returned at the end of the previous
+sync, so after the first full fetch only the changes are transferred. Assets are a short list and are fetched in full
+every time. Every chunk of records is written with bulk inserts and updates, resolving existing rows with a single
+``IN`` query per chunk.
+
+Retired users are not mirrored. Apple allows the client user id of a retired user to be registered again under a new
+user id, which then takes over the mirrored row of that client user id.
+"""
+import datetime
+import logging
+import uuid
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+from flask import Flask, current_app
+
+from commandment.models import db
+from commandment.runner.registry import job
+from commandment.vpp import get_vpp
+from commandment.vpp.enum import VPPPricingParam, VPPProductType, VPPUserStatus
+from commandment.vpp.models import VPPAccount, VPPAsset, VPPLicense, VPPUser
+from commandment.vpp.vpp import VPP
+
+logger = logging.getLogger(__name__)
+
+#: Number of records written per bulk insert/update, and per commit.
+VPP_UPSERT_CHUNK = 1000
+
+
+def _enum_value(enum, value):
+    try:
+        return enum(value)
+    except ValueError:
+        return None
+
+
+def _client_user_id(value: Optional[str]) -> Optional[uuid.UUID]:
+    """Client user IDs are stored as UUIDs, which is what Commandment registers users with."""
+    if value is None:
+        return None
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        logger.warning('Ignoring VPP clientUserIdStr which is not a UUID: %s', value)
+        return None
+
+
+def chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Split an iterable of records into lists of at most ``size``, without consuming it all up front."""
+    it = iter(records)
+    chunk = list(islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, size))
+
+
+def vpp_license_mapping(license: dict, vpp_account_id: int, now: datetime.datetime) -> dict:
+    """Convert a license record from getVPPLicensesSrv into a mapping of `VPPLicense` attributes."""
+    return {
+        'license_id': license['licenseId'],
+        'vpp_account_id': vpp_account_id,
+        'adam_id': license.get('adamIdStr') or str(license.get('adamId')),
+        'product_type': _enum_value(VPPProductType, license.get('productTypeId')),
+        'product_type_name': license.get('productTypeName'),
+        'pricing_param': _enum_value(VPPPricingParam, license.get('pricingParam')),
+        'is_irrevocable': license.get('isIrrevocable'),
+        'status': license.get('status'),
+        'user_id': license.get('userId'),
+        'client_user_id': _client_user_id(license.get('clientUserIdStr')),
+        'its_id_hash': license.get('itsIdHash'),
+        'serial_number': license.get('serialNumber'),
+        'updated_at': now,
+    }
+
+
+def vpp_user_mapping(user: dict, vpp_account_id: int, now: datetime.datetime) -> Optional[dict]:
+    """Convert a user record from getVPPUsersSrv into a mapping of `VPPUser` attributes.
+
+    Returns:
+        Optional[dict]: The mapping, or None if the user has no usable client user id.
+    """
+    client_user_id = _client_user_id(user.get('clientUserIdStr'))
+    if client_user_id is None:
+        return None
+
+    return {
+        'user_id': user['userId'],
+        'vpp_account_id': vpp_account_id,
+        'client_user_id': client_user_id,
+        'email': user.get('email'),
+        'status': _enum_value(VPPUserStatus, user.get('status')),
+        'invite_url': user.get('inviteUrl'),
+        'invite_code': user.get('inviteCode'),
+        'its_id_hash': user.get('itsIdHash'),
+        'updated_at': now,
+    }
+
+
+def vpp_asset_mapping(asset: dict, vpp_account_id: int, now: datetime.datetime) -> dict:
+    """Convert an asset record from getVPPAssetsSrv into a mapping of `VPPAsset` attributes."""
+    return {
+        'vpp_account_id': vpp_account_id,
+        'adam_id': asset.get('adamIdStr') or str(asset.get('adamId')),
+        'pricing_param': _enum_value(VPPPricingParam, asset.get('pricingParam')),
+        'product_type': _enum_value(VPPProductType, asset.get('productTypeId')),
+        'product_type_name': asset.get('productTypeName'),
+        'is_irrevocable': asset.get('isIrrevocable'),
+        'device_assignable': asset.get('deviceAssignable'),
+        'total_count': asset.get('totalCount'),
+        'assigned_count': asset.get('assignedCount'),
+        'available_count': asset.get('availableCount'),
+        'retired_count': asset.get('retiredCount'),
+        'updated_at': now,
+    }
+
+
+def upsert_mappings(session, model, key: str, mappings: List[dict]) -> Dict[str, int]:
+    """Insert or update mappings in bulk, by a primary key which is assigned by the VPP service.
+
+    The caller is responsible for committing the session.
+
+    Returns:
+        Dict[str, int]: Counts of inserted and updated rows.
+    """
+    column = getattr(model, key)
+    by_key = {m[key]: m for m in mappings}  # The last record for a key wins
+    existing = {k for k, in session.query(column).filter(column.in_(list(by_key.keys())))}
+
+    updates = [m for k, m in by_key.items() if k in existing]
+    inserts = [m for k, m in by_key.items() if k not in existing]
+
+    if updates:
+        session.bulk_update_mappings(model, updates)
+    if inserts:
+        session.bulk_insert_mappings(model, inserts)
+
+    return {'inserted': len(inserts), 'updated': len(updates)}
+
+
+def vpp_sync_assets(vpp: VPP, vpp_account: VPPAccount) -> Dict[str, int]:
+    """Replace the mirrored assets of an account with the current list from the VPP service."""
+    now = datetime.datetime.utcnow()
+    reply = vpp.assets()
+    mappings = [vpp_asset_mapping(a, vpp_account.id, now) for a in reply.get('assets', [])]
+    mappings = [m for m in mappings if m['pricing_param'] is not None]
+
+    existing = {(adam_id, pricing_param): asset_id for asset_id, adam_id, pricing_param in db.session.query(
+        VPPAsset.id, VPPAsset.adam_id, VPPAsset.pricing_param).filter(VPPAsset.vpp_account_id == vpp_account.id)}
+
+    updates, inserts = [], []
+    for m in mappings:
+        asset_id = existing.pop((m['adam_id'], m['pricing_param']), None)
+        if asset_id is None:
+            inserts.append(m)
+        else:
+            m['id'] = asset_id
+            updates.append(m)
+
+    if updates:
+        db.session.bulk_update_mappings(VPPAsset, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(VPPAsset, inserts)
+    if existing:  # No longer returned by the service
+        db.session.query(VPPAsset).filter(VPPAsset.id.in_(list(existing.values()))).delete(synchronize_session=False)
+
+    db.session.commit()
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(existing)}
+
+
+def release_users(user_ids: List[int]):
+    """Clear the user of licenses which refer to users that are about to be removed or given a new user id.
+
+    The license sync which follows the user sync sets the current user of each license again.
+    """
+    db.session.query(VPPLicense).filter(VPPLicense.user_id.in_(user_ids)).update(
+        {VPPLicense.user_id: None, VPPLicense.client_user_id: None}, synchronize_session=False)
+
+
+def vpp_sync_users(vpp: VPP, vpp_account: VPPAccount) -> Dict[str, int]:
+    """Mirror users modified since the last sync, then store the token to resume from.
+
+    Retired users are removed from the mirror. A user registered with the client user id of a mirrored user, which
+    must have been retired, updates the row of that client user id.
+    """
+    stream = vpp.stream_users(since_modified_token=vpp_account.users_since_modified_token)
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'retired': 0}
+
+    for chunk in chunks(stream, VPP_UPSERT_CHUNK):
+        now = datetime.datetime.utcnow()
+        mappings = [vpp_user_mapping(u, vpp_account.id, now) for u in chunk]
+        stats['skipped'] += sum(1 for m in mappings if m is None)
+        mappings = [m for m in mappings if m is not None]
+
+        retired = [m['user_id'] for m in mappings if m['status'] == VPPUserStatus.Retired]
+        if retired:
+            release_users(retired)
+            stats['retired'] += db.session.query(VPPUser).filter(VPPUser.user_id.in_(retired)).delete(
+                synchronize_session=False)
+
+        # The last record for a client user id wins, like upsert_mappings does for user ids
+        registered = {m['client_user_id']: m for m in mappings if m['status'] != VPPUserStatus.Retired}
+        renumbered = {user_id: registered[client_user_id]['user_id'] for user_id, client_user_id in db.session.query(
+            VPPUser.user_id, VPPUser.client_user_id).filter(VPPUser.client_user_id.in_(list(registered.keys())))
+            if user_id != registered[client_user_id]['user_id']}
+        if renumbered:
+            release_users(list(renumbered.keys()))
+            for user_id, new_user_id in renumbered.items():
+                db.session.query(VPPUser).filter(VPPUser.user_id == user_id).update(
+                    {VPPUser.user_id: new_user_id}, synchronize_session=False)
+
+        result = upsert_mappings(db.session, VPPUser, 'user_id', list(registered.values()))
+        stats['inserted'] += result['inserted']
+        stats['updated'] += result['updated']
+        db.session.commit()
+
+    vpp_account.users_since_modified_token = stream.since_modified_token
+    db.session.commit()
+    return stats
+
+
+def unmirrored_users_removed(mappings: List[dict]) -> List[dict]:
+    """Clear the user of licenses whose user is not mirrored, eg. because its client user id is not a UUID.
+
+    ``user_id`` and ``client_user_id`` are foreign keys to `VPPUser`, so a license may only refer to mirrored users.
+    """
+    user_ids = {m['user_id'] for m in mappings if m['user_id'] is not None}
+    mirrored = {user_id for user_id, in db.session.query(VPPUser.user_id).filter(
+        VPPUser.user_id.in_(list(user_ids)))} if user_ids else set()
+
+    for m in mappings:
+        if m['user_id'] not in mirrored:
+            m['user_id'] = None
+            m['client_user_id'] = None
+
+    return mappings
+
+
+def vpp_sync_licenses(vpp: VPP, vpp_account: VPPAccount) -> Dict[str, int]:
+    """Mirror licenses modified since the last sync, then store the token to resume from."""
+    stream = vpp.stream_licenses(since_modified_token=vpp_account.licenses_since_modified_token)
+    stats = {'inserted': 0, 'updated': 0}
+
+    for chunk in chunks(stream, VPP_UPSERT_CHUNK):
+        now = datetime.datetime.utcnow()
+        result = upsert_mappings(db.session, VPPLicense, 'license_id', unmirrored_users_removed(
+            [vpp_license_mapping(l, vpp_account.id, now) for l in chunk]))
+        stats['inserted'] += result['inserted']
+        stats['updated'] += result['updated']
+        db.session.commit()
+
+    vpp_account.licenses_since_modified_token = stream.since_modified_token
+    db.session.commit()
+    return stats
+
+
+def vpp_sync_account(app: Flask, vpp: VPP, vpp_account: VPPAccount):
+    """Perform a single sync of assets, users and licenses for one VPP account.
+
+    Users are synced before licenses, because licenses refer to them.
+    """
+    assets = vpp_sync_assets(vpp, vpp_account)
+    users = vpp_sync_users(vpp, vpp_account)
+    licenses = vpp_sync_licenses(vpp, vpp_account)
+
+    app.logger.info('VPP sync for %s: assets %s, users %s, licenses %s', vpp_account.org_name, assets, users, licenses)
+
+
+def vpp_thread_callback(app: Flask):
+    """Sync every VPP account, logging rather than raising errors for a single account."""
+    with app.app_context():
+        accounts = db.session.query(VPPAccount).all()
+        if not accounts:
+            app.logger.info('Not attempting a VPP sync, no account configured.')
+            return
+
+        for vpp_account in accounts:
+            try:
+                vpp_sync_account(app, get_vpp(vpp_account), vpp_account)
+            except Exception:
+                app.logger.exception('VPP sync failed for account %d', vpp_account.id)
+                db.session.rollback()
+
+
+@job('vpp.sync', leader_only=True)
+def vpp_sync():
+    """Runner job which performs a single VPP synchronisation pass."""
+    vpp_thread_callback(current_app._get_current_object())
@@ -8,18 +8,32 @@ TODO:
     - The license assignment method remains untested.
 """
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from typing import List, Optional, Iterator, Tuple, Dict, Text, Any
+from typing import List, Optional, Iterator, Tuple, Dict, Text, Any, Callable
 import json
 import base64
 
+from commandment.clients import pooled_session
 from commandment.vpp.decorators import raise_error_replies
+from commandment.vpp.errors import VPPAPIError
 from commandment.vpp.enum import LicenseAssociation, LicenseDisassociation, LicenseAssociationType, \
     LicenseDisassociationType, VPPPricingParam
 
 SERVICE_CONFIG_URL = 'https://vpp.itunes.apple.com/WebObjects/MZFinance.woa/wa/VPPServiceConfigSrv'
 """str: The default production URL to fetch VPP service configuration from."""
 
+_service_config_cache: Dict[str, Tuple[float, dict]] = {}
+_service_config_lock = threading.Lock()
+
+
+def clear_service_config_cache():
+    """Forget every cached VPP service configuration."""
+    with _service_config_lock:
+        _service_config_cache.clear()
+
 
 def encode_stoken(token: dict) -> bytes:
     """Encode a dict containing the sToken properties into a base64 token for use with VPP.
@@ -129,6 +143,56 @@ class VPPLicenseCursor(VPPCursor):
             return None
 
 
+class VPPRecordStream(object):
+    """Iterate over every record returned by a batched VPP endpoint, one record at a time.
+
+    While the records of one page are being consumed, the request for the next page is already in flight on a
+    background thread, so the time spent waiting for the service overlaps with processing.
+
+    After the stream is exhausted, :attr:`since_modified_token` holds the token to resume from on the next
+    incremental fetch.
+
+    Args:
+          fetch (Callable[[Optional[str]], dict]): Fetches the first page when called with None, or the page for the
+            given batch token.
+          key (str): The key of the records list in each page, eg. 'licenses'.
+          since_modified_token (str): The token the stream was started from, if any.
+
+    Attributes:
+          pages (int): The number of pages received so far.
+          total (Optional[int]): The total number of records, as reported by the first page.
+          since_modified_token (Optional[str]): The most recent since modified token.
+    """
+
+    def __init__(self, fetch: Callable[[Optional[str]], dict], key: str, since_modified_token: str = None) -> None:
+        self._fetch = fetch
+        self.key = key
+        self.since_modified_token = since_modified_token
+        self.pages = 0
+        self.total: Optional[int] = None
+
+    def __iter__(self) -> Iterator[dict]:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(self._fetch, None)
+
+            while pending is not None:
+                reply = pending.result()
+                if reply.get('status') == -1:
+                    raise VPPAPIError(reply.get('errorNumber'), reply.get('errorMessage'))
+
+                batch_token = reply.get('batchToken')
+                pending = executor.submit(self._fetch, batch_token) if batch_token else None
+
+                self.pages += 1
+                if self.total is None:
+                    self.total = reply.get('totalCount')
+                if reply.get('sinceModifiedToken'):
+                    self.since_modified_token = reply['sinceModifiedToken']
+
+                for record in reply.get(self.key) or []:
+                    yield record
+
+
 class VPPLicenseOperation(object):
     """VPPLicenseOperation represents a number of license operations on a single Adam ID (iTunes Store Product).
 
@@ -241,7 +305,8 @@ class VPP(object):
         LicenseDisassociationType.LicenseID: 'disassociateLicenseIdStrs',
     }
 
-    def __init__(self, stoken: str, vpp_service_config_url: str = SERVICE_CONFIG_URL, service_config: dict = None) -> None:
+    def __init__(self, stoken: str, vpp_service_config_url: str = SERVICE_CONFIG_URL, service_config: dict = None,
+                 service_config_ttl: int = 3600, pool_maxsize: int = 10) -> None:
         """
         The VPP class is a wrapper around a requests session and provides an API for interacting with Apple's VPP
         service.
@@ -250,25 +315,47 @@ class VPP(object):
             stoken (str): Service Token
             vpp_service_config_url (str): URL to the VPPServiceConfigSrv endpoint. defaults to Apple's live server.
             service_config (dict): Dictionary containing service config, if you do not want to fetch it (testing only).
+            service_config_ttl (int): Seconds to cache the fetched service config for. The cache is shared by every
+                instance in this process.
+            pool_maxsize (int): The number of keep-alive connections to each VPP host.
         """
-        self._session = requests.Session()
+        self._session = pooled_session(pool_maxsize=pool_maxsize)
         self._session.headers.update({'Content-Type': 'application/json'})
         self._stoken = stoken
+        self._service_config_url = vpp_service_config_url
+        self._service_config_ttl = service_config_ttl
+        self._fixed_service_config = service_config
 
         if not service_config:
-            fetched_service_config = self._fetch_config(vpp_service_config_url)
-            self._service_config = fetched_service_config
-        else:
-            self._service_config = service_config
+            self._fetch_config(vpp_service_config_url)
+
+    @property
+    def _service_config(self) -> dict:
+        """dict: The service configuration, re-fetched once the cached copy is older than the TTL."""
+        if self._fixed_service_config:
+            return self._fixed_service_config
+
+        return self._fetch_config(self._service_config_url)
 
     def _fetch_config(self, service_config_url: str) -> dict:
         """Fetch the service configuration from Apple, which contains all of the URLs required for VPP.
 
+        The configuration is cached per URL, so only the first client in a process, and the first after the TTL
+        expires, has to wait for it.
+
         Args:
             service_config_url (str): The VPPServiceConfigSrv URL to use
         """
-        res = self._session.get(service_config_url)
-        return res.json()
+        with _service_config_lock:
+            cached = _service_config_cache.get(service_config_url)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+            res = self._session.get(service_config_url)
+            config = res.json()
+            _service_config_cache[service_config_url] = (time.monotonic() + self._service_config_ttl, config)
+
+            return config
 
     @raise_error_replies
     def register_user(self, client_user_id: str, email: str = None, facilitator_member_id: str = None,
@@ -529,6 +616,49 @@ class VPP(object):
 
         return cursor
 
+    def stream_licenses(self,
+                        adam_id: int = None,
+                        pricing_param: Optional[VPPPricingParam] = None,
+                        assigned_only: bool = False,
+                        since_modified_token: str = None) -> VPPRecordStream:
+        """Stream every license matching the supplied criteria, prefetching the next page in the background.
+
+        Args:
+              adam_id (int): Get licenses that match this Adam ID
+              pricing_param (Optional[VPPPricingParam]): Get licenses that match this 'Quality' param.
+              assigned_only (bool): Return only licenses that are assigned to users, if this value is true.
+              since_modified_token (str): Only stream licenses modified since this token was issued.
+
+        Returns:
+              VPPRecordStream: An iterable of license dicts. No request is made until iteration starts.
+        """
+        def fetch(batch_token: Optional[str]) -> dict:
+            if batch_token is None:
+                return self.licenses(adam_id, pricing_param, assigned_only,
+                                     since_modified_token=since_modified_token)._current
+
+            return self.licenses(assigned_only=assigned_only, batch_token=batch_token)._current
+
+        return VPPRecordStream(fetch, 'licenses', since_modified_token)
+
+    def stream_users(self, include_retired: int = 1, since_modified_token: str = None) -> VPPRecordStream:
+        """Stream every VPP user, prefetching the next page in the background.
+
+        Args:
+            include_retired (int): 0 - do not include retired users, 1 - include retired users
+            since_modified_token (str): Only stream users modified since this token was issued.
+
+        Returns:
+              VPPRecordStream: An iterable of user dicts. No request is made until iteration starts.
+        """
+        def fetch(batch_token: Optional[str]) -> dict:
+            if batch_token is None:
+                return self.users(include_retired, since_modified_token=since_modified_token)._current
+
+            return self.users(include_retired, batch_token=batch_token)._current
+
+        return VPPRecordStream(fetch, 'users', since_modified_token)
+
     def save(self, operation: VPPLicenseOperation, notify: bool = False) -> dict:
         """Execute a license management operation, represented by a VPPLicenseOperation or subclass.
 
@@ -62,12 +62,17 @@ setup(
         ],
         'macOS': [
             'pyobjc'
+        ],
+        'speedups': [
+            'orjson',
+            'zstandard',
         ]
     },
     setup_requires=['pytest-runner'],
     entry_points={
         'console_scripts': [
             'commandment=commandment.cli:server',
+            'commandment-export=commandment.inventory.export:main',
             'appmanifest=commandment.pkg.appmanifest:main',
         ]
     },
@@ -1,11 +1,15 @@
 import pytest
 import os
+import time
 from tests.conftest import *
+from commandment.auth.models import OAuth2Token
 from commandment.models import Device
+from commandment.api.resources import DeviceList
 from sqlalchemy.orm.session import Session
 
 TEST_DIR = os.path.realpath(os.path.dirname(__file__))
 TEST_DATA_DIR = os.path.realpath(TEST_DIR + '/../../testdata')
+AUTHORIZATION = {'Authorization': 'Bearer test-access-token'}
 
 
 @pytest.fixture(scope='function')
@@ -17,3 +21,27 @@ def device(session: Session):
     )
     session.add(d)
     session.commit()
+
+
+@pytest.fixture(scope='function')
+def auth_headers(session: Session) -> dict:
+    """Create a bearer token, and return the headers which authorize API requests with it."""
+    token = OAuth2Token(client_id='test', token_type='Bearer', access_token='test-access-token', scope='',
+                        revoked=False, issued_at=int(time.time()), expires_in=3600)
+    session.add(token)
+    session.commit()
+
+    return AUTHORIZATION
+
+
+@pytest.fixture(scope='function', autouse=True)
+def resource_session():
+    """Remove the scoped session which the resources were declared with, before and after each test.
+
+    The session fixture replaces ``db.session``, but the resource data layers keep the original scoped session. Its
+    session stays bound to the app of the first test which used it unless it is removed.
+    """
+    scoped_session = DeviceList.data_layer['session']
+    scoped_session.remove()
+    yield scoped_session
+    scoped_session.remove()
@@ -0,0 +1,139 @@
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.inventory import catalog
+from commandment.inventory.models import ApplicationVersion, InstalledApplication
+from commandment.models import Device
+
+APPLICATIONS = [
+    {'bundle_identifier': 'com.example.a', 'version': '1.0', 'name': 'A', 'bundle_size': 1024, 'beta_app': False},
+    {'bundle_identifier': 'com.example.b', 'version': '2.0', 'name': 'B'},
+    {'name': 'Set Info'},
+]
+
+
+@pytest.fixture(scope='function')
+def devices(session: Session):
+    """Create 4 devices which all have the same applications installed."""
+    for i in range(4):
+        device = Device(udid='00000000-1111-2222-3333-{:012d}'.format(i))
+        session.add(device)
+        session.flush()
+        catalog.replace_installed_applications(
+            device, [dict(application, dynamic_size=i) for application in APPLICATIONS[:3 if i % 2 else 2]])
+    session.commit()
+
+
+@pytest.mark.usefixtures('devices')
+class TestCatalog:
+
+    def test_version_key(self):
+        key = catalog.version_key({'bundle_identifier': 'com.example.a', 'version': '1.0'})
+        assert len(key) == 64
+        assert catalog.version_key({'version': '1.0', 'bundle_identifier': 'com.example.a'}) == key
+        assert catalog.version_key({'bundle_identifier': 'com.example.a', 'version': '1.0', 'name': 'A'}) != key
+        assert catalog.version_key({'bundle_identifier': 'com.example.a', 'version': '1.0', 'dynamic_size': 1}) == key
+
+    def test_deduplicated(self, session: Session):
+        assert session.query(ApplicationVersion).count() == 3
+        assert session.query(InstalledApplication).count() == 10
+
+    def test_application_version_ids(self, session: Session):
+        ids = catalog.application_version_ids([APPLICATIONS[1], {'name': 'New'}, APPLICATIONS[1]])
+        assert ids[0] == ids[2]
+        assert session.query(ApplicationVersion).count() == 4
+        assert session.query(ApplicationVersion).get(ids[1]).name == 'New'
+
+    def test_concurrent_insert(self, session: Session, monkeypatch):
+        """Another device inserts one of two new applications between the lookup and the insert."""
+        new = [{'bundle_identifier': 'com.example.c'}, {'bundle_identifier': 'com.example.d'}]
+        lookup = catalog._lookup
+
+        def racing_lookup(keys):
+            monkeypatch.setattr(catalog, '_lookup', lookup)
+            session.add(ApplicationVersion(key=catalog.version_key(new[0]), bundle_identifier='com.example.c'))
+            session.flush()
+            return {}
+
+        monkeypatch.setattr(catalog, '_lookup', racing_lookup)
+        ids = catalog.application_version_ids(new)
+        assert [session.query(ApplicationVersion).get(i).bundle_identifier for i in ids] == [
+            'com.example.c', 'com.example.d']
+        assert session.query(ApplicationVersion).count() == 5
+
+    def test_attributes(self, session: Session):
+        application = session.query(InstalledApplication).filter(
+            InstalledApplication.bundle_identifier == 'com.example.a', InstalledApplication.device_id == 2).one()
+        assert application.name == 'A'
+        assert application.bundle_size == 1024
+        assert application.beta_app is False
+        assert application.dynamic_size == 1
+        assert application.device.udid == '00000000-1111-2222-3333-000000000001'
+
+    def test_replace(self, session: Session):
+        device = session.query(Device).get(2)
+        assert len(device.installed_applications) == 3
+
+        catalog.replace_installed_applications(device, [{'bundle_identifier': 'com.example.a', 'version': '1.1'}])
+        session.commit()
+
+        assert [(a.bundle_identifier, a.version) for a in device.installed_applications] == [('com.example.a', '1.1')]
+        assert session.query(ApplicationVersion).count() == 4  # Versions are kept
+        assert session.query(InstalledApplication).count() == 8
+
+    def test_read_only(self, session: Session):
+        application = session.query(InstalledApplication).filter(
+            InstalledApplication.bundle_identifier == 'com.example.a', InstalledApplication.device_id == 2).one()
+
+        session.delete(application)
+        with pytest.raises(InvalidRequestError):
+            session.flush()
+        session.rollback()
+
+        application.name = 'Renamed'
+        with pytest.raises(InvalidRequestError):
+            session.flush()
+        session.rollback()
+
+        assert session.query(ApplicationVersion).count() == 3
+        assert session.query(InstalledApplication).count() == 10
+
+    def test_device_id_writable(self, session: Session):
+        application = session.query(InstalledApplication).filter(InstalledApplication.device_id == 2).first()
+        application.device_id = None
+        session.commit()
+        assert session.query(InstalledApplication).filter(InstalledApplication.device_id == 2).count() == 2
+
+    def test_devices_with_application(self):
+        assert catalog.devices_with_application('com.example.b') == [1, 2, 3, 4]
+        assert catalog.devices_with_application('com.example.a', '1.0') == [1, 2, 3, 4]
+        assert catalog.devices_with_application('com.example.a', '1.1') == []
+
+
+@pytest.mark.usefixtures('devices', 'auth_headers')
+class TestInstalledApplicationsAPI:
+
+    def test_list(self, client: MDMClient):
+        response = client.get('/api/v1/devices/2/installed_applications', content_type='application/vnd.api+json',
+                              headers=AUTHORIZATION)
+        assert response.status_code == 200
+        data = response.get_json(force=True)['data']
+        assert [o['attributes']['name'] for o in data] == ['A', 'B', 'Set Info']
+        assert data[0]['attributes']['dynamic_size'] == 1
+
+    def test_read_only(self, client: MDMClient):
+        response = client.patch('/api/v1/installed_applications/1', content_type='application/vnd.api+json',
+                                headers=AUTHORIZATION, data='{"data": {"type": "installed_applications", "id": "1", '
+                                                            '"attributes": {"name": "Renamed"}}}')
+        assert response.status_code == 405
+        response = client.delete('/api/v1/installed_applications/1', headers=AUTHORIZATION)
+        assert response.status_code == 405
+
+    def test_filter(self, client: MDMClient):
+        response = client.get(
+            '/api/v1/installed_applications?filter=[{"name":"bundle_identifier","op":"eq","val":"com.example.b"}]',
+            content_type='application/vnd.api+json', headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert len(response.get_json(force=True)['data']) == 4
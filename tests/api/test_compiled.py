@@ -0,0 +1,102 @@
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.api.compiled import CompiledSchema, UrlTemplate, encode
+from commandment.api.schema import DeviceSchema
+from commandment.inventory import catalog
+from commandment.inventory.models import InstalledCertificate
+from commandment.mdm import CommandStatus
+from commandment.models import Device, Command
+
+
+@pytest.fixture(scope='function')
+def inventory(session: Session):
+    """Create devices with a mix of missing, unicode and numeric values, and some inventory for each."""
+    start = datetime(2019, 6, 1, 12, 0, 0, 123456)
+    for i in range(12):
+        device = Device(
+            udid='00000000-1111-2222-3333-{:012d}'.format(i),
+            device_name='Ünïcödé "device" {}'.format(i) if i % 3 else None,
+            last_seen=start + timedelta(minutes=i) if i % 4 else None,
+            battery_level=i / 7.0 if i % 2 else None,
+            passcode_present=bool(i % 2) if i % 5 else None,
+            profile_uuid=str(uuid.UUID(int=i)) if i % 2 else None,
+        )
+        session.add(device)
+        session.flush()
+        catalog.replace_installed_applications(device, [{'bundle_identifier': 'com.example.{}'.format(i),
+                                                         'name': 'App\t{}'.format(i), 'bundle_size': i * 1024,
+                                                         'is_validated': i % 2 == 0}])
+        session.add(InstalledCertificate(device=device, device_udid=device.udid, x509_cn='Cert {}'.format(i),
+                                         is_identity=i == 0, fingerprint_sha256='{:064x}'.format(i),
+                                         der_data=b'\x00'))
+        session.add(Command(device=device, request_type='DeviceInformation', uuid=uuid.UUID(int=100 + i),
+                            status=CommandStatus.Queued, ttl=5, queued_at=start, sent_at=None))
+    session.commit()
+
+
+@pytest.mark.usefixtures('inventory', 'auth_headers')
+class TestCompiledSerialization:
+
+    @pytest.mark.parametrize('url', [
+        '/api/v1/devices',
+        '/api/v1/devices?page[size]=5&page[number]=2',
+        '/api/v1/devices?page[after]=&page[size]=5&sort=-last_seen',
+        '/api/v1/devices?page[after]=&page[count]=0&fields[devices]=device_name,battery_level,commands',
+        '/api/v1/devices?filter[device_name]=nothing',
+        '/api/v1/installed_applications',
+        '/api/v1/devices/2/installed_applications',
+        '/api/v1/installed_certificates?sort=-x509_cn',
+        '/api/v1/commands',
+        '/api/v1/devices/3/commands',
+    ])
+    def test_identical(self, app: Flask, client: MDMClient, monkeypatch, url: str):
+        """The compiled output must be byte for byte the same as the output of the schema."""
+        compiled = []
+        dumps = CompiledSchema.dumps
+        monkeypatch.setattr(CompiledSchema, 'dumps', lambda self, rows: compiled.append(rows) or dumps(self, rows))
+
+        app.config['API_COMPILED_SERIALIZATION'] = False
+        expected = client.get(url, content_type='application/vnd.api+json', headers=AUTHORIZATION)
+        assert expected.status_code == 200, expected.data
+
+        app.config['API_COMPILED_SERIALIZATION'] = True
+        response = client.get(url, content_type='application/vnd.api+json', headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert len(compiled) == 1
+        assert response.data == expected.data
+        assert response.headers['Content-Type'] == expected.headers['Content-Type']
+
+    def test_compiles_device_schema(self, app: Flask):
+        schema = DeviceSchema(many=True, include_data=())
+        compiled = CompiledSchema.compile(schema, Device, ('id', 'last_seen'))
+        assert compiled is not None
+        assert Device.dep_profile_id in compiled.columns
+
+    def test_include_not_compiled(self, app: Flask):
+        schema = DeviceSchema(many=True, include_data=('tags',))
+        assert CompiledSchema.compile(schema, Device) is None
+
+
+class TestCompiledHelpers:
+
+    @pytest.mark.parametrize('value', [None, True, False, 0, -3, 1.5, float('nan'), 'ascii', 'ü\n"', [1, 'a']])
+    def test_encode(self, value):
+        import json
+        from flask_rest_jsonapi.utils import JSONEncoder
+        assert encode(value) == json.dumps(value, cls=JSONEncoder)
+
+    def test_url_template(self, app: Flask):
+        template = UrlTemplate('api_app.device_detail', ('device_id',))
+        assert template.build((42,)) == '/v1/devices/42'
+        assert template.build((None,)) is None
+
+    def test_url_template_other_rule(self, app: Flask):
+        """A missing argument falls back to a rule of the endpoint which does not need it."""
+        template = UrlTemplate('api_app.commands_list', ('device_id',))
+        assert template.build((7,)) == '/v1/devices/7/commands'
+        assert template.build((None,)) == '/v1/commands'
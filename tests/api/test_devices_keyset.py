@@ -0,0 +1,121 @@
+import json
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import pytest
+from flask import Response
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.models import db, Device
+
+
+@pytest.fixture(scope='function')
+def devices(session: Session):
+    """Create devices which share last_seen values, and some which have never been seen."""
+    start = datetime(2019, 6, 1, 12, 0, 0, 123456)
+    for i in range(25):
+        session.add(Device(
+            udid='00000000-1111-2222-3333-{:012d}'.format(i),
+            device_name='device-{}'.format(i),
+            last_seen=None if i % 7 == 0 else start + timedelta(hours=i // 3),
+        ))
+    session.commit()
+
+
+def get(client: MDMClient, url: str) -> dict:
+    response: Response = client.get(url, content_type='application/vnd.api+json',
+                                    headers=AUTHORIZATION)
+    assert response.status_code == 200, response.data
+    return json.loads(response.data)
+
+
+def walk(client: MDMClient, url: str) -> list:
+    """Follow the next links from ``url``, returning every page."""
+    pages = []
+    while url is not None:
+        page = get(client, url)
+        pages.append(page)
+        url = page['links'].get('next')
+        if url is not None:
+            parts = urlsplit(url)
+            url = parts.path + '?' + parts.query
+
+    return pages
+
+
+@pytest.mark.usefixtures('devices', 'auth_headers')
+class TestDevicesKeyset:
+
+    @pytest.mark.parametrize('sort', ['', 'id', '-id', 'last_seen', '-last_seen'])
+    def test_walk(self, client: MDMClient, session: Session, sort: str):
+        """Following the next links should return every device exactly once, in the requested order."""
+        url = '/api/v1/devices?page[after]=&page[size]=4'
+        if sort:
+            url += '&sort=' + sort
+        pages = walk(client, url)
+
+        ids = [int(d['id']) for page in pages for d in page['data']]
+        assert len(ids) == 25
+        assert len(set(ids)) == 25
+        assert all(len(page['data']) <= 4 for page in pages)
+
+        devices = {d.id: d for d in session.query(Device)}
+        field = sort.lstrip('-') or 'id'
+        keys = [(devices[i].last_seen is not None, devices[i].last_seen or datetime.min, i)
+                if field == 'last_seen' else i for i in ids]
+        assert keys == sorted(keys, reverse=sort.startswith('-'))
+
+    def test_count(self, client: MDMClient):
+        """The count is included unless page[count]=0."""
+        assert get(client, '/api/v1/devices?page[after]=')['meta']['count'] == 25
+        assert 'meta' not in get(client, '/api/v1/devices?page[after]=&page[count]=0')
+
+    def test_offset_pagination(self, client: MDMClient):
+        """Without page[after] the device list is paginated by page number as before."""
+        page = get(client, '/api/v1/devices?page[number]=2&page[size]=10')
+        assert [d['attributes']['device_name'] for d in page['data']] == ['device-{}'.format(i) for i in range(10, 20)]
+        assert page['meta']['count'] == 25
+        assert 'last' in page['links']
+
+    def test_invalid_sort(self, client: MDMClient):
+        response: Response = client.get('/api/v1/devices?page[after]=&sort=device_name',
+                                        content_type='application/vnd.api+json',
+                                        headers=AUTHORIZATION)
+        assert response.status_code == 400
+
+    def test_invalid_cursor(self, client: MDMClient):
+        response: Response = client.get('/api/v1/devices?page[after]=notacursor',
+                                        content_type='application/vnd.api+json',
+                                        headers=AUTHORIZATION)
+        assert response.status_code == 400
+
+    def test_sparse_fieldset(self, client: MDMClient):
+        """Only the requested attributes are returned, relationship links still work."""
+        page = get(client, '/api/v1/devices?page[after]=&page[size]=10&sort=-last_seen&fields[devices]=device_name,commands')
+        device = page['data'][0]
+        assert set(device['attributes']) == {'device_name'}
+        assert set(device['relationships']) == {'commands'}
+        assert 'next' in page['links']
+
+    @pytest.mark.parametrize('sort', ['last_seen', '-last_seen'])
+    def test_query_plan(self, client: MDMClient, session: Session, sort: str):
+        """Every page is read in order from ix_devices_last_seen_id, without sorting the remaining rows."""
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT') and 'ORDER BY' in statement and 'LIMIT' in statement:
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            walk(client, '/api/v1/devices?page[after]=&page[size]=4&page[count]=0&sort=' + sort)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        assert len(statements) == 7
+        connection = session.connection(mapper=Device.__mapper__)
+        for statement, parameters in statements:
+            plan = ' '.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters))
+            assert 'ix_devices_last_seen_id' in plan
+            assert 'TEMP B-TREE' not in plan
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+import pytest
+from flask import Flask
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.inventory.export import export, export_columns
+from commandment.inventory import catalog
+from commandment.inventory.models import InstalledProfile
+from commandment.models import Device
+
+
+@pytest.fixture(scope='function')
+def inventory(session: Session):
+    """Create devices with installed applications and profiles."""
+    for i in range(7):
+        device = Device(udid='00000000-1111-2222-3333-{:012d}'.format(i), device_name='Dévice, "{}"'.format(i),
+                        last_seen=datetime(2019, 6, 1, 12, i) if i % 2 else None)
+        session.add(device)
+        session.flush()
+        catalog.replace_installed_applications(device, [
+            {'name': 'App {}'.format(a), 'bundle_identifier': 'com.example.{}'.format(a), 'bundle_size': a * 1024}
+            for a in range(3)])
+        session.add(InstalledProfile(device=device, device_udid=device.udid, payload_identifier='com.example.profile',
+                                     payload_uuid=uuid.UUID(int=i), is_managed=True))
+    session.commit()
+
+
+@pytest.mark.usefixtures('inventory')
+class TestExport:
+
+    def test_columns(self, app: Flask):
+        names = [name for name, _, _ in export_columns('installed_applications')]
+        assert names[-2:] == ['device_id', 'device_udid']
+        assert 'bundle_identifier' in names
+        assert 'device' not in names
+        assert 'push_magic' not in [name for name, _, _ in export_columns('devices')]
+
+    def test_ndjson(self, app: Flask):
+        chunks = list(export('installed_applications', 'ndjson', chunk_size=5))
+        assert len(chunks) == 5  # 21 rows
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        assert len(rows) == 21
+        assert [r['id'] for r in rows] == sorted(r['id'] for r in rows)
+        assert rows[4] == {'id': rows[4]['id'], 'bundle_identifier': 'com.example.1', 'name': 'App 1',
+                           'short_version': None, 'version': None, 'bundle_size': 1024, 'dynamic_size': None,
+                           'is_validated': None, 'device_id': 2, 'device_udid': '00000000-1111-2222-3333-000000000001'}
+
+    def test_formatted_like_api(self, app: Flask):
+        devices = [json.loads(line) for line in ''.join(export('devices')).splitlines()]
+        assert devices[1]['last_seen'] == '2019-06-01T12:01:00+00:00'
+        assert devices[0]['last_seen'] is None
+
+        profiles = [json.loads(line) for line in ''.join(export('installed_profiles')).splitlines()]
+        assert profiles[3]['payload_uuid'] == str(uuid.UUID(int=3))
+
+    def test_csv(self, app: Flask):
+        text = ''.join(export('devices', 'csv', chunk_size=3))
+        rows = list(csv.reader(io.StringIO(text)))
+        assert len(rows) == 8
+        header = rows[0]
+        assert rows[3][header.index('device_name')] == 'Dévice, "2"'
+        assert rows[1][header.index('last_seen')] == ''
+
+    def test_columns_format(self, app: Flask):
+        chunks = [json.loads(line) for line in export('installed_profiles', 'columns', chunk_size=4)]
+        assert [c['rows'] for c in chunks] == [4, 3]
+        assert chunks[1]['columns']['device_id'] == [5, 6, 7]
+        assert chunks[0]['columns']['payload_identifier'] == ['com.example.profile'] * 4
+        assert 'is_managed' not in chunks[0]['columns']  # Not part of the schema
+
+    def test_unknown(self, app: Flask):
+        with pytest.raises(ValueError):
+            export('passwords')
+        with pytest.raises(ValueError):
+            export('devices', 'xml')
+
+
+@pytest.mark.usefixtures('inventory')
+class TestExportEndpoint:
+
+    def test_requires_token(self, client: MDMClient):
+        response = client.get('/api/v1/export/devices')
+        assert response.status_code == 401
+
+    @pytest.mark.usefixtures('auth_headers')
+    def test_stream(self, client: MDMClient):
+        response = client.get('/api/v1/export/installed_applications?format=csv', headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'text/csv'
+        assert 'installed_applications.csv' in response.headers['Content-Disposition']
+        assert len(response.get_data(as_text=True).splitlines()) == 22
+
+    @pytest.mark.usefixtures('auth_headers')
+    @pytest.mark.parametrize('url,status', [
+        ('/api/v1/export/passwords', 400),
+        ('/api/v1/export/devices?format=xml', 400),
+    ])
+    def test_invalid(self, client: MDMClient, url: str, status: int):
+        response = client.get(url, headers=AUTHORIZATION)
+        assert response.status_code == status
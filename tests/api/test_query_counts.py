@@ -0,0 +1,117 @@
+import uuid
+from datetime import datetime
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.api.keyset import KeysetDataLayer
+from commandment.api.resources import DeviceList
+from commandment.dep.models import DEPAccount, DEPProfile
+from commandment.inventory import catalog
+from commandment.inventory.models import InstalledCertificate
+from commandment.mdm import CommandStatus
+from commandment.models import db, Device, Command, Tag
+
+DEVICES = 20
+
+
+@pytest.fixture(scope='function')
+def inventory(session: Session):
+    """Create devices which all have tags, commands, inventory and a DEP profile."""
+    account = DEPAccount(consumer_key='a', consumer_secret='b', access_token='c', access_secret='d')
+    profiles = [DEPProfile(profile_name='Profile {}'.format(i), url='https://localhost/enroll', dep_account=account)
+                for i in range(2)]
+    tags = [Tag(name='Tag {}'.format(i), color='ff0000') for i in range(3)]
+    start = datetime(2019, 6, 1)
+
+    for i in range(DEVICES):
+        device = Device(udid='00000000-1111-2222-3333-{:012d}'.format(i), device_name='Device {}'.format(i),
+                        last_seen=start, dep_profile=profiles[i % 2], tags=tags[:i % 3 + 1])
+        session.add(device)
+        session.flush()
+        catalog.replace_installed_applications(device, [
+            {'name': 'App {}'.format(a), 'bundle_identifier': 'com.example.{}'.format(a)} for a in range(2)])
+        session.add(InstalledCertificate(device=device, device_udid=device.udid, x509_cn='Cert {}'.format(i),
+                                         is_identity=False, fingerprint_sha256='{:064x}'.format(i), der_data=b'\x00'))
+        for c in range(2):
+            session.add(Command(device=device, request_type='DeviceInformation', uuid=uuid.UUID(int=i * 2 + c),
+                                status=CommandStatus.Queued, ttl=5, queued_at=start))
+    session.commit()
+
+
+@pytest.mark.usefixtures('inventory', 'auth_headers')
+class TestQueryCounts:
+    """Assert that listing a page costs a fixed number of queries, whatever the number of rows or included objects.
+
+    The limits include the query which validates the access token, and the count query of offset pagination.
+    """
+
+    @pytest.mark.parametrize('url,max_queries', [
+        ('/api/v1/devices', 3),
+        ('/api/v1/devices?page[after]=&page[count]=0', 2),
+        ('/api/v1/devices?include=tags', 4),
+        ('/api/v1/devices?include=commands,installed_applications,installed_certificates', 6),
+        ('/api/v1/devices?include=tags,commands,dep_profile', 8),
+        ('/api/v1/devices?include=dep_profile.dep_account', 7),
+        ('/api/v1/devices?include=tags.devices', 5),
+        ('/api/v1/devices/1/commands', 4),
+        ('/api/v1/commands', 3),
+        ('/api/v1/installed_applications', 3),
+        ('/api/v1/installed_certificates', 3),
+        ('/api/v1/tags', 3),
+        ('/api/v1/tags?include=devices', 4),
+        ('/api/v1/dep/profiles/', 6),
+    ])
+    @pytest.mark.parametrize('compiled', [True, False])
+    def test_max_queries(self, app: Flask, client: MDMClient, url: str, max_queries: int, compiled: bool):
+        app.config['API_COMPILED_SERIALIZATION'] = compiled
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = client.get(url, content_type='application/vnd.api+json', headers=AUTHORIZATION)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        assert response.status_code == 200, response.data
+        assert len(response.get_json(force=True)['data']) > 0
+        assert len(statements) <= max_queries, '\n\n'.join(statements)
+
+    def test_included_data(self, client: MDMClient):
+        """Assert that eager loading does not change the included objects."""
+        response = client.get('/api/v1/devices?include=tags,dep_profile&page[size]=50',
+                              content_type='application/vnd.api+json', headers=AUTHORIZATION)
+        assert response.status_code == 200
+        body = response.get_json(force=True)
+        types = {(o['type'], o['id']) for o in body['included']}
+        assert len([t for t in types if t[0] == 'tags']) == 3
+        assert len([t for t in types if t[0] == 'dep_profiles']) == 2
+        assert len(body['data'][2]['relationships']['tags']['data']) == 3
+
+    def test_invalid_include(self, client: MDMClient):
+        response = client.get('/api/v1/devices?include=device_name', content_type='application/vnd.api+json',
+                              headers=AUTHORIZATION)
+        assert response.status_code == 400
+
+
+class TestEagerLoadPolicy:
+
+    def test_default_strategies(self, session: Session):
+        data_layer = KeysetDataLayer({'session': session, 'model': Device, 'resource': DeviceList})
+        query = session.query(Device).options(data_layer.loader('dep_profile', Device.dep_profile),
+                                              data_layer.loader('tags', Device.tags))
+        assert 'LEFT OUTER JOIN dep_profiles' in str(query)
+        assert 'tags' not in str(query)
+
+    def test_configured_strategy(self, session: Session):
+        data_layer = KeysetDataLayer({'session': session, 'model': Device, 'resource': DeviceList,
+                                      'eagerload': {'dep_profile': 'selectin', 'tags': 'joined'}})
+        query = session.query(Device).options(data_layer.loader('dep_profile', Device.dep_profile),
+                                              data_layer.loader('tags', Device.tags))
+        assert 'dep_profiles' not in str(query)
+        assert 'JOIN tags' in str(query)
@@ -0,0 +1,120 @@
+import pytest
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.inventory import catalog, rollups
+from commandment.inventory.models import ApplicationVersionCount, installed_applications
+from commandment.models import Device
+
+
+@pytest.fixture(scope='function')
+def fleet(session: Session):
+    """Create 6 devices across two models and OS versions, with some applications installed."""
+    for i in range(6):
+        device = Device(udid='00000000-1111-2222-3333-{:012d}'.format(i), model_name='MacBook Pro' if i < 4 else 'iPad',
+                        model='MacBookPro15,1' if i < 4 else 'iPad8,1', os_version='10.14.{}'.format(i % 2))
+        session.add(device)
+        session.flush()
+        applications = [{'bundle_identifier': 'com.example.a', 'version': '1.0' if i < 5 else '2.0'}]
+        if i % 3 == 0:
+            applications.append({'bundle_identifier': 'com.example.b', 'version': '3.1'})
+        catalog.replace_installed_applications(device, applications)
+    # Not attached to a device
+    session.execute(installed_applications.insert(), {
+        'device_udid': 'unknown',
+        'application_version_id': catalog.application_version_ids([{'bundle_identifier': 'com.example.a',
+                                                                     'version': '1.0'}])[0],
+    })
+    session.commit()
+
+    rollups.refresh_rollups()
+
+
+@pytest.mark.usefixtures('fleet')
+class TestRollups:
+
+    def test_refresh(self, session: Session):
+        assert rollups.application_counts() == [
+            {'bundle_identifier': 'com.example.a', 'version': '1.0', 'devices': 5},
+            {'bundle_identifier': 'com.example.b', 'version': '3.1', 'devices': 2},
+            {'bundle_identifier': 'com.example.a', 'version': '2.0', 'devices': 1},
+        ]
+        assert rollups.device_counts() == [
+            {'model': 'MacBookPro15,1', 'os_version': '10.14.0', 'platform': 'macOS', 'devices': 2},
+            {'model': 'MacBookPro15,1', 'os_version': '10.14.1', 'platform': 'macOS', 'devices': 2},
+            {'model': 'iPad8,1', 'os_version': '10.14.0', 'platform': 'iOS', 'devices': 1},
+            {'model': 'iPad8,1', 'os_version': '10.14.1', 'platform': 'iOS', 'devices': 1},
+        ]
+
+    def test_refresh_compacts(self, session: Session):
+        rollups.record_application_versions([('com.example.a', '1.0')], [('com.example.a', '2.0')])
+        session.commit()
+        rollups.refresh_rollups()
+        assert session.query(ApplicationVersionCount).count() == 3
+
+    def test_group_by(self):
+        assert rollups.device_counts(('os_version',)) == [
+            {'os_version': '10.14.0', 'devices': 3},
+            {'os_version': '10.14.1', 'devices': 3},
+        ]
+        assert rollups.device_counts(('model',), platform='iOS') == [{'model': 'iPad8,1', 'devices': 2}]
+        with pytest.raises(ValueError):
+            rollups.device_counts(('serial_number',))
+
+    def test_record_application_versions(self, session: Session):
+        rollups.record_application_versions(
+            [('com.example.a', '1.0'), ('com.example.b', '3.1'), ('com.example.b', '3.1')],
+            [('com.example.a', '2.0'), ('com.example.b', '3.1')])
+        session.commit()
+
+        assert rollups.application_counts('com.example.a') == [
+            {'bundle_identifier': 'com.example.a', 'version': '1.0', 'devices': 4},
+            {'bundle_identifier': 'com.example.a', 'version': '2.0', 'devices': 2},
+        ]
+        assert rollups.application_counts('com.example.b', '3.1')[0]['devices'] == 2
+
+    def test_record_device_model(self, session: Session):
+        device = session.query(Device).filter(Device.model_name == 'iPad').order_by(Device.id).first()
+        before = rollups.device_key(device)
+        device.os_version = '13.1'
+        rollups.record_device_model(before, rollups.device_key(device))
+        rollups.record_device_model(None, ('iPhone11,2', '13.1', 'iOS'))
+        session.commit()
+
+        assert rollups.device_counts(('os_version',), platform='iOS') == [
+            {'os_version': '13.1', 'devices': 2},
+            {'os_version': '10.14.1', 'devices': 1},
+        ]
+
+    def test_removed_keys_not_listed(self, session: Session):
+        rollups.record_application_versions([('com.example.a', '2.0')], [])
+        session.commit()
+        assert [c['version'] for c in rollups.application_counts('com.example.a')] == ['1.0']
+
+
+@pytest.mark.usefixtures('fleet', 'auth_headers')
+class TestRollupEndpoints:
+
+    def test_applications(self, client: MDMClient):
+        response = client.get('/api/v1/rollups/applications?bundle_identifier=com.example.a&version=2.0',
+                              headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert response.get_json() == {
+            'data': [{'bundle_identifier': 'com.example.a', 'version': '2.0', 'devices': 1}]}
+
+    def test_devices(self, client: MDMClient):
+        response = client.get('/api/v1/rollups/devices?group_by=platform,os_version&platform=macOS',
+                              headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert response.get_json()['data'] == [
+            {'platform': 'macOS', 'os_version': '10.14.0', 'devices': 2},
+            {'platform': 'macOS', 'os_version': '10.14.1', 'devices': 2},
+        ]
+
+    def test_devices_invalid_group(self, client: MDMClient):
+        response = client.get('/api/v1/rollups/devices?group_by=udid', headers=AUTHORIZATION)
+        assert response.status_code == 400
+
+    def test_requires_token(self, client: MDMClient):
+        response = client.get('/api/v1/rollups/applications')
+        assert response.status_code == 401
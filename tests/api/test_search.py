@@ -0,0 +1,114 @@
+import pytest
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from tests.api.conftest import AUTHORIZATION
+from commandment.api.search import search_devices, prefix_search
+from commandment.models import Device
+
+
+@pytest.fixture(scope='function')
+def devices(session: Session):
+    """Create devices with distinct names, hostnames, serial numbers and MAC addresses."""
+    for i in range(10):
+        session.add(Device(
+            udid='{:08X}-1111-2222-3333-444455556666'.format(i * 7919),
+            serial_number='C02XL{:04d}JG5'.format(i),
+            device_name="Jane's MacBook {}".format(i) if i % 2 else 'iPad {}'.format(i),
+            hostname='host-{}.example.com'.format(i) if i < 5 else None,
+            wifi_mac='a4:83:e7:00:00:{:02x}'.format(i),
+        ))
+    session.commit()
+
+
+def names(devices):
+    return [d.device_name for d in devices]
+
+
+@pytest.mark.usefixtures('devices')
+class TestSearch:
+
+    def test_name(self):
+        assert names(search_devices('macbook host-3')) == ["Jane's MacBook 3"]
+        assert len(search_devices('MACBOOK')) == 5
+
+    def test_substring(self):
+        assert names(search_devices('L0007')) == ["Jane's MacBook 7"]
+        assert names(search_devices('e7:00:00:04')) == ['iPad 4']
+        assert names(search_devices('host-2.example')) == ['iPad 2']
+
+    def test_udid_prefix(self):
+        udid = '{:08X}'.format(6 * 7919)
+        assert names(search_devices(udid)) == ['iPad 6']
+
+    def test_all_terms(self):
+        assert names(search_devices('jane host-3')) == ["Jane's MacBook 3"]
+        assert search_devices('jane ipad') == []
+
+    def test_short_terms(self):
+        assert sorted(names(search_devices('host ip'))) == ['iPad 0', 'iPad 2', 'iPad 4']
+        assert len(search_devices('ip')) == 5
+
+    def test_limit(self):
+        assert len(search_devices('a4:83', limit=3)) == 3
+
+    def test_empty(self):
+        assert search_devices('  ') == []
+
+    def test_special_characters(self):
+        assert search_devices('"') == []
+        assert search_devices('100%') == []
+        assert len(search_devices("jane's macbook")) == 5
+
+    def test_index_updated(self, session: Session):
+        device = session.query(Device).filter(Device.device_name == 'iPad 0').one()
+        device.device_name = 'Renamed'
+        session.commit()
+        assert 'iPad 0' not in names(search_devices('ipad'))
+        assert names(search_devices('renamed')) == ['Renamed']
+
+        session.execute(Device.__table__.delete().where(Device.id == device.id))
+        session.commit()
+        assert search_devices('renamed') == []
+
+    def test_bulk_inserted(self, session: Session):
+        session.bulk_insert_mappings(Device, [{'udid': 'bulk', 'serial_number': 'DEPSERIAL1', 'device_name': None}])
+        session.commit()
+        assert [d.udid for d in search_devices('depserial')] == ['bulk']
+
+    def test_without_fts_table(self, session: Session):
+        """Databases which could not create the index are searched by prefix."""
+        connection = session.connection(mapper=Device.__mapper__)
+        for trigger in ('insert', 'delete', 'update'):
+            connection.execute('DROP TRIGGER devices_search_{}'.format(trigger))
+        connection.execute('DROP TABLE devices_search')
+
+        assert names(search_devices('jane host-1')) == ["Jane's MacBook 1"]
+        assert search_devices('macbook') == []
+
+    def test_prefix_search(self):
+        assert names(prefix_search(['jane', 'host-1'], 20)) == ["Jane's MacBook 1"]
+        assert prefix_search(['macbook'], 20) == []
+
+
+@pytest.mark.usefixtures('devices')
+class TestSearchEndpoint:
+
+    def test_requires_token(self, client: MDMClient):
+        response = client.get('/api/v1/devices/search?q=ipad')
+        assert response.status_code == 401
+
+    @pytest.mark.usefixtures('auth_headers')
+    def test_search(self, client: MDMClient):
+        response = client.get('/api/v1/devices/search?q=macbook&limit=2', headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/vnd.api+json'
+        data = response.get_json(force=True)['data']
+        assert len(data) == 2
+        assert data[0]['type'] == 'devices'
+        assert 'MacBook' in data[0]['attributes']['device_name']
+
+    @pytest.mark.usefixtures('auth_headers')
+    @pytest.mark.parametrize('query', ['', '?q=', '?q=ipad&limit=x', '?q=ipad&limit=0'])
+    def test_invalid(self, client: MDMClient, query: str):
+        response = client.get('/api/v1/devices/search' + query, headers=AUTHORIZATION)
+        assert response.status_code == 400
@@ -2,9 +2,12 @@ import pytest
 import os
 import json
 import sqlalchemy
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.x509 import NameOID
 from flask import Response
 
-from commandment.dep.models import DEPProfile
+from commandment.dep.models import DEPProfile, DEPServerTokenCertificate
 from commandment.models import Device
 from tests.client import MDMClient
 
@@ -33,3 +36,19 @@ class TestDEPAPI:
 
         d: Device = session.query(Device).filter(Device.id == 1).one()
         assert d.dep_profile_id is not None
+
+
+class TestDEPCertificate:
+
+    def test_certificate_download(self, client: MDMClient, session):
+        """Assert that the first download creates the DEP token certificate, and later downloads return the same one."""
+        response: Response = client.get('/dep/certificate/download')
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'application/x-x509-ca-cert'
+
+        certificate = x509.load_pem_x509_certificate(response.data, default_backend())
+        assert certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == 'COMMANDMENT-DEP'
+        assert certificate.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == 'COMMANDMENT-CA'
+        assert session.query(DEPServerTokenCertificate).count() == 1
+
+        assert client.get('/dep/certificate/download').data == response.data
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy.orm.session import Session
+from commandment.benchmarks.depsim import DEPSimulatorAdapter
+from commandment.dep.assignment import batches, define_profiles, pending_assignments, run_assignments
+from commandment.dep.dep import DEP
+from commandment.dep.models import DEPAccount, DEPProfile
+from commandment.models import Device
+
+
+@pytest.fixture
+def adapter() -> DEPSimulatorAdapter:
+    return DEPSimulatorAdapter(device_count=0)
+
+
+@pytest.fixture
+def fake_dep(adapter: DEPSimulatorAdapter) -> DEP:
+    d = DEP('consumer_key', 'consumer_secret', 'access_token', 'access_secret', url=DEPSimulatorAdapter.URL)
+    adapter.mount(d)
+    return d
+
+
+@pytest.fixture
+def dep_account(session: Session) -> DEPAccount:
+    account = DEPAccount(consumer_key='a', consumer_secret='b', access_token='c', access_secret='d')
+    session.add(account)
+    session.commit()
+    return account
+
+
+class TestDEPAssignment:
+
+    def test_batches(self):
+        """Assert that serial numbers are split into batches no larger than the given size."""
+        assert [len(b) for b in batches(list(range(2500)), 1000)] == [1000, 1000, 500]
+
+    def test_define_profiles(self, session: Session, fake_dep: DEP, adapter: DEPSimulatorAdapter,
+                             dep_account: DEPAccount):
+        """Assert that pending profiles are defined concurrently and receive their UUID."""
+        profiles = [DEPProfile(profile_name='Profile {}'.format(i), url='https://localhost/enroll',
+                               dep_account=dep_account) for i in range(3)]
+        session.add_all(profiles)
+        session.commit()
+
+        assert define_profiles(fake_dep, profiles, max_workers=3) == 3
+        session.commit()
+
+        assert len(adapter.profiles) == 3
+        for p in profiles:
+            assert p.uuid.hex.upper() in adapter.profiles
+            assert p.last_upload_at is not None
+
+    def test_run_assignments(self, session: Session, fake_dep: DEP, adapter: DEPSimulatorAdapter,
+                             dep_account: DEPAccount):
+        """Assert that devices are assigned their profile in batches, and the results are written back."""
+        profile_uuid = fake_dep.define_profile({'profile_name': 'Test'})['profile_uuid']
+        profile = DEPProfile(uuid=profile_uuid, profile_name='Test', url='https://localhost/enroll',
+                             dep_account=dep_account)
+        session.add(profile)
+        session.commit()
+
+        serial_numbers = [DEPSimulatorAdapter.serial_number(i) for i in range(25)]
+        session.add_all([Device(serial_number=s, is_dep=True, profile_status='empty', dep_profile_id=profile.id)
+                         for s in serial_numbers])
+        session.commit()
+
+        assert len(pending_assignments(dep_account)[profile_uuid]) == 25
+
+        stats = run_assignments(fake_dep, dep_account, max_workers=4, batch_size=10)
+
+        assert stats == {'pending': 25, 'SUCCESS': 25}
+        assert adapter.requests['POST /profile/devices'] == 3
+        assert set(adapter.assignments) == set(serial_numbers)
+
+        devices = session.query(Device).all()
+        assert all(d.profile_status == 'assigned' and d.profile_uuid == profile_uuid for d in devices)
+        assert pending_assignments(dep_account) == {}
+
+    def test_default_profile(self, session: Session, fake_dep: DEP, adapter: DEPSimulatorAdapter,
+                             dep_account: DEPAccount):
+        """Assert that DEP devices without a profile receive the account default profile."""
+        profile_uuid = fake_dep.define_profile({'profile_name': 'Default'})['profile_uuid']
+        profile = DEPProfile(uuid=profile_uuid, profile_name='Default', url='https://localhost/enroll',
+                             dep_account=dep_account)
+        session.add(profile)
+        session.commit()
+
+        dep_account.default_dep_profile = profile
+        session.add_all([
+            Device(serial_number='C02UNASSIGNED', is_dep=True, profile_status='empty'),
+            Device(serial_number='C02NOTDEP', is_dep=False),
+        ])
+        session.commit()
+
+        unassigned = session.query(Device).filter(Device.serial_number == 'C02UNASSIGNED').one()
+        assert pending_assignments(dep_account) == {profile_uuid: [(unassigned.id, 'C02UNASSIGNED')]}
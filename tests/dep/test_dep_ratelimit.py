@@ -0,0 +1,109 @@
+import pytest
+from datetime import datetime, timezone
+from commandment.benchmarks.depsim import DEPSimulatorAdapter
+from commandment.dep.dep import DEP
+from commandment.dep.errors import DEPServiceError, DEPRateLimitError
+from commandment.dep.ratelimit import TokenBucket, parse_retry_after, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def adapter() -> DEPSimulatorAdapter:
+    return DEPSimulatorAdapter(device_count=10)
+
+
+@pytest.fixture
+def fake_dep(adapter: DEPSimulatorAdapter) -> DEP:
+    d = DEP('consumer_key', 'consumer_secret', 'access_token', 'access_secret', url=DEPSimulatorAdapter.URL,
+            requests_per_second=None, backoff=0.01, max_backoff=0.01)
+    adapter.mount(d)
+    return d
+
+
+class TestRateLimit:
+
+    def test_parse_retry_after_seconds(self):
+        """Assert that a numeric Retry-After is parsed as seconds."""
+        assert parse_retry_after('120') == 120.0
+        assert parse_retry_after(' 5 ') == 5.0
+
+    def test_parse_retry_after_date(self):
+        """Assert that an HTTP-date Retry-After is converted to seconds from now."""
+        now = datetime(2015, 10, 21, 7, 28, 0, tzinfo=timezone.utc)
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:30 GMT', now) == 30.0
+        assert parse_retry_after('Wed, 21 Oct 2015 07:27:00 GMT', now) == 0.0
+        assert parse_retry_after('soon') is None
+
+    def test_backoff_delay_bounds(self):
+        """Assert that backoff delays are jittered below an exponentially growing, capped bound."""
+        for attempt in range(1, 10):
+            assert 0 <= backoff_delay(attempt, 1.0, 8.0) <= min(8.0, 2 ** (attempt - 1))
+
+    def test_token_bucket(self):
+        """Assert that the bucket allows a burst, then spaces requests at the configured rate."""
+        clock = FakeClock()
+        bucket = TokenBucket(2.0, 2, clock=clock, sleep=clock.sleep)
+
+        assert [bucket.acquire() for _ in range(4)] == [0.0, 0.0, 0.5, 0.5]
+        assert clock.now == 1.0
+
+    def test_token_bucket_pause(self):
+        """Assert that a pause holds back requests even when tokens are available."""
+        clock = FakeClock()
+        bucket = TokenBucket(None, clock=clock, sleep=clock.sleep)
+        bucket.pause(3.0)
+
+        assert bucket.acquire() == 3.0
+        assert bucket.acquire() == 0.0
+
+
+class TestDEPScheduling:
+
+    def test_retries_throttled(self, fake_dep: DEP, adapter: DEPSimulatorAdapter):
+        """Assert that 429 and 503 responses are retried until the request succeeds."""
+        adapter.fail_next(429, retry_after='0')
+        adapter.fail_next(503)
+
+        assert fake_dep.account()['server_name'] == 'Benchmark MDM'
+        assert adapter.requests['GET /account'] == 3
+        assert fake_dep.metrics.throttled == 2
+        assert fake_dep.metrics.retries == 2
+
+    def test_retries_exhausted(self, fake_dep: DEP, adapter: DEPSimulatorAdapter):
+        """Assert that the service error is raised when the request is still throttled after all retries."""
+        adapter.fail_next(429, count=10, retry_after='0')
+
+        with pytest.raises(DEPServiceError):
+            fake_dep.account()
+
+        assert adapter.requests['GET /account'] == 6
+
+    def test_refreshes_token(self, fake_dep: DEP, adapter: DEPSimulatorAdapter):
+        """Assert that a 401 response fetches a new session token and re-issues the request once."""
+        fake_dep.fetch_token()
+        adapter.fail_next(401)
+
+        assert fake_dep.account() is not None
+        assert adapter.requests['GET /session'] == 2
+        assert fake_dep.metrics.token_refreshes == 1
+
+        adapter.fail_next(401, count=2)
+        with pytest.raises(DEPServiceError):
+            fake_dep.account()
+
+    def test_max_wait(self, fake_dep: DEP, adapter: DEPSimulatorAdapter):
+        """Assert that a Retry-After longer than the maximum wait fails instead of blocking."""
+        adapter.fail_next(429, retry_after='3600')
+
+        with pytest.raises(DEPRateLimitError):
+            fake_dep.account()
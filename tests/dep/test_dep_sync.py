@@ -0,0 +1,126 @@
+import pytest
+from flask import Flask
+from requests import Response
+from sqlalchemy.orm.session import Session
+from commandment.dep import threads
+from commandment.dep.errors import DEPServiceError
+from commandment.dep.models import DEPAccount
+from commandment.dep.threads import dep_upsert_page, dep_fetch_devices, dep_thread_callback
+from commandment.models import Device
+
+
+def dep_device(serial_number: str, **kwargs) -> dict:
+    d = {
+        'serial_number': serial_number,
+        'model': 'MacBook Pro',
+        'description': 'MBP 13.3',
+        'color': 'SPACE GRAY',
+        'os': 'OSX',
+        'device_family': 'Mac',
+        'profile_status': 'empty',
+        'device_assigned_by': 'test@localhost',
+        'device_assigned_date': '2019-01-01T00:00:00Z',
+    }
+    d.update(kwargs)
+    return d
+
+
+class FakeDEP:
+    """Returns canned fetch pages in place of the DEP service."""
+    def __init__(self, pages):
+        self.pages = pages
+        self.limits = []
+
+    def devices(self, cursor=None, limit=100):
+        self.limits.append(limit)
+        return iter(self.pages)
+
+
+class TestDEPSync:
+
+    def test_upsert_page(self, session: Session):
+        """Assert that a page inserts new devices and updates existing devices by serial number."""
+        session.add(Device(serial_number='C02EXISTING', udid='existing'))
+        session.commit()
+
+        stats = dep_upsert_page(session, [
+            dep_device('C02EXISTING', color='SILVER'),
+            dep_device('C02NEW', profile_status='assigned', profile_uuid='ABC',
+                       profile_assign_time='2019-01-02T00:00:00Z'),
+        ])
+        session.commit()
+
+        assert stats['inserted'] == 1
+        assert stats['updated'] == 1
+
+        existing = session.query(Device).filter(Device.serial_number == 'C02EXISTING').one()
+        assert existing.udid == 'existing'
+        assert existing.color == 'SILVER'
+        assert existing.is_dep
+
+        new = session.query(Device).filter(Device.serial_number == 'C02NEW').one()
+        assert new.profile_uuid == 'ABC'
+        assert new.profile_assign_time is not None
+
+    def test_upsert_sync_page(self, session: Session):
+        """Assert that sync operations are applied, and deleted devices are no longer marked as DEP devices."""
+        dep_upsert_page(session, [dep_device('C02DELETED')])
+        session.commit()
+
+        stats = dep_upsert_page(session, [
+            {'serial_number': 'C02DELETED', 'op_type': 'deleted', 'op_date': '2019-01-03T00:00:00Z'},
+            dep_device('C02ADDED', op_type='added', op_date='2019-01-03T00:00:00Z'),
+            dep_device('C02BOGUS', op_type='bogus', op_date='2019-01-03T00:00:00Z'),
+        ])
+        session.commit()
+
+        assert stats == {'inserted': 1, 'updated': 0, 'deleted': 1, 'skipped': 1}
+        assert not session.query(Device).filter(Device.serial_number == 'C02DELETED').one().is_dep
+        assert session.query(Device).filter(Device.serial_number == 'C02ADDED').count() == 1
+
+    def test_fetch_checkpoints_cursor(self, app: Flask, session: Session):
+        """Assert that every page is written with its cursor, and the page size is capped."""
+        account = DEPAccount(consumer_key='a', consumer_secret='b', access_token='c', access_secret='d')
+        session.add(account)
+        session.commit()
+        app.config['DEP_PAGE_SIZE'] = 5000
+
+        dep = FakeDEP([
+            {'devices': [dep_device('C02{}'.format(i)) for i in range(3)], 'cursor': 'first',
+             'more_to_follow': True, 'fetched_until': '2019-01-01T00:00:00Z'},
+            {'devices': [dep_device('C02{}'.format(i)) for i in range(2, 5)], 'cursor': 'second',
+             'more_to_follow': False, 'fetched_until': '2019-01-02T00:00:00Z'},
+        ])
+        stats = dep_fetch_devices(app, dep, account.id)
+
+        assert dep.limits == [1000]
+        assert stats['pages'] == 2
+        assert stats['inserted'] == 5
+        assert stats['updated'] == 1
+        assert session.query(Device).count() == 5
+        assert account.cursor == 'second'
+        assert not account.more_to_follow
+
+    def test_expired_cursor_fails_sync(self, app: Flask, session: Session, monkeypatch):
+        """Assert that an expired cursor is cleared for the next run, and the error still fails the sync."""
+        account = DEPAccount(consumer_key='a', consumer_secret='b', access_token='c', access_secret='d',
+                             cursor='expired')
+        session.add(account)
+        session.commit()
+
+        response = Response()
+        response.status_code = 400
+        response._content = b'"EXPIRED_CURSOR"'
+
+        def fetch_devices(app, dep, dep_account_id):
+            raise DEPServiceError(response=response)
+
+        monkeypatch.setattr(threads, 'get_dep', lambda dep_account: FakeDEP([]))
+        monkeypatch.setattr(threads, 'dep_sync_organization', lambda app, dep: None)
+        monkeypatch.setattr(threads, 'dep_fetch_devices', fetch_devices)
+
+        with pytest.raises(DEPServiceError):
+            dep_thread_callback(app)
+
+        session.expire_all()
+        assert session.query(DEPAccount).one().cursor is None
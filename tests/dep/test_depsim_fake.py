@@ -0,0 +1,30 @@
+import pytest
+from commandment.benchmarks.depsim import DEPSimulatorAdapter
+from commandment.dep.dep import DEP
+
+
+@pytest.fixture
+def fake_dep() -> DEP:
+    d = DEP('consumer_key', 'consumer_secret', 'access_token', 'access_secret', url=DEPSimulatorAdapter.URL)
+    DEPSimulatorAdapter(device_count=250).mount(d)
+    return d
+
+
+class TestDEPSimulatorAdapter:
+
+    def test_fetch_cursor(self, fake_dep: DEP):
+        """Assert that the fetch cursor pages through the whole fake fleet."""
+        pages = list(fake_dep.devices(limit=100))
+        assert [len(p['devices']) for p in pages] == [100, 100, 50]
+        assert not pages[-1]['more_to_follow']
+
+    def test_page_size_capped(self, fake_dep: DEP):
+        """Assert that the page size requested from the service never exceeds the DEP maximum."""
+        cursor = fake_dep.devices(limit=5000)
+        assert cursor.limit == DEP.MaxPageSize
+
+    def test_profile_assignment(self, fake_dep: DEP):
+        """Assert that profiles defined through the fake can be assigned."""
+        profile_uuid = fake_dep.define_profile({'profile_name': 'Test'})['profile_uuid']
+        result = fake_dep.assign_profile(profile_uuid, DEPSimulatorAdapter.serial_number(0))
+        assert result['devices'] == {DEPSimulatorAdapter.serial_number(0): 'SUCCESS'}
@@ -0,0 +1,69 @@
+from uuid import uuid4
+from sqlalchemy.orm.session import Session
+from commandment.enroll.cache import ProfileCache, configuration_version, with_identity
+from commandment.models import Organization
+from commandment.profiles.models import PKCS12CertificatePayload
+
+
+def pkcs12_payload(content: bytes) -> PKCS12CertificatePayload:
+    return PKCS12CertificatePayload(
+        uuid=uuid4(),
+        certificate_file_name='device_identity.p12',
+        identifier='com.example.identity',
+        display_name='Device Identity Certificate',
+        type='com.apple.security.pkcs12',
+        password='sekret',
+        payload_content=content,
+        version=1
+    )
+
+
+class TestProfileCache:
+
+    def test_render_once_per_version(self):
+        """Assert that a profile is only rendered again when the version changes."""
+        cache = ProfileCache()
+        renders = []
+
+        def render():
+            renders.append(1)
+            return len(renders)
+
+        assert cache.get('trust', ('a',), render) == 1
+        assert cache.get('trust', ('a',), render) == 1
+        assert cache.get('trust', ('b',), render) == 2
+        assert cache.get('other', ('b',), render) == 3
+
+    def test_version_follows_organization(self, session: Session):
+        """Assert that changing the organization changes the configuration version."""
+        org = Organization(name='Commandment', payload_prefix='com.example')
+        session.add(org)
+        session.commit()
+
+        version = configuration_version()
+        assert configuration_version() == version
+
+        org.name = 'Renamed'
+        session.commit()
+        assert configuration_version() != version
+
+    def test_with_identity(self):
+        """Assert that the identity payload is replaced and the MDM payload refers to the new identity."""
+        first, second = pkcs12_payload(b'first'), pkcs12_payload(b'second')
+        template = {
+            'PayloadUUID': 'template',
+            'PayloadContent': [
+                {'PayloadType': 'com.apple.security.root', 'PayloadUUID': 'ca'},
+                {'PayloadType': 'com.apple.security.pkcs12', 'PayloadUUID': str(first.uuid)},
+                {'PayloadType': 'com.apple.mdm', 'PayloadUUID': 'mdm', 'IdentityCertificateUUID': str(first.uuid)},
+            ],
+        }
+
+        profile = with_identity(template, second)
+
+        ca, identity, mdm = profile['PayloadContent']
+        assert ca is template['PayloadContent'][0]
+        assert identity['PayloadUUID'] == str(second.uuid)
+        assert mdm['IdentityCertificateUUID'] == str(second.uuid)
+        assert profile['PayloadUUID'] != 'template'
+        assert template['PayloadContent'][2]['IdentityCertificateUUID'] == str(first.uuid)
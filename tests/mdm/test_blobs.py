@@ -0,0 +1,82 @@
+import plistlib
+import pytest
+from flask import Response
+from sqlalchemy.orm.session import Session
+from tests.client import MDMClient
+from commandment import dbtypes
+from commandment.mdm import CommandStatus, commands
+from commandment.models import Blob, Command, Device
+from commandment.profiles.models import Profile
+
+PROFILE_DATA = plistlib.dumps({'PayloadContent': [{'PayloadType': 'com.apple.wifi.managed'}] * 50,
+                               'PayloadIdentifier': 'com.example.profile', 'PayloadType': 'Configuration'})
+
+
+@pytest.fixture(scope='function')
+def install_profile_commands(session: Session):
+    """Queue the same InstallProfile command for 3 devices."""
+    for i in range(3):
+        device = Device(udid='00000000-1111-2222-3333-44445555666{}'.format(i))
+        command = Command.from_model(commands.InstallProfile(None, profile=Profile(data=PROFILE_DATA)))
+        command.device = device
+        session.add(command)
+    session.commit()
+
+
+class TestCompressed:
+
+    @pytest.mark.parametrize('codec', ['zlib'] + (['zstd'] if dbtypes.zstandard is not None else []))
+    def test_compress(self, codec: str):
+        value = dbtypes.compress(PROFILE_DATA, codec)
+        assert value[:1] == dbtypes.CODEC_HEADERS[codec]
+        assert len(value) < len(PROFILE_DATA)
+        assert dbtypes.decompress(value) == PROFILE_DATA
+
+    def test_small_values_uncompressed(self):
+        compressed = dbtypes.Compressed(codec='zlib', min_size=128)
+        assert compressed.process_bind_param(b'short', None) == b'nshort'
+        assert compressed.process_result_value(b'nshort', None) == b'short'
+        assert compressed.process_bind_param(PROFILE_DATA, None)[:1] == b'z'
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            dbtypes.compress(b'data', 'lzma')
+        with pytest.raises(ValueError):
+            dbtypes.decompress(b'xdata')
+
+    def test_json(self):
+        encoded = dbtypes.CompressedJSONEncodedDict(codec='zlib')
+        value = {'Payload': 'A' * 1000, 'Identifier': 'com.example'}
+        stored = encoded.process_bind_param(value, None)
+        assert len(stored) < 100
+        assert encoded.process_result_value(stored, None) == value
+
+
+@pytest.mark.usefixtures('install_profile_commands')
+class TestBlobs:
+
+    def test_stored_once(self, session: Session):
+        assert session.query(Blob).count() == 1
+        blob = session.query(Blob).one()
+        assert blob.data == PROFILE_DATA
+        assert blob.size == len(PROFILE_DATA)
+        assert [c.payload_id for c in session.query(Command)] == [blob.id] * 3
+
+    def test_parameters(self, session: Session):
+        command = session.query(Command).first()
+        assert 'Payload' not in command.parameters
+        cmd = commands.Command.new_request_type(command.request_type, command.request_parameters, command.uuid)
+        assert cmd.to_dict()['Command']['Payload'] == PROFILE_DATA
+
+    def test_find_or_create(self, session: Session):
+        blob = Blob.find_or_create(b'other data')
+        assert Blob.find_or_create(b'other data') is blob
+        session.commit()
+        assert session.query(Blob).count() == 2
+
+    def test_send(self, client: MDMClient, session: Session):
+        idle = plistlib.dumps({'Status': 'Idle', 'UDID': '00000000-1111-2222-3333-444455556661'})
+        response: Response = client.put('/mdm', data=idle, content_type='text/xml')
+        assert response.status_code == 200
+        assert plistlib.loads(response.data)['Command']['Payload'] == PROFILE_DATA
+        assert session.query(Command).filter(Command.status == CommandStatus.Sent).count() == 1
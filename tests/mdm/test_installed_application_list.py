@@ -2,6 +2,7 @@ import pytest
 import os
 from flask import Response
 from tests.client import MDMClient
+from commandment.inventory import rollups
 from commandment.mdm import CommandStatus
 from commandment.models import Command, Device
 
@@ -39,3 +40,19 @@ class TestInstalledApplicationList:
         d: Device = session.query(Device).filter(Device.udid == '00000000-1111-2222-3333-444455556666').one()
         ia = d.installed_applications
         assert len(ia) == 3
+
+    def test_installed_application_list_rollup(self, client: MDMClient, installed_application_list_response: str, session):
+        rollups.refresh_rollups()
+        for _ in range(2):  # The second response replaces the same applications
+            session.query(Command).update({'status': CommandStatus.Sent.value})
+            session.commit()
+            response: Response = client.put('/mdm', data=installed_application_list_response, content_type='text/xml')
+            assert response.status_code == 200
+
+        d: Device = session.query(Device).filter(Device.udid == '00000000-1111-2222-3333-444455556666').one()
+        counts = rollups.application_counts()
+        assert len(counts) == len({(a.bundle_identifier, a.version) for a in d.installed_applications})
+        assert all(c['devices'] == 1 for c in counts)
+
+        rollups.refresh_rollups()
+        assert rollups.application_counts() == counts
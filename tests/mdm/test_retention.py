@@ -0,0 +1,91 @@
+import datetime
+import uuid
+import pytest
+from sqlalchemy.orm.session import Session
+from commandment.apps.models import ManagedApplication
+from commandment.mdm import CommandStatus
+from commandment.mdm import retention
+from commandment.models import ArchivedCommand, Blob, Command, Device
+
+NOW = datetime.datetime.utcnow()
+OLD = NOW - datetime.timedelta(days=60)
+
+
+@pytest.fixture(scope='function')
+def commands(session: Session):
+    """Create 10 old acknowledged commands, and one old command of every other status and a recent one."""
+    device = Device(udid='00000000-1111-2222-3333-444455556666')
+    session.add(device)
+
+    def command(status: CommandStatus, acknowledged_at=OLD, queued_at=OLD) -> Command:
+        c = Command(request_type='DeviceInformation', uuid=str(uuid.uuid4()), parameters={'Queries': ['UDID']},
+                    status=status, queued_at=queued_at, acknowledged_at=acknowledged_at, device=device)
+        session.add(c)
+        return c
+
+    for _ in range(10):
+        command(CommandStatus.Acknowledged)
+    command(CommandStatus.Error)
+    command(CommandStatus.Expired, acknowledged_at=None)
+    command(CommandStatus.Queued, acknowledged_at=None)
+    command(CommandStatus.Sent, acknowledged_at=None)
+    command(CommandStatus.NotNow)
+    command(CommandStatus.Acknowledged, acknowledged_at=NOW)
+    session.add(ManagedApplication(device=device, ia_command=command(CommandStatus.Acknowledged)))
+    session.commit()
+
+
+@pytest.mark.usefixtures('commands')
+class TestRetention:
+
+    def test_archive(self, session: Session):
+        stats = retention.archive_commands(30, batch_size=5)
+        assert stats == {'archived': 12, 'batches': 3}
+
+        assert sorted(status.value for status, in session.query(Command.status)) == [
+            'Acknowledged', 'Acknowledged', 'NotNow', 'Queued', 'Sent']
+        assert session.query(ArchivedCommand).count() == 12
+
+    def test_copied(self, session: Session):
+        original = session.query(Command).filter(Command.status == CommandStatus.Error).one()
+        copy = (original.id, original.uuid, original.parameters, original.device_id)
+        retention.archive_commands(30)
+
+        archived = session.query(ArchivedCommand).get(copy[0])
+        assert (archived.id, archived.uuid, archived.parameters, archived.device_id) == copy
+        assert archived.status == CommandStatus.Error
+        assert archived.archived_at is not None
+
+    def test_max_batches(self, session: Session):
+        assert retention.archive_commands(30, batch_size=4, max_batches=2) == {'archived': 8, 'batches': 2}
+        assert retention.archive_commands(30, batch_size=4) == {'archived': 4, 'batches': 1}
+        assert retention.archive_commands(30, batch_size=4) == {'archived': 0, 'batches': 0}
+
+    def test_retention_days(self):
+        assert retention.archive_commands(90)['archived'] == 0
+
+    def test_purge(self, session: Session):
+        retention.archive_commands(30)
+        assert retention.purge_archive(1) == 0
+
+        session.query(ArchivedCommand).update({'archived_at': OLD})
+        session.commit()
+        assert retention.purge_archive(1, batch_size=5) == 12
+        assert session.query(ArchivedCommand).count() == 0
+
+    def test_purge_blobs(self, session: Session):
+        command = session.query(Command).filter(Command.status == CommandStatus.Error).one()
+        command.payload = Blob.find_or_create(b'profile')
+        Blob.find_or_create(b'unused')
+        session.commit()
+        command_id = command.id
+
+        retention.archive_commands(30)
+        assert retention.purge_blobs() == 1
+        assert session.query(ArchivedCommand).get(command_id).payload_id is not None
+
+        session.query(ArchivedCommand).update({'archived_at': OLD})
+        session.commit()
+        retention.purge_archive(1)
+        assert retention.purge_blobs() == 1
+        assert session.query(Blob).count() == 0
@@ -0,0 +1,61 @@
+import threading
+from cryptography import x509
+from cryptography.x509 import NameOID
+from flask import Flask
+from commandment.pki.ca import get_signer, get_ca, SerialAllocator
+from commandment.pki.models import CertificateAuthority
+
+
+class TestSerialAllocator:
+
+    def test_blocks(self):
+        """Assert that serials are handed out from consecutive reserved blocks."""
+        reserved = []
+
+        def reserve(count: int) -> int:
+            reserved.append(count)
+            return len(reserved) * count
+
+        serials = SerialAllocator(reserve, block_size=3)
+        assert [serials.next() for _ in range(7)] == [1, 2, 3, 4, 5, 6, 7]
+        assert reserved == [3, 3, 3]
+
+    def test_threads(self):
+        """Assert that no serial is handed out twice when allocating from several threads."""
+        lock = threading.Lock()
+        end = [0]
+
+        def reserve(count: int) -> int:
+            with lock:
+                end[0] += count
+                return end[0]
+
+        serials = SerialAllocator(reserve, block_size=10)
+        allocated = []
+        threads = [threading.Thread(target=lambda: allocated.extend(serials.next() for _ in range(50)))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(allocated) == list(range(1, 201))
+
+
+class TestCASigner:
+
+    def test_sign(self, app: Flask, session, csr: x509.CertificateSigningRequest):
+        """Assert that the signer is reused, and reserves serials from the CA row in blocks."""
+        app.config['PKI_SERIAL_BLOCK_SIZE'] = 10
+        signer = get_signer()
+        assert get_signer() is signer
+
+        first = signer.sign(csr)
+        second = signer.sign(csr)
+
+        assert (first.serial_number, second.serial_number) == (1, 2)
+        assert first.subject == csr.subject
+        assert first.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == get_ca().common_name
+
+        session.expire_all()
+        assert session.query(CertificateAuthority.serial).scalar() == 10
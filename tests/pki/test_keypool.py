@@ -0,0 +1,70 @@
+import itertools
+import threading
+import time
+from commandment.pki.keypool import KeyPool
+
+
+class FakeGenerator:
+    """Returns sequential integers in place of keys, and records the key size it was asked for."""
+    def __init__(self):
+        self.counter = itertools.count()
+        self.key_sizes = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key_size: int):
+        with self.lock:
+            self.key_sizes.append(key_size)
+            return next(self.counter)
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestKeyPool:
+
+    def test_take_without_start_generates_inline(self):
+        """Assert that an empty pool still hands out keys, by generating them in the caller."""
+        generate = FakeGenerator()
+        pool = KeyPool(2, key_size=1024, generate=generate)
+
+        assert pool.take() == 0
+        assert (pool.hits, pool.misses) == (0, 1)
+        assert generate.key_sizes == [1024]
+
+    def test_refill(self):
+        """Assert that the pool is filled in the background and refilled after keys are taken."""
+        pool = KeyPool(3, generate=FakeGenerator())
+        pool.start()
+        try:
+            assert wait_for(lambda: len(pool) == 3)
+
+            taken = [pool.take(), pool.take()]
+            assert taken == [0, 1]
+            assert (pool.hits, pool.misses) == (2, 0)
+
+            assert wait_for(lambda: len(pool) == 3)
+        finally:
+            pool.stop()
+
+    def test_keys_are_unique_across_threads(self):
+        """Assert that no key is handed out twice when taken concurrently."""
+        pool = KeyPool(5, generate=FakeGenerator())
+        pool.start()
+        taken = []
+        try:
+            threads = [threading.Thread(target=lambda: taken.append(pool.take())) for _ in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            pool.stop()
+
+        assert len(set(taken)) == 20
+        assert pool.hits + pool.misses == 20
@@ -0,0 +1,40 @@
+import pytest
+from flask import Flask
+from tests.conftest import *
+from commandment.models import Device
+from commandment.runner.registry import job
+from commandment.runner.worker import Runner
+
+calls = []
+
+
+@job('tests.succeed')
+def succeed(**kwargs):
+    calls.append(kwargs)
+
+
+@job('tests.fail', max_attempts=2)
+def fail(**kwargs):
+    raise ValueError('Expected failure')
+
+
+@job('tests.leader', leader_only=True)
+def leader(**kwargs):
+    calls.append(kwargs)
+
+
+@job('tests.sharded', sharded=True)
+def sharded(**kwargs):
+    calls.append(kwargs)
+
+
+@job('tests.ranged', sharded=True, shard_by=Device.id)
+def ranged(**kwargs):
+    calls.append(kwargs)
+
+
+@pytest.fixture(scope='function')
+def runner(app: Flask, session) -> Runner:
+    """A runner which is never started, so that tests can drive each step."""
+    del calls[:]
+    return Runner(app, workers=1, poll_interval=0.1, lease_seconds=60, retry_delay=0)
@@ -0,0 +1,84 @@
+import datetime
+from commandment.models import Device
+from commandment.runner.cluster import acquire_lease, release_lease, id_ranges
+from commandment.runner.models import Job, RunnerLease
+from commandment.runner.registry import enqueue
+from commandment.runner.worker import Runner
+from tests.runner.conftest import calls
+
+
+class TestCluster:
+
+    def test_lease_exclusive(self, session):
+        """Assert that a lease is held by one node until it expires or is released."""
+        assert acquire_lease('test', 'node-a', 60)
+        assert acquire_lease('test', 'node-a', 60)
+        assert not acquire_lease('test', 'node-b', 60)
+
+        release_lease('test', 'node-a')
+        assert acquire_lease('test', 'node-b', 60)
+
+    def test_lease_expiry(self, session):
+        """Assert that an expired lease is taken over by another node."""
+        assert acquire_lease('test', 'node-a', 60)
+        lease = session.query(RunnerLease).filter(RunnerLease.name == 'test').one()
+        lease.expires_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        session.commit()
+
+        assert acquire_lease('test', 'node-b', 60)
+        session.expire_all()
+        assert lease.owner == 'node-b'
+
+    def test_leader_only_job(self, runner: Runner, app, session):
+        """Assert that only the leader claims leader-only jobs."""
+        follower = Runner(app, workers=1)
+        assert runner.elect()
+        assert not follower.elect()
+
+        j = enqueue('tests.leader')
+        session.commit()
+
+        assert follower.claim() is None
+        assert runner.claim() == j.id
+
+    def test_sharded_schedule(self, runner: Runner, app, session):
+        """Assert that a sharded job is enqueued once per live node."""
+        follower = Runner(app, workers=1)
+        runner.elect()
+        follower.elect()
+        runner.sync_schedules({'tests.sharded': 60})
+
+        assert runner.enqueue_due() == 2
+        shards = sorted(j.parameters['shard'] for j in session.query(Job).filter(Job.name == 'tests.sharded'))
+        assert shards == [0, 1]
+
+    def test_id_range(self, session):
+        """Assert that every device id falls into exactly one shard."""
+        for i in range(10):
+            session.add(Device(udid='udid-{}'.format(i)))
+        session.commit()
+
+        ids = [d.id for d in session.query(Device)]
+        ranges = id_ranges(Device.id, 3)
+        for device_id in ids:
+            assert len([r for r in ranges if r[0] <= device_id < r[1]]) == 1
+
+    def test_ranged_schedule(self, runner: Runner, app, session):
+        """Assert that the id range of every shard is fixed when the shards are enqueued."""
+        runner.shards = 2
+        for i in range(4):
+            session.add(Device(udid='udid-{}'.format(i)))
+        session.commit()
+        ids = sorted(d.id for d in session.query(Device))
+        runner.sync_schedules({'tests.ranged': 60})
+
+        assert runner.enqueue_due() == 2
+        parameters = sorted((j.parameters for j in session.query(Job).filter(Job.name == 'tests.ranged')),
+                            key=lambda p: p['shard'])
+        assert [(p['lower'], p['upper']) for p in parameters] == [(ids[0], ids[2]), (ids[2], ids[3] + 1)]
+
+        session.query(Device).filter(Device.id == ids[0]).delete()
+        session.commit()
+        for _ in range(2):
+            runner.run_job(runner.claim())
+        assert sorted((c['lower'], c['upper']) for c in calls) == [(ids[0], ids[2]), (ids[2], ids[3] + 1)]
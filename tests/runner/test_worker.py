@@ -0,0 +1,86 @@
+import datetime
+from commandment.runner import JobStatus
+from commandment.runner.models import Job, JobSchedule
+from commandment.runner.registry import enqueue
+from commandment.runner.worker import Runner
+from tests.runner.conftest import calls
+
+
+class TestRunner:
+
+    def test_claim_and_run(self, runner: Runner, session):
+        """Assert that a one-off job is claimed, executed with its parameters and marked as succeeded."""
+        j = enqueue('tests.succeed', serial_number='C02ABC')
+        session.commit()
+
+        job_id = runner.claim()
+        assert job_id == j.id
+        runner.run_job(job_id)
+
+        session.expire_all()
+        assert j.status == JobStatus.Succeeded
+        assert j.attempts == 1
+        assert j.lease_owner is None
+        assert calls == [{'serial_number': 'C02ABC'}]
+
+    def test_claim_is_exclusive(self, runner: Runner, app, session):
+        """Assert that a job leased by one node cannot be claimed by another."""
+        enqueue('tests.succeed')
+        session.commit()
+
+        other = Runner(app, workers=1)
+        assert runner.claim() is not None
+        assert other.claim() is None
+
+    def test_expired_lease_is_reclaimed(self, runner: Runner, app, session):
+        """Assert that a job whose lease expired is claimed by another node."""
+        j = enqueue('tests.succeed')
+        session.commit()
+        runner.claim()
+
+        j.lease_expires_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        session.commit()
+
+        other = Runner(app, workers=1)
+        assert other.claim() == j.id
+        session.expire_all()
+        assert j.lease_owner == other.node_id
+        assert j.attempts == 2
+
+    def test_failure_retries_then_fails(self, runner: Runner, session):
+        """Assert that a failing job is requeued until it runs out of attempts."""
+        j = enqueue('tests.fail')
+        session.commit()
+
+        runner.run_job(runner.claim())
+        session.expire_all()
+        assert j.status == JobStatus.Queued
+        assert 'Expected failure' in j.error
+
+        runner.run_job(runner.claim())
+        session.expire_all()
+        assert j.status == JobStatus.Failed
+        assert j.finished_at is not None
+
+    def test_schedule_enqueues_once(self, runner: Runner, app, session):
+        """Assert that a due schedule is only enqueued by one node, and not again while its job is pending."""
+        runner.sync_schedules({'tests.succeed': 60})
+        other = Runner(app, workers=1)
+
+        assert runner.enqueue_due() == 1
+        assert other.enqueue_due() == 0
+
+        schedule = session.query(JobSchedule).filter(JobSchedule.name == 'tests.succeed').one()
+        schedule.next_run_at = datetime.datetime.utcnow()
+        session.commit()
+        assert other.enqueue_due() == 0
+        assert session.query(Job).filter(Job.schedule_id == schedule.id).count() == 1
+
+    def test_unconfigured_schedule_disabled(self, runner: Runner, session):
+        """Assert that a schedule removed from the configuration is disabled."""
+        runner.sync_schedules({'tests.succeed': 60})
+        runner.sync_schedules({})
+
+        schedule = session.query(JobSchedule).filter(JobSchedule.name == 'tests.succeed').one()
+        assert not schedule.enabled
+        assert runner.enqueue_due() == 0
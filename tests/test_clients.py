@@ -0,0 +1,101 @@
+import json
+import pytest
+import requests
+from flask import Flask
+from requests.adapters import BaseAdapter
+from commandment.clients import ClientRegistry, pooled_session
+from commandment.dep.dep import DEP, get_dep, clients as dep_clients
+from commandment.dep.models import DEPAccount
+from commandment.vpp import vpp as vpp_module
+from commandment.vpp.vpp import VPP, clear_service_config_cache
+
+SERVICE_CONFIG_URL = 'http://vppsim.invalid/VPPServiceConfigSrv'
+
+
+class ServiceConfigAdapter(BaseAdapter):
+    """Serves a VPP service configuration and counts how often it was requested."""
+    def __init__(self):
+        super(ServiceConfigAdapter, self).__init__()
+        self.count = 0
+
+    def send(self, request, **kwargs):
+        self.count += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = json.dumps({'getVPPAssetsSrvUrl': 'http://vppsim.invalid/getVPPAssetsSrv'}).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def config_adapter(monkeypatch) -> ServiceConfigAdapter:
+    adapter = ServiceConfigAdapter()
+
+    def session(*args, **kwargs):
+        s = pooled_session(*args, **kwargs)
+        s.mount('http://vppsim.invalid', adapter)
+        return s
+
+    monkeypatch.setattr(vpp_module, 'pooled_session', session)
+    clear_service_config_cache()
+    yield adapter
+    clear_service_config_cache()
+
+
+class TestClientRegistry:
+
+    def test_reuses_client(self):
+        """Assert that a client is only built once for the same account and key."""
+        registry = ClientRegistry()
+        first = registry.get(1, 'key', object)
+
+        assert registry.get(1, 'key', object) is first
+        assert registry.get(2, 'key', object) is not first
+        assert len(registry) == 2
+
+    def test_replaces_client_on_new_key(self):
+        """Assert that a client is rebuilt, and the old one forgotten, when the key of the account changes."""
+        registry = ClientRegistry()
+        first = registry.get(1, 'old', object)
+
+        assert registry.get(1, 'new', object) is not first
+        assert len(registry) == 1
+
+    def test_pooled_session(self):
+        """Assert that pooled sessions keep the configured number of connections per host."""
+        session = pooled_session(pool_maxsize=25)
+        assert session.get_adapter('https://mdmenrollment.apple.com')._pool_maxsize == 25
+
+
+class TestServiceClients:
+
+    def test_get_dep(self, app: Flask):
+        """Assert that the DEP client is shared until the account credentials change."""
+        dep_clients.clear()
+        account = DEPAccount(id=1, consumer_key='a', consumer_secret='b', access_token='c', access_secret='d')
+
+        dep = get_dep(account)
+        assert isinstance(dep, DEP)
+        assert get_dep(account) is dep
+
+        account.access_token = 'renewed'
+        assert get_dep(account) is not dep
+        dep_clients.clear()
+
+    def test_vpp_service_config_cached(self, config_adapter: ServiceConfigAdapter):
+        """Assert that the service config is fetched once per TTL, not once per client."""
+        first = VPP('stoken', vpp_service_config_url=SERVICE_CONFIG_URL)
+        second = VPP('stoken', vpp_service_config_url=SERVICE_CONFIG_URL)
+
+        assert first._service_config == second._service_config
+        assert config_adapter.count == 1
+
+    def test_vpp_service_config_expires(self, config_adapter: ServiceConfigAdapter):
+        """Assert that the service config is fetched again once the TTL has passed."""
+        vpp = VPP('stoken', vpp_service_config_url=SERVICE_CONFIG_URL, service_config_ttl=0)
+        assert vpp._service_config['getVPPAssetsSrvUrl'] is not None
+        assert config_adapter.count == 2
@@ -0,0 +1,68 @@
+import datetime
+import pickle
+import uuid
+import pytest
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.session import Session
+from commandment import dbtypes
+from commandment.models import Command
+
+SQLITE = sqlite.dialect()
+POSTGRESQL = postgresql.dialect()
+
+
+class TestGUID:
+
+    @pytest.mark.parametrize('binary', [False, True])
+    def test_round_trip(self, binary: bool):
+        guid = dbtypes.GUID(binary=binary)
+        value = uuid.uuid4()
+        stored = guid.process_bind_param(value, SQLITE)
+        assert stored == (value.bytes if binary else value.hex)
+        assert guid.process_bind_param(str(value), SQLITE) == stored
+        assert guid.process_result_value(stored, SQLITE) == value
+
+    def test_postgresql(self):
+        guid = dbtypes.GUID(binary=True)
+        value = uuid.uuid4()
+        assert guid.process_bind_param(value, POSTGRESQL) == str(value)
+        assert guid.process_result_value(str(value), POSTGRESQL) == value
+
+    def test_lazy_uuid(self):
+        value = uuid.uuid4()
+        lazy = dbtypes.LazyUUID.from_hex(value.hex)
+        assert isinstance(lazy, uuid.UUID)
+        assert lazy == value and value == lazy
+        assert lazy == dbtypes.LazyUUID(value.hex)
+        assert lazy != uuid.uuid4()
+        assert hash(lazy) == hash(value)
+        assert {value: 1}[lazy] == 1
+        assert str(lazy) == str(value)
+        assert lazy.int == value.int
+        assert lazy.bytes == value.bytes
+        assert lazy.version == 4
+        assert pickle.loads(pickle.dumps(lazy)) == value
+
+    def test_column(self, session: Session):
+        value = uuid.uuid4()
+        session.add(Command(request_type='DeviceInformation', uuid=value, parameters={}))
+        session.commit()
+        session.expire_all()
+        assert session.query(Command).filter(Command.uuid == str(value)).one().uuid == value
+
+
+class TestJSON:
+
+    def test_round_trip(self):
+        value = {'Queries': ['UDID'], 'Count': 1, 'Name': 'Jane’s iPad', 'Nested': {'Flag': True, 'None': None}}
+        encoded = dbtypes.JSONEncodedDict()
+        assert encoded.process_result_value(encoded.process_bind_param(value, SQLITE), SQLITE) == value
+
+    def test_same_as_stdlib(self):
+        value = {'at': datetime.datetime(2019, 6, 20, 10, 31, 47, 902114), 1: 'one', 'big': 2 ** 70}
+        assert dbtypes.json_loads(dbtypes.json_dumps(value)) == {
+            'at': '2019-06-20T10:31:47.902114', '1': 'one', 'big': 2 ** 70}
+
+    def test_unserializable(self):
+        with pytest.raises(TypeError):
+            dbtypes.json_dumps({'value': object()})
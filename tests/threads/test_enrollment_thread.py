@@ -0,0 +1,34 @@
+import pytest
+import threading
+from flask import Flask
+from commandment.threads import enrollment_thread
+
+
+@pytest.fixture(scope='function')
+def storm_app(app: Flask):
+    app.config['ENROLLMENT_STORM_MODE'] = True
+    app.config['ENROLLMENT_WORKERS'] = 2
+    app.config['ENROLLMENT_QUEUE_SIZE'] = 2
+    enrollment_thread.start(app)
+    yield app
+    enrollment_thread.stop()
+
+
+class TestEnrollmentThread:
+
+    def test_submit_without_pool(self):
+        """Assert that work is rejected so that the caller runs it inline when storm mode is disabled."""
+        assert not enrollment_thread.submit(lambda: None)
+
+    def test_submit_runs_work(self, storm_app: Flask):
+        """Assert that queued work is executed by a worker."""
+        done = threading.Event()
+        assert enrollment_thread.submit(done.set)
+        assert done.wait(5)
+
+    def test_submit_when_full(self, storm_app: Flask):
+        """Assert that a full queue refuses work instead of blocking the request."""
+        release = threading.Event()
+        results = [enrollment_thread.submit(release.wait) for _ in range(10)]
+        release.set()
+        assert not all(results)
@@ -1,4 +1,6 @@
 import pytest
+from flask import Flask
+from commandment.runner import worker
 from commandment.threads import startup_thread
 from commandment.pki.models import CACertificate
 
@@ -12,3 +14,16 @@ class TestStartupThread:
         assert certificate.x509_cn == 'COMMANDMENT-CA'
         assert certificate.pem_data is not None
         assert certificate.fingerprint is not None
+
+    def test_runner_without_push_certificate(self, app: Flask, monkeypatch):
+        """Assert that the runner is started even though the push certificate does not exist."""
+        started = []
+        monkeypatch.setattr(startup_thread, 'run_migrations', lambda app: None)
+        monkeypatch.setattr(startup_thread, 'generate_ca', lambda app: None)
+        monkeypatch.setattr(worker, 'start', started.append)
+        app.config['PUSH_CERTIFICATE'] = '/nonexistent/push.pem'
+
+        with pytest.raises(RuntimeError):
+            startup_thread.startup_callback(app)
+
+        assert started == [app]
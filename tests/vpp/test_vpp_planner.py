@@ -0,0 +1,147 @@
+import base64
+import json
+import threading
+from sqlalchemy.orm.session import Session
+from commandment.apps.models import Application, PurchaseMethod
+from commandment.models import Device, Tag
+from commandment.vpp.enum import VPPPricingParam
+from commandment.vpp.models import VPPAccount, VPPAsset, VPPAssignmentResult, VPPLicense
+from commandment.vpp.planner import plan, execute, assign_device_licenses, LicenseBatch
+
+ADAM_ID = '408709785'
+
+
+def vpp_accounts(count: int):
+    return [VPPAccount(stoken=base64.b64encode(json.dumps({
+        'token': 'token{}'.format(i), 'expDate': '2030-01-01T00:00:00-0800', 'orgName': 'Org {}'.format(i)
+    }).encode()).decode()) for i in range(count)]
+
+
+class FakeVPP:
+    """Answers manageVPPLicensesByAdamIdSrv requests, failing associations for the serial numbers in ``fail``."""
+    def __init__(self, fail=(), limit: int = 2):
+        self.fail = set(fail)
+        self.requests = []
+        self.next_license_id = 1000
+        self.lock = threading.Lock()
+        self._service_config = {'maxBatchAssociateLicenseCount': limit, 'maxBatchDisassociateLicenseCount': limit}
+
+    def bulk_update_licenses(self, adam_id, association_type=None, associate=None, disassociation_type=None,
+                             disassociate=None, pricing_param='STDQ', notify=False):
+        with self.lock:
+            self.requests.append((adam_id, list(associate or []), list(disassociate or [])))
+            associations = []
+            for serial_number in associate or []:
+                if serial_number in self.fail:
+                    associations.append({'serialNumber': serial_number, 'errorNumber': 9616,
+                                         'errorMessage': 'Device not eligible'})
+                else:
+                    self.next_license_id += 1
+                    associations.append({'serialNumber': serial_number, 'licenseIdStr': str(self.next_license_id)})
+
+        return {'status': 0, 'associations': associations,
+                'disassociations': [{'serialNumber': s} for s in disassociate or []]}
+
+
+class TestVPPPlanner:
+
+    def test_plan_splits_batches(self):
+        """Assert that the differences are split at the per request limits."""
+        batches, unavailable = plan({ADAM_ID: {'A', 'B', 'C', 'D', 'E'}}, {ADAM_ID: {'A', 'Z'}}, 2, 10, remove=True)
+
+        assert [(b.associate, b.disassociate) for b in batches] == [(['B', 'C'], ['Z']), (['D', 'E'], [])]
+        assert unavailable == {}
+
+    def test_plan_limits_to_available(self):
+        """Assert that associations beyond the available licenses are left out of the plan."""
+        batches, unavailable = plan({ADAM_ID: {'A', 'B', 'C'}}, {}, 10, 10, available={ADAM_ID: 2})
+
+        assert batches[0].associate == ['A', 'B']
+        assert unavailable == {ADAM_ID: {'C'}}
+
+    def test_execute_records_partial_failure(self):
+        """Assert that the outcome of every serial number is returned, including failures within a batch."""
+        vpp = FakeVPP(fail=['B'])
+        results = execute(vpp, [LicenseBatch(ADAM_ID, VPPPricingParam.StandardQuality, ['A', 'B']),
+                                LicenseBatch(ADAM_ID, VPPPricingParam.StandardQuality, ['C'])], max_workers=2)
+
+        outcomes = {r['serial_number']: (r['succeeded'], r['error_number']) for r in results}
+        assert outcomes == {'A': (True, None), 'B': (False, 9616), 'C': (True, None)}
+
+    def test_assign_device_licenses(self, session: Session):
+        """Assert that tagged devices are assigned licenses, results are stored and the next plan is empty."""
+        tag = Tag(name='Students', color='888888')
+        app = Application(display_name='Pages', bundle_id='com.apple.Pages', itunes_store_id=int(ADAM_ID),
+                          purchase_method=PurchaseMethod.VPP_APP_ASSIGNMENT, tags=[tag])
+        devices = [Device(serial_number='C02{:09d}'.format(i), udid=str(i), tags=[tag]) for i in range(5)]
+        session.add_all([tag, app] + devices)
+        session.commit()
+
+        vpp = FakeVPP(fail=['C02000000003'])
+        stats = assign_device_licenses(vpp, max_workers=3)
+
+        assert stats == {'batches': 3, 'succeeded': 4, 'failed': 1, 'unavailable': 0}
+        assert session.query(VPPLicense).filter(VPPLicense.serial_number != None).count() == 4
+
+        failed = session.query(VPPAssignmentResult).filter(VPPAssignmentResult.succeeded == False).one()
+        assert failed.serial_number == 'C02000000003'
+        assert failed.error_number == 9616
+
+        vpp.fail = set()
+        stats = assign_device_licenses(vpp)
+        assert stats == {'batches': 1, 'succeeded': 1, 'failed': 0, 'unavailable': 0}
+        assert session.query(VPPAssignmentResult).filter(VPPAssignmentResult.succeeded == False).count() == 0
+
+    def test_assign_device_licenses_per_account(self, session: Session):
+        """Assert that licenses held under another account are neither counted nor disassociated."""
+        accounts = vpp_accounts(2)
+        tag = Tag(name='Students', color='888888')
+        app = Application(display_name='Pages', bundle_id='com.apple.Pages', itunes_store_id=int(ADAM_ID),
+                          purchase_method=PurchaseMethod.VPP_APP_ASSIGNMENT, tags=[tag])
+        tagged = Device(serial_number='C02000000001', udid='1', tags=[tag])
+        session.add_all(accounts + [tag, app, tagged])
+        session.flush()
+        session.add_all([
+            VPPAsset(vpp_account_id=accounts[0].id, adam_id=ADAM_ID, pricing_param=VPPPricingParam.StandardQuality,
+                     available_count=10),
+            VPPLicense(license_id=1, vpp_account_id=accounts[1].id, adam_id=ADAM_ID, serial_number='C02000000001',
+                       pricing_param=VPPPricingParam.StandardQuality, status='Associated'),
+            VPPLicense(license_id=2, vpp_account_id=accounts[1].id, adam_id=ADAM_ID, serial_number='C02000000002',
+                       pricing_param=VPPPricingParam.StandardQuality, status='Associated'),
+        ])
+        session.commit()
+
+        vpp = FakeVPP()
+        stats = assign_device_licenses(vpp, accounts[0], remove=True)
+
+        assert stats == {'batches': 1, 'succeeded': 1, 'failed': 0, 'unavailable': 0}
+        assert vpp.requests == [(ADAM_ID, ['C02000000001'], [])]
+        assert session.query(VPPLicense).get(2).serial_number == 'C02000000002'
+
+    def test_assign_device_licenses_owned_products(self, session: Session):
+        """Assert that each account only assigns the products it holds licenses for, and keeps its own results."""
+        accounts = vpp_accounts(2)
+        tag = Tag(name='Students', color='888888')
+        apps = [Application(display_name='App {}'.format(i), bundle_id='com.example.app{}'.format(i),
+                            itunes_store_id=int(ADAM_ID) + i, purchase_method=PurchaseMethod.VPP_APP_ASSIGNMENT,
+                            tags=[tag]) for i in range(3)]
+        session.add_all(accounts + apps + [tag, Device(serial_number='C02000000001', udid='1', tags=[tag])])
+        session.flush()
+        session.add_all([VPPAsset(vpp_account_id=account.id, adam_id=adam_id,
+                                  pricing_param=VPPPricingParam.StandardQuality, available_count=10)
+                         for account, adam_id in ((accounts[0], ADAM_ID), (accounts[1], ADAM_ID),
+                                                  (accounts[1], str(int(ADAM_ID) + 1)))])
+        session.commit()
+
+        requests = []
+        for account in accounts:
+            vpp = FakeVPP(fail=['C02000000001'])
+            assign_device_licenses(vpp, account)
+            requests.append(sorted(vpp.requests))
+
+        assert requests == [[(ADAM_ID, ['C02000000001'], [])],
+                            [(ADAM_ID, ['C02000000001'], []), (str(int(ADAM_ID) + 1), ['C02000000001'], [])]]
+        results = session.query(VPPAssignmentResult.vpp_account_id, VPPAssignmentResult.adam_id).order_by(
+            VPPAssignmentResult.vpp_account_id, VPPAssignmentResult.adam_id).all()
+        assert results == [(accounts[0].id, ADAM_ID), (accounts[1].id, ADAM_ID),
+                           (accounts[1].id, str(int(ADAM_ID) + 1))]
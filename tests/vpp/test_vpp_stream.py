@@ -0,0 +1,68 @@
+import threading
+import pytest
+from typing import Optional
+from commandment.vpp.errors import VPPAPIError
+from commandment.vpp.vpp import VPPRecordStream
+
+
+class FakePages:
+    """Serves pages of license records by batch token and records the order of fetches."""
+    def __init__(self, page_count: int, page_size: int = 3):
+        self.page_count = page_count
+        self.page_size = page_size
+        self.fetched = []
+        self.second_page_requested = threading.Event()
+
+    def __call__(self, batch_token: Optional[str]) -> dict:
+        page = 0 if batch_token is None else int(batch_token)
+        self.fetched.append(page)
+        if page == 1:
+            self.second_page_requested.set()
+
+        reply = {
+            'status': 0,
+            'totalCount': self.page_count * self.page_size,
+            'licenses': [{'licenseId': page * self.page_size + i} for i in range(self.page_size)],
+        }
+        if page + 1 < self.page_count:
+            reply['batchToken'] = str(page + 1)
+        else:
+            reply['sinceModifiedToken'] = 'modified-{}'.format(page)
+
+        return reply
+
+
+class TestVPPRecordStream:
+
+    def test_streams_all_records(self):
+        """Assert that every record of every page is yielded in order, and the resume token is kept."""
+        pages = FakePages(4)
+        stream = VPPRecordStream(pages, 'licenses')
+
+        assert [l['licenseId'] for l in stream] == list(range(12))
+        assert pages.fetched == [0, 1, 2, 3]
+        assert stream.pages == 4
+        assert stream.total == 12
+        assert stream.since_modified_token == 'modified-3'
+
+    def test_prefetches_next_page(self):
+        """Assert that the next page is requested before the current page has been consumed."""
+        pages = FakePages(2)
+        records = iter(VPPRecordStream(pages, 'licenses'))
+
+        next(records)
+        assert pages.second_page_requested.wait(5)
+
+    def test_lazy(self):
+        """Assert that nothing is fetched until iteration starts."""
+        pages = FakePages(2)
+        VPPRecordStream(pages, 'licenses', since_modified_token='previous')
+        assert pages.fetched == []
+
+    def test_error_reply(self):
+        """Assert that an error reply from the service is raised."""
+        stream = VPPRecordStream(lambda token: {'status': -1, 'errorNumber': 9600, 'errorMessage': 'Missing'},
+                                 'licenses')
+
+        with pytest.raises(VPPAPIError):
+            list(stream)
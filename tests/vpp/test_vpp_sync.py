@@ -0,0 +1,160 @@
+import base64
+import json
+import uuid
+import pytest
+from sqlalchemy.orm.session import Session
+from commandment.vpp.enum import VPPPricingParam, VPPUserStatus
+from commandment.vpp.models import VPPAccount, VPPAsset, VPPLicense, VPPUser
+from commandment.vpp.threads import vpp_sync_assets, vpp_sync_licenses, vpp_sync_users
+from commandment.vpp.vpp import VPPRecordStream
+
+USER_CID = str(uuid.uuid4()).upper()
+
+
+def license_record(license_id: int, **kwargs) -> dict:
+    d = {
+        'licenseId': license_id,
+        'adamIdStr': '408709785',
+        'productTypeId': 8,
+        'productTypeName': 'Application',
+        'pricingParam': 'STDQ',
+        'isIrrevocable': False,
+        'status': 'Available',
+    }
+    d.update(kwargs)
+    return d
+
+
+class FakeVPP:
+    """Serves canned pages in place of the VPP service, and records the since modified tokens it was asked for."""
+    def __init__(self, licenses=None, users=None, assets=None):
+        self.license_pages = licenses or []
+        self.user_pages = users or []
+        self.asset_list = assets or []
+        self.since_modified_tokens = []
+
+    def _stream(self, pages, key, since_modified_token):
+        self.since_modified_tokens.append(since_modified_token)
+
+        def fetch(batch_token):
+            return pages[0 if batch_token is None else int(batch_token)]
+
+        return VPPRecordStream(fetch, key, since_modified_token)
+
+    def stream_licenses(self, since_modified_token=None):
+        return self._stream(self.license_pages, 'licenses', since_modified_token)
+
+    def stream_users(self, since_modified_token=None):
+        return self._stream(self.user_pages, 'users', since_modified_token)
+
+    def assets(self):
+        return {'status': 0, 'assets': self.asset_list}
+
+
+@pytest.fixture
+def vpp_account(session: Session) -> VPPAccount:
+    account = VPPAccount(stoken=base64.b64encode(json.dumps({
+        'token': 'token', 'expDate': '2030-01-01T00:00:00-0800', 'orgName': 'Commandment'}).encode()).decode())
+    session.add(account)
+    session.commit()
+    return account
+
+
+class TestVPPSync:
+
+    def test_sync_licenses_incremental(self, session: Session, vpp_account: VPPAccount):
+        """Assert that licenses are mirrored, and the next sync resumes from the since modified token."""
+        vpp = FakeVPP(licenses=[
+            {'status': 0, 'licenses': [license_record(1), license_record(2)], 'batchToken': '1'},
+            {'status': 0, 'licenses': [license_record(3, serialNumber='C02TEST', status='Associated')],
+             'sinceModifiedToken': 'first'},
+        ])
+        assert vpp_sync_licenses(vpp, vpp_account) == {'inserted': 3, 'updated': 0}
+        assert vpp_account.licenses_since_modified_token == 'first'
+
+        vpp.license_pages = [{'status': 0, 'licenses': [license_record(3)], 'sinceModifiedToken': 'second'}]
+        assert vpp_sync_licenses(vpp, vpp_account) == {'inserted': 0, 'updated': 1}
+        assert vpp.since_modified_tokens == [None, 'first']
+        assert vpp_account.licenses_since_modified_token == 'second'
+
+        released = session.query(VPPLicense).get(3)
+        assert released.serial_number is None
+        assert released.pricing_param == VPPPricingParam.StandardQuality
+        assert released.vpp_account_id == vpp_account.id
+
+    def test_sync_users(self, session: Session, vpp_account: VPPAccount):
+        """Assert that users are mirrored and users without a UUID client id are skipped."""
+        vpp = FakeVPP(users=[{'status': 0, 'users': [
+            {'userId': 1, 'clientUserIdStr': USER_CID, 'email': 'user@localhost', 'status': 'Registered'},
+            {'userId': 2, 'clientUserIdStr': 'not-a-uuid', 'status': 'Registered'},
+        ], 'sinceModifiedToken': 'users'}])
+
+        assert vpp_sync_users(vpp, vpp_account) == {'inserted': 1, 'updated': 0, 'skipped': 1, 'retired': 0}
+        user = session.query(VPPUser).get(1)
+        assert user.status == VPPUserStatus.Registered
+        assert vpp_account.users_since_modified_token == 'users'
+
+    def test_sync_users_registered_again(self, session: Session, vpp_account: VPPAccount):
+        """Assert that retired users are removed, and a client user id registered again updates its row."""
+        other_cid = str(uuid.uuid4()).upper()
+        vpp = FakeVPP(users=[{'status': 0, 'users': [
+            {'userId': 1, 'clientUserIdStr': USER_CID, 'status': 'Associated'},
+            {'userId': 2, 'clientUserIdStr': other_cid, 'status': 'Associated'},
+        ], 'sinceModifiedToken': 'first'}], licenses=[{'status': 0, 'licenses': [
+            license_record(1, userId=1, clientUserIdStr=USER_CID, status='Associated'),
+        ], 'sinceModifiedToken': 'licenses'}])
+        vpp_sync_users(vpp, vpp_account)
+        vpp_sync_licenses(vpp, vpp_account)
+
+        vpp.user_pages = [{'status': 0, 'users': [
+            {'userId': 1, 'clientUserIdStr': USER_CID, 'status': 'Retired'},
+            {'userId': 3, 'clientUserIdStr': USER_CID, 'status': 'Registered'},
+            {'userId': 2, 'clientUserIdStr': other_cid, 'status': 'Retired'},
+            {'userId': 4, 'clientUserIdStr': other_cid, 'status': 'Registered'},
+        ], 'sinceModifiedToken': 'second'}]
+        assert vpp_sync_users(vpp, vpp_account) == {'inserted': 2, 'updated': 0, 'skipped': 0, 'retired': 2}
+        assert [(u.user_id, u.status) for u in session.query(VPPUser).order_by(VPPUser.user_id)] == [
+            (3, VPPUserStatus.Registered), (4, VPPUserStatus.Registered)]
+        assert session.query(VPPLicense).get(1).user_id is None
+
+        vpp.user_pages = [{'status': 0, 'users': [
+            {'userId': 5, 'clientUserIdStr': USER_CID, 'status': 'Registered'},
+        ], 'sinceModifiedToken': 'third'}]
+        assert vpp_sync_users(vpp, vpp_account) == {'inserted': 0, 'updated': 1, 'skipped': 0, 'retired': 0}
+        assert session.query(VPPUser).filter(VPPUser.client_user_id == uuid.UUID(USER_CID)).one().user_id == 5
+
+    def test_sync_licenses_unmirrored_user(self, session: Session, vpp_account: VPPAccount):
+        """Assert that licenses of users which were skipped do not refer to them."""
+        vpp = FakeVPP(users=[{'status': 0, 'users': [
+            {'userId': 1, 'clientUserIdStr': USER_CID, 'status': 'Associated'},
+            {'userId': 2, 'clientUserIdStr': 'not-a-uuid', 'status': 'Associated'},
+        ], 'sinceModifiedToken': 'users'}], licenses=[{'status': 0, 'licenses': [
+            license_record(1, userId=1, clientUserIdStr=USER_CID, status='Associated'),
+            license_record(2, userId=2, clientUserIdStr='not-a-uuid', status='Associated'),
+            license_record(3, userId=3, clientUserIdStr=str(uuid.uuid4()), status='Associated'),
+        ], 'sinceModifiedToken': 'licenses'}])
+        vpp_sync_users(vpp, vpp_account)
+
+        assert vpp_sync_licenses(vpp, vpp_account) == {'inserted': 3, 'updated': 0}
+        assert session.query(VPPLicense).get(1).user_id == 1
+        assert session.query(VPPLicense).get(1).client_user_id == uuid.UUID(USER_CID)
+        for license_id in (2, 3):
+            license = session.query(VPPLicense).get(license_id)
+            assert (license.user_id, license.client_user_id) == (None, None)
+            assert license.status == 'Associated'
+
+    def test_sync_assets_and_available_seats(self, session: Session, vpp_account: VPPAccount):
+        """Assert that assets are replaced on every sync and available seats are read from the mirror."""
+        vpp = FakeVPP(assets=[
+            {'adamIdStr': '408709785', 'pricingParam': 'STDQ', 'productTypeId': 8, 'totalCount': 10,
+             'assignedCount': 3, 'availableCount': 7, 'retiredCount': 0, 'deviceAssignable': True},
+            {'adamIdStr': '361309726', 'pricingParam': 'STDQ', 'productTypeId': 8, 'totalCount': 1,
+             'assignedCount': 0, 'availableCount': 1, 'retiredCount': 0, 'deviceAssignable': True},
+        ])
+        assert vpp_sync_assets(vpp, vpp_account) == {'inserted': 2, 'updated': 0, 'deleted': 0}
+        assert VPPAsset.available_seats('408709785') == 7
+
+        vpp.asset_list = [dict(vpp.asset_list[0], assignedCount=4, availableCount=6)]
+        assert vpp_sync_assets(vpp, vpp_account) == {'inserted': 0, 'updated': 1, 'deleted': 1}
+        assert VPPAsset.available_seats('408709785') == 6
+        assert VPPAsset.available_seats('361309726') == 0
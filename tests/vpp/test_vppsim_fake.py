@@ -0,0 +1,83 @@
+import uuid
+import pytest
+from commandment.benchmarks.vppsim import VPPSimulatorAdapter
+from commandment.vpp.enum import LicenseAssociationType, LicenseDisassociationType
+from commandment.vpp.vpp import VPP
+
+
+@pytest.fixture
+def adapter() -> VPPSimulatorAdapter:
+    return VPPSimulatorAdapter(asset_count=2, licenses_per_asset=700, user_count=3, max_batch=2)
+
+
+@pytest.fixture
+def vpp(adapter: VPPSimulatorAdapter) -> VPP:
+    client = VPP('stoken', service_config=adapter.service_config)
+    adapter.mount(client)
+    return client
+
+
+class TestVPPSimulatorContract:
+    """The VPP client run against the in-process fake, which the VPP benchmark relies on."""
+
+    def test_licenses_cursor(self, vpp: VPP):
+        """Assert that the cursor pages through every license and ends with a since modified token."""
+        cursor = vpp.licenses()
+        assert cursor.total == 1400
+        assert cursor.batch_count == 600
+
+        pages = 1
+        while cursor.batch_token:
+            cursor = vpp.licenses(batch_token=cursor.batch_token)
+            pages += 1
+
+        assert pages == 3
+        assert cursor.since_modified_token is not None
+
+    def test_stream_licenses_by_adam_id(self, vpp: VPP, adapter: VPPSimulatorAdapter):
+        """Assert that the adam id filter is carried across pages."""
+        stream = vpp.stream_licenses(adam_id=adapter.adam_ids[1])
+        licenses = list(stream)
+
+        assert len(licenses) == 700
+        assert {l['adamIdStr'] for l in licenses} == {adapter.adam_ids[1]}
+        assert stream.pages == 2
+
+    def test_associate_then_stream_modified(self, vpp: VPP, adapter: VPPSimulatorAdapter):
+        """Assert that associations are reflected in the assets and in the next incremental fetch."""
+        stream = vpp.stream_licenses()
+        list(stream)
+
+        reply = vpp.bulk_update_licenses(adapter.adam_ids[0], LicenseAssociationType.SerialNumber, ['A', 'B'])
+        assert reply['status'] == 0
+        assert [a['serialNumber'] for a in reply['associations']] == ['A', 'B']
+
+        modified = list(vpp.stream_licenses(since_modified_token=stream.since_modified_token))
+        assert {l['serialNumber'] for l in modified} == {'A', 'B'}
+
+        asset = vpp.assets()['assets'][0]
+        assert (asset['assignedCount'], asset['availableCount']) == (2, 698)
+
+        reply = vpp.bulk_update_licenses(adapter.adam_ids[0], disassociation_type=LicenseDisassociationType.SerialNumber,
+                                         disassociate=['A'])
+        assert reply['disassociations'][0]['serialNumber'] == 'A'
+        assert vpp.assets()['assets'][0]['assignedCount'] == 1
+
+    def test_associate_over_batch_limit(self, vpp: VPP, adapter: VPPSimulatorAdapter):
+        """Assert that a request over the advertised batch limit is refused as a whole."""
+        reply = vpp.bulk_update_licenses(adapter.adam_ids[0], LicenseAssociationType.SerialNumber, ['A', 'B', 'C'])
+        assert reply['status'] == -1
+
+    def test_register_and_retire_user(self, vpp: VPP):
+        """Assert that registered users can be fetched, and that retired users are only listed on request."""
+        client_user_id = str(uuid.uuid4()).upper()
+        reply = vpp.register_user(client_user_id, 'new@localhost')
+        assert reply['status'] == 0
+        assert reply['user']['inviteUrl']
+
+        assert vpp.get_user(client_user_id)['user']['email'] == 'new@localhost'
+        assert len(list(vpp.stream_users())) == 4
+
+        vpp.retire_user(client_user_id)
+        assert len(list(vpp.stream_users(include_retired=0))) == 3
+        assert len(list(vpp.stream_users(include_retired=1))) == 4